@@ -1,179 +1,140 @@
+import asyncio
 import json
+from django.conf import settings
+from django.db.models import Q
 from django.utils import timezone
-from django.shortcuts import get_object_or_404
 
-from channels.generic.websocket import WebsocketConsumer
-from asgiref.sync import async_to_sync
-from app_users.models import User, MessageChat
-
-
-class ChatConsumer(WebsocketConsumer):
-    def connect(self):
+from channels.db import database_sync_to_async
+from channels.generic.websocket import AsyncWebsocketConsumer
+from app_users.models import UserMatch, MessageChat
+
+
+class ChatConsumer(AsyncWebsocketConsumer):
+    """chat between two matched users, one channels group per chatroom uuid
+    the consumer runs on the event loop, so an open (idle) socket does not
+    occupy a thread: the database work of an event is done by one
+    database_sync_to_async call (load_chatroom, store_message, store_read)
+    both users of the match are loaded once at connect and the group event
+    carries the stored message, so delivering a message to the sockets of
+    the chatroom (chat_message) does not touch the database
+    the was_seen events of the frontend are collected into one read receipt
+    ("read up to message id") per CHAT_READ_RECEIPT_INTERVAL seconds, stored
+    and sent to the chatroom as one chat_read event
+    """
+
+    async def connect(self):
         """function to extablish a chat room and connection to the frontend"""
 
-        # obtain the chatroom uuid from the session of the current user!
-        chatroom_uuid = self.scope["session"].get("chatroom_uuid", None)
+        # the match of the chatroom of the session of the current user!
+        self.user_match = await self.load_chatroom()
 
         # set the room_group_name of channels to the correct uuid
-        if chatroom_uuid:
-            self.room_group_name = chatroom_uuid
+        if not self.user_match:
+            # no chatroom (the chat view was not opened) or not a user of
+            # the match: refuse the socket
+            self.room_group_name = None
+            await self.close()
+            return
+        self.room_group_name = str(self.user_match.chatroom_uuid)
+
+        # the sending (current) & receiving (matched) user of this socket
+        if self.user_match.user_id == self.scope["user"].pk:
+            self.current_user, self.matched_user = (
+                self.user_match.user,
+                self.user_match.other,
+            )
         else:
-            self.room_group_name = "UNDEFINED"
-            raise Exception("No chatroom_uuid defined! This is really bad!")
+            self.current_user, self.matched_user = (
+                self.user_match.other,
+                self.user_match.user,
+            )
+
+        # the messages delivered to & seen by the current user, which are not
+        # stored as read yet (and the task which will store them)
+        self.delivered, self.read_id, self.read_task = set(), None, None
 
         # initiate the connection
-        async_to_sync(self.channel_layer.group_add)(
-            self.room_group_name, self.channel_name
-        )
+        await self.channel_layer.group_add(self.room_group_name, self.channel_name)
 
         # Accepts incoming socket request from the frontend
-        self.accept()
+        await self.accept()
+
+    async def disconnect(self, close_code):
+        """function to leave the chat room (the group forgets the socket),
+        the pending read receipt is sent right away
+        """
+        if self.room_group_name:
+            if self.read_task:
+                self.read_task.cancel()
+            await self.send_read()
+            await self.channel_layer.group_discard(
+                self.room_group_name, self.channel_name
+            )
 
-    def receive(self, text_data):
+    async def receive(self, text_data):
         """function to receive chat messages from the room_group_name"""
 
         # load the json that was send by the frontend JS
         serialized_data_from_chat_frontend = json.loads(text_data)
 
-        was_seen = serialized_data_from_chat_frontend.get("was_seen", None)
-        message_pk = serialized_data_from_chat_frontend.get("message_pk", None)
-        message = serialized_data_from_chat_frontend.get("message", None)
-        sending_user_pk = serialized_data_from_chat_frontend.get(
-            "sending_user_pk", None
-        )
-        sending_user_name = serialized_data_from_chat_frontend.get("sending_user", None)
-        receiving_user_pk = serialized_data_from_chat_frontend.get(
-            "receiving_user_pk", None
+        # check if the receiving user has drawn the message
+        if serialized_data_from_chat_frontend.get(
+            "was_seen", None
+        ) and serialized_data_from_chat_frontend.get("message_pk", None):
+            self.mark_seen(serialized_data_from_chat_frontend["message_pk"])
+            return
+
+        # the frontend may only send as the user of this socket to its match
+        if serialized_data_from_chat_frontend.get("sending_user_pk", None) != str(
+            self.current_user.pk
+        ) or serialized_data_from_chat_frontend.get("receiving_user_pk", None) != str(
+            self.matched_user.pk
+        ):
+            return
+
+        chat_object = await self.store_message(
+            serialized_data_from_chat_frontend.get("message", None)
         )
-        receiving_user_name = serialized_data_from_chat_frontend.get(
-            "receiving_user", None
+        if chat_object is None:
+            # skip this message and don't store/ send!
+            return
+
+        # send the stored message to the sockets of the chatroom
+        await self.channel_layer.group_send(
+            self.room_group_name,
+            {
+                "type": "chat_message",
+                "message_pk": chat_object.pk,
+                "message": chat_object.message,
+                "message_sent_date": chat_object.sent_date.strftime("%Y-%m-%d"),
+                "message_sent_time": chat_object.sent_time,
+                "sending_user_pk": str(self.current_user.pk),
+                "sending_user": self.current_user.username,
+                "receiving_user_pk": str(self.matched_user.pk),
+                "receiving_user": self.matched_user.username,
+            },
         )
 
-        # init user object vars
-        current_user = matched_user = None
-        # get actual user objects from the database
-        if sending_user_pk != "None":
-            current_user = get_object_or_404(
-                User, pk=sending_user_pk, username=sending_user_name
-            )
-        if receiving_user_pk != "None":
-            matched_user = get_object_or_404(
-                User, pk=receiving_user_pk, username=receiving_user_name
-            )
-
-        # check if the receiving user has drawn the message
-        if was_seen and message_pk:
-            # check if data is valid!
-            try:
-                # get the correct message for the database
-                chat_object = MessageChat.objects.filter(
-                    pk=message_pk, message=message
-                ).last()
-                if chat_object:
-                    # check if current user is the receiving user!
-                    if self.scope["user"] == chat_object.other:
-                        # update the chat message with seen date!
-                        chat_object.seen_date = timezone.now()
-                        chat_object.save()
-                return
-
-            # invalid message!
-            except MessageChat.DoesNotExist:
-                return
-        else:
-            # get last send message
-            chat_object = MessageChat.objects.filter(
-                user=current_user, other=matched_user, message=message
-            ).last()
-
-            # check if last message is exact same message as current one!
-            if (
-                chat_object
-                and chat_object.user == current_user
-                and chat_object.other == matched_user
-                and chat_object.message == message
-                and timezone.now().strftime("%H%M%S")
-                <= chat_object.sent_date.strftime("%H%M%S")
-            ):
-                # skip this message and don't store/ send!
-                return
-
-            else:
-                # create new message in database!
-                chat_object = MessageChat.objects.create(
-                    user=current_user, other=matched_user, message=message
-                )
-
-                # add message pk to the serialized data
-                serialized_data_from_chat_frontend["message_pk"] = chat_object.pk
-
-                # add the key "type" to the serialized data
-                serialized_data_from_chat_frontend["type"] = "chat_message"
-
-                # send the serialized data to the frontend
-                async_to_sync(self.channel_layer.group_send)(
-                    self.room_group_name, serialized_data_from_chat_frontend
-                )
-
-    def chat_message(self, event):
-        """function to send chat message to the room_group_name"""
-
-        was_seen = event.get("was_seen", None)
-        message_pk = event.get("message_pk", None)
-        message = event.get("message", None)
-        message_sent_date = event.get("message_sent_date", None)
-        message_sent_time = event.get("message_sent_date", None)
-        message_seen_date = event.get("message_sent_date", None)
-        message_seen_time = event.get("message_sent_date", None)
-        sending_user_pk = event.get("sending_user_pk", None)
-        sending_user_name = event.get("sending_user", None)
-        receiving_user_pk = event.get("receiving_user_pk", None)
-        receiving_user_name = event.get("receiving_user", None)
-
-        # init user object vars
-        current_user = matched_user = None
-
-        # get actual user objects from the database
-        if sending_user_pk != "None":
-            current_user = get_object_or_404(
-                User, pk=sending_user_pk, username=sending_user_name
-            )
-        if receiving_user_pk != "None":
-            matched_user = get_object_or_404(
-                User, pk=receiving_user_pk, username=receiving_user_name
-            )
+    async def chat_message(self, event):
+        """function to send chat message to the room_group_name (a new
+        message is not seen yet, the receiving frontend reports it as seen)
+        """
 
-        # get the message object by pk (and other stuff to prevent misuse)
-        try:
-            chat_object = MessageChat.objects.get(
-                pk=message_pk, user=current_user, other=matched_user, message=message
-            )
-        except MessageChat.DoesNotExist:
-            chat_object = None
-
-        # check if valid user where found
-        if chat_object:
-            message_sent_date = chat_object.sent_date.strftime("%Y-%m-%d")
-            message_sent_time = chat_object.sent_date.strftime("%I:%M %p").lstrip("0")
-            # check if this user is the receiver
-            if self.scope["user"] == chat_object.other and not chat_object.seen_date:
-                # set seen_date to now!
-                chat_object.seen_date = timezone.now()
-                chat_object.save()
-                message_seen_date = chat_object.seen_date.strftime("%Y-%m-%d")
-                message_seen_time = chat_object.seen_date.strftime("%H:%M:%S")
+        # only messages delivered to the current user can be seen by it
+        if event["receiving_user_pk"] == str(self.current_user.pk):
+            self.delivered.add(event["message_pk"])
 
         # serialize data and send to the room_group_name
-        self.send(
+        await self.send(
             text_data=json.dumps(
                 {
                     "type": "chat",
-                    "message_pk": chat_object.pk if chat_object else None,
+                    "message_pk": event["message_pk"],
                     "message": event["message"],
-                    "message_sent_date": message_sent_date,
-                    "message_sent_time": message_sent_time,
-                    "message_seen_date": message_seen_date,
-                    "message_seen_time": message_seen_time,
+                    "message_sent_date": event["message_sent_date"],
+                    "message_sent_time": event["message_sent_time"],
+                    "message_seen_date": None,
+                    "message_seen_time": None,
                     "sending_user_pk": event["sending_user_pk"],
                     "sending_user": event["sending_user"],
                     "receiving_user_pk": event["receiving_user_pk"],
@@ -181,3 +142,103 @@ class ChatConsumer(WebsocketConsumer):
                 }
             )
         )
+
+    async def chat_read(self, event):
+        """function to send a read receipt to the room_group_name: the user
+        read the messages sent to it up to the id read_up_to
+        """
+        await self.send(
+            text_data=json.dumps(
+                {
+                    "type": "read",
+                    "user_pk": event["user_pk"],
+                    "read_up_to": event["read_up_to"],
+                }
+            )
+        )
+
+    def mark_seen(self, message_pk):
+        """collect a message drawn by the current user (its receiver) into
+        the read receipt which is sent by the pending task
+        """
+        if message_pk not in self.delivered:
+            return
+        self.delivered.discard(message_pk)
+        self.read_id = max(self.read_id or 0, message_pk)
+        if not self.read_task or self.read_task.done():
+            self.read_task = asyncio.create_task(self.send_read_later())
+
+    async def send_read_later(self):
+        await asyncio.sleep(settings.CHAT_READ_RECEIPT_INTERVAL)
+        await self.send_read()
+        # messages seen while the receipt was stored are sent with the next
+        if self.read_id is not None:
+            self.read_task = asyncio.create_task(self.send_read_later())
+
+    async def send_read(self):
+        """store the read receipt (one UPDATE) and send it to the chatroom"""
+        read_id = self.read_id
+        if read_id is None:
+            return
+        await self.store_read(read_id)
+        if self.read_id == read_id:
+            self.read_id = None
+        await self.channel_layer.group_send(
+            self.room_group_name,
+            {
+                "type": "chat_read",
+                "user_pk": str(self.current_user.pk),
+                "read_up_to": read_id,
+            },
+        )
+
+    @database_sync_to_async
+    def load_chatroom(self) -> UserMatch | None:
+        """return the match (with both users) of the chatroom of the session,
+        None without chatroom or if the current user is not a user of it
+        """
+
+        # obtain the chatroom uuid from the session of the current user!
+        chatroom_uuid = self.scope["session"].get("chatroom_uuid", None)
+        user_pk = self.scope["user"].pk
+        if not chatroom_uuid or not user_pk:
+            return None
+        try:
+            return (
+                UserMatch.objects.select_related("user", "other")
+                .only("chatroom_uuid", "user__username", "other__username")
+                .get(
+                    Q(user_id=user_pk) | Q(other_id=user_pk),
+                    chatroom_uuid=chatroom_uuid,
+                    unmatched=False,
+                )
+            )
+        except UserMatch.DoesNotExist:
+            return None
+
+    @database_sync_to_async
+    def store_read(self, read_id: int):
+        """store that the current user read the chat up to read_id"""
+        self.user_match.read(self.current_user.pk, read_id)
+
+    @database_sync_to_async
+    def store_message(self, message: str) -> MessageChat | None:
+        """store a new message of the current user to the matched user and
+        return it (None for a repeated one)
+        """
+
+        # get last send message
+        chat_object = MessageChat.objects.filter(
+            user=self.current_user, other=self.matched_user, message=message
+        ).last()
+
+        # check if last message is exact same message as current one!
+        if chat_object and timezone.now().strftime(
+            "%H%M%S"
+        ) <= chat_object.sent_date.strftime("%H%M%S"):
+            return None
+
+        # create new message in database!
+        return MessageChat.objects.create(
+            user=self.current_user, other=self.matched_user, message=message
+        )
@@ -0,0 +1,186 @@
+import asyncio
+import threading
+import time
+import tracemalloc
+import uuid
+import numpy as np
+from django.contrib.sessions.backends.db import SessionStore
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import setup_databases, teardown_databases
+from django.utils.module_loading import import_string
+from channels.testing import WebsocketCommunicator
+
+from app_users.models import User, UserMatch
+from hotsox_prediction.benchmark import benchmark_metadata, write_results
+
+
+class Command(BaseCommand):
+    help = (
+        "measures how many idle chat sockets one process holds (connect time, "
+        "memory & threads per socket) and the chat messages per second of the "
+        "ChatConsumer (in-memory channel layer, new test database), saved as json"
+    )
+
+    # seconds to wait for a message of the consumer
+    TIMEOUT = 60
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--connections", type=int, nargs="+", default=[100, 1000, 5000]
+        )
+        parser.add_argument("--rooms", type=int, default=50)
+        parser.add_argument("--messages", type=int, default=500)
+        parser.add_argument(
+            "--consumer",
+            default="app_chat.consumers.ChatConsumer",
+            help="dotted path of the consumer class (e.g. a former implementation)",
+        )
+        parser.add_argument("--output", default="benchmark_chat_django.json")
+
+    def communicator(self, application, user, chatroom_uuid) -> WebsocketCommunicator:
+        """a chat socket of user (scope like the session & auth middlewares)"""
+        communicator = WebsocketCommunicator(application, "/chat/")
+        session = SessionStore()
+        session["chatroom_uuid"] = chatroom_uuid
+        communicator.scope["session"] = session
+        communicator.scope["user"] = user
+        return communicator
+
+    async def connect(self, application, rooms: list, amount: int) -> tuple:
+        """open amount sockets (both users of the rooms in turn), return them
+        by room and the metrics of the idle sockets
+        """
+        threads = threading.active_count()
+        tracemalloc.start()
+        start = time.perf_counter()
+        sockets = {}
+        for index in range(amount):
+            users, chatroom_uuid = rooms[index // 2 % len(rooms)]
+            sockets.setdefault(chatroom_uuid, []).append(
+                self.communicator(application, users[index % 2], chatroom_uuid)
+            )
+        connected = await asyncio.gather(
+            *(
+                communicator.connect(timeout=self.TIMEOUT)
+                for communicators in sockets.values()
+                for communicator in communicators
+            )
+        )
+        seconds = time.perf_counter() - start
+        memory = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        return sockets, {
+            "connected": sum(accepted for accepted, _ in connected),
+            "connect_s": round(seconds, 3),
+            "kb_per_socket": round(memory / amount / 2**10, 3),
+            "threads": threading.active_count() - threads,
+        }
+
+    async def chat(self, rooms: list, sockets: dict, messages: int) -> dict:
+        """send messages (spread over the rooms, the rooms chat at the same
+        time) and wait until every socket of the room received each of them
+        """
+
+        async def chat_in_room(users, chatroom_uuid, amount):
+            communicators = sockets.get(chatroom_uuid, [])
+            latencies = []
+            for index in range(amount if communicators else 0):
+                start = time.perf_counter()
+                await communicators[0].send_json_to(
+                    {
+                        # every text once, equal texts of a second are skipped
+                        "message": f"hot sox {chatroom_uuid} {index}",
+                        "sending_user_pk": str(users[0].pk),
+                        "sending_user": users[0].username,
+                        "receiving_user_pk": str(users[1].pk),
+                        "receiving_user": users[1].username,
+                    }
+                )
+                await asyncio.gather(
+                    *(
+                        communicator.receive_json_from(timeout=self.TIMEOUT)
+                        for communicator in communicators
+                    )
+                )
+                latencies.append((time.perf_counter() - start) * 1000)
+            return latencies
+
+        start = time.perf_counter()
+        latencies = await asyncio.gather(
+            *(
+                chat_in_room(users, chatroom_uuid, messages // len(rooms))
+                for users, chatroom_uuid in rooms
+            )
+        )
+        seconds = time.perf_counter() - start
+        latencies = [latency for room in latencies for latency in room]
+        p50, p99 = np.percentile(latencies, [50, 99]) if latencies else (0.0, 0.0)
+        return {
+            "messages": len(latencies),
+            "messages_per_s": round(len(latencies) / seconds, 1),
+            "ms_p50": round(float(p50), 3),
+            "ms_p99": round(float(p99), 3),
+        }
+
+    async def benchmark(self, application, rooms: list, kwargs) -> list:
+        scales = []
+        for amount in sorted(kwargs["connections"]):
+            sockets, idle = await self.connect(application, rooms, amount)
+            chat = await self.chat(rooms, sockets, kwargs["messages"])
+            await asyncio.gather(
+                *(
+                    communicator.disconnect(timeout=self.TIMEOUT)
+                    for communicators in sockets.values()
+                    for communicator in communicators
+                )
+            )
+            scales.append({"connections": amount, "idle": idle, "chat": chat})
+            self.stdout.write(
+                f"{amount:>6} sockets: connect {idle['connect_s']:7.2f}s "
+                f"{idle['kb_per_socket']:7.1f}KB/socket {idle['threads']:4} threads "
+                f"| {chat['messages_per_s']:8.1f} messages/s "
+                f"p50 {chat['ms_p50']:8.1f}ms p99 {chat['ms_p99']:8.1f}ms"
+            )
+        return scales
+
+    def handle(self, *args, **kwargs):
+        application = import_string(kwargs["consumer"]).as_asgi()
+        databases = setup_databases(verbosity=0, interactive=False)
+        try:
+            users = User.objects.bulk_create(
+                [
+                    User(
+                        username=f"benchmark{index}",
+                        email=f"benchmark{index}@hotsox.test",
+                    )
+                    for index in range(2 * kwargs["rooms"])
+                ]
+            )
+            # two users & the chatroom uuid of their match per room
+            rooms = [
+                (users[index : index + 2], str(uuid.uuid4()))
+                for index in range(0, len(users), 2)
+            ]
+            matches = [
+                UserMatch(user=user, other=other, chatroom_uuid=chatroom_uuid)
+                for (user, other), chatroom_uuid in rooms
+            ]
+            for match in matches:
+                match.low_id, match.high_id = UserMatch.pair(
+                    match.user_id, match.other_id
+                )
+            UserMatch.objects.bulk_create(matches)
+            database = connection.vendor
+            scales = asyncio.run(self.benchmark(application, rooms, kwargs))
+        finally:
+            teardown_databases(databases, verbosity=0)
+
+        results = {
+            **benchmark_metadata("django", database),
+            "consumer": kwargs["consumer"],
+            "settings": {key: kwargs[key] for key in ("rooms", "messages")},
+            "scales": scales,
+        }
+        write_results(kwargs["output"], results)
+        self.stdout.write(f"results saved to {kwargs['output']}")
@@ -0,0 +1,194 @@
+from django.test import TransactionTestCase, override_settings
+from django.contrib.sessions.backends.db import SessionStore
+from app_users.models import User, UserMatch, MessageChat
+from asgiref.sync import async_to_sync
+from channels.db import database_sync_to_async
+from channels.testing import WebsocketCommunicator
+from datetime import date
+
+from .consumers import ChatConsumer
+
+import json
+import uuid
+
+
+class Test(TransactionTestCase):
+    def setUp(self):
+        self.user1 = User.objects.create(
+            username="quirk-unicorn 1",
+            email="quirk-unicorn1@example.com",
+            info_birthday=date(2000, 1, 1),
+            location_latitude=0,
+            location_longitude=0,
+        )
+        self.user2 = User.objects.create(
+            username="quirk-unicorn 2",
+            email="quirk-unicorn2@example.com",
+            info_birthday=date(2000, 1, 1),
+            location_latitude=0,
+            location_longitude=0,
+        )
+        self.chatroom_uuid = str(
+            UserMatch.objects.create(
+                user=self.user1, other=self.user2, chatroom_uuid=uuid.uuid4()
+            ).chatroom_uuid
+        )
+
+    def communicator(self, user, chatroom_uuid) -> WebsocketCommunicator:
+        """a chat socket of user (scope like the session & auth middlewares)"""
+        communicator = WebsocketCommunicator(ChatConsumer.as_asgi(), "/chat/")
+        session = SessionStore()
+        if chatroom_uuid:
+            session["chatroom_uuid"] = chatroom_uuid
+        communicator.scope["session"] = session
+        communicator.scope["user"] = user
+        return communicator
+
+    def message(self, text: str) -> dict:
+        return {
+            "message": text,
+            "sending_user_pk": str(self.user1.pk),
+            "sending_user": self.user1.username,
+            "receiving_user_pk": str(self.user2.pk),
+            "receiving_user": self.user2.username,
+        }
+
+    async def test_no_chat_without_chatroom(self):
+        communicator = self.communicator(self.user1, None)
+        connected, _ = await communicator.connect()
+        self.assertFalse(connected)
+
+    async def test_no_chat_of_other_users(self):
+        user3 = await database_sync_to_async(User.objects.create)(
+            username="quirk-unicorn 3",
+            email="quirk-unicorn3@example.com",
+            info_birthday=date(2000, 1, 1),
+            location_latitude=0,
+            location_longitude=0,
+        )
+        communicator = self.communicator(user3, self.chatroom_uuid)
+        connected, _ = await communicator.connect()
+        self.assertFalse(connected)
+
+    async def test_no_message_as_other_user(self):
+        communicator = self.communicator(self.user2, self.chatroom_uuid)
+        await communicator.connect()
+        await communicator.send_json_to(self.message("hot sox!"))
+        self.assertTrue(await communicator.receive_nothing())
+        self.assertFalse(await database_sync_to_async(MessageChat.objects.exists)())
+        await communicator.disconnect()
+
+    def test_chat_message_without_queries(self):
+        consumer = ChatConsumer()
+        # the state of a connected socket of the receiving user
+        consumer.current_user, consumer.delivered = self.user2, set()
+        sent = []
+
+        async def send(text_data):
+            sent.append(json.loads(text_data))
+
+        consumer.send = send
+        event = {
+            "type": "chat_message",
+            "message_pk": 1,
+            "message": "hot sox!",
+            "message_sent_date": "2026-10-18",
+            "message_sent_time": "9:30 PM",
+            "sending_user_pk": str(self.user1.pk),
+            "sending_user": self.user1.username,
+            "receiving_user_pk": str(self.user2.pk),
+            "receiving_user": self.user2.username,
+        }
+        # the sockets of the chatroom get the message of the group event
+        with self.assertNumQueries(0):
+            async_to_sync(consumer.chat_message)(event)
+        self.assertEqual(1, sent[0]["message_pk"])
+        self.assertEqual("9:30 PM", sent[0]["message_sent_time"])
+        self.assertEqual(self.user1.username, sent[0]["sending_user"])
+        self.assertEqual({1}, consumer.delivered)
+
+    async def test_chat_message(self):
+        sender = self.communicator(self.user1, self.chatroom_uuid)
+        receiver = self.communicator(self.user2, self.chatroom_uuid)
+        self.assertTrue((await sender.connect())[0])
+        self.assertTrue((await receiver.connect())[0])
+
+        await sender.send_json_to(self.message("hot sox!"))
+        sent, received = (
+            await sender.receive_json_from(),
+            await receiver.receive_json_from(),
+        )
+
+        chat_object = await database_sync_to_async(MessageChat.objects.get)()
+        for response in (sent, received):
+            self.assertEqual("chat", response["type"])
+            self.assertEqual(chat_object.pk, response["message_pk"])
+            self.assertEqual("hot sox!", response["message"])
+            self.assertEqual(self.user1.username, response["sending_user"])
+        self.assertEqual(
+            chat_object.sent_date.strftime("%Y-%m-%d"), received["message_sent_date"]
+        )
+        # the receiving frontend reports the message as seen (was_seen)
+        self.assertIsNone(chat_object.seen_date)
+        self.assertIsNone(received["message_seen_time"])
+
+        await sender.disconnect()
+        await receiver.disconnect()
+
+    @override_settings(CHAT_READ_RECEIPT_INTERVAL=0.1)
+    async def test_chat_message_was_seen(self):
+        sender = self.communicator(self.user1, self.chatroom_uuid)
+        receiver = self.communicator(self.user2, self.chatroom_uuid)
+        await sender.connect()
+        await receiver.connect()
+
+        received = []
+        for index in range(3):
+            await sender.send_json_to(self.message(f"hot sox {index}!"))
+            await sender.receive_json_from()
+            received.append(await receiver.receive_json_from())
+        # both frontends report the messages they have drawn
+        for message in received:
+            for communicator in (sender, receiver):
+                await communicator.send_json_to(
+                    {
+                        **self.message(message["message"]),
+                        "was_seen": True,
+                        "message_pk": message["message_pk"],
+                    }
+                )
+
+        # only the receiving user reads the messages: one read receipt for
+        # all of them
+        read_up_to = received[-1]["message_pk"]
+        for communicator in (sender, receiver):
+            self.assertEqual(
+                {
+                    "type": "read",
+                    "user_pk": str(self.user2.pk),
+                    "read_up_to": read_up_to,
+                },
+                await communicator.receive_json_from(),
+            )
+            self.assertTrue(await communicator.receive_nothing())
+        user_match = await database_sync_to_async(UserMatch.objects.get)()
+        self.assertEqual(read_up_to, user_match.read_id(self.user2.pk))
+        self.assertIsNone(user_match.read_id(self.user1.pk))
+        self.assertFalse(
+            await database_sync_to_async(
+                MessageChat.objects.filter(seen_date=None).exists
+            )()
+        )
+
+        # the pending receipt is sent when the socket is closed
+        await sender.send_json_to(self.message("bye!"))
+        await sender.receive_json_from()
+        message = await receiver.receive_json_from()
+        await receiver.send_json_to(
+            {**message, "was_seen": True, "message_pk": message["message_pk"]}
+        )
+        await receiver.disconnect()
+        self.assertEqual(
+            message["message_pk"], (await sender.receive_json_from())["read_up_to"]
+        )
+        await sender.disconnect()
@@ -0,0 +1,123 @@
+import importlib.util
+import os
+import unittest
+from django.conf import settings
+from django.test import SimpleTestCase, TransactionTestCase, override_settings
+from django.contrib.sessions.backends.db import SessionStore
+from app_users.models import User, UserMatch, MessageChat
+from channels.db import database_sync_to_async
+from channels.layers import get_channel_layer
+from channels.testing import WebsocketCommunicator
+from datetime import date
+from unittest import mock
+
+from .consumers import ChatConsumer
+
+import uuid
+
+
+def load_settings(**environ):
+    """the project settings evaluated with the given environment variables"""
+    spec = importlib.util.spec_from_file_location(
+        "settings_under_test", settings.BASE_DIR / "hotsox_project" / "settings.py"
+    )
+    module = importlib.util.module_from_spec(spec)
+    with mock.patch.dict(os.environ, environ):
+        spec.loader.exec_module(module)
+    return module
+
+
+class ChannelLayerSettingsTest(SimpleTestCase):
+    def test_redis_layer_selected_by_url(self):
+        # no redis needed: the layer connects on its first message
+        url = "redis://redis-django:6379/0"
+        layers = load_settings(CHANNEL_LAYER_URL=url).CHANNEL_LAYERS
+        with override_settings(CHANNEL_LAYERS=layers):
+            layer = get_channel_layer()
+        self.assertEqual("channels_redis.core", type(layer).__module__)
+        self.assertEqual("RedisChannelLayer", type(layer).__name__)
+        self.assertEqual([{"address": url}], layer.hosts)
+        self.assertEqual("hotsox_chat", layer.prefix)
+
+    def test_in_memory_layer_without_url(self):
+        environ = {key: value for key, value in os.environ.items()}
+        environ.pop("CHANNEL_LAYER_URL", None)
+        with mock.patch.dict(os.environ, environ, clear=True):
+            layers = load_settings().CHANNEL_LAYERS
+        self.assertEqual(
+            "channels.layers.InMemoryChannelLayer", layers["default"]["BACKEND"]
+        )
+
+
+@unittest.skipUnless(
+    os.getenv("CHANNEL_LAYER_TEST_URL"), "CHANNEL_LAYER_TEST_URL (redis) not set"
+)
+@override_settings(
+    CHANNEL_LAYERS={
+        worker: {
+            "BACKEND": "channels_redis.core.RedisChannelLayer",
+            "CONFIG": {
+                "hosts": [os.getenv("CHANNEL_LAYER_TEST_URL")],
+                "prefix": "test-chat",
+            },
+        }
+        for worker in ("default", "worker_a", "worker_b")
+    }
+)
+class MultiWorkerChatTest(TransactionTestCase):
+    def setUp(self):
+        self.user1 = User.objects.create(
+            username="quirk-unicorn 1",
+            email="quirk-unicorn1@example.com",
+            info_birthday=date(2000, 1, 1),
+            location_latitude=0,
+            location_longitude=0,
+        )
+        self.user2 = User.objects.create(
+            username="quirk-unicorn 2",
+            email="quirk-unicorn2@example.com",
+            info_birthday=date(2000, 1, 1),
+            location_latitude=0,
+            location_longitude=0,
+        )
+        self.chatroom_uuid = str(
+            UserMatch.objects.create(
+                user=self.user1, other=self.user2, chatroom_uuid=uuid.uuid4()
+            ).chatroom_uuid
+        )
+
+    def communicator(self, worker, user) -> WebsocketCommunicator:
+        """a chat socket of user served by the consumer of a worker"""
+        consumer = type(worker, (ChatConsumer,), {"channel_layer_alias": worker})
+        communicator = WebsocketCommunicator(consumer.as_asgi(), "/chat/")
+        session = SessionStore()
+        session["chatroom_uuid"] = self.chatroom_uuid
+        communicator.scope["session"] = session
+        communicator.scope["user"] = user
+        return communicator
+
+    async def test_chat_across_workers(self):
+        sender = self.communicator("worker_a", self.user1)
+        receiver = self.communicator("worker_b", self.user2)
+        self.assertTrue((await sender.connect())[0])
+        self.assertTrue((await receiver.connect())[0])
+
+        await sender.send_json_to(
+            {
+                "message": "hot sox!",
+                "sending_user_pk": str(self.user1.pk),
+                "sending_user": self.user1.username,
+                "receiving_user_pk": str(self.user2.pk),
+                "receiving_user": self.user2.username,
+            }
+        )
+        received = await receiver.receive_json_from(timeout=5)
+        sent = await sender.receive_json_from(timeout=5)
+
+        chat_object = await database_sync_to_async(MessageChat.objects.get)()
+        self.assertEqual(chat_object.pk, received["message_pk"])
+        self.assertEqual(chat_object.pk, sent["message_pk"])
+        self.assertEqual("hot sox!", received["message"])
+
+        await sender.disconnect()
+        await receiver.disconnect()
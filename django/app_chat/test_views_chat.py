@@ -2,6 +2,8 @@ from django.test import TestCase
 from app_users.models import User, UserMatch, MessageChat
 from datetime import date, timedelta
 
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 
 from importlib import import_module
@@ -69,6 +71,18 @@ class Test(TestCase):
             social_spotify="https://www.spotify.com/quirk_unicorn/",
         )
 
+    def test_no_chat_without_login(self):
+        # even with a legacy match row without pair an anonymous user is sent
+        # to the login page
+        UserMatch.objects.bulk_create(
+            [UserMatch(user=self.user1, other=self.user2, chatroom_uuid=uuid.uuid4())]
+        )
+        for name in ("app_chat:chat", "app_chat:chat-history"):
+            url = reverse(name, kwargs={"matched_user_name": self.user2.username})
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 302)
+            self.assertTrue(response["location"].startswith("/user/login/?next="))
+
     def test_no_chat_with_none_existing_user(self):
         # log user in
         self.client.force_login(user=self.user1)
@@ -140,12 +154,82 @@ class Test(TestCase):
             reverse("app_chat:chat", kwargs={"matched_user_name": self.user2.username})
         )
 
-        # check if chats are maxed @ 300
+        # check if only the latest page of chats is shown (oldest first)
         # check if chats for the "other user" are set to seen
         self.assertEqual(response.status_code, 200)
         self.assertTemplateUsed("app_chat/chat_lobby.html")
-        self.assertEqual(len(response.context["all_chats"]), 300)
-        # my chat is not been seen yet!
-        self.assertEqual(response.context["all_chats"][0].seen_date, None)
-        # I have seen this chat!
-        self.assertNotEqual(response.context["all_chats"][299].seen_date, None)
+        all_chats = response.context["all_chats"]
+        self.assertEqual(len(all_chats), MessageChat.HISTORY_PAGE_SIZE)
+        self.assertEqual(all_chats[-1], MessageChat.objects.latest("pk"))
+        self.assertIsNotNone(response.context["history_cursor"])
+        # no chat is deleted anymore
+        self.assertEqual(MessageChat.objects.count(), 400)
+        # I have seen these chats!
+        self.assertFalse(
+            MessageChat.objects.filter(other=self.user1, seen_date=None).exists()
+        )
+        # my chats are not been seen yet!
+        self.assertFalse(
+            MessageChat.objects.filter(other=self.user2)
+            .exclude(seen_date=None)
+            .exists()
+        )
+
+    def test_chat_history(self):
+        UserMatch.objects.create(
+            user=self.user1, other=self.user2, chatroom_uuid=uuid.uuid4()
+        )
+        for i in range(60):
+            MessageChat.objects.create(
+                user=self.user1, other=self.user2, message=f"Test {i}!"
+            )
+            MessageChat.objects.create(
+                user=self.user2, other=self.user1, message=f"Answer {i}!"
+            )
+
+        # walk through the history page by page
+        self.client.force_login(user=self.user1)
+        url = reverse(
+            "app_chat:chat-history", kwargs={"matched_user_name": self.user2.username}
+        )
+        pages = [self.client.get(url).json()]
+        while pages[-1]["next"]:
+            pages.append(self.client.get(url, {"before": pages[-1]["next"]}).json())
+
+        self.assertEqual([50, 50, 20], [len(page["messages"]) for page in pages])
+        # every chat once, the newest first
+        self.assertEqual(
+            list(MessageChat.objects.order_by("-sent_date", "-pk").values_list("pk")),
+            [(chat["message_pk"],) for page in pages for chat in page["messages"]],
+        )
+        self.assertEqual(self.user2.username, pages[0]["messages"][0]["sending_user"])
+        # the same time format as the messages of the socket
+        newest = MessageChat.objects.latest("pk")
+        self.assertEqual(newest.sent_time, pages[0]["messages"][0]["message_sent_time"])
+
+        self.assertEqual(400, self.client.get(url, {"before": "invalid"}).status_code)
+        self.client.force_login(user=User.objects.create(username="quirk-unicorn 3"))
+        self.assertEqual(404, self.client.get(url).status_code)
+
+    def test_chat_with_match_same_queries_for_long_chats(self):
+        UserMatch.objects.create(
+            user=self.user1, other=self.user2, chatroom_uuid=uuid.uuid4()
+        )
+        self.client.force_login(user=self.user1)
+        url = reverse(
+            "app_chat:chat", kwargs={"matched_user_name": self.user2.username}
+        )
+
+        # the first request creates the session
+        self.client.get(url)
+        queries = []
+        for chats in (10, 500):
+            MessageChat.objects.bulk_create(
+                MessageChat(user=self.user2, other=self.user1, message="Test!")
+                for i in range(chats)
+            )
+            with CaptureQueriesContext(connection) as context:
+                self.assertEqual(200, self.client.get(url).status_code)
+            queries.append(len(context.captured_queries))
+        # opening a long chat costs as many queries as a short one
+        self.assertEqual(queries[0], queries[1])
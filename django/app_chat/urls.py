@@ -3,4 +3,11 @@ from . import views
 
 
 app_name = "app_chat"
-urlpatterns = [path("<str:matched_user_name>", views.chat_with_match, name="chat")]
+urlpatterns = [
+    path("<str:matched_user_name>", views.chat_with_match, name="chat"),
+    path(
+        "<str:matched_user_name>/history",
+        views.chat_history,
+        name="chat-history",
+    ),
+]
@@ -1,67 +1,95 @@
+from django.contrib.auth.decorators import login_required
 from django.shortcuts import render, redirect
+from django.http import JsonResponse
 from django.urls import reverse
 from app_users.models import User, UserMatch, MessageChat
-from django.db.models import Q
 
-from django.utils import timezone
+
+def get_match(request, matched_user_name: str) -> tuple:
+    """return the matched user & the UserMatch object of the current user and
+    matched_user_name, (None, None) if they are not matched (anymore)
+    """
+    try:
+        matched_user = User.objects.get(username=matched_user_name)
+        user_match_object = UserMatch.between(request.user, matched_user).get()
+    except (User.DoesNotExist, UserMatch.DoesNotExist):
+        return None, None
+    if user_match_object.unmatched:
+        return None, None
+    return matched_user, user_match_object
 
 
 # TODO: rewrite as classbased view
+@login_required
 def chat_with_match(request, matched_user_name):
     """Main view to initiate a new chat conversation
-    Gather the User, matched user, and all the chats that have been done
+    Gather the User, matched user, and the latest page of the chats that
+    have been done (older pages are loaded by chat_history)
     get a chatroom UUID
     """
 
     # define a url to redirect to if an invalid record is detected
     error_url = reverse("app_users:user-matches")
 
-    # get the other user object from the url argument
-    try:
-        matched_user = User.objects.get(username=matched_user_name)
-    except User.DoesNotExist:
-        # if no valid matched user was found we redirect to error url
-        return redirect(error_url)
-
-    # get the UserMatch object to obtain the chatroom UUID
-    try:
-        user_match_object = UserMatch.objects.get(
-            Q(user=request.user, other=matched_user)
-            | Q(user=matched_user, other=request.user)
-        )
-        if user_match_object.unmatched:
-            return redirect(error_url)
-        chatroom_uuid = str(user_match_object.chatroom_uuid)
-        request.session["chatroom_uuid"] = chatroom_uuid
-    except UserMatch.DoesNotExist:
-        # if no valid match was found we redirect to error url
+    # get the other user object from the url argument and the UserMatch
+    # object to obtain the chatroom UUID
+    matched_user, user_match_object = get_match(request, matched_user_name)
+    if not user_match_object:
+        # if no valid matched user/ match was found we redirect to error url
         return redirect(error_url)
+    chatroom_uuid = str(user_match_object.chatroom_uuid)
+    request.session["chatroom_uuid"] = chatroom_uuid
 
-    # get all chats send my the current user (to matched user)
-    all_chats = MessageChat.objects.filter(
-        Q(user=request.user, other=matched_user)
-        | Q(user=matched_user, other=request.user)
-    ).order_by("sent_date")
+    # the latest page of the chats between both users (newest first)
+    chats, history_cursor = MessageChat.history(request.user.pk, matched_user.pk)
 
     # every chat message that was sent by the matched users
-    # will be marked as seen since it is now displayed to the user
-    # every message that was stored above the max count will be deleted
-    max_allowes_stored_chats = 300
-    max_allowes_stored_chats_count = 0
-    for chat in all_chats:
-        if max_allowes_stored_chats_count >= max_allowes_stored_chats:
-            chat.delete()
-        else:
-            if chat.other == request.user:
-                if not chat.seen_date:
-                    chat.seen_date = timezone.now()
-                    chat.save()
-        max_allowes_stored_chats_count += 1
+    # will be marked as seen since the chat is now displayed to the user
+    # (read receipt up to the newest message)
+    user_match_object.read(request.user.pk)
 
     context = {
         "sending_user": request.user,
         "receiving_user": matched_user,
-        "all_chats": all_chats[:max_allowes_stored_chats],
+        "all_chats": chats[::-1],
+        "history_cursor": history_cursor,
+        # my chats up to this id have been seen by the matched user
+        "read_up_to": user_match_object.read_id(matched_user.pk) or 0,
         "chatroom_UUID": chatroom_uuid,
     }
     return render(request, "chat/chat_lobby.html", context)
+
+
+@login_required
+def chat_history(request, matched_user_name):
+    """json of the page of the chats sent before the cursor ?before= (the
+    "next" cursor of the previous page), the newest first
+    """
+    matched_user, user_match_object = get_match(request, matched_user_name)
+    if not user_match_object:
+        return JsonResponse({"detail": "no match"}, status=404)
+
+    before = request.GET.get("before", None)
+    if before is not None:
+        before = MessageChat.parse_cursor(before)
+        if before is None:
+            return JsonResponse({"detail": "invalid cursor"}, status=400)
+
+    chats, history_cursor = MessageChat.history(
+        request.user.pk, matched_user.pk, before=before
+    )
+    return JsonResponse(
+        {
+            "messages": [
+                {
+                    "message_pk": chat.pk,
+                    "message": chat.message,
+                    "message_sent_date": chat.sent_date.strftime("%Y-%m-%d"),
+                    "message_sent_time": chat.sent_time,
+                    "sending_user": chat.user.username,
+                }
+                for chat in chats
+            ],
+            "next": history_cursor,
+        }
+    )
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class AppHomeConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "app_home"
+
+    def ready(self):
+        import app_home.signals
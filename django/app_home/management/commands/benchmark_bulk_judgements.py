@@ -0,0 +1,87 @@
+import time
+import numpy as np
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from app_home.pre_prediction_algorithm import PrePredictionAlgorithm
+from app_users.models import Sock, SockLike
+from .benchmark_next_sock import Command as NextSockBenchmark
+
+
+class Command(NextSockBenchmark):
+    help = (
+        "compares storing swipes one by one (SockLike.judge, the single judge "
+        "endpoint) with one bulk judgement (SockLike.judge_many) of the same size"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--judgements", type=int, default=500)
+        # share of likes and of judged socks which already like the swiping sock
+        parser.add_argument("--likes", type=float, default=0.3)
+        parser.add_argument("--mutual", type=float, default=0.1)
+        parser.add_argument("--seed", type=int, default=1981)
+        parser.add_argument("--current-database", action="store_true")
+
+    def judgements(self, generator, sock: Sock, others: list, kwargs) -> list:
+        """random decisions of sock on the others, some of them like sock"""
+        likes = generator.random(len(others)) < kwargs["likes"]
+        mutual = generator.random(len(others)) < kwargs["mutual"]
+        SockLike.objects.bulk_create(
+            [
+                SockLike.new(other.pk, sock.pk, like=True)
+                for other, liked_back in zip(others, mutual)
+                if liked_back
+            ]
+        )
+        return [(other, bool(like)) for other, like in zip(others, likes)]
+
+    def measure(self, function) -> tuple:
+        """return the result, the queries and the time (seconds) of a call"""
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            result = function()
+            seconds = time.perf_counter() - start
+        return result, len(queries), seconds
+
+    def benchmark(self, generator, kwargs):
+        amount = kwargs["judgements"]
+        # two swiping socks of different users, each judges its own amount of socks
+        sock_ids = self.insert_socks(generator, 2 * amount + 4)
+        socks = list(
+            Sock.objects.filter(pk__in=sock_ids).select_related("user").order_by("pk")
+        )
+        single_sock, bulk_sock = socks[0], socks[2]
+        single = self.judgements(generator, single_sock, socks[4 : 4 + amount], kwargs)
+        bulk = self.judgements(generator, bulk_sock, socks[4 + amount :], kwargs)
+
+        def judge_one_by_one():
+            matches = 0
+            for other_sock, like in single:
+                PrePredictionAlgorithm.sock_judged(single_sock, other_sock.pk)
+                matches += SockLike.judge(single_sock, other_sock, like)[1] is not None
+            return matches
+
+        def judge_at_once():
+            judged, matches = SockLike.judge_many(bulk_sock, bulk)
+            PrePredictionAlgorithm.socks_judged(bulk_sock, judged)
+            return len(matches)
+
+        return [
+            (name, *self.measure(function))
+            for name, function in (
+                ("per swipe", judge_one_by_one),
+                ("bulk", judge_at_once),
+            )
+        ]
+
+    def handle(self, *args, **kwargs):
+        generator = np.random.default_rng(kwargs["seed"])
+        database, results = self.in_benchmark_database(
+            kwargs, lambda: self.benchmark(generator, kwargs)
+        )
+        self.stdout.write(f"{kwargs['judgements']} judgements ({database})")
+        for name, matches, queries, seconds in results:
+            self.stdout.write(
+                f"{name:>9}: {seconds * 1000:8.1f}ms {queries:6} queries "
+                f"{matches:4} new matches"
+            )
@@ -0,0 +1,228 @@
+import json
+import time
+import numpy as np
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import setup_databases, teardown_databases
+
+from app_home.pre_prediction_algorithm import PrePredictionAlgorithm
+from app_users.models import Sock, SockLike, SockProfilePicture, User
+from hotsox_prediction.benchmark import (
+    benchmark_metadata,
+    compare_results,
+    next_sock_phases,
+    synthetic_judgements,
+    synthetic_locations,
+    synthetic_sock_rows,
+    write_results,
+)
+from hotsox_prediction.candidate_queue import LocalCache
+from hotsox_prediction.geo_buckets import GeoBuckets
+from hotsox_prediction.sock_feature_store import SockFeatureStore
+
+
+class Rollback(Exception):
+    """leaves the transaction of a benchmark in the current database"""
+
+
+class Command(BaseCommand):
+    help = (
+        "measures the latency (p50/p99) and peak memory of "
+        "PrePredictionAlgorithm.get_next_sock on growing synthetic databases "
+        "(bulk inserted socks with like/dislike histories) and saves them as json"
+    )
+
+    # socks per synthetic user
+    SOCKS_PER_USER = 2
+    BATCH_SIZE = 5000
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--socks", type=int, nargs="+", default=[1000, 10000, 100000, 1000000]
+        )
+        parser.add_argument("--swipers", type=int, default=20)
+        parser.add_argument("--history", type=int, default=200)
+        parser.add_argument("--calls", type=int, default=5)
+        parser.add_argument("--seed", type=int, default=1981)
+        parser.add_argument("--output", default="benchmark_next_sock_django.json")
+        parser.add_argument("--compare", help="json result of a former run")
+        parser.add_argument(
+            "--current-database",
+            action="store_true",
+            help="use the configured database inside a rolled back transaction "
+            "instead of a new test database (e.g. an empty local postgres)",
+        )
+
+    def insert_socks(self, generator, amount: int) -> list:
+        """bulk insert amount socks (with a picture) of new users, return the ids"""
+        offset = User.objects.count()
+        users = User.objects.bulk_create(
+            [
+                User(
+                    username=f"benchmark{offset + index}",
+                    email=f"benchmark{offset + index}@hotsox.test",
+                    info_gender=str(generator.integers(1, 6)),
+                    location_city="benchmark",
+                    location_latitude=latitude,
+                    location_longitude=longitude,
+                    location_bucket=GeoBuckets.bucket(latitude, longitude),
+                )
+                for index, (latitude, longitude) in enumerate(
+                    synthetic_locations(generator, amount // self.SOCKS_PER_USER + 1)
+                )
+            ],
+            batch_size=self.BATCH_SIZE,
+        )
+        socks = Sock.objects.bulk_create(
+            [
+                Sock(
+                    user_id=users[index // self.SOCKS_PER_USER].pk,
+                    **{
+                        # the choices are stored as strings
+                        attribute: str(value)
+                        if attribute in SockFeatureStore.CODE_ATTRIBUTES
+                        else value
+                        for attribute, value in row.items()
+                    },
+                )
+                for index, row in enumerate(synthetic_sock_rows(generator, amount))
+            ],
+            batch_size=self.BATCH_SIZE,
+        )
+        sock_ids = [sock.pk for sock in socks]
+        SockProfilePicture.objects.bulk_create(
+            [
+                SockProfilePicture(sock_id=sock_id, profile_picture="benchmark")
+                for sock_id in sock_ids
+            ],
+            batch_size=self.BATCH_SIZE,
+        )
+        return sock_ids
+
+    def insert_judgements(self, judgements: list):
+        SockLike.objects.bulk_create(
+            [
+                SockLike.new(sock_id, judged_id, liked)
+                for sock_id, judged_id, liked in judgements
+            ],
+            batch_size=self.BATCH_SIZE,
+        )
+
+    def judge(self, next_sock, user, sock):
+        """dislike the next sock like the swipe view does"""
+        if next_sock is not None:
+            SockLike.objects.create(
+                sock=sock, target=next_sock, decision=SockLike.Decision.DISLIKE
+            )
+            PrePredictionAlgorithm.sock_judged(sock, next_sock.pk)
+
+    def benchmark(self, generator, kwargs) -> list:
+        scales, sock_ids = [], []
+        for amount in sorted(kwargs["socks"]):
+            # the database grows from scale to scale
+            start = time.perf_counter()
+            new_ids = self.insert_socks(generator, amount - len(sock_ids))
+            sock_ids += new_ids
+            swiper_ids = generator.choice(
+                new_ids, min(kwargs["swipers"], len(new_ids)), replace=False
+            )
+            # realistic histories of the swipers and of a sample of all socks
+            history_ids = generator.choice(
+                new_ids, max(1, len(new_ids) // 100), replace=False
+            )
+            self.insert_judgements(
+                synthetic_judgements(
+                    generator,
+                    sorted(set(swiper_ids.tolist()) | set(history_ids.tolist())),
+                    sock_ids,
+                    kwargs["history"],
+                )
+            )
+            insert_seconds = time.perf_counter() - start
+
+            start = time.perf_counter()
+            PrePredictionAlgorithm.feature_store = (
+                PrePredictionAlgorithm.build_feature_store()
+            )
+            store_seconds = time.perf_counter() - start
+
+            swipers = [
+                (sock.user, sock)
+                for sock in Sock.objects.filter(pk__in=swiper_ids.tolist())
+                .select_related("user")
+                .order_by("pk")
+            ]
+            phases = next_sock_phases(
+                PrePredictionAlgorithm.get_next_sock,
+                self.judge,
+                lambda user, sock: PrePredictionAlgorithm.candidate_queue.invalidate(
+                    user.pk, sock.pk
+                ),
+                swipers,
+                kwargs["calls"],
+            )
+            scales.append(
+                {
+                    "socks": len(sock_ids),
+                    "judgements": SockLike.objects.count(),
+                    "insert_s": round(insert_seconds, 3),
+                    "feature_store_s": round(store_seconds, 3),
+                    "phases": phases,
+                }
+            )
+            self.stdout.write(
+                f"{len(sock_ids):>8} socks: "
+                + " | ".join(
+                    f"{phase} p50 {metrics['ms_p50']:8.1f}ms "
+                    f"p99 {metrics['ms_p99']:8.1f}ms {metrics['peak_mb']:6.1f}MB"
+                    for phase, metrics in phases.items()
+                )
+            )
+        return scales
+
+    def in_benchmark_database(self, kwargs, benchmark) -> tuple:
+        """run benchmark() in a new test database (or in a rolled back
+        transaction of the current one) and return the database vendor and
+        the result
+        """
+        queue = PrePredictionAlgorithm.candidate_queue
+        judged_filter = PrePredictionAlgorithm.ranker.judged_filter
+        former = queue.cache, PrePredictionAlgorithm.feature_store
+        # the queues of the synthetic socks must not end up in the shared cache
+        queue.cache = judged_filter.cache = LocalCache()
+        databases = None
+        if not kwargs["current_database"]:
+            databases = setup_databases(verbosity=0, interactive=False)
+        try:
+            with transaction.atomic():
+                database = connection.vendor
+                result = benchmark()
+                raise Rollback
+        except Rollback:
+            pass
+        finally:
+            if databases is not None:
+                teardown_databases(databases, verbosity=0)
+            queue.cache = judged_filter.cache = former[0]
+            PrePredictionAlgorithm.feature_store = former[1]
+        return database, result
+
+    def handle(self, *args, **kwargs):
+        generator = np.random.default_rng(kwargs["seed"])
+        database, scales = self.in_benchmark_database(
+            kwargs, lambda: self.benchmark(generator, kwargs)
+        )
+
+        results = {
+            **benchmark_metadata("django", database),
+            "settings": {
+                key: kwargs[key] for key in ("swipers", "history", "calls", "seed")
+            },
+            "scales": scales,
+        }
+        write_results(kwargs["output"], results)
+        self.stdout.write(f"results saved to {kwargs['output']}")
+        if kwargs["compare"]:
+            with open(kwargs["compare"]) as file:
+                lines = compare_results(json.load(file), results)
+            self.stdout.write("\n".join(lines))
@@ -0,0 +1,68 @@
+import os
+import time
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from hotsox_prediction.benchmark import (
+    SyntheticSockSource,
+    synthetic_sock,
+    synthetic_store,
+)
+from hotsox_prediction.candidate_queue import CandidateQueue, LocalCache
+from hotsox_prediction.ranking import SockRanker
+from hotsox_prediction.text_similarity import MinHashTextSimilarity
+
+
+class Command(BaseCommand):
+    help = (
+        "compares the time of ranking a synthetic pool in this process with the "
+        "ranking on several worker processes (SockRanker.parallel)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--socks", type=int, default=1000000)
+        parser.add_argument("--workers", type=int, nargs="+", default=[2, 4, 8])
+        parser.add_argument("--count", type=int, default=51)
+        parser.add_argument("--rankings", type=int, default=3)
+        parser.add_argument("--seed", type=int, default=1981)
+
+    def measure(self, ranker, source, count, rankings) -> tuple:
+        """return the result and the average time (seconds) of the rankings"""
+        start = time.perf_counter()
+        for _ in range(rankings):
+            result = ranker.rank_candidates(source, count)
+        return result, (time.perf_counter() - start) / rankings
+
+    def handle(self, *args, **kwargs):
+        count, rankings = kwargs["count"], kwargs["rankings"]
+        store = synthetic_store(np.random.default_rng(kwargs["seed"]), kwargs["socks"])
+        source = SyntheticSockSource(store, synthetic_sock())
+        ranker = SockRanker(
+            CandidateQueue(LocalCache()),
+            ann_min_socks=float("inf"),
+            chunk_size=max(2000, kwargs["socks"] // 10),
+        )
+        # the signature tables are set up once, outside of the measurements
+        MinHashTextSimilarity.signature("hot sox")
+
+        self.stdout.write(
+            f"top {count} of {kwargs['socks']} socks, {os.cpu_count()} cores"
+        )
+        exact, serial_time = self.measure(ranker, source, count, rankings)
+        self.stdout.write(f"{1:>3} process: {serial_time * 1000:8.1f}ms")
+        for workers in kwargs["workers"]:
+            with ranker.parallel(store, workers) as scorer:
+                # the first ranking starts the worker processes
+                ranker.rank_candidates(source, count)
+                result, parallel_time = self.measure(ranker, source, count, rankings)
+            if scorer is None:
+                # less than 2 workers or a daemonic process (see SockRanker.parallel)
+                self.stderr.write(f"{workers:>3} workers: scored in this process")
+                continue
+            if result != exact:
+                self.stderr.write("the parallel ranking differs from the serial one")
+
+            self.stdout.write(
+                f"{workers:>3} workers: {parallel_time * 1000:8.1f}ms "
+                f"(speedup {serial_time / parallel_time:4.2f}x)"
+            )
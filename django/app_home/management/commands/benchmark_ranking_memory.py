@@ -0,0 +1,79 @@
+import time
+import tracemalloc
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from hotsox_prediction.benchmark import (
+    SyntheticSockSource,
+    synthetic_sock,
+    synthetic_store,
+)
+from hotsox_prediction.candidate_queue import CandidateQueue, LocalCache
+from hotsox_prediction.ranking import SockRanker
+from hotsox_prediction.text_similarity import MinHashTextSimilarity
+
+
+class Command(BaseCommand):
+    help = (
+        "compares the peak memory (tracemalloc) and the time of ranking the whole "
+        "pool at once with the streamed ranking of SockRanker on synthetic socks"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--socks", type=int, nargs="+", default=[10000, 50000, 200000]
+        )
+        parser.add_argument("--count", type=int, default=51)
+        parser.add_argument("--chunk-size", type=int, default=2000)
+        parser.add_argument("--seed", type=int, default=1981)
+
+    def measure(self, function) -> tuple:
+        """return the result, peak memory (bytes) and time (seconds) of a call"""
+        tracemalloc.start()
+        start = time.perf_counter()
+        result = function()
+        seconds = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        return result, peak, seconds
+
+    def handle(self, *args, **kwargs):
+        generator = np.random.default_rng(kwargs["seed"])
+        count = kwargs["count"]
+        ranker = SockRanker(
+            CandidateQueue(LocalCache()),
+            ann_min_socks=float("inf"),
+            chunk_size=kwargs["chunk_size"],
+        )
+        current_sock = synthetic_sock()
+        # the signature tables are set up once, outside of the measurements
+        MinHashTextSimilarity.signature("hot sox")
+
+        self.stdout.write(
+            f"top {count} of the pool, chunks of {kwargs['chunk_size']} socks"
+        )
+        for amount in kwargs["socks"]:
+            store = synthetic_store(generator, amount)
+            source = SyntheticSockSource(store, current_sock)
+
+            # former ranking: all ids of the pool in one engine
+            exact, full_peak, full_time = self.measure(
+                lambda: store.engine(
+                    [
+                        sock_id
+                        for chunk in source.unseen_sock_id_chunks(amount)
+                        for sock_id in chunk
+                    ]
+                ).top_k(current_sock, count)
+            )
+            streamed, stream_peak, stream_time = self.measure(
+                lambda: ranker.rank_candidates(source, count)
+            )
+            if streamed != exact:
+                self.stderr.write("the streamed ranking differs from the full one")
+
+            self.stdout.write(
+                f"{amount:>8} socks: whole pool {full_peak / 2**20:7.1f}MB "
+                f"{full_time * 1000:7.1f}ms | streamed {stream_peak / 2**20:5.1f}MB "
+                f"{stream_time * 1000:7.1f}ms"
+            )
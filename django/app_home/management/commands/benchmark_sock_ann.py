@@ -0,0 +1,137 @@
+import time
+import numpy as np
+from datetime import date
+from types import SimpleNamespace
+from django.core.management.base import BaseCommand
+
+from hotsox_prediction.sock_ann_index import SockANNIndex
+from hotsox_prediction.sock_scoring import SockScoringEngine
+from hotsox_prediction.text_similarity import MinHashTextSimilarity
+
+
+class Command(BaseCommand):
+    help = (
+        "compares the recall and latency of the approximate nearest neighbour "
+        "retrieval (SockANNIndex + exact re-ranking) with brute-force scoring "
+        "on synthetic socks"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--socks", type=int, default=100000)
+        parser.add_argument("--queries", type=int, default=50)
+        parser.add_argument("--count", type=int, default=50)
+        parser.add_argument("--candidates", type=int, default=300)
+        parser.add_argument("--leaf-size", type=int, default=512)
+        parser.add_argument(
+            "--approximations", type=float, nargs="+", default=[0.0, 0.5, 1.0, 2.0]
+        )
+        parser.add_argument("--seed", type=int, default=1981)
+
+    def synthetic_integers(self, generator, amount: int) -> np.ndarray:
+        """integer attributes of socks clustered around some typical socks"""
+        maxima = np.array(
+            [
+                SockScoringEngine.MAXIMA[attribute]
+                for attribute in SockScoringEngine.INTEGER_ATTRIBUTES
+            ]
+        )
+        prototypes = generator.integers(0, maxima + 1, (100, len(maxima)))
+        noise = generator.normal(0, maxima / 6, (amount, len(maxima)))
+        integers = prototypes[generator.integers(0, 100, amount)] + noise
+        return np.clip(np.rint(integers), 0, maxima).astype(np.int64)
+
+    def engine(self, keys, integers, days, signatures) -> SockScoringEngine:
+        texts = {attribute: [""] * len(keys) for attribute in ("info_special",)}
+        texts["info_about"] = texts["info_special"]
+        return SockScoringEngine.from_arrays(
+            keys=keys,
+            integers=integers,
+            days=days,
+            texts=texts,
+            signatures=signatures,
+        )
+
+    def handle(self, *args, **kwargs):
+        generator = np.random.default_rng(kwargs["seed"])
+        count = kwargs["count"]
+        integers = self.synthetic_integers(generator, kwargs["socks"])
+        days = np.full(
+            (len(integers), len(SockScoringEngine.DATE_ATTRIBUTES)),
+            date.today().toordinal(),
+        )
+        signatures = np.full(
+            (
+                len(integers),
+                len(SockScoringEngine.TEXT_ATTRIBUTES),
+                MinHashTextSimilarity.NUM_PERMUTATIONS,
+            ),
+            MinHashTextSimilarity.EMPTY,
+            dtype=np.uint32,
+        )
+        sock_ids = np.arange(len(integers))
+        queries = [
+            SimpleNamespace(
+                **dict(zip(SockScoringEngine.INTEGER_ATTRIBUTES, row)),
+                **dict.fromkeys(SockScoringEngine.DATE_ATTRIBUTES, date.today()),
+                **dict.fromkeys(SockScoringEngine.TEXT_ATTRIBUTES, ""),
+            )
+            for row in self.synthetic_integers(generator, kwargs["queries"])
+        ]
+
+        # brute force: score every sock
+        exact = []
+        start = time.perf_counter()
+        for query in queries:
+            engine = self.engine(sock_ids, integers, days, signatures)
+            scores = engine.score(query)
+            exact.append((scores, np.sort(scores)[-count]))
+        brute_force_time = (time.perf_counter() - start) / len(queries)
+        self.stdout.write(
+            f"{len(integers)} socks, top {count} of {len(queries)} queries, "
+            f"{kwargs['candidates']} candidates to re-rank"
+        )
+        self.stdout.write(f"brute force: {brute_force_time * 1000:.1f}ms per query")
+
+        index = SockANNIndex(leaf_size=kwargs["leaf_size"])
+        start = time.perf_counter()
+        index.insert_many(sock_ids.tolist(), integers)
+        self.stdout.write(f"index built in {time.perf_counter() - start:.2f}s")
+
+        # incremental updates: remove and insert 1000 socks
+        changed = generator.choice(sock_ids, 1000, replace=False)
+        start = time.perf_counter()
+        for sock_id in changed.tolist():
+            index.remove(sock_id)
+        index.insert_many(changed.tolist(), integers[changed])
+        self.stdout.write(
+            f"{(time.perf_counter() - start) / len(changed) * 1e6:.0f}us per "
+            "incremental remove & insert"
+        )
+
+        for approximation in kwargs["approximations"]:
+            index.approximation = approximation
+            recall, query_time = [], 0.0
+            for query, (scores, threshold) in zip(queries, exact):
+                start = time.perf_counter()
+                candidates = np.array(
+                    index.query(
+                        SockScoringEngine.encode_integers(query),
+                        kwargs["candidates"],
+                    ),
+                    dtype=np.int64,
+                )
+                engine = self.engine(
+                    candidates,
+                    integers[candidates],
+                    days[candidates],
+                    signatures[candidates],
+                )
+                keys, _ = engine.top_k(query, count)
+                query_time += time.perf_counter() - start
+                # share of the results which are as good as the exact top count
+                recall.append(np.mean(scores[keys] >= threshold) if keys else 0)
+
+            self.stdout.write(
+                f"approximation {approximation:.2f}: recall {np.mean(recall):.3f}, "
+                f"{query_time / len(queries) * 1000:.1f}ms per query"
+            )
@@ -0,0 +1,155 @@
+import random
+import time
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from hotsox_prediction.sock_scoring import SockScoringEngine
+from hotsox_prediction.text_similarity import MinHashTextSimilarity
+
+SYLLABLES = "ka lo mi su te ra no fi zu we pa do ri gu sa ne bo li ta mo".split()
+
+
+class Command(BaseCommand):
+    help = (
+        "compares the MinHash text similarity of the sock scoring with the "
+        "SequenceMatcher ratio (accuracy & speed) on synthetic sock texts"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--candidates", type=int, default=2000)
+        parser.add_argument("--queries", type=int, default=10)
+        parser.add_argument(
+            "--words", type=int, default=20, help="average words per text"
+        )
+        parser.add_argument("--seed", type=int, default=1981)
+
+    def build_vocabulary(self, generator: random.Random):
+        """random words with zipf distributed frequencies"""
+        self.vocabulary = sorted(
+            {
+                "".join(generator.choices(SYLLABLES, k=generator.randint(1, 3)))
+                for _ in range(3000)
+            }
+        )
+        self.weights = [1 / rank for rank in range(1, len(self.vocabulary) + 1)]
+
+    def synthetic_words(self, generator: random.Random, amount: int) -> list:
+        return generator.choices(self.vocabulary, self.weights, k=amount)
+
+    def mutate(self, generator: random.Random, text: list, rate: float) -> list:
+        """replace, insert or delete a share of the words of a text"""
+        text = list(text)
+        words = self.synthetic_words(generator, len(text))
+        for word in words[: max(1, int(len(text) * rate))]:
+            position = generator.randrange(len(text))
+            operation = generator.random()
+            if operation < 0.4:
+                text[position] = word
+            elif operation < 0.7 or len(text) == 1:
+                text.insert(position, word)
+            else:
+                del text[position]
+        return text
+
+    def synthetic_texts(self, generator: random.Random, amount: int, words: int):
+        """random texts, half of them are variations of earlier texts"""
+        texts = []
+        for _ in range(amount):
+            if texts and generator.random() < 0.5:
+                texts.append(self.mutate(generator, generator.choice(texts), 0.3))
+            else:
+                length = max(1, int(generator.gauss(words, words / 3)))
+                texts.append(self.synthetic_words(generator, length))
+        return texts
+
+    def handle(self, *args, **kwargs):
+        generator = random.Random(kwargs["seed"])
+        self.build_vocabulary(generator)
+        candidates = self.synthetic_texts(
+            generator, kwargs["candidates"], kwargs["words"]
+        )
+        # every query is a variation of a known source text
+        sources = [
+            generator.randrange(len(candidates)) for _ in range(kwargs["queries"])
+        ]
+        queries = [
+            " ".join(self.mutate(generator, candidates[source], 0.2))
+            for source in sources
+        ]
+        candidates = [" ".join(text) for text in candidates]
+
+        # signatures are precomputed when socks are saved
+        start = time.perf_counter()
+        signatures = MinHashTextSimilarity.signatures(candidates)
+        signature_time = time.perf_counter() - start
+
+        exact, estimated = [], []
+        exact_time = estimated_time = 0.0
+        for query in queries:
+            start = time.perf_counter()
+            exact.append(SockScoringEngine.text_ratios(query, candidates))
+            exact_time += time.perf_counter() - start
+
+            start = time.perf_counter()
+            estimated.append(
+                MinHashTextSimilarity.similarities(
+                    MinHashTextSimilarity.signature(query), signatures
+                )
+            )
+            estimated_time += time.perf_counter() - start
+
+        exact, estimated = np.array(exact), np.array(estimated)
+        errors = np.abs(exact - estimated)
+        top1 = np.mean(np.argmax(exact, axis=1) == np.argmax(estimated, axis=1))
+        top10 = np.mean(
+            [
+                len(
+                    set(np.argsort(-row_exact)[:10])
+                    & set(np.argsort(-row_estimated)[:10])
+                )
+                / 10
+                for row_exact, row_estimated in zip(exact, estimated)
+            ]
+        )
+        # the source text (or an identical one) should be the best match
+        exact_sources = np.mean(
+            [
+                exact[row, source] == exact[row].max()
+                for row, source in enumerate(sources)
+            ]
+        )
+        estimated_sources = np.mean(
+            [
+                estimated[row, source] == estimated[row].max()
+                for row, source in enumerate(sources)
+            ]
+        )
+        comparisons = len(queries) * len(candidates)
+
+        self.stdout.write(
+            f"{len(queries)} queries x {len(candidates)} texts of "
+            f"{np.mean([len(text) for text in candidates]):.0f} characters "
+            f"({MinHashTextSimilarity.NUM_PERMUTATIONS} permutations, "
+            f"shingles of {MinHashTextSimilarity.SHINGLE_SIZE})"
+        )
+        self.stdout.write(
+            f"SequenceMatcher: {exact_time / comparisons * 1e6:.2f}us per comparison"
+        )
+        self.stdout.write(
+            f"MinHash:         {estimated_time / comparisons * 1e6:.2f}us per comparison"
+            f" (+ {signature_time / len(candidates) * 1e6:.0f}us per text on save)"
+        )
+        self.stdout.write(
+            f"mean abs error {errors.mean():.3f}, max error {errors.max():.3f}, "
+            f"correlation {np.corrcoef(exact.ravel(), estimated.ravel())[0, 1]:.3f}"
+        )
+        self.stdout.write(
+            f"same best text in {top1:.0%} of the queries, "
+            f"top 10 overlap {top10:.0%}"
+        )
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"source text ranked first: SequenceMatcher {exact_sources:.0%}, "
+                f"MinHash {estimated_sources:.0%}"
+            )
+        )
@@ -0,0 +1,34 @@
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from app_home.pre_prediction_algorithm import PrePredictionAlgorithm
+
+
+class Command(BaseCommand):
+    help = "builds the sock feature store of the prediction and saves it to disk"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--path",
+            type=str,
+            default=getattr(settings, "SOCK_FEATURE_STORE_PATH", None),
+            help="Directory to save the store to (SOCK_FEATURE_STORE_PATH)",
+        )
+
+    def handle(self, *args, **kwargs):
+        if not kwargs["path"]:
+            raise CommandError("no path for the sock feature store given")
+
+        start = time.perf_counter()
+        # the changes published while building are applied by the workers
+        version = PrePredictionAlgorithm.feature_store_sync.version()
+        store = PrePredictionAlgorithm.build_feature_store()
+        store.sync_version = version
+        store.save(kwargs["path"])
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"saved {len(store)} socks to {kwargs['path']} "
+                f"in {time.perf_counter() - start:.2f}s"
+            )
+        )
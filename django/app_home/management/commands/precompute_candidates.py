@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand
+
+from app_home.pre_prediction_algorithm import PrePredictionAlgorithm
+
+
+class Command(BaseCommand):
+    help = (
+        "refreshes the candidate queues of all active socks (like the celery task "
+        "precompute_candidates) and reports how long the rebuild took"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--restart",
+            action="store_true",
+            help="start a new rebuild instead of continuing an unfinished one",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=None,
+            help="processes scoring the pools (default CANDIDATE_PRECOMPUTE_WORKERS)",
+        )
+
+    def handle(self, *args, **kwargs):
+        metrics = PrePredictionAlgorithm.precompute_candidates(
+            kwargs["restart"], kwargs["workers"]
+        )
+        self.stdout.write(
+            f"{metrics['socks']} active socks in {metrics['chunks']} chunks "
+            f"ranked against a pool of {metrics['pool']} socks"
+        )
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"rebuild took {metrics['seconds']:.2f}s "
+                f"({metrics['ms_per_sock']:.1f}ms per sock, "
+                f"{metrics['wall_seconds']:.2f}s wall time)"
+            )
+        )
@@ -1,8 +1,27 @@
-from django.db.models import Q
-from app_users.models import User, Sock, SockLike, UserMatch
-import random
-from datetime import datetime, timedelta
-from difflib import SequenceMatcher
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import connection, transaction
+from django.db.models import Q, F, Exists, OuterRef, Value
+from django.db.models.functions import Cos, Greatest, Least, Power, Radians, Sin
+from django.utils import timezone
+from app_users.models import User, Sock, SockLike, SockProfilePicture, UserMatch
+import math
+from itertools import islice
+from datetime import timedelta
+from hotsox_prediction import (
+    CandidatePrecomputation,
+    CandidateQueue,
+    FeatureStoreSync,
+    GeoBuckets,
+    RedisCache,
+    RedisSwipeStream,
+    SockFeatureStore,
+    SockRanker,
+    SockSource,
+    SwipeBuffer,
+)
 
 
 class PrePredictionAlgorithm:
@@ -10,159 +29,388 @@ class PrePredictionAlgorithm:
     a next sock should be predicted for the pool of given socks
     """
 
+    # process wide feature store, None until it is loaded (see get_feature_store)
+    feature_store = None
+    # ranked queues of the next socks per swiping sock (stored in the django cache)
+    candidate_queue = CandidateQueue(
+        cache,
+        size=getattr(settings, "CANDIDATE_QUEUE_SIZE", 50),
+        timeout=getattr(settings, "CANDIDATE_QUEUE_TIMEOUT", 60 * 15),
+    )
+    # the socks changed by other processes (and the fastapi service, through
+    # SOCK_FEATURE_STORE_SYNC_URL) are reloaded into the feature store (at most
+    # every SOCK_FEATURE_STORE_SYNC_INTERVAL seconds, see FeatureStoreSync)
+    feature_store_sync = FeatureStoreSync(
+        RedisCache(settings.SOCK_FEATURE_STORE_SYNC_URL)
+        if getattr(settings, "SOCK_FEATURE_STORE_SYNC_URL", None)
+        else cache,
+        interval=getattr(settings, "SOCK_FEATURE_STORE_SYNC_INTERVAL", 5),
+    )
+    # shared ranking core (hotsox_prediction), fed by a DjangoSockSource
+    ranker = SockRanker(
+        candidate_queue,
+        ann_min_socks=getattr(settings, "SOCK_ANN_MIN_SOCKS", 20000),
+        ann_candidates=getattr(settings, "SOCK_ANN_CANDIDATES", 300),
+        chunk_size=getattr(settings, "SOCK_RANKING_CHUNK_SIZE", 2000),
+        slow_ms=getattr(settings, "PREDICTION_SLOW_MS", 500),
+    )
+    # queues of active socks are refreshed ahead of time (app_home/tasks.py)
+    precomputation = CandidatePrecomputation(
+        ranker, chunk_size=getattr(settings, "CANDIDATE_PRECOMPUTE_CHUNK_SIZE", 200)
+    )
+    # write-behind swipes (SWIPE_WRITE_BEHIND): the judgements are buffered in a
+    # redis stream (SWIPE_BUFFER_URL, shared with the celery worker) and
+    # flushed to the database by the celery task flush_swipe_buffer
+    swipe_buffer = (
+        SwipeBuffer(
+            RedisSwipeStream(settings.SWIPE_BUFFER_URL),
+            batch_size=getattr(settings, "SWIPE_BUFFER_BATCH_SIZE", 1000),
+        )
+        if getattr(settings, "SWIPE_WRITE_BEHIND", False)
+        else None
+    )
+
     @staticmethod
-    def _compare_socks(current_sock, challenger_sock):
-        """function to calculate a similarity score between two socks"""
+    def build_feature_store() -> SockFeatureStore:
+        """build a new feature store of all socks from the database"""
+        return SockFeatureStore.build(
+            Sock.objects.all().iterator(chunk_size=2000),
+            SockProfilePicture.objects.values_list("sock_id", flat=True).distinct(),
+        )
 
-        similarity_score = -1
-
-        # Weightage of each attribute
-        weights = {
-            "info_color": 10,
-            "info_size": 8,
-            "info_type": 7,
-            "info_fabric": 6,
-            "info_condition": 6,
-            "info_holes": 6,
-            "info_age": 5,
-            "info_fabric_thickness": 5,
-            "info_kilometers": 4,
-            "info_inoutdoor": 4,
-            "info_washed": 4,
-            "info_brand": 3,
-            "info_joining_date": 5,
-            "info_separation_date": 2,
-            "info_special": 2,
-            "info_about": 2,
-        }
-        # Maxima for percentage calculation
-        maxima = {
-            "info_color": 10,
-            "info_size": 7,
-            "info_type": 9,
-            "info_fabric": 7,
-            "info_condition": 12,
-            "info_holes": 10,
-            "info_age": 25,
-            "info_fabric_thickness": 7,
-            "info_kilometers": 1000,
-            "info_inoutdoor": 9,
-            "info_washed": 7,
-            "info_brand": 12,
-        }
-
-        # Calculate similarity score for each attribute
-        ratio = 1  # default ratio
-        for attribute, weight in weights.items():
-            # calculate for dates
-            if attribute in ["info_joining_date", "info_separation_date"]:
-                current_value = current_sock.__dict__.get(attribute)
-                challenger_value = challenger_sock.__dict__.get(attribute)
-                delta = abs((current_value - challenger_value).days)
-                if delta <= 60:
-                    ratio = (60 - delta) / 60
-                else:
-                    ratio = 0.1
-                similarity_score += weight * ratio
-
-            # calculate for text
-            elif attribute in ["info_special", "info_about"]:
-                current_value = current_sock.__dict__.get(attribute)
-                challenger_value = challenger_sock.__dict__.get(attribute)
-                ratio = SequenceMatcher(None, current_value, challenger_value).ratio()
-                similarity_score += weight * ratio
-
-            # calcualte for any other integer values
+    @staticmethod
+    def get_feature_store() -> SockFeatureStore:
+        """return the process wide feature store of all socks
+        a saved store (manage.py build_sock_feature_store) is memory-mapped from
+        settings.SOCK_FEATURE_STORE_PATH, otherwise it is built from the database.
+        Afterwards it is kept up to date by the signals in app_home/signals.py
+        (the saves of this process) and the feature_store_sync (the saves of
+        the other processes)
+        """
+        store = PrePredictionAlgorithm.feature_store
+        if store is None:
+            path = getattr(settings, "SOCK_FEATURE_STORE_PATH", None)
+            if SockFeatureStore.exists(path):
+                store = SockFeatureStore.load(path)
             else:
-                ratio = (
-                    1
-                    - abs(
-                        int(current_sock.__dict__.get(attribute))
-                        - int(challenger_sock.__dict__.get(attribute))
-                    )
-                    / maxima[attribute]
-                )
-                similarity_score += weight * ratio
+                store = PrePredictionAlgorithm.build_feature_store()
+
+        def load(sock_ids):
+            return (
+                Sock.objects.filter(pk__in=sock_ids),
+                SockProfilePicture.objects.filter(sock_id__in=sock_ids)
+                .values_list("sock_id", flat=True)
+                .distinct(),
+            )
 
-        # return final score
-        return similarity_score
+        def build():
+            # in a background thread, with a database connection of its own
+            try:
+                return PrePredictionAlgorithm.build_feature_store()
+            finally:
+                connection.close()
+
+        PrePredictionAlgorithm.feature_store = (
+            PrePredictionAlgorithm.feature_store_sync.refresh(store, load, build)
+        )
+        return PrePredictionAlgorithm.feature_store
 
     @staticmethod
-    def _prefilter_list_of_all_socks(
-        current_user: User, current_user_sock: Sock
-    ) -> list:
+    def sock_changed(sock_id):
+        """publish a changed sock to the feature stores of the other processes
+        once the transaction is committed
+        """
+        transaction.on_commit(
+            lambda: PrePredictionAlgorithm.feature_store_sync.publish([sock_id])
+        )
+
+    @staticmethod
+    def _compare_socks(current_sock, challenger_sock):
+        """function to calculate a similarity score between two socks"""
+        return SockRanker.compare_socks(current_sock, challenger_sock)
+
+    @staticmethod
+    def _prefilter_queryset(current_user: User, current_user_sock: Sock):
         """This method is used to pre filter the list of all socks to the currently
-        useen ones and return a list. All the liked and disliked socks as well as the
+        useen ones and return a queryset. All the liked and disliked socks as well as the
         socks of the user him/herself are excluded from the list.
+        The whole filter is done in one single database query (NOT EXISTS subqueries),
+        so the costs per swipe do not grow with the amount of SockLike rows.
         """
 
-        # get a queryset of all the unseen socks
-        processed_socks = (
-            SockLike.objects.filter(Q(like__isnull=False) | Q(dislike__isnull=False))
-            .filter(sock=current_user_sock)
-            .values_list("like", "dislike")
+        # socks that have at least one picture
+        has_picture = SockProfilePicture.objects.filter(sock=OuterRef("pk"))
+
+        # socks that were already liked or disliked by the current sock
+        # (index-only on the unique sock & target index)
+        already_judged = SockLike.objects.filter(
+            sock=current_user_sock, target=OuterRef("pk")
+        )
+
+        # users that have been unmatched, so that we can exclude their socks!
+        # TODO: could be extended to exclude socks of any matched user too!
+        # (one probe of the unique pair index, see UserMatch.between)
+        unwanted_user = UserMatch.objects.filter(
+            unmatched=True,
+            low_id=Least(Value(current_user.pk), OuterRef("user")),
+            high_id=Greatest(Value(current_user.pk), OuterRef("user")),
         )
-        # create a list of all the pks of the unseen socks
-        processed_socks_pks = [
-            sock_pk for sock_like in processed_socks for sock_pk in sock_like if sock_pk
-        ]
 
         # get the queryset of all available socks, but:
-        # exclude all the seen socks from the list of all the socks (above)
-        # exclude the socks of the current user too!
+        # exclude the socks of the current user, all the seen socks,
+        # all the socks without any pictures & the socks of unwanted users
         unseen_socks = (
-            Sock.objects.all()
-            .exclude(pk__in=processed_socks_pks)
-            .exclude(user=current_user)
+            Sock.objects.exclude(user=current_user)
+            .filter(Exists(has_picture))
+            .filter(~Exists(already_judged))
+            .filter(~Exists(unwanted_user))
+            .order_by("pk")
         )
 
-        # build a list of users that have been unmatched,
-        # so that we can exclude their socks of the unseen socks!
-        # TODO: could be extended to exclude socks of any matched user too!
-        unwanted_user_list = [
-            match.user if match.user != current_user else match.other
-            for match in current_user.get_unmatched()
-        ]
-
-        # exclude all the socks without any pictures & unwanted users
-        unseen_socks = [
-            sock
-            for sock in unseen_socks
-            if sock.get_all_pictures() and sock.user not in unwanted_user_list
-        ]
+        # socks judged by buffered swipes which are not stored yet
+        if PrePredictionAlgorithm.swipe_buffer is not None:
+            pending = PrePredictionAlgorithm.swipe_buffer.pending(current_user_sock.pk)
+            if pending:
+                unseen_socks = unseen_socks.exclude(pk__in=pending)
 
-        if unseen_socks:
-            return unseen_socks
-        return []
+        max_distance = getattr(settings, "SOCK_MAX_DISTANCE_KM", 0)
+        if max_distance:
+            unseen_socks = PrePredictionAlgorithm._near_socks(
+                unseen_socks, current_user, max_distance
+            )
+        return unseen_socks
 
     @staticmethod
-    def get_next_sock(current_user, current_user_sock: Sock) -> Sock | None:
-        """currently this method is a simple mockup of the later version!
-        It is used to give a random record (sock) from the remaining pool of
-        unseen socks. We use basic randomization for that - nothing fancy!
+    def _near_socks(socks, current_user: User, max_distance: float):
+        """restrict a sock queryset to the socks of users within max_distance km
+        the grid cells around the user (indexed location_bucket ranges, see
+        GeoBuckets) narrow the users down, the exact distance is checked on them.
+        Users without a known location are not filtered and not found
         """
+        latitude = current_user.location_latitude
+        longitude = current_user.location_longitude
+        ranges = GeoBuckets.ranges(latitude, longitude, max_distance)
+        if ranges is None:
+            return socks
 
-        # remaining unseen socks as list
-        unseen_socks = PrePredictionAlgorithm._prefilter_list_of_all_socks(
-            current_user, current_user_sock
+        near_buckets = Q()
+        for first, last in ranges:
+            near_buckets |= Q(user__location_bucket__range=(first, last))
+        # haversine term of the distance (see GeoBuckets.haversine_limit)
+        other_latitude = Radians(F("user__location_latitude"))
+        other_longitude = Radians(F("user__location_longitude"))
+        haversine = Power(
+            Sin((other_latitude - math.radians(latitude)) / 2), 2
+        ) + math.cos(math.radians(latitude)) * Cos(other_latitude) * Power(
+            Sin((other_longitude - math.radians(longitude)) / 2), 2
+        )
+        return (
+            socks.filter(near_buckets)
+            .alias(haversine=haversine)
+            .filter(haversine__lte=GeoBuckets.haversine_limit(max_distance))
         )
 
-        # check if there are remaining socks
-        if unseen_socks:
-            max_score = -1
-            chosen_one = unseen_socks[0]
-            # find best contender for match
-            for challenger_sock in unseen_socks:
-                score = PrePredictionAlgorithm._compare_socks(
-                    current_user_sock, challenger_sock
-                )
-                # detect if sock is better match then current best
-                if score > max_score:
-                    max_score = score
-                    chosen_one = challenger_sock
+    @staticmethod
+    def _prefilter_list_of_all_socks(
+        current_user: User, current_user_sock: Sock
+    ) -> list:
+        """return the pre filtered socks (see _prefilter_queryset) as a list"""
+        return list(
+            PrePredictionAlgorithm._prefilter_queryset(current_user, current_user_sock)
+        )
+
+    @staticmethod
+    def rank_candidates(
+        current_user: User, current_user_sock: Sock, count: int
+    ) -> tuple[list, list]:
+        """rank the unseen socks and return the ids and scores of the best
+        count socks (best first), see SockRanker.rank_candidates
+        """
+        return PrePredictionAlgorithm.ranker.rank_candidates(
+            DjangoSockSource(current_user, current_user_sock), count
+        )
+
+    @staticmethod
+    def get_next_socks(current_user, current_user_sock: Sock, count: int) -> list:
+        """return the next (up to count) best matching unseen socks for the current sock
+        the socks are served from a ranked candidate queue (see SockRanker.next_socks),
+        so the pool of unseen socks is only prefiltered and scored (once) if the
+        queue runs low. The pictures of the socks are prefetched.
+        """
+        return PrePredictionAlgorithm.ranker.next_socks(
+            DjangoSockSource(current_user, current_user_sock), count
+        )
 
-            # this is the currently simplest version of a pre-prediction: randomizing
-            return chosen_one
+    @staticmethod
+    def explain_next_socks(
+        current_user, current_user_sock: Sock, count: int
+    ) -> tuple[list, list]:
+        """return the next socks (see get_next_socks) and their score breakdown
+        with the timing spans of the pipeline (see SockRanker.explain)
+        """
+        source = DjangoSockSource(current_user, current_user_sock)
+        next_socks = PrePredictionAlgorithm.ranker.next_socks(source, count)
+        return next_socks, PrePredictionAlgorithm.ranker.explain(source, next_socks)
 
+    @staticmethod
+    def get_next_sock(current_user, current_user_sock: Sock) -> Sock | None:
+        """return the best matching unseen sock for the current sock (see get_next_socks)"""
+        next_socks = PrePredictionAlgorithm.get_next_socks(
+            current_user, current_user_sock, 1
+        )
+        if next_socks:
+            return next_socks[0]
         # no reaming socks - return None!
         return None
+
+    @staticmethod
+    def active_sock_sources(after_id: int, limit: int) -> list:
+        """return the sources of the next (up to limit) socks with an id above
+        after_id whose users logged in within CANDIDATE_PRECOMPUTE_ACTIVE_DAYS
+        """
+        since = timezone.now() - timedelta(
+            days=getattr(settings, "CANDIDATE_PRECOMPUTE_ACTIVE_DAYS", 7)
+        )
+        socks = (
+            Sock.objects.filter(pk__gt=after_id, user__last_login__gte=since)
+            .select_related("user")
+            .order_by("pk")[:limit]
+        )
+        return [DjangoSockSource(sock.user, sock) for sock in socks]
+
+    @staticmethod
+    def candidate_queue_shared() -> bool:
+        """are the candidate queues shared by all processes (not in the memory
+        of this process, see REDIS_DJANGO_CACHE_URL)
+        """
+        return not isinstance(caches["default"], (LocMemCache, DummyCache))
+
+    @staticmethod
+    def precompute_candidates(
+        restart: bool = False, workers: int | None = None
+    ) -> dict:
+        """refresh the candidate queues of all active socks ahead of time
+        (see CandidatePrecomputation) and return the metrics of the rebuild
+        the pools are scored on workers processes (CANDIDATE_PRECOMPUTE_WORKERS)
+        """
+        if workers is None:
+            workers = getattr(settings, "CANDIDATE_PRECOMPUTE_WORKERS", 0)
+        with PrePredictionAlgorithm.ranker.parallel(
+            PrePredictionAlgorithm.get_feature_store(), workers
+        ):
+            return PrePredictionAlgorithm.precomputation.run(
+                PrePredictionAlgorithm.active_sock_sources, restart
+            )
+
+    @staticmethod
+    def sock_judged(current_user_sock: Sock, judged_sock_id):
+        """remove a liked or disliked sock from the candidate queue"""
+        PrePredictionAlgorithm.ranker.sock_judged(
+            current_user_sock.user_id, current_user_sock.pk, judged_sock_id
+        )
+
+    @staticmethod
+    def socks_judged(current_user_sock: Sock, judged_sock_ids):
+        """remove several liked or disliked socks from the candidate queue"""
+        PrePredictionAlgorithm.ranker.socks_judged(
+            current_user_sock.user_id, current_user_sock.pk, judged_sock_ids
+        )
+
+    @staticmethod
+    def buffer_judgements(current_user_sock: Sock, judgements: list):
+        """buffer likes & dislikes [(sock id, like), ...] of the current sock
+        (write-behind swipes, see SwipeBuffer), the judged socks are removed
+        from the candidate queue at once
+        """
+        PrePredictionAlgorithm.swipe_buffer.add(current_user_sock.pk, judgements)
+        PrePredictionAlgorithm.socks_judged(
+            current_user_sock, [sock_id for sock_id, _ in judgements]
+        )
+
+    @staticmethod
+    def flush_swipe_buffer(on_match=None, max_batches: int | None = None) -> dict:
+        """store the buffered swipes batch by batch (one transaction per batch,
+        see SockLike.judge_many) and return the metrics of the flush
+        on_match(sock, other_sock, user_match) is called for every new match
+        after its batch was committed
+        """
+
+        def store(judgements: dict) -> int:
+            socks = Sock.objects.select_related("user").in_bulk(
+                set(judgements)
+                | {
+                    judged_id
+                    for sock_judgements in judgements.values()
+                    for judged_id, _ in sock_judgements
+                }
+            )
+            matches = []
+            with transaction.atomic():
+                for sock_id, sock_judgements in judgements.items():
+                    # deleted socks are skipped
+                    sock = socks.get(sock_id)
+                    if sock is None:
+                        continue
+                    other_socks = [
+                        (socks[judged_id], like)
+                        for judged_id, like in sock_judgements
+                        if judged_id in socks
+                        and socks[judged_id].user_id != sock.user_id
+                    ]
+                    _, user_matches = SockLike.judge_many(sock, other_socks)
+                    for user_match in user_matches:
+                        other_sock = next(
+                            other_sock
+                            for other_sock, like in other_socks
+                            if like and other_sock.user_id == user_match.other_id
+                        )
+                        matches.append((sock, other_sock, user_match))
+            if on_match is not None:
+                for match in matches:
+                    on_match(*match)
+            return len(matches)
+
+        return PrePredictionAlgorithm.swipe_buffer.flush(store, max_batches)
+
+
+class DjangoSockSource(SockSource):
+    """django ORM adapter of the shared SockRanker (see hotsox_prediction)"""
+
+    def feature_store(self) -> SockFeatureStore:
+        return PrePredictionAlgorithm.get_feature_store()
+
+    def unseen_sock_ids(self, sock_ids) -> list:
+        return list(
+            PrePredictionAlgorithm._prefilter_queryset(self.user, self.sock)
+            .filter(pk__in=sock_ids)
+            .values_list("pk", flat=True)
+        )
+
+    def unseen_sock_id_chunks(self, chunk_size: int, picture_after=None):
+        queryset = PrePredictionAlgorithm._prefilter_queryset(self.user, self.sock)
+        if picture_after is not None:
+            new_picture = SockProfilePicture.objects.filter(
+                sock=OuterRef("pk"), pk__gt=picture_after
+            )
+            queryset = queryset.filter(Exists(new_picture))
+        sock_ids = queryset.values_list("pk", flat=True).iterator(chunk_size=chunk_size)
+        while chunk := list(islice(sock_ids, chunk_size)):
+            yield chunk
+
+    def judged_sock_ids(self) -> list:
+        judged_sock_ids = list(
+            SockLike.objects.filter(sock=self.sock).values_list("target_id", flat=True)
+        )
+        if PrePredictionAlgorithm.swipe_buffer is not None:
+            judged_sock_ids += PrePredictionAlgorithm.swipe_buffer.pending(self.sock.pk)
+        return judged_sock_ids
+
+    def load_socks(self, sock_ids):
+        return Sock.objects.filter(pk__in=sock_ids)
+
+    def available_socks(self, sock_ids) -> dict:
+        return (
+            PrePredictionAlgorithm._prefilter_queryset(self.user, self.sock)
+            .prefetch_related("profile_picture")
+            .in_bulk(sock_ids)
+        )
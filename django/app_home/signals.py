@@ -0,0 +1,54 @@
+from django.db.models import signals
+from django.dispatch import receiver
+
+from app_users.models import Sock, SockProfilePicture
+from .pre_prediction_algorithm import PrePredictionAlgorithm
+
+
+# signal handlers to keep the sock feature store of the prediction up to date
+# (only if the store was already loaded by this process), the changed socks
+# are published to the other processes
+@receiver(signals.post_save, sender=Sock)
+def feature_store_sock_saved(sender, instance, **kwargs):
+    PrePredictionAlgorithm.sock_changed(instance.pk)
+    store = PrePredictionAlgorithm.feature_store
+    if store is not None:
+        try:
+            store.upsert(instance)
+        except (TypeError, ValueError, OverflowError):
+            # attributes can not be encoded, the sock gets loaded on demand
+            store.remove(instance.pk)
+
+
+@receiver(signals.post_delete, sender=Sock)
+def feature_store_sock_deleted(sender, instance, **kwargs):
+    PrePredictionAlgorithm.sock_changed(instance.pk)
+    store = PrePredictionAlgorithm.feature_store
+    if store is not None:
+        store.remove(instance.pk)
+
+
+@receiver(signals.post_save, sender=SockProfilePicture)
+def feature_store_picture_saved(sender, instance, **kwargs):
+    PrePredictionAlgorithm.sock_changed(instance.sock_id)
+    store = PrePredictionAlgorithm.feature_store
+    if store is not None:
+        store.set_has_picture(instance.sock_id, True)
+
+
+@receiver(signals.post_delete, sender=SockProfilePicture)
+def feature_store_picture_deleted(sender, instance, **kwargs):
+    PrePredictionAlgorithm.sock_changed(instance.sock_id)
+    store = PrePredictionAlgorithm.feature_store
+    if store is not None:
+        store.set_has_picture(
+            instance.sock_id,
+            SockProfilePicture.objects.filter(sock_id=instance.sock_id).exists(),
+        )
+
+
+# new pictures make socks available for swiping, the candidate queues merge them in
+@receiver(signals.post_save, sender=SockProfilePicture)
+def candidate_queue_picture_saved(sender, instance, created, **kwargs):
+    if created:
+        PrePredictionAlgorithm.candidate_queue.picture_added(instance.pk)
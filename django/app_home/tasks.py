@@ -0,0 +1,36 @@
+from __future__ import absolute_import, unicode_literals
+
+import logging
+
+from celery import shared_task
+
+from app_mail.tasks import send_match_mails
+from .pre_prediction_algorithm import PrePredictionAlgorithm
+
+logger = logging.getLogger("hotsox_prediction")
+
+
+@shared_task(name="precompute_candidates")
+def precompute_candidates(restart=False, workers=None):
+    if not PrePredictionAlgorithm.candidate_queue_shared():
+        # the queues would only be stored in the memory of the celery worker
+        logger.warning("precompute_candidates needs a shared cache (redis)")
+        return {"message": "the candidate queues are not in a shared cache!"}
+    metrics = PrePredictionAlgorithm.precompute_candidates(restart, workers)
+    return {
+        "message": f"candidate queues of {metrics['socks']} active socks precomputed!",
+        "metrics": metrics,
+    }
+
+
+@shared_task(name="flush_swipe_buffer")
+def flush_swipe_buffer():
+    if PrePredictionAlgorithm.swipe_buffer is None:
+        return {"message": "write-behind swipes are not enabled!"}
+    metrics = PrePredictionAlgorithm.flush_swipe_buffer(
+        on_match=lambda sock, other_sock, user_match: send_match_mails(sock, other_sock)
+    )
+    return {
+        "message": f"{metrics['judgements']} buffered judgements stored!",
+        "metrics": metrics,
+    }
@@ -0,0 +1,34 @@
+from io import StringIO
+from django.core.management import call_command
+from django.test import SimpleTestCase
+from hotsox_prediction.ranking import BoundedTopK
+
+
+class Test(SimpleTestCase):
+    def test_BoundedTopK_keeps_best(self):
+        best = BoundedTopK(3)
+        best.push_many([1, 2, 3], [1.0, 5.0, 3.0])
+        best.push_many([4, 5, 6], [4.0, 0.5, 5.0])
+
+        self.assertEqual(3, len(best))
+        # on ties the key pushed first wins
+        self.assertEqual(([2, 6, 4], [5.0, 5.0, 4.0]), best.result())
+
+    def test_BoundedTopK_empty(self):
+        best = BoundedTopK(0)
+        best.push_many([1, 2], [1.0, 2.0])
+        self.assertEqual(([], []), best.result())
+
+    def test_benchmark_ranking_memory_command(self):
+        out = StringIO()
+        call_command(
+            "benchmark_ranking_memory",
+            "--socks",
+            "3000",
+            "--chunk-size",
+            "500",
+            stdout=out,
+            stderr=out,
+        )
+        self.assertIn("3000 socks", out.getvalue())
+        self.assertNotIn("differs", out.getvalue())
@@ -0,0 +1,53 @@
+from django.test import SimpleTestCase
+from hotsox_prediction.candidate_queue import CandidateQueue, LocalCache
+
+
+class Test(SimpleTestCase):
+    def setUp(self):
+        self.queue = CandidateQueue(LocalCache(), size=3, low_watermark=2)
+
+    def test_CandidateQueue_set_truncates_to_size(self):
+        entry = self.queue.set(1, 2, [5, 6, 7, 8], [4.0, 3.0, 2.0, 1.0], True, 0)
+
+        self.assertEqual([5, 6, 7], entry["ids"])
+        self.assertFalse(entry["complete"])
+        self.assertEqual(entry, self.queue.get(1, 2))
+        self.assertIsNone(self.queue.get(1, 3))
+
+    def test_CandidateQueue_merge_keeps_ranking(self):
+        entry = self.queue.set(1, 2, [5, 6], [4.0, 2.0], True, 0)
+        entry = self.queue.merge(1, 2, entry, [7, 8], [2.0, 3.0], 10)
+
+        # on ties the candidates already in the queue come first
+        self.assertEqual([5, 8, 6], entry["ids"])
+        self.assertEqual([4.0, 3.0, 2.0], entry["scores"])
+        self.assertEqual(10, entry["last_picture_id"])
+        # candidate 7 did not fit anymore
+        self.assertFalse(entry["complete"])
+
+    def test_CandidateQueue_discard_and_refill(self):
+        self.assertTrue(self.queue.needs_refill(None))
+        self.queue.set(1, 2, [5, 6, 7], [3.0, 2.0, 1.0], False, 0)
+        self.assertFalse(self.queue.needs_refill(self.queue.get(1, 2)))
+
+        entry = self.queue.discard(1, 2, [5, 7])
+        self.assertEqual([6], entry["ids"])
+        self.assertEqual([2.0], entry["scores"])
+        self.assertTrue(self.queue.needs_refill(entry))
+
+        # complete queues are never refilled, even if they are empty
+        entry = self.queue.set(1, 2, [], [], True, 0)
+        self.assertFalse(self.queue.needs_refill(entry))
+
+    def test_CandidateQueue_latest_picture(self):
+        self.assertEqual(0, self.queue.latest_picture_id())
+        self.queue.picture_added(4)
+        self.queue.picture_added(2)
+        self.assertEqual(4, self.queue.latest_picture_id())
+
+    def test_LocalCache_timeout(self):
+        cache = LocalCache()
+        cache.set("a", 1, timeout=-1)
+        cache.set("b", 2)
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(2, cache.get("b"))
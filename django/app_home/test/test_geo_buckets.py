@@ -0,0 +1,43 @@
+from django.test import SimpleTestCase
+from hotsox_prediction.geo_buckets import GeoBuckets
+
+
+class Test(SimpleTestCase):
+    def covered(self, ranges, latitude, longitude) -> bool:
+        bucket = GeoBuckets.bucket(latitude, longitude)
+        return any(first <= bucket <= last for first, last in ranges)
+
+    def test_GeoBuckets_bucket(self):
+        self.assertIsNone(GeoBuckets.bucket(None, 13.4))
+        # (0, 0) is stored for cities which could not be geocoded
+        self.assertIsNone(GeoBuckets.bucket(0, 0))
+        self.assertEqual(0, GeoBuckets.bucket(-90, -180))
+        self.assertEqual(
+            GeoBuckets.ROWS * GeoBuckets.COLUMNS - 1, GeoBuckets.bucket(90, 179.9)
+        )
+
+    def test_GeoBuckets_ranges_cover_radius(self):
+        berlin = (52.52, 13.40)
+        ranges = GeoBuckets.ranges(*berlin, 100)
+        # one range per row of cells
+        self.assertEqual(4, len(ranges))
+        self.assertTrue(self.covered(ranges, 52.39, 13.06))  # potsdam
+        self.assertTrue(self.covered(ranges, 53.10, 13.40))  # 64km north
+        self.assertFalse(self.covered(ranges, 53.55, 9.99))  # hamburg
+        self.assertIsNone(GeoBuckets.ranges(0, 0, 100))
+
+    def test_GeoBuckets_ranges_antimeridian_and_poles(self):
+        ranges = GeoBuckets.ranges(-17.7, 179.9, 100)  # fiji
+        self.assertTrue(self.covered(ranges, -17.7, -179.8))
+        self.assertTrue(self.covered(ranges, -17.7, 179.5))
+        self.assertFalse(self.covered(ranges, -17.7, 0.5))
+
+        # close to the pole the whole rows are covered
+        ranges = GeoBuckets.ranges(89.5, 10, 200)
+        self.assertTrue(self.covered(ranges, 89.0, -170))
+
+    def test_GeoBuckets_haversine_limit(self):
+        self.assertAlmostEqual(
+            27.0, GeoBuckets.distance_km((52.52, 13.40), (52.39, 13.06)), delta=1
+        )
+        self.assertEqual(1.0, GeoBuckets.haversine_limit(50000))
@@ -0,0 +1,41 @@
+import json
+from django.test import SimpleTestCase
+from hotsox_prediction.instrumentation import PipelineMetrics, PipelineTrace, log_trace
+
+
+class Test(SimpleTestCase):
+    def test_PipelineTrace_sums_spans(self):
+        trace = PipelineTrace()
+        for chunk in trace.timed("prefilter", [[1, 2], [3]]):
+            with trace.span("score", len(chunk)) as span:
+                span["out"] = 1
+
+        stages = trace.as_dict()["stages"]
+        self.assertEqual(["prefilter", "score"], list(stages))
+        self.assertEqual(
+            (None, 3), (stages["prefilter"]["in"], stages["prefilter"]["out"])
+        )
+        self.assertEqual(
+            (2, 3, 2), tuple(stages["score"][key] for key in ("calls", "in", "out"))
+        )
+
+    def test_PipelineMetrics_snapshot(self):
+        metrics = PipelineMetrics()
+        for ms in (1.0, 3.0):
+            metrics.record(
+                {"ms": ms, "stages": {"score": {"ms": ms, "in": 10, "out": 2}}}
+            )
+
+        snapshot = metrics.snapshot()
+        self.assertEqual(2, snapshot["runs"])
+        self.assertEqual(20, snapshot["stages"]["score"]["candidates_in"])
+        self.assertEqual(2.0, snapshot["stages"]["total"]["ms_p50"])
+        self.assertEqual(3.0, snapshot["stages"]["score"]["ms_max"])
+
+    def test_log_trace_slow_runs(self):
+        with self.assertLogs("hotsox_prediction", "WARNING") as logs:
+            log_trace("next_socks", {"ms": 12.0, "stages": {}}, 10, sock=1)
+        self.assertEqual(
+            {"event": "next_socks", "sock": 1, "ms": 12.0, "stages": {}},
+            json.loads(logs.records[0].getMessage()),
+        )
@@ -0,0 +1,63 @@
+import json
+from django.test import SimpleTestCase
+from hotsox_prediction.candidate_queue import LocalCache
+from hotsox_prediction.judged_filter import JudgedSockFilter
+
+
+class Test(SimpleTestCase):
+    def setUp(self):
+        self.filter = JudgedSockFilter(LocalCache())
+
+    def test_JudgedSockFilter_no_false_negatives(self):
+        judged = list(range(1, 20000, 7))
+        entry = JudgedSockFilter.build(judged)
+
+        self.assertTrue(JudgedSockFilter.contains(entry, judged).all())
+        # the false positive rate stays below the error rate
+        others = [sock_id for sock_id in range(1, 20000) if sock_id % 7 != 1]
+        self.assertLess(
+            JudgedSockFilter.contains(entry, others).mean(),
+            JudgedSockFilter.ERROR_RATE,
+        )
+        # about 1.2 bytes per judged sock (base64 encoded)
+        self.assertLess(len(entry["bits"]), 4 / 3 * 1.2 * 2 * len(judged) + 4)
+        # the entry can be stored in a json based cache
+        self.assertEqual(entry, json.loads(json.dumps(entry)))
+
+    def test_JudgedSockFilter_get_add_and_rebuild(self):
+        loads = []
+
+        def judged_sock_ids():
+            loads.append(1)
+            return [5, 6]
+
+        entry = self.filter.get(1, judged_sock_ids)
+        self.assertEqual(
+            [True, True, False], list(JudgedSockFilter.contains(entry, [5, 6, 7]))
+        )
+        # judgements are added to the stored filter, it is not rebuilt
+        self.filter.add(1, 7)
+        entry = self.filter.get(1, judged_sock_ids)
+        self.assertTrue(JudgedSockFilter.contains(entry, [7])[0])
+        self.assertEqual(1, len(loads))
+
+        # a full filter is rebuilt with a larger capacity
+        for sock_id in range(100, 100 + JudgedSockFilter.MIN_CAPACITY):
+            self.filter.add(1, sock_id)
+        self.filter.get(1, lambda: list(range(300)))
+        self.assertEqual(600, self.filter.get(1, judged_sock_ids)["capacity"])
+
+        # filters of other socks are missing until they are needed
+        self.filter.add(2, 5)
+        self.assertIsNone(self.filter.cache.get(self.filter.key(2)))
+
+    def test_JudgedSockFilter_add_many(self):
+        self.filter.get(1, lambda: [5])
+        self.filter.add_many(1, [6, 7, 8])
+        entry = self.filter.get(1, lambda: [])
+        self.assertEqual(4, entry["count"])
+        self.assertTrue(all(JudgedSockFilter.contains(entry, [5, 6, 7, 8])))
+
+        # a batch that does not fit drops the filter (rebuilt on demand)
+        self.filter.add_many(1, range(100, 100 + entry["capacity"]))
+        self.assertIsNone(self.filter.cache.get(self.filter.key(1)))
@@ -0,0 +1,60 @@
+import numpy as np
+from io import StringIO
+from django.core.management import call_command
+from django.test import SimpleTestCase
+from hotsox_prediction.benchmark import (
+    SyntheticSockSource,
+    synthetic_sock,
+    synthetic_store,
+)
+from hotsox_prediction.candidate_queue import CandidateQueue, LocalCache
+from hotsox_prediction.parallel_scoring import ParallelSockScorer
+from hotsox_prediction.ranking import SockRanker
+
+
+class Test(SimpleTestCase):
+    def setUp(self):
+        self.store = synthetic_store(np.random.default_rng(1981), 3000)
+        self.source = SyntheticSockSource(self.store, synthetic_sock())
+        self.ranker = SockRanker(
+            CandidateQueue(LocalCache()), ann_min_socks=float("inf"), chunk_size=500
+        )
+
+    def test_SockRanker_parallel_equals_serial(self):
+        serial = self.ranker.rank_candidates(self.source, 20)
+
+        with self.ranker.parallel(self.store, 2) as scorer:
+            scorer.min_shard_size = 1000
+            self.assertEqual(serial, self.ranker.rank_candidates(self.source, 20))
+        self.assertIsNone(self.ranker.parallel_scorer)
+        self.assertEqual({}, scorer.blocks)
+
+    def test_SockRanker_parallel_without_workers(self):
+        with self.ranker.parallel(self.store, 1) as scorer:
+            self.assertIsNone(scorer)
+            self.assertIsNone(self.ranker.parallel_scorer)
+
+    def test_ParallelSockScorer_snapshot_rows(self):
+        with ParallelSockScorer(2) as scorer:
+            scorer.share(self.store)
+            # the last sock moves into the row of a removed one
+            self.store.remove(1)
+            rows, shared = scorer.snapshot_rows(self.store, [2, 3000])
+            self.assertEqual([1, 0], rows.tolist())
+            self.assertEqual([True, False], shared.tolist())
+
+    def test_benchmark_parallel_scoring_command(self):
+        out = StringIO()
+        call_command(
+            "benchmark_parallel_scoring",
+            "--socks",
+            "3000",
+            "--workers",
+            "2",
+            "--rankings",
+            "1",
+            stdout=out,
+            stderr=out,
+        )
+        self.assertIn("2 workers", out.getvalue())
+        self.assertNotIn("differs", out.getvalue())
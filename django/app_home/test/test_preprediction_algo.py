@@ -1,8 +1,18 @@
-from django.test import TestCase
+import json
+import os
+import tempfile
+from io import StringIO
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.core.cache import cache
+from django.utils import timezone
 from unittest import mock
 from app_users.models import User, UserMatch, Sock, SockLike, SockProfilePicture
 from datetime import date, timedelta
-from app_home.pre_prediction_algorithm import PrePredictionAlgorithm
+from app_home.pre_prediction_algorithm import DjangoSockSource, PrePredictionAlgorithm
+from app_home.tasks import precompute_candidates
+from hotsox_prediction.geo_buckets import GeoBuckets
+from hotsox_prediction.sock_scoring import SockScoringEngine
 from uuid import uuid4
 
 
@@ -148,6 +158,10 @@ class Test(TestCase):
             user=self.user1, other=self.user2, chatroom_uuid=uuid4(), unmatched=False
         )
 
+    def tearDown(self):
+        # the candidate queues live in the cache, do not share them between tests
+        cache.clear()
+
     def test_PrePredictionAlgorithm_prefilter_remainig_socks(self):
         list_of_unseen_socks = PrePredictionAlgorithm._prefilter_list_of_all_socks(
             self.user1, self.sock
@@ -215,6 +229,353 @@ class Test(TestCase):
         self.assertEqual([], list(list_of_unseen_socks))
         self.assertNotEqual([self.sock3, self.sock4], list(list_of_unseen_socks))
 
+    def test_PrePredictionAlgorithm_prefilter_exclude_socks_without_picture(self):
+        # sock4 has no pictures anymore - so only sock3 should be left
+        SockProfilePicture.objects.filter(sock=self.sock4).delete()
+        list_of_unseen_socks = PrePredictionAlgorithm._prefilter_list_of_all_socks(
+            self.user1, self.sock
+        )
+
+        self.assertEqual([self.sock3], list(list_of_unseen_socks))
+
+    def test_PrePredictionAlgorithm_prefilter_single_query(self):
+        SockLike.objects.create(sock=self.sock, like=self.sock3)
+        # the whole prefilter is done with one single query
+        with self.assertNumQueries(1):
+            list_of_unseen_socks = PrePredictionAlgorithm._prefilter_list_of_all_socks(
+                self.user1, self.sock
+            )
+
+        self.assertEqual([self.sock4], list(list_of_unseen_socks))
+
+    def set_location(self, user, latitude, longitude):
+        # the pre_save signal of the user resets the location in tests
+        User.objects.filter(pk=user.pk).update(
+            location_latitude=latitude,
+            location_longitude=longitude,
+            location_bucket=GeoBuckets.bucket(latitude, longitude),
+        )
+        user.refresh_from_db()
+
+    def test_PrePredictionAlgorithm_prefilter_max_distance(self):
+        # berlin & potsdam are ~27km apart
+        self.set_location(self.user1, 52.52, 13.40)
+        self.set_location(self.user2, 52.39, 13.06)
+
+        with override_settings(SOCK_MAX_DISTANCE_KM=50):
+            with self.assertNumQueries(1):
+                list_of_unseen_socks = (
+                    PrePredictionAlgorithm._prefilter_list_of_all_socks(
+                        self.user1, self.sock
+                    )
+                )
+            self.assertEqual([self.sock3, self.sock4], list_of_unseen_socks)
+
+        with override_settings(SOCK_MAX_DISTANCE_KM=20):
+            self.assertEqual(
+                [],
+                PrePredictionAlgorithm._prefilter_list_of_all_socks(
+                    self.user1, self.sock
+                ),
+            )
+            # socks of users without a known location are not found
+            self.set_location(self.user2, 0, 0)
+            self.set_location(self.user1, 52.39, 13.06)
+            self.assertEqual(
+                [],
+                PrePredictionAlgorithm._prefilter_list_of_all_socks(
+                    self.user1, self.sock
+                ),
+            )
+            # users without a known location are not filtered
+            self.set_location(self.user1, 0, 0)
+            self.assertEqual(
+                [self.sock3, self.sock4],
+                PrePredictionAlgorithm._prefilter_list_of_all_socks(
+                    self.user1, self.sock
+                ),
+            )
+
+    def test_SockScoringEngine_scores_all_candidates(self):
+        # sock4 was washed way more often than the current sock
+        self.sock4.info_washed = 9
+        self.sock4.save()
+
+        engine = SockScoringEngine([self.sock3, self.sock4])
+        scores = engine.score(self.sock)
+
+        # sock3 is identical (score 78), sock4 loses the whole washed weight (4)
+        self.assertEqual([78.0, 74.0], list(scores))
+        # batched scores are identical to the single sock comparison
+        self.assertEqual(
+            [
+                PrePredictionAlgorithm._compare_socks(self.sock, self.sock3),
+                PrePredictionAlgorithm._compare_socks(self.sock, self.sock4),
+            ],
+            list(scores),
+        )
+
+    def test_PrePredictionAlgorithm_get_next_sock_best_score(self):
+        next_sock = PrePredictionAlgorithm.get_next_sock(self.user1, self.sock)
+        self.assertEqual(self.sock3, next_sock)
+
+    def test_PrePredictionAlgorithm_rank_candidates_nearest_neighbours(self):
+        ranker = PrePredictionAlgorithm.ranker
+        try:
+            with mock.patch.multiple(
+                ranker, ann_min_socks=0, ann_candidates=4
+            ), mock.patch.object(
+                ranker, "nearest_sock_ids", wraps=ranker.nearest_sock_ids
+            ) as nearest_sock_ids:
+                ids, _ = PrePredictionAlgorithm.rank_candidates(
+                    self.user1, self.sock, 2
+                )
+            self.assertEqual([self.sock3.pk, self.sock4.pk], ids)
+            self.assertEqual(1, nearest_sock_ids.call_count)
+
+            # the index is attached to the store and kept up to date
+            store = PrePredictionAlgorithm.feature_store
+            self.assertEqual(len(store), len(store.ann_index))
+            self.sock4.delete()
+            self.assertEqual(len(store), len(store.ann_index))
+        finally:
+            PrePredictionAlgorithm.feature_store = None
+
+    def test_PrePredictionAlgorithm_rank_candidates_skips_judged_neighbours(self):
+        ranker = PrePredictionAlgorithm.ranker
+        SockLike.objects.create(sock=self.sock, like=self.sock3)
+        PrePredictionAlgorithm.sock_judged(self.sock, self.sock3.pk)
+        source = DjangoSockSource(self.user1, self.sock)
+        self.assertEqual(
+            [True, False],
+            list(ranker.maybe_judged(source, [self.sock3.pk, self.sock4.pk])),
+        )
+        try:
+            with mock.patch.multiple(ranker, ann_min_socks=0, ann_candidates=4):
+                with mock.patch.object(
+                    source, "unseen_sock_ids", wraps=source.unseen_sock_ids
+                ) as unseen_sock_ids:
+                    ids, _ = ranker.rank_candidates(source, 1)
+            self.assertEqual([self.sock4.pk], ids)
+            # the judged neighbour is not part of the prefilter query
+            self.assertNotIn(self.sock3.pk, unseen_sock_ids.call_args.args[0])
+        finally:
+            PrePredictionAlgorithm.feature_store = None
+
+    def test_PrePredictionAlgorithm_rank_candidates_in_chunks(self):
+        # sock4 was washed way more often than the current sock
+        self.sock4.info_washed = 9
+        self.sock4.save()
+        ranker = PrePredictionAlgorithm.ranker
+
+        expected = PrePredictionAlgorithm.rank_candidates(self.user1, self.sock, 2)
+        with mock.patch.object(ranker, "chunk_size", 1):
+            # every chunk is scored on its own, the best socks are kept
+            self.assertEqual(
+                expected,
+                PrePredictionAlgorithm.rank_candidates(self.user1, self.sock, 2),
+            )
+            self.assertEqual(
+                [self.sock3.pk],
+                PrePredictionAlgorithm.rank_candidates(self.user1, self.sock, 1)[0],
+            )
+
+    def test_PrePredictionAlgorithm_get_next_socks_ranked(self):
+        # sock4 was washed way more often than the current sock
+        self.sock4.info_washed = 9
+        self.sock4.save()
+
+        next_socks = PrePredictionAlgorithm.get_next_socks(self.user1, self.sock, 3)
+        self.assertEqual([self.sock3, self.sock4], next_socks)
+        # the pictures are prefetched
+        with self.assertNumQueries(0):
+            self.assertEqual(1, len(next_socks[1].profile_picture.all()))
+
+    def test_PrePredictionAlgorithm_get_next_sock_from_candidate_queue(self):
+        ranker = PrePredictionAlgorithm.ranker
+        with mock.patch.object(
+            ranker, "rank_candidates", wraps=ranker.rank_candidates
+        ) as rank_candidates:
+            self.assertEqual(
+                self.sock3, PrePredictionAlgorithm.get_next_sock(self.user1, self.sock)
+            )
+            # the next request is served from the queue
+            self.assertEqual(
+                self.sock3, PrePredictionAlgorithm.get_next_sock(self.user1, self.sock)
+            )
+
+            # judged socks leave the queue
+            SockLike.objects.create(sock=self.sock, like=self.sock3)
+            PrePredictionAlgorithm.sock_judged(self.sock, self.sock3.pk)
+            self.assertEqual(
+                self.sock4, PrePredictionAlgorithm.get_next_sock(self.user1, self.sock)
+            )
+            SockLike.objects.create(sock=self.sock, dislike=self.sock4)
+            PrePredictionAlgorithm.sock_judged(self.sock, self.sock4.pk)
+            self.assertIsNone(
+                PrePredictionAlgorithm.get_next_sock(self.user1, self.sock)
+            )
+
+        # the queue held all candidates, so they were only ranked once
+        self.assertEqual(1, rank_candidates.call_count)
+
+    def test_PrePredictionAlgorithm_candidate_queue_drops_unavailable_socks(self):
+        self.assertEqual(
+            self.sock3, PrePredictionAlgorithm.get_next_sock(self.user1, self.sock)
+        )
+        # sock3 has no pictures anymore, the head of the queue is skipped
+        SockProfilePicture.objects.filter(sock=self.sock3).delete()
+        self.assertEqual(
+            self.sock4, PrePredictionAlgorithm.get_next_sock(self.user1, self.sock)
+        )
+        queue = PrePredictionAlgorithm.candidate_queue
+        self.assertEqual([self.sock4.pk], queue.get(self.user1.pk, self.sock.pk)["ids"])
+
+    @mock.patch("cloudinary.uploader.upload")
+    def test_PrePredictionAlgorithm_candidate_queue_merges_new_socks(
+        self, mock_uploader_upload
+    ):
+        self.assertEqual(
+            self.sock3, PrePredictionAlgorithm.get_next_sock(self.user1, self.sock)
+        )
+
+        # a new sock becomes available as soon as it has a picture
+        sock5 = Sock.objects.create(
+            user=self.user2,
+            info_joining_date=date.today(),
+            info_name="Unicorn Fart 3",
+            info_about="Something completely different",
+            info_color="1",
+            info_fabric="2",
+            info_fabric_thickness="7",
+            info_brand="13",
+            info_type="4",
+            info_size="7",
+            info_age=10,
+            info_separation_date=date.today() - timedelta(days=365),
+            info_condition="9",
+            info_holes=3,
+            info_kilometers=1000,
+            info_inoutdoor="1",
+            info_washed=2,
+            info_special="Never won anything",
+        )
+        SockProfilePicture.objects.create(sock=sock5, profile_picture="picture.jpg")
+
+        self.assertEqual(
+            self.sock3, PrePredictionAlgorithm.get_next_sock(self.user1, self.sock)
+        )
+        queue = PrePredictionAlgorithm.candidate_queue
+        self.assertEqual(
+            [self.sock3.pk, self.sock4.pk, sock5.pk],
+            queue.get(self.user1.pk, self.sock.pk)["ids"],
+        )
+
+    def test_PrePredictionAlgorithm_precompute_candidates(self):
+        # only the socks of users who logged in recently are precomputed
+        self.user1.last_login = timezone.now()
+        self.user1.save()
+
+        metrics = PrePredictionAlgorithm.precompute_candidates()
+        self.assertEqual(2, metrics["socks"])
+        self.assertEqual(metrics, PrePredictionAlgorithm.precomputation.last_run())
+        queue = PrePredictionAlgorithm.candidate_queue
+        for sock in (self.sock, self.sock2):
+            self.assertEqual(
+                [self.sock3.pk, self.sock4.pk],
+                queue.get(self.user1.pk, sock.pk)["ids"],
+            )
+        self.assertIsNone(queue.get(self.user2.pk, self.sock3.pk))
+
+        # the next swipe is served from the precomputed queue
+        ranker = PrePredictionAlgorithm.ranker
+        with mock.patch.object(ranker, "rank_candidates") as rank_candidates:
+            self.assertEqual(
+                self.sock3, PrePredictionAlgorithm.get_next_sock(self.user1, self.sock)
+            )
+        rank_candidates.assert_not_called()
+
+    def test_precompute_candidates_task_needs_shared_cache(self):
+        self.user1.last_login = timezone.now()
+        self.user1.save()
+
+        # queues in the memory of the celery worker are never read by the web
+        with self.assertLogs("hotsox_prediction", "WARNING"):
+            self.assertNotIn("metrics", precompute_candidates())
+        self.assertIsNone(PrePredictionAlgorithm.precomputation.last_run())
+
+        with mock.patch.object(
+            PrePredictionAlgorithm, "candidate_queue_shared", return_value=True
+        ):
+            self.assertEqual(2, precompute_candidates()["metrics"]["socks"])
+
+    def test_PrePredictionAlgorithm_precompute_candidates_continues(self):
+        self.user1.last_login = timezone.now()
+        self.user1.save()
+        precomputation = PrePredictionAlgorithm.precomputation
+
+        with mock.patch.object(precomputation, "chunk_size", 1):
+            progress = precomputation.run_chunk(
+                PrePredictionAlgorithm.active_sock_sources
+            )
+            self.assertFalse(progress["done"])
+            self.assertEqual(self.sock.pk, precomputation.progress()["cursor"])
+
+            # an interrupted rebuild continues after the last finished chunk
+            metrics = PrePredictionAlgorithm.precompute_candidates()
+        self.assertEqual(2, metrics["socks"])
+        self.assertEqual(3, metrics["chunks"])
+        self.assertIsNone(precomputation.progress())
+
+    def test_benchmark_next_sock_command(self):
+        socks = Sock.objects.count()
+        out = StringIO()
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, "next_sock.json")
+            arguments = ["--socks", "200", "400", "--swipers", "3", "--history", "20"]
+            call_command(
+                "benchmark_next_sock",
+                *arguments,
+                "--current-database",
+                "--output",
+                output,
+                stdout=out,
+            )
+            with open(output) as file:
+                results = json.load(file)
+            call_command(
+                "benchmark_next_sock",
+                *arguments,
+                "--current-database",
+                "--output",
+                output,
+                "--compare",
+                output,
+                stdout=out,
+            )
+
+        self.assertEqual("django", results["implementation"])
+        self.assertEqual([200, 400], [scale["socks"] for scale in results["scales"]])
+        self.assertEqual(3, results["scales"][0]["phases"]["cold"]["calls"])
+        self.assertEqual(15, results["scales"][0]["phases"]["warm"]["calls"])
+        self.assertIn("400 socks warm", out.getvalue())
+        # the synthetic socks are rolled back
+        self.assertEqual(socks, Sock.objects.count())
+        self.assertEqual(socks, len(PrePredictionAlgorithm.get_feature_store()))
+
+    def test_benchmark_bulk_judgements_command(self):
+        out = StringIO()
+        call_command(
+            "benchmark_bulk_judgements",
+            "--judgements",
+            "20",
+            "--current-database",
+            stdout=out,
+        )
+        self.assertIn("per swipe", out.getvalue())
+        self.assertIn("bulk", out.getvalue())
+        self.assertEqual(0, SockLike.objects.count())
+
     # Only do this test if we decide on the fact that if one sock of a user was match,
     # all the other socks of the user will not be shown for further matches.
     # def test_PrePredictionAlgorithm_prefilter_no_socks_after_user_match(self):
@@ -0,0 +1,65 @@
+import numpy as np
+from io import StringIO
+from django.core.management import call_command
+from django.test import SimpleTestCase
+from hotsox_prediction.sock_ann_index import SockANNIndex
+
+
+class Test(SimpleTestCase):
+    def setUp(self):
+        generator = np.random.default_rng(7)
+        self.integers = generator.integers(0, 10, (500, len(SockANNIndex.SCALE)))
+        self.sock_ids = list(range(1000, 1500))
+
+    def nearest(self, query, count, sock_ids=None):
+        """brute force nearest socks by the weighted L1 distance"""
+        distances = np.abs(SockANNIndex.vectors(self.integers - query)).sum(axis=1)
+        order = np.argsort(distances, kind="stable")
+        return distances, [self.sock_ids[row] for row in order[:count]]
+
+    def test_SockANNIndex_query_exact(self):
+        index = SockANNIndex(leaf_size=16, approximation=0.0)
+        index.insert_many(self.sock_ids, self.integers)
+        query = self.integers[42]
+
+        distances, expected = self.nearest(query, 20)
+        result = index.query(query, 20)
+
+        self.assertEqual(500, len(index))
+        self.assertEqual(self.sock_ids[42], result[0])
+        # same distances (the order of equal distances may differ)
+        rows = [self.sock_ids.index(sock_id) for sock_id in result]
+        self.assertEqual(
+            sorted(distances[[self.sock_ids.index(i) for i in expected]]),
+            sorted(distances[rows]),
+        )
+
+    def test_SockANNIndex_incremental_insert_and_remove(self):
+        index = SockANNIndex(leaf_size=8, approximation=0.0)
+        # one by one, so leaves have to be split
+        for sock_id, integers in zip(self.sock_ids, self.integers):
+            index.insert(sock_id, integers)
+        for sock_id in self.sock_ids[:250]:
+            index.remove(sock_id)
+
+        self.assertEqual(250, len(index))
+        self.assertNotIn(self.sock_ids[0], index)
+        result = index.query(self.integers[0], 250)
+        self.assertEqual(sorted(self.sock_ids[250:]), sorted(result))
+
+        # moving a sock updates its position
+        index.insert(self.sock_ids[300], self.integers[0])
+        self.assertEqual(self.sock_ids[300], index.query(self.integers[0], 1)[0])
+
+    def test_benchmark_sock_ann_command(self):
+        output = StringIO()
+        call_command(
+            "benchmark_sock_ann",
+            socks=3000,
+            queries=3,
+            count=5,
+            candidates=50,
+            approximations=[0.0],
+            stdout=output,
+        )
+        self.assertIn("recall 1.000", output.getvalue())
@@ -0,0 +1,169 @@
+import tempfile
+import numpy as np
+from django.test import TestCase
+from unittest import mock
+from app_users.models import User, Sock, SockProfilePicture
+from datetime import date, timedelta
+from app_home.pre_prediction_algorithm import PrePredictionAlgorithm
+from hotsox_prediction.candidate_queue import LocalCache
+from hotsox_prediction.feature_store_sync import FeatureStoreSync
+from hotsox_prediction.sock_feature_store import SockFeatureStore
+from hotsox_prediction.sock_scoring import SockScoringEngine
+
+
+def create_sock(user, **kwargs):
+    sock_data = {
+        "info_name": "Fuzzy Wuzzy",
+        "info_about": "Fuzzy Wuzzy was a bear. Fuzzy Wuzzy had no hair.",
+        "info_color": "5",
+        "info_fabric": "2",
+        "info_fabric_thickness": "7",
+        "info_brand": "13",
+        "info_type": "4",
+        "info_size": "7",
+        "info_age": 10,
+        "info_separation_date": date.today() - timedelta(days=365),
+        "info_condition": "9",
+        "info_holes": 3,
+        "info_kilometers": 1000,
+        "info_inoutdoor": "1",
+        "info_washed": 2,
+        "info_special": "Once won first place in a sock puppet competition",
+    }
+    sock_data.update(kwargs)
+    return Sock.objects.create(user=user, **sock_data)
+
+
+class Test(TestCase):
+    @mock.patch("cloudinary.uploader.upload")
+    def setUp(self, mock_uploader_upload):
+        self.user = User.objects.create(
+            username="quirk-unicorn 1",
+            email="quirk-unicorn1@example.com",
+            password="testpassword",
+            info_birthday=date(2000, 1, 1),
+            location_city="Rainbow City",
+        )
+        self.sock1 = create_sock(self.user)
+        self.sock2 = create_sock(self.user, info_color="1", info_kilometers=20)
+        self.sock3 = create_sock(
+            self.user,
+            info_about="Some totally different story",
+            info_separation_date=date.today() - timedelta(days=20),
+        )
+        SockProfilePicture.objects.create(
+            sock=self.sock2, profile_picture="picture.jpg"
+        )
+
+    def tearDown(self):
+        # make sure no other test uses the store of this test
+        PrePredictionAlgorithm.feature_store = None
+
+    def test_SockFeatureStore_build(self):
+        store = PrePredictionAlgorithm.build_feature_store()
+
+        self.assertEqual(3, len(store))
+        self.assertIn(self.sock2.pk, store)
+        self.assertTrue(store.has_picture[store.index[self.sock2.pk]])
+        self.assertFalse(store.has_picture[store.index[self.sock3.pk]])
+
+    def test_SockFeatureStore_scores_identical_to_orm(self):
+        store = PrePredictionAlgorithm.build_feature_store()
+        engine = store.engine([self.sock2.pk, self.sock3.pk])
+
+        self.assertEqual(
+            list(SockScoringEngine([self.sock2, self.sock3]).score(self.sock1)),
+            list(engine.score(self.sock1)),
+        )
+        self.assertEqual(self.sock3.pk, engine.best_match(self.sock1))
+
+    def test_SockFeatureStore_save_and_load_memory_mapped(self):
+        store = PrePredictionAlgorithm.build_feature_store()
+        with tempfile.TemporaryDirectory() as directory:
+            store.save(directory)
+            self.assertTrue(SockFeatureStore.exists(directory))
+            loaded = SockFeatureStore.load(directory)
+
+            self.assertIsInstance(loaded.codes, np.memmap)
+            self.assertEqual(np.int8, loaded.codes.dtype)
+            self.assertEqual(np.int16, loaded.counts.dtype)
+            self.assertEqual(list(store.ids[: len(store)]), list(loaded.ids))
+            self.assertEqual(
+                list(store.engine([self.sock2.pk]).score(self.sock1)),
+                list(loaded.engine([self.sock2.pk]).score(self.sock1)),
+            )
+
+            # incremental updates still work on a memory-mapped store
+            sock4 = create_sock(self.user)
+            loaded.upsert(sock4)
+            loaded.remove(self.sock1.pk)
+            self.assertIn(sock4.pk, loaded)
+            self.assertNotIn(self.sock1.pk, loaded)
+            self.assertEqual(
+                sorted([self.sock2.pk, self.sock3.pk, sock4.pk]),
+                sorted(loaded.ids[: len(loaded)].tolist()),
+            )
+
+    def test_SockFeatureStore_updated_by_signals(self):
+        store = PrePredictionAlgorithm.get_feature_store()
+
+        # new socks are added to the store
+        sock4 = create_sock(self.user, info_color="2")
+        self.assertIn(sock4.pk, store)
+
+        # updated socks are updated in the store
+        sock4.info_color = "3"
+        sock4.save()
+        self.assertEqual(3, store.integers(store.rows([sock4.pk]))[0, 0])
+
+        # pictures set the picture flag
+        picture = SockProfilePicture.objects.create(
+            sock=sock4, profile_picture="picture.jpg"
+        )
+        self.assertTrue(store.has_picture[store.index[sock4.pk]])
+        SockProfilePicture.objects.filter(pk=picture.pk).delete()
+        self.assertFalse(store.has_picture[store.index[sock4.pk]])
+
+        # deleted socks are removed from the store
+        sock4_pk = sock4.pk
+        sock4.delete()
+        self.assertNotIn(sock4_pk, store)
+
+    def test_SockFeatureStore_synced_with_other_processes(self):
+        sync = FeatureStoreSync(LocalCache(), interval=0)
+        with mock.patch.object(PrePredictionAlgorithm, "feature_store_sync", sync):
+            store = PrePredictionAlgorithm.get_feature_store()
+            self.assertEqual(0, store.sync_version)
+
+            # saves are published once they are committed
+            with self.captureOnCommitCallbacks(execute=True):
+                create_sock(self.user, info_color="2")
+            self.assertEqual(1, sync.version())
+
+            # socks changed by another process (no signals here) are reloaded
+            Sock.objects.filter(pk=self.sock1.pk).update(info_color="3")
+            Sock.objects.filter(pk=self.sock3.pk).delete()
+            sync.publish([self.sock1.pk, self.sock3.pk])
+            self.assertIs(store, PrePredictionAlgorithm.get_feature_store())
+            self.assertEqual(3, store.integers(store.rows([self.sock1.pk]))[0, 0])
+            self.assertNotIn(self.sock3.pk, store)
+            self.assertEqual(2, store.sync_version)
+
+    def test_FeatureStoreSync_rebuilds_when_behind(self):
+        sync = FeatureStoreSync(LocalCache(), interval=0)
+        store, rebuilt = SockFeatureStore(), SockFeatureStore()
+        store.sync_version = 0
+        sync.publish([self.sock1.pk])
+        sync.publish([self.sock2.pk])
+        # the first entry expired: the store is rebuilt in the background
+        sync.cache.delete(sync.key(1))
+        with self.assertLogs("hotsox_prediction", "WARNING"):
+            self.assertIs(store, sync.refresh(store, None, lambda: rebuilt))
+        sync.rebuilding.join()
+        self.assertIs(rebuilt, sync.refresh(store, None, None))
+        self.assertEqual(2, rebuilt.sync_version)
+
+        # an entry which is still being published is read by the next pull
+        sync.cache.add(sync.key("version"), 0)
+        sync.cache.incr(sync.key("version"))
+        self.assertEqual((2, []), sync.changes(2))
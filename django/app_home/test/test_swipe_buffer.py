@@ -0,0 +1,47 @@
+from django.test import SimpleTestCase
+from hotsox_prediction.swipe_buffer import LocalSwipeStream, SwipeBuffer
+
+
+class Test(SimpleTestCase):
+    def setUp(self):
+        self.buffer = SwipeBuffer(LocalSwipeStream(), batch_size=2)
+
+    def test_SwipeBuffer_pending_until_flushed(self):
+        self.buffer.add(1, [(5, True), (6, False)])
+        self.buffer.add(2, [(5, True)])
+        self.assertEqual({5, 6}, self.buffer.pending(1))
+        self.assertEqual(3, len(self.buffer))
+
+        batches, pending = [], []
+
+        def store(judgements):
+            batches.append(judgements)
+            pending.append(self.buffer.pending(1))
+            return 1
+
+        metrics = self.buffer.flush(store, max_batches=1)
+        self.assertEqual([{1: [(5, True), (6, False)]}], batches)
+        # the judgements are still pending while they are stored
+        self.assertEqual([{5, 6}], pending)
+        self.assertEqual(set(), self.buffer.pending(1))
+        self.assertEqual({5}, self.buffer.pending(2))
+        self.assertEqual(
+            (2, 1, 1),
+            tuple(metrics[key] for key in ("judgements", "batches", "matches")),
+        )
+
+        metrics = self.buffer.flush(store)
+        self.assertEqual({2: [(5, True)]}, batches[-1])
+        self.assertEqual(0, len(self.buffer))
+        self.assertEqual(1, metrics["judgements"])
+
+    def test_SwipeBuffer_failed_flush_keeps_judgements(self):
+        self.buffer.add(1, [(5, True)])
+
+        def store(judgements):
+            raise RuntimeError("database is gone")
+
+        with self.assertRaises(RuntimeError):
+            self.buffer.flush(store)
+        self.assertEqual(1, len(self.buffer))
+        self.assertEqual({5}, self.buffer.pending(1))
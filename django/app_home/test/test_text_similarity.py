@@ -0,0 +1,47 @@
+import numpy as np
+from io import StringIO
+from django.core.management import call_command
+from django.test import SimpleTestCase
+from difflib import SequenceMatcher
+from hotsox_prediction.text_similarity import MinHashTextSimilarity
+
+
+class Test(SimpleTestCase):
+    text = "Fuzzy Wuzzy was a bear. Fuzzy Wuzzy had no hair. Fuzzy Wuzzy wasn't very fuzzy, was he?"
+
+    def similarity(self, text, other):
+        return MinHashTextSimilarity.similarities(
+            MinHashTextSimilarity.signature(text),
+            MinHashTextSimilarity.signature(other)[None],
+        )[0]
+
+    def test_MinHashTextSimilarity_signature(self):
+        signature = MinHashTextSimilarity.signature(self.text)
+
+        self.assertEqual((MinHashTextSimilarity.NUM_PERMUTATIONS,), signature.shape)
+        self.assertEqual(np.uint32, signature.dtype)
+        # signatures are stable (they are saved in the feature store)
+        self.assertEqual(
+            list(signature), list(MinHashTextSimilarity.signature(self.text))
+        )
+
+    def test_MinHashTextSimilarity_similarities(self):
+        self.assertEqual(1.0, self.similarity(self.text, self.text))
+        self.assertEqual(1.0, self.similarity("", ""))
+        self.assertEqual(0.0, self.similarity(self.text, ""))
+        self.assertEqual(0.0, self.similarity("abcdefgh", "stuvwxyz"))
+
+        # similar texts are close to the SequenceMatcher ratio
+        other = "Fuzzy Wuzzy was a bear. Fuzzy Wuzzy had no hair."
+        self.assertAlmostEqual(
+            SequenceMatcher(None, self.text, other).ratio(),
+            self.similarity(self.text, other),
+            delta=0.15,
+        )
+
+    def test_benchmark_text_similarity_command(self):
+        output = StringIO()
+        call_command(
+            "benchmark_text_similarity", candidates=50, queries=2, stdout=output
+        )
+        self.assertIn("source text ranked first", output.getvalue())
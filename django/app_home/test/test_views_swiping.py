@@ -1,4 +1,5 @@
 from django.test import TestCase
+from django.core.cache import cache
 from unittest import mock
 from app_users.models import User, Sock, SockLike, UserMatch
 from datetime import date, timedelta
@@ -111,6 +112,10 @@ class Test(TestCase):
             info_special="Once won first place in a sock puppet competition",
         )
 
+    def tearDown(self):
+        # the candidate queues live in the cache, do not share them between tests
+        cache.clear()
+
     def test_swipe_page_without_sock(self):
         # log user in
         self.client.force_login(user=self.user)
@@ -169,7 +174,7 @@ class Test(TestCase):
         self.assertEqual(response.status_code, 302)
         self.assertTemplateUsed("app_user/swipe.html")
 
-    @mock.patch("app_home.views.celery_send_mail")
+    @mock.patch("app_mail.tasks.celery_send_mail")
     def test_swipe_page_with_sock_selected_user_match(self, celery_mock):
         celery_mock.return_value = {"msg": "done"}
 
@@ -206,3 +211,5 @@ class Test(TestCase):
         self.assertEqual(matches.user, self.user)
         self.assertEqual(matches.other, self.user2)
         self.assertNotEqual(matches.chatroom_uuid, "")
+        # both users are notified by the shared match mails
+        self.assertEqual(2, celery_mock.delay.call_count)
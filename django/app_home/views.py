@@ -1,16 +1,14 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.urls import reverse
 from django.views.generic import TemplateView
-from django.db.models import Q
 from django.contrib import messages
-import uuid
 
 from app_users.validator import HotSoxLogInAndValidationCheckMixin
-from app_users.models import User, Sock, SockLike, UserMatch
+from app_users.models import User, Sock, SockLike
 from .pre_prediction_algorithm import PrePredictionAlgorithm
 from app_geo.utilities import GeoLocation
 
-from app_mail.tasks import celery_send_mail
+from app_mail.tasks import send_match_mails
 
 
 class HomeView(HotSoxLogInAndValidationCheckMixin, TemplateView):
@@ -108,79 +106,63 @@ class SwipeView(HotSoxLogInAndValidationCheckMixin, TemplateView):
             Sock, pk=request.POST.get("sock_pk", None)
         )
 
+        # write-behind swipes: the judgement is buffered and stored by a celery
+        # task, new matches are notified by mail then
+        decision = request.POST.get("decision", None)
+        if PrePredictionAlgorithm.swipe_buffer is not None and decision in (
+            "like",
+            "dislike",
+        ):
+            PrePredictionAlgorithm.buffer_judgements(
+                current_user_sock, [(sock_to_be_decided_on.pk, decision == "like")]
+            )
+            return redirect(reverse("app_home:swipe"))
+
         # frontend liked the sock
-        if request.POST.get("decision", None) == "like":
-            # we use get_or_create to beware of duplicates!
-            _, sock_like_created = SockLike.objects.get_or_create(
-                sock=current_user_sock, like=sock_to_be_decided_on
+        if decision == "like":
+            # one transaction: the like, the check of the reciprocal like & the match
+            _, user_match_object = SockLike.judge(
+                current_user_sock, sock_to_be_decided_on, like=True
+            )
+            PrePredictionAlgorithm.sock_judged(
+                current_user_sock, sock_to_be_decided_on.pk
             )
 
-            # check for user to user match via the socks
-            if current_user_sock in sock_to_be_decided_on.get_likes():
-                # create match in UserMatchTable if not already exists!
-                try:
-                    user_match_object = UserMatch.objects.get(
-                        Q(user=current_user_sock.user, other=sock_to_be_decided_on.user)
-                        | Q(
-                            other=current_user_sock.user,
-                            user=sock_to_be_decided_on.user,
-                        )
-                    )
-                    user_match_created = False
-                except UserMatch.DoesNotExist:
-                    user_match_object = UserMatch.objects.create(
-                        user=current_user_sock.user,
-                        other=sock_to_be_decided_on.user,
-                        chatroom_uuid=uuid.uuid4(),
-                    )
-                    user_match_created = True
-
-                if user_match_created:
-                    # sending match email
-                    match_message = "Please visit HotSox to check your new match:)"
-                    celery_send_mail.delay(
-                        email_subject=f"You have a match with {sock_to_be_decided_on.user.username}",
-                        email_message=match_message,
-                        recipient_list=[current_user_sock.user.email],
-                        notification=current_user_sock.user.notification,
-                    )
-                    celery_send_mail.delay(
-                        email_subject=f"You have a match with {current_user_sock.user.username}",
-                        email_message=match_message,
-                        recipient_list=[sock_to_be_decided_on.user.email],
-                        notification=sock_to_be_decided_on.user.notification,
-                    )
-
-                    context = {
-                        "user": current_user_sock.user,
-                        "user_sock": current_user_sock,
-                        "matched_user": sock_to_be_decided_on.user,
-                        "distance": GeoLocation.get_distance(
-                            (
-                                current_user_sock.user.location_latitude,
-                                current_user_sock.user.location_longitude,
-                            ),
-                            (
-                                sock_to_be_decided_on.user.location_latitude,
-                                sock_to_be_decided_on.user.location_longitude,
-                            ),
+            # the like completed a user to user match via the socks
+            if user_match_object:
+                # sending match email (as the write-behind flush does)
+                send_match_mails(current_user_sock, sock_to_be_decided_on)
+
+                context = {
+                    "user": current_user_sock.user,
+                    "user_sock": current_user_sock,
+                    "matched_user": sock_to_be_decided_on.user,
+                    "distance": GeoLocation.get_distance(
+                        (
+                            current_user_sock.user.location_latitude,
+                            current_user_sock.user.location_longitude,
                         ),
-                        "matched_user_sock": sock_to_be_decided_on,
-                    }
-                    # add navigation arrows
-                    context["left_arrow_go_to_url"] = reverse("app_home:swipe")
-                    context["right_arrow_go_to_url"] = reverse(
-                        "app_users:user-match-profile-details",
-                        kwargs={"username": sock_to_be_decided_on.user.username},
-                    )
+                        (
+                            sock_to_be_decided_on.user.location_latitude,
+                            sock_to_be_decided_on.user.location_longitude,
+                        ),
+                    ),
+                    "matched_user_sock": sock_to_be_decided_on,
+                }
+                # add navigation arrows
+                context["left_arrow_go_to_url"] = reverse("app_home:swipe")
+                context["right_arrow_go_to_url"] = reverse(
+                    "app_users:user-match-profile-details",
+                    kwargs={"username": sock_to_be_decided_on.user.username},
+                )
 
-                    return render(request, "app_home/match.html", context)
+                return render(request, "app_home/match.html", context)
 
         # frontend disliked the sock
-        elif request.POST.get("decision", None) == "dislike":
-            # we use get_or_create to beware of duplicates!
-            _, sock_dislike_created = SockLike.objects.get_or_create(
-                sock=current_user_sock, dislike=sock_to_be_decided_on
+        elif decision == "dislike":
+            SockLike.judge(current_user_sock, sock_to_be_decided_on, like=False)
+            PrePredictionAlgorithm.sock_judged(
+                current_user_sock, sock_to_be_decided_on.pk
             )
 
         # reload the frontend
@@ -15,3 +15,18 @@ def celery_send_mail(
             from_email=settings.EMAIL_HOST_USER,
             recipient_list=recipient_list,
         )
+
+
+def send_match_mails(user_sock, other_sock):
+    """notify both users of a new match (celery)"""
+    match_message = "Please visit HotSox to check your new match :)"
+    for user, other_user in (
+        (user_sock.user, other_sock.user),
+        (other_sock.user, user_sock.user),
+    ):
+        celery_send_mail.delay(
+            email_subject=f"You have a match with {other_user.username}",
+            email_message=match_message,
+            recipient_list=[user.email],
+            notification=user.notification,
+        )
@@ -30,6 +30,13 @@ class SockLikeSerializer(serializers.ModelSerializer):
         exclude = ["sock"]
 
 
+class JudgementSerializer(serializers.Serializer):
+    """a like (true) or dislike (false) of another sock (bulk judgement)"""
+
+    sock_id = serializers.IntegerField()
+    like = serializers.BooleanField()
+
+
 class SockProfilePictureSerializer(serializers.ModelSerializer):
     # this is needed to show a upload file dialog!
     profile_picture = serializers.FileField()
@@ -96,6 +103,15 @@ class ChatSerializer(serializers.ModelSerializer):
         exclude = ["user"]
 
 
+class ChatHistorySerializer(serializers.ModelSerializer):
+    user = UserChatSerializer()
+    other = UserChatSerializer()
+
+    class Meta:
+        model = MessageChat
+        fields = "__all__"
+
+
 class ChatSendSerializer(serializers.ModelSerializer):
     class Meta:
         model = MessageChat
@@ -1,9 +1,21 @@
 from unittest import mock
 from django.test import TestCase
+from django.core.cache import cache
 from django.contrib.auth.hashers import make_password, check_password
 from django.urls import reverse
 from django.core.files.uploadedfile import SimpleUploadedFile
-from app_users.models import User, Sock, SockProfilePicture, MessageMail, MessageChat
+from app_users.models import (
+    User,
+    Sock,
+    SockLike,
+    SockProfilePicture,
+    MessageMail,
+    MessageChat,
+    UserMatch,
+)
+from app_home.pre_prediction_algorithm import PrePredictionAlgorithm
+from app_restapi.views_swipe import ApiJudgeSocks
+from hotsox_prediction.swipe_buffer import LocalSwipeStream, SwipeBuffer
 
 from datetime import date, timedelta
 
@@ -14,6 +26,7 @@ from .inital_test_setup import (
 )
 
 from rest_framework.test import APIClient
+from app_mail.tasks import send_match_mails
 
 sock_data1 = {
     "info_name": "Main Sock",
@@ -90,6 +103,10 @@ class TestUser(TestCase):
             data={"profile_picture": picture},
         )
 
+    def tearDown(self):
+        # the candidate queues live in the cache, do not share them between tests
+        cache.clear()
+
     def test_swipe_next_sock(self):
         token(self.client, "admin", "admin")
         response = self.client.get(
@@ -112,7 +129,88 @@ class TestUser(TestCase):
         assert response.status_code == 400
         assert content == {"error": "this sock was not found"}
 
-    @mock.patch("app_restapi.views_swipe.celery_send_mail")
+    def test_swipe_next_socks(self):
+        token(self.client, "admin", "admin")
+        response = self.client.get(
+            reverse(
+                "app_restapi:api_next_socks",
+                kwargs={"sock_id": self.sock1.pk, "count": 5},
+            ),
+            format="json",
+        )
+        content = response.json()
+
+        assert response.status_code == 200
+        assert [sock["id"] for sock in content] == [self.sock2.pk]
+        assert len(content[0]["profile_picture"]) == 1
+
+    def test_swipe_next_socks_invalide_count(self):
+        token(self.client, "admin", "admin")
+        response = self.client.get(
+            reverse(
+                "app_restapi:api_next_socks",
+                kwargs={"sock_id": self.sock1.pk, "count": 0},
+            ),
+            format="json",
+        )
+
+        assert response.status_code == 400
+
+    def test_swipe_next_sock_explain(self):
+        token(self.client, "admin", "admin")
+        response = self.client.get(
+            reverse("app_restapi:api_next_sock", kwargs={"sock_id": self.sock1.pk})
+            + "?explain=true",
+            format="json",
+        )
+        content = response.json()
+
+        assert response.status_code == 200
+        assert content["id"] == self.sock2.pk
+        explain = content["explain"]
+        assert explain["sock_id"] == self.sock2.pk
+        assert explain["attributes"]["info_color"] == {
+            "current": "1",
+            "candidate": "1",
+            "ratio": 1.0,
+            "weight": 10,
+            "points": 10.0,
+        }
+        assert "prefilter" in explain["pipeline"]["stages"]
+        assert "score" in explain["pipeline"]["stages"]
+
+    def test_swipe_next_sock_explain_staff_only(self):
+        token(self.client, "testuser2", "testuser2")
+        response = self.client.get(
+            reverse(
+                "app_restapi:api_next_socks",
+                kwargs={"sock_id": self.sock2.pk, "count": 2},
+            )
+            + "?explain=true",
+            format="json",
+        )
+
+        assert response.status_code == 403
+
+    def test_swipe_metrics(self):
+        token(self.client, "admin", "admin")
+        self.client.get(
+            reverse("app_restapi:api_next_sock", kwargs={"sock_id": self.sock1.pk}),
+            format="json",
+        )
+        response = self.client.get(reverse("app_restapi:api_swipe_metrics"))
+        content = response.json()
+
+        assert response.status_code == 200
+        assert content["runs"] >= 1
+        assert content["stages"]["total"]["runs"] == content["runs"]
+        assert content["stages"]["available"]["candidates_out"] >= 1
+
+        token(self.client, "testuser2", "testuser2")
+        response = self.client.get(reverse("app_restapi:api_swipe_metrics"))
+        assert response.status_code == 403
+
+    @mock.patch("app_mail.tasks.celery_send_mail")
     def test_swipe_judge_sock(self, mock):
         mock.return_value = "mocked"
 
@@ -175,3 +273,157 @@ class TestUser(TestCase):
         assert content["match"]["user"]["username"] == self.user2.username
         assert content["match"]["other_user"]["username"] == self.user1.username
         assert len(content["match"]["chatroom_uuid"]) == 36
+
+    @mock.patch("app_mail.tasks.celery_send_mail")
+    def test_swipe_judge_socks(self, mail_mock):
+        sock3 = Sock.objects.create(user=self.user2, **sock_data2)
+        SockLike.objects.create(sock=self.sock2, like=self.sock1)
+        url = reverse("app_restapi:api_judge_socks", kwargs={"sock_id": self.sock1.pk})
+
+        token(self.client, "admin", "admin")
+        judgements = [
+            {"sock_id": self.sock2.pk, "like": True},
+            {"sock_id": sock3.pk, "like": False},
+            {"sock_id": self.sock1.pk, "like": True},
+            {"sock_id": 999, "like": True},
+        ]
+        response = self.client.post(url, judgements, format="json")
+        content = response.json()
+        assert response.status_code == 201
+        assert content["judged"] == [self.sock2.pk, sock3.pk]
+        assert content["already_judged"] == []
+        # own and unknown socks are not judged
+        assert content["not_found"] == [self.sock1.pk, 999]
+        # the mutual like matches the users
+        assert len(content["matches"]) == 1
+        assert content["matches"][0]["other_user"]["username"] == self.user2.username
+        assert content["matches"][0]["other_sock"]["info_name"] == "Test Sock1"
+        assert mail_mock.delay.call_count == 2
+
+        # repeated judgements change nothing
+        response = self.client.post(url, judgements[:2], format="json")
+        content = response.json()
+        assert content["judged"] == []
+        assert content["already_judged"] == [self.sock2.pk, sock3.pk]
+        assert content["matches"] == []
+        assert SockLike.objects.filter(sock=self.sock1).count() == 2
+
+        response = self.client.post(url, [{"sock_id": "x"}], format="json")
+        assert response.status_code == 400
+
+        # too many judgements are rejected before they are validated
+        with mock.patch.object(ApiJudgeSocks, "max_judgements", 1), mock.patch(
+            "app_restapi.views_swipe.JudgementSerializer"
+        ) as serializer:
+            response = self.client.post(url, judgements, format="json")
+        assert response.status_code == 400
+        assert response.json() == {"error": "at most 1 judgements per request"}
+        serializer.assert_not_called()
+
+    def test_swipe_judge_sock_dislike(self):
+        token(self.client, "admin", "admin")
+        url = reverse(
+            "app_restapi:api_judge_sock",
+            kwargs={"sock_id": self.sock1.pk, "other_sock_id": self.sock2.pk},
+        )
+
+        # the dislike is stored once, so the sock is not shown again
+        for _ in range(2):
+            response = self.client.post(url + "?like=false", format="json")
+            assert response.status_code == 201
+            assert response.json() == {
+                "message": f"sock <{self.sock2.pk}> was disliked"
+            }
+        assert list(
+            SockLike.objects.filter(sock=self.sock1).values_list("dislike", flat=True)
+        ) == [self.sock2.pk]
+
+        # a later like does not change the dislike
+        response = self.client.post(url + "?like=true", format="json")
+        assert response.status_code == 208
+        assert response.json() == {
+            "message": f"sock <{self.sock2.pk}> was already disliked",
+            "match": "no new match",
+        }
+
+    @mock.patch("app_mail.tasks.celery_send_mail")
+    def test_swipe_judge_sock_write_behind(self, mock_mail):
+        sock3 = Sock.objects.create(user=self.user2, **sock_data2)
+        token(self.client, username="testuser2", password="testuser2")
+        with mock.patch("cloudinary.uploader.upload"):
+            self.client.post(
+                reverse(
+                    "app_restapi:api_sock_profilepic_create",
+                    kwargs={"sock_id": sock3.pk},
+                ),
+                data={
+                    "profile_picture": SimpleUploadedFile(
+                        "picture.jpg", b"file_content", content_type="image/jpeg"
+                    )
+                },
+            )
+        SockLike.objects.create(sock=self.sock2, like=self.sock1)
+        with mock.patch.object(
+            PrePredictionAlgorithm, "swipe_buffer", SwipeBuffer(LocalSwipeStream())
+        ):
+            token(self.client, "admin", "admin")
+            url = reverse(
+                "app_restapi:api_judge_sock",
+                kwargs={"sock_id": self.sock1.pk, "other_sock_id": self.sock2.pk},
+            )
+            # the like is acknowledged at once, nothing is stored yet
+            response = self.client.post(url + "?like=true", format="json")
+            assert response.status_code == 202
+            response = self.client.post(url + "?like=true", format="json")
+            assert response.status_code == 208
+            assert not SockLike.objects.filter(sock=self.sock1).exists()
+
+            # the buffered sock is not shown again
+            response = self.client.get(
+                reverse(
+                    "app_restapi:api_next_socks",
+                    kwargs={"sock_id": self.sock1.pk, "count": 5},
+                )
+            )
+            assert [sock["id"] for sock in response.json()] == [sock3.pk]
+            cache.clear()
+            response = self.client.get(
+                reverse(
+                    "app_restapi:api_next_socks",
+                    kwargs={"sock_id": self.sock1.pk, "count": 5},
+                )
+            )
+            assert [sock["id"] for sock in response.json()] == [sock3.pk]
+
+            response = self.client.post(
+                reverse(
+                    "app_restapi:api_judge_socks", kwargs={"sock_id": self.sock1.pk}
+                ),
+                [
+                    {"sock_id": self.sock2.pk, "like": True},
+                    {"sock_id": sock3.pk, "like": False},
+                ],
+                format="json",
+            )
+            assert response.status_code == 202
+            assert response.json()["judged"] == [sock3.pk]
+            assert response.json()["already_judged"] == [self.sock2.pk]
+
+            # the flush stores the judgements and finds the match
+            metrics = PrePredictionAlgorithm.flush_swipe_buffer(
+                on_match=lambda sock, other_sock, user_match: send_match_mails(
+                    sock, other_sock
+                )
+            )
+            assert metrics["judgements"] == 2
+            assert metrics["matches"] == 1
+            assert PrePredictionAlgorithm.swipe_buffer.pending(self.sock1.pk) == set()
+            assert SockLike.objects.filter(sock=self.sock1, like=self.sock2).exists()
+            assert SockLike.objects.filter(sock=self.sock1, dislike=sock3).exists()
+            assert (
+                UserMatch.objects.filter(user=self.user1, other=self.user2).count() == 1
+            )
+            assert mock_mail.delay.call_count == 2
+
+            # flushing again changes nothing
+            assert PrePredictionAlgorithm.flush_swipe_buffer()["judgements"] == 0
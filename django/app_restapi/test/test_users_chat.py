@@ -55,7 +55,7 @@ class TestUser(TestCase):
             headers=token(self.client, "admin", "admin"),
             format="json",
         )
-        assert response.json() == []
+        assert response.json() == {"next": None, "results": []}
 
     def test_user_chats_with_chats_between_users(self):
         user1 = User.objects.get(username=TEST_USER1["username"])
@@ -71,10 +71,48 @@ class TestUser(TestCase):
             format="json",
         )
         assert response.status_code == 200
-        response_json = response.json()[0]
+        assert response.json()["next"] == None
+        response_json = response.json()["results"][0]
+        assert response_json["user"] == {
+            "username": "admin",
+            "email": "admin@admin.com",
+        }
         assert response_json["other"] == {
             "username": "testuser2",
             "email": "testuser2@testuser2.com",
         }
         assert response_json["message"] == "test message"
         assert response_json["seen_date"] == None
+
+    def test_user_chats_between_users_pages(self):
+        user1 = User.objects.get(username=TEST_USER1["username"])
+        user2 = User.objects.get(username=TEST_USER2["username"])
+        for i in range(30):
+            MessageChat.objects.create(user=user1, other=user2, message=f"test {i}")
+            MessageChat.objects.create(user=user2, other=user1, message=f"answer {i}")
+
+        url = reverse(
+            "app_restapi:api_chat_get_send",
+            kwargs={"receiver": TEST_USER2["username"]},
+        )
+        headers = token(self.client, "admin", "admin")
+        first = self.client.get(url, headers=headers, format="json").json()
+        second = self.client.get(first["next"], headers=headers, format="json").json()
+
+        # both directions, the newest first, every chat once
+        assert [chat["message"] for chat in first["results"]][:2] == [
+            "answer 29",
+            "test 29",
+        ]
+        assert len(first["results"]) == MessageChat.HISTORY_PAGE_SIZE
+        assert second["next"] == None
+        assert [chat["id"] for chat in first["results"] + second["results"]] == list(
+            MessageChat.objects.order_by("-sent_date", "-pk").values_list(
+                "pk", flat=True
+            )
+        )
+
+        response = self.client.get(
+            url, {"before": "invalid"}, headers=headers, format="json"
+        )
+        assert response.status_code == 400
@@ -88,11 +88,26 @@ urlpatterns = [
         views_swipe.ApiSwipeNextSock.as_view(),
         name="api_next_sock",
     ),
+    path(
+        "user/swipe/<int:sock_id>/next/<int:count>",
+        views_swipe.ApiSwipeNextSocks.as_view(),
+        name="api_next_socks",
+    ),
+    path(
+        "user/swipe/metrics",
+        views_swipe.ApiSwipeMetrics.as_view(),
+        name="api_swipe_metrics",
+    ),
     path(
         "user/swipe/<int:sock_id>/judge/<int:other_sock_id>",
         views_swipe.ApiJudgeSock.as_view(),
         name="api_judge_sock",
     ),
+    path(
+        "user/swipe/<int:sock_id>/judge",
+        views_swipe.ApiJudgeSocks.as_view(),
+        name="api_judge_socks",
+    ),
     # Match
     path(
         "user/matches/",
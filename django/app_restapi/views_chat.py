@@ -2,6 +2,7 @@ from rest_framework import status
 from rest_framework.permissions import IsAuthenticated, IsAdminUser
 from rest_framework.response import Response
 from rest_framework import permissions
+from rest_framework.utils.urls import replace_query_param
 
 from rest_framework.generics import (
     GenericAPIView,
@@ -13,6 +14,7 @@ from django.shortcuts import get_object_or_404
 from app_users.models import User, MessageChat
 from .serializers_users import (
     ChatSerializer,
+    ChatHistorySerializer,
     ChatSendSerializer,
 )
 
@@ -45,7 +47,7 @@ class ApiGetChats(ListAPIView):
 
 class ApiGetSendChat(GenericAPIView):
     """
-    Get a chat with a specific receiver
+    Get a chat with a specific receiver (a page, ?before= for the older ones)
     Sned a chat to a specific receiver
     """
 
@@ -54,7 +56,7 @@ class ApiGetSendChat(GenericAPIView):
     def get_serializer_class(self):
         if self.request.method == "POST":
             return ChatSendSerializer
-        return ChatSerializer
+        return ChatHistorySerializer
 
     def get(self, request, *args, **kwargs):
         # get expected user instance
@@ -62,14 +64,28 @@ class ApiGetSendChat(GenericAPIView):
         receiver_user = get_object_or_404(User, username=kwargs.get("receiver", None))
 
         if user and receiver_user and user != receiver_user:
-            queryset = (
-                MessageChat.objects.all()
-                .filter(user=user, other=receiver_user)
-                .order_by("-pk")
+            # keyset pagination: ?before= is the "next" cursor of the
+            # previous page (the chats of both users, newest first)
+            before = request.query_params.get("before", None)
+            if before is not None:
+                before = MessageChat.parse_cursor(before)
+                if before is None:
+                    return Response(status=status.HTTP_400_BAD_REQUEST)
+            chats, cursor = MessageChat.history(
+                user.pk, receiver_user.pk, before=before
+            )
+            # serialize chat instances
+            return Response(
+                data={
+                    "next": replace_query_param(
+                        request.build_absolute_uri(), "before", cursor
+                    )
+                    if cursor
+                    else None,
+                    "results": ChatHistorySerializer(chats, many=True).data,
+                },
+                status=status.HTTP_200_OK,
             )
-            # serialize user instance
-            serialized_user = ChatSerializer(queryset, many=True).data
-            return Response(data=serialized_user, status=status.HTTP_200_OK)
         else:
             return Response(status=status.HTTP_400_BAD_REQUEST)
 
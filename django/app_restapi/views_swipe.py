@@ -1,4 +1,3 @@
-import uuid
 from rest_framework import status
 from rest_framework.permissions import IsAuthenticated, IsAdminUser
 from rest_framework.response import Response
@@ -8,21 +7,32 @@ from rest_framework.generics import (
     GenericAPIView,
 )
 
+from django.conf import settings
 from django.shortcuts import get_object_or_404
-from django.db.models import Q
 
-from app_users.models import Sock, SockLike, UserMatch
+from app_users.models import Sock, SockLike
 from .serializers_users import (
+    JudgementSerializer,
     SockSerializer,
     UserForMatchSerializer,
     SockForMatchSerializer,
     SockForMatchWithIDSerializer,
 )
 
-from app_mail.tasks import celery_send_mail
+from app_mail.tasks import send_match_mails
 from app_home.pre_prediction_algorithm import PrePredictionAlgorithm
 
 
+def match_json(user_sock: Sock, other_sock: Sock, user_match) -> dict:
+    return {
+        "user": UserForMatchSerializer(user_sock.user).data,
+        "other_user": UserForMatchSerializer(other_sock.user).data,
+        "sock": SockForMatchSerializer(user_sock).data,
+        "other_sock": SockForMatchSerializer(other_sock).data,
+        "chatroom_uuid": user_match.chatroom_uuid,
+    }
+
+
 class ApiSwipeNextSock(GenericAPIView):
     """Get next sock view"""
 
@@ -39,19 +49,97 @@ class ApiSwipeNextSock(GenericAPIView):
                 {"error": "this sock was not found"}, status=status.HTTP_400_BAD_REQUEST
             )
 
-        # get a next sock to swipe for
-        next_sock = PrePredictionAlgorithm.get_next_sock(current_user, current_sock)
+        # the score breakdown of the socks (debug explain mode) is for staff only
+        explain = request.query_params.get("explain") == "true"
+        if explain and not current_user.is_staff:
+            return Response(
+                {"error": "explain is only available for staff users"},
+                status=status.HTTP_403_FORBIDDEN,
+            )
 
-        print(current_user, current_sock, Sock.objects.all())
+        # get a next sock to swipe for
+        if explain:
+            next_socks, explanations = PrePredictionAlgorithm.explain_next_socks(
+                current_user, current_sock, 1
+            )
+            next_sock = next_socks[0] if next_socks else None
+        else:
+            next_sock = PrePredictionAlgorithm.get_next_sock(current_user, current_sock)
 
         if next_sock:
             # return the sock as json
             serialize_sock = SockForMatchWithIDSerializer(next_sock)
-            return Response(serialize_sock.data, status=status.HTTP_200_OK)
+            data = serialize_sock.data
+            if explain:
+                data["explain"] = explanations[0]
+            return Response(data, status=status.HTTP_200_OK)
         # no more socks to swipe for
         return Response({"error": "no more socks"}, status=status.HTTP_404_NOT_FOUND)
 
 
+class ApiSwipeNextSocks(GenericAPIView):
+    """Get the next <count> socks view (a deck of ranked socks for prefetching)"""
+
+    permission_classes = [IsAuthenticated]
+    serializer_class = SockForMatchWithIDSerializer
+
+    def get(self, request, *args, **kwargs):
+        current_user = request.user
+        # get the sock that the user is currently using to swipe
+        try:
+            current_sock = Sock.objects.get(user=current_user, pk=kwargs["sock_id"])
+        except Sock.DoesNotExist:
+            return Response(
+                {"error": "this sock was not found"}, status=status.HTTP_400_BAD_REQUEST
+            )
+
+        max_count = PrePredictionAlgorithm.candidate_queue.size
+        if not 1 <= kwargs["count"] <= max_count:
+            return Response(
+                {"error": f"count has to be between 1 and {max_count}"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        # the score breakdown of the socks (debug explain mode) is for staff only
+        explain = request.query_params.get("explain") == "true"
+        if explain and not current_user.is_staff:
+            return Response(
+                {"error": "explain is only available for staff users"},
+                status=status.HTTP_403_FORBIDDEN,
+            )
+
+        # get the next socks to swipe for (one prefilter & scoring pass at most)
+        if explain:
+            next_socks, explanations = PrePredictionAlgorithm.explain_next_socks(
+                current_user, current_sock, kwargs["count"]
+            )
+        else:
+            next_socks = PrePredictionAlgorithm.get_next_socks(
+                current_user, current_sock, kwargs["count"]
+            )
+
+        if next_socks:
+            # return the socks (including their pictures) as json
+            serialize_socks = SockForMatchWithIDSerializer(next_socks, many=True)
+            data = serialize_socks.data
+            if explain:
+                for item, explanation in zip(data, explanations):
+                    item["explain"] = explanation
+            return Response(data, status=status.HTTP_200_OK)
+        # no more socks to swipe for
+        return Response({"error": "no more socks"}, status=status.HTTP_404_NOT_FOUND)
+
+
+class ApiSwipeMetrics(GenericAPIView):
+    """Get the stage metrics of the prediction pipeline (of this process)"""
+
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, *args, **kwargs):
+        metrics = PrePredictionAlgorithm.ranker.metrics.snapshot()
+        return Response(metrics, status=status.HTTP_200_OK)
+
+
 class ApiJudgeSock(GenericAPIView):
     """Judge a sock view"""
 
@@ -91,78 +179,68 @@ class ApiJudgeSock(GenericAPIView):
                 status=status.HTTP_400_BAD_REQUEST,
             )
 
-        # Store the decision in the database
-        if request.query_params.get("like") == "true":
-            # we use get_or_create to beware of duplicates!
-            sock_instance, sock_like_created = SockLike.objects.get_or_create(
-                sock=current_user_sock, like=sock_to_be_decided_on
+        # write-behind swipes: the judgement is buffered and stored by a celery
+        # task, new matches are notified by mail then
+        if PrePredictionAlgorithm.swipe_buffer is not None:
+            pending = PrePredictionAlgorithm.swipe_buffer.pending(current_user_sock.pk)
+            if sock_to_be_decided_on.pk in pending:
+                return Response(
+                    {
+                        "message": f"sock <{sock_to_be_decided_on.pk}> was already judged",
+                        "match": "no new match",
+                    },
+                    status=status.HTTP_208_ALREADY_REPORTED,
+                )
+            like = request.query_params.get("like") == "true"
+            PrePredictionAlgorithm.buffer_judgements(
+                current_user_sock, [(sock_to_be_decided_on.pk, like)]
+            )
+            return Response(
+                {
+                    "message": f"sock <{sock_to_be_decided_on.pk}> was {'liked' if like else 'disliked'}",
+                    "match": "a new match is notified by mail",
+                },
+                status=status.HTTP_202_ACCEPTED,
             )
-            if not sock_like_created:
+
+        # Store the decision in the database (see SockLike.judge)
+        like = request.query_params.get("like") == "true"
+        sock_like_created, user_match_object = SockLike.judge(
+            current_user_sock, sock_to_be_decided_on, like=like
+        )
+        # the judged sock is removed from the candidate queue of the current sock
+        PrePredictionAlgorithm.sock_judged(current_user_sock, sock_to_be_decided_on.pk)
+
+        if not sock_like_created:
+            # the former judgement counts (a sock judges another sock once)
+            stored_like = SockLike.objects.filter(
+                sock=current_user_sock,
+                target=sock_to_be_decided_on,
+                decision=SockLike.Decision.LIKE,
+            ).exists()
+            if like or stored_like:
                 # return a message of now new match
                 return Response(
                     {
-                        "message": f"sock <{sock_to_be_decided_on.pk}> was already liked",
+                        "message": f"sock <{sock_to_be_decided_on.pk}> was already {'liked' if stored_like else 'disliked'}",
                         "match": "no new match",
                     },
                     status=status.HTTP_208_ALREADY_REPORTED,
                 )
 
-            # check for user to user match via the socks
-            if current_user_sock in sock_to_be_decided_on.get_likes():
-                # create match in UserMatchTable if not already exists!
-                try:
-                    user_match_object = UserMatch.objects.get(
-                        Q(user=current_user_sock.user, other=sock_to_be_decided_on.user)
-                        | Q(
-                            other=current_user_sock.user,
-                            user=sock_to_be_decided_on.user,
-                        )
-                    )
-                    user_match_created = False
-                except UserMatch.DoesNotExist:
-                    user_match_object = UserMatch.objects.create(
-                        user=current_user_sock.user,
-                        other=sock_to_be_decided_on.user,
-                        chatroom_uuid=uuid.uuid4(),
-                    )
-                    user_match_created = True
-
-                if user_match_created:
-                    # sending match email
-                    match_message = "Please visit HotSox to check your new match :)"
-                    celery_send_mail.delay(
-                        email_subject=f"You have a match with {sock_to_be_decided_on.user.username}",
-                        email_message=match_message,
-                        recipient_list=[current_user_sock.user.email],
-                        notification=current_user_sock.user.notification,
-                    )
-                    celery_send_mail.delay(
-                        email_subject=f"You have a match with {current_user_sock.user.username}",
-                        email_message=match_message,
-                        recipient_list=[sock_to_be_decided_on.user.email],
-                        notification=sock_to_be_decided_on.user.notification,
-                    )
-
-                    # return a message of a new match
-                    match_json = {
-                        "user": UserForMatchSerializer(current_user_sock.user).data,
-                        "other_user": UserForMatchSerializer(
-                            sock_to_be_decided_on.user
-                        ).data,
-                        "sock": SockForMatchSerializer(current_user_sock).data,
-                        "other_sock": SockForMatchSerializer(
-                            sock_to_be_decided_on
-                        ).data,
-                        "chatroom_uuid": user_match_object.chatroom_uuid,
-                    }
-
-                    return Response(
-                        {
-                            "message": f"sock <{sock_to_be_decided_on.pk}> was liked",
-                            "match": match_json,
-                        },
-                        status=status.HTTP_201_CREATED,
-                    )
+        if like:
+            # the like completed a user to user match via the socks
+            if user_match_object:
+                send_match_mails(current_user_sock, sock_to_be_decided_on)
+                return Response(
+                    {
+                        "message": f"sock <{sock_to_be_decided_on.pk}> was liked",
+                        "match": match_json(
+                            current_user_sock, sock_to_be_decided_on, user_match_object
+                        ),
+                    },
+                    status=status.HTTP_201_CREATED,
+                )
 
             # return a message of now new match
             return Response(
@@ -178,3 +256,96 @@ class ApiJudgeSock(GenericAPIView):
             {"message": f"sock <{sock_to_be_decided_on.pk}> was disliked"},
             status=status.HTTP_201_CREATED,
         )
+
+
+class ApiJudgeSocks(GenericAPIView):
+    """Judge several socks at once view (e.g. swipes queued while offline)
+    the body is a list of {"sock_id": ..., "like": true/false}
+    """
+
+    permission_classes = [IsAuthenticated]
+    serializer_class = JudgementSerializer
+    # judgements per request
+    max_judgements = getattr(settings, "SWIPE_BULK_MAX_JUDGEMENTS", 500)
+
+    def post(self, request, *args, **kwargs):
+        current_user = request.user
+        try:
+            current_user_sock = Sock.objects.select_related("user").get(
+                user=current_user, pk=kwargs["sock_id"]
+            )
+        except Sock.DoesNotExist:
+            return Response(
+                {"error": "your sock was not found"}, status=status.HTTP_404_NOT_FOUND
+            )
+
+        # oversized payloads are rejected before they are validated
+        if isinstance(request.data, list) and len(request.data) > self.max_judgements:
+            return Response(
+                {"error": f"at most {self.max_judgements} judgements per request"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        serializer = JudgementSerializer(data=request.data, many=True)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        decisions = {
+            judgement["sock_id"]: judgement["like"]
+            for judgement in serializer.validated_data
+        }
+        # the socks to judge in one query, own socks can not be judged
+        other_socks = (
+            Sock.objects.filter(pk__in=decisions)
+            .exclude(user=current_user)
+            .select_related("user")
+            .in_bulk()
+        )
+        # write-behind swipes: the judgements are buffered (see ApiJudgeSock)
+        if PrePredictionAlgorithm.swipe_buffer is not None:
+            pending = PrePredictionAlgorithm.swipe_buffer.pending(current_user_sock.pk)
+            buffered = sorted(other_socks.keys() - pending)
+            PrePredictionAlgorithm.buffer_judgements(
+                current_user_sock,
+                [(sock_id, decisions[sock_id]) for sock_id in buffered],
+            )
+            return Response(
+                {
+                    "judged": buffered,
+                    "already_judged": sorted(other_socks.keys() & pending),
+                    "not_found": sorted(decisions.keys() - other_socks.keys()),
+                    "matches": [],
+                },
+                status=status.HTTP_202_ACCEPTED,
+            )
+
+        judged, user_matches = SockLike.judge_many(
+            current_user_sock,
+            [
+                (other_sock, decisions[sock_id])
+                for sock_id, other_sock in other_socks.items()
+            ],
+        )
+        # the judged socks are removed from the candidate queue
+        PrePredictionAlgorithm.socks_judged(current_user_sock, judged)
+
+        matches = []
+        for user_match in user_matches:
+            other_sock = next(
+                other_sock
+                for sock_id, other_sock in sorted(other_socks.items())
+                if sock_id in judged
+                and decisions[sock_id]
+                and other_sock.user_id == user_match.other_id
+            )
+            send_match_mails(current_user_sock, other_sock)
+            matches.append(match_json(current_user_sock, other_sock, user_match))
+
+        return Response(
+            {
+                "judged": sorted(judged),
+                "already_judged": sorted(other_socks.keys() - judged),
+                "not_found": sorted(decisions.keys() - other_socks.keys()),
+                "matches": matches,
+            },
+            status=status.HTTP_201_CREATED,
+        )
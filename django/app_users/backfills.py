@@ -0,0 +1,114 @@
+from django.db import transaction
+from django.db.models import F
+from django.db.models.functions import Greatest, Least
+
+# SockLike.Decision
+DISLIKE, LIKE = 0, 1
+
+
+def backfill_socklike_decisions(SockLike, batch_size: int = 5000) -> dict:
+    """fill target & decision of the SockLike rows stored with like / dislike only
+    (before migration 0010 or by instances of the former version meanwhile)
+    the rows are walked in batches of ascending ids, every batch is one short
+    transaction, so the table is never locked for long. A row judging a sock
+    which its sock already judged (a like and a dislike of the same sock) is
+    deleted, a sock judges another sock only once. SockLike is a model class
+    (the historical model in migrations). Running it again is harmless.
+    """
+    result = {"filled": 0, "deleted": 0, "batches": 0}
+    last_pk = 0
+    while True:
+        batch = list(
+            SockLike.objects.filter(pk__gt=last_pk, target=None)
+            .order_by("pk")
+            .values_list("pk", "sock_id", "like_id", "dislike_id")[:batch_size]
+        )
+        if not batch:
+            return result
+        last_pk = batch[-1][0]
+
+        with transaction.atomic():
+            # the pairs judged by rows filled already
+            judged = set(
+                SockLike.objects.filter(
+                    sock_id__in={sock_id for _, sock_id, _, _ in batch},
+                    target_id__in={
+                        like_id if like_id is not None else dislike_id
+                        for _, _, like_id, dislike_id in batch
+                    },
+                ).values_list("sock_id", "target_id")
+            )
+            likes, dislikes, duplicates = [], [], []
+            for pk, sock_id, like_id, dislike_id in batch:
+                target_id = like_id if like_id is not None else dislike_id
+                if target_id is None or (sock_id, target_id) in judged:
+                    duplicates.append(pk)
+                    continue
+                judged.add((sock_id, target_id))
+                (likes if like_id is not None else dislikes).append(pk)
+
+            SockLike.objects.filter(pk__in=duplicates).delete()
+            SockLike.objects.filter(pk__in=likes).update(
+                target=F("like"), decision=LIKE
+            )
+            SockLike.objects.filter(pk__in=dislikes).update(
+                target=F("dislike"), decision=DISLIKE
+            )
+        result["filled"] += len(likes) + len(dislikes)
+        result["deleted"] += len(duplicates)
+        result["batches"] += 1
+
+
+def backfill_usermatch_pairs(UserMatch, batch_size: int = 5000) -> dict:
+    """fill low_id & high_id of the UserMatch rows stored without the canonical
+    pair (before migration 0013 or by instances of the former version)
+    batch by batch like backfill_socklike_decisions. Of several matches of the
+    same two users the first one is kept (unmatched if any of them was), the
+    others are deleted. UserMatch is a model class (the historical model in
+    migrations). Running it again is harmless.
+    """
+    result = {"filled": 0, "deleted": 0, "batches": 0}
+    last_pk = 0
+    while True:
+        batch = list(
+            UserMatch.objects.filter(
+                pk__gt=last_pk, low_id=None, user__isnull=False, other__isnull=False
+            )
+            .order_by("pk")
+            .values_list("pk", "user_id", "other_id", "unmatched")[:batch_size]
+        )
+        if not batch:
+            return result
+        last_pk = batch[-1][0]
+
+        with transaction.atomic():
+            user_ids = {user_id for _, user_id, _, _ in batch} | {
+                other_id for _, _, other_id, _ in batch
+            }
+            # the pairs of rows filled already
+            kept = {
+                (low_id, high_id): pk
+                for pk, low_id, high_id in UserMatch.objects.filter(
+                    low_id__in=user_ids, high_id__in=user_ids
+                ).values_list("pk", "low_id", "high_id")
+            }
+            fill, duplicates, unmatch = [], [], set()
+            for pk, user_id, other_id, unmatched in batch:
+                pair = min(user_id, other_id), max(user_id, other_id)
+                if pair in kept:
+                    duplicates.append(pk)
+                    if unmatched:
+                        unmatch.add(kept[pair])
+                    continue
+                kept[pair] = pk
+                fill.append(pk)
+
+            UserMatch.objects.filter(pk__in=duplicates).delete()
+            UserMatch.objects.filter(pk__in=fill).update(
+                low_id=Least("user_id", "other_id"),
+                high_id=Greatest("user_id", "other_id"),
+            )
+            UserMatch.objects.filter(pk__in=unmatch).update(unmatched=True)
+        result["filled"] += len(fill)
+        result["deleted"] += len(duplicates)
+        result["batches"] += 1
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from app_users.backfills import backfill_socklike_decisions
+from app_users.models import SockLike
+
+
+class Command(BaseCommand):
+    help = (
+        "fills target & decision of the SockLike rows stored with like / dislike "
+        "only (batch by batch, see app_users/backfills.py). Run it after a rolling "
+        "deploy, instances of the former version only write like / dislike"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=5000)
+
+    def handle(self, *args, **kwargs):
+        result = backfill_socklike_decisions(SockLike, kwargs["batch_size"])
+        self.stdout.write(
+            f"{result['filled']} judgements filled, {result['deleted']} duplicates "
+            f"deleted in {result['batches']} batches"
+        )
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from app_users.backfills import backfill_usermatch_pairs
+from app_users.models import UserMatch
+
+
+class Command(BaseCommand):
+    help = (
+        "fills low_id & high_id of the UserMatch rows stored without the "
+        "canonical pair (batch by batch, see app_users/backfills.py). Run it "
+        "after a rolling deploy, instances of the former version only write "
+        "user / other"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=5000)
+
+    def handle(self, *args, **kwargs):
+        result = backfill_usermatch_pairs(UserMatch, kwargs["batch_size"])
+        self.stdout.write(
+            f"{result['filled']} matches filled, {result['deleted']} duplicates "
+            f"deleted in {result['batches']} batches"
+        )
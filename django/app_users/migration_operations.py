@@ -0,0 +1,50 @@
+from django.db import migrations
+
+
+class AddIndexConcurrently(migrations.AddIndex):
+    """CREATE INDEX CONCURRENTLY on postgres (writes go on while the index is
+    built), a plain CREATE INDEX on other databases
+    """
+
+    atomic = False
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        model = to_state.apps.get_model(app_label, self.model_name)
+        if schema_editor.connection.vendor != "postgresql":
+            return super().database_forwards(
+                app_label, schema_editor, from_state, to_state
+            )
+        if self.allow_migrate_model(schema_editor.connection.alias, model):
+            schema_editor.execute(
+                self.index.create_sql(model, schema_editor, concurrently=True)
+            )
+
+
+class AddUniqueConstraintConcurrently(migrations.AddConstraint):
+    """add a unique constraint without blocking writes on postgres: its index
+    is built CONCURRENTLY first and then turned into the constraint (USING
+    INDEX only takes a short lock), other databases add the constraint as usual
+    """
+
+    atomic = False
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        model = to_state.apps.get_model(app_label, self.model_name)
+        if schema_editor.connection.vendor != "postgresql":
+            return super().database_forwards(
+                app_label, schema_editor, from_state, to_state
+            )
+        if self.allow_migrate_model(schema_editor.connection.alias, model):
+            quote = schema_editor.quote_name
+            table = quote(model._meta.db_table)
+            name = quote(self.constraint.name)
+            columns = ", ".join(
+                quote(model._meta.get_field(field).column)
+                for field in self.constraint.fields
+            )
+            schema_editor.execute(
+                f"CREATE UNIQUE INDEX CONCURRENTLY {name} ON {table} ({columns})"
+            )
+            schema_editor.execute(
+                f"ALTER TABLE {table} ADD CONSTRAINT {name} UNIQUE USING INDEX {name}"
+            )
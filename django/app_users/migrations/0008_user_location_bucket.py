@@ -0,0 +1,33 @@
+# Generated by Django 4.2.1 on 2026-10-18 15:42
+
+from django.db import migrations, models
+
+from hotsox_prediction.geo_buckets import GeoBuckets
+
+
+def set_location_buckets(apps, schema_editor):
+    User = apps.get_model("app_users", "User")
+    users = User.objects.exclude(location_latitude=None).exclude(
+        location_longitude=None
+    )
+    for user in users.iterator(chunk_size=2000):
+        user.location_bucket = GeoBuckets.bucket(
+            user.location_latitude, user.location_longitude
+        )
+        if user.location_bucket is not None:
+            user.save(update_fields=["location_bucket"])
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("app_users", "0007_alter_sock_info_brand_alter_sock_info_color_and_more"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="user",
+            name="location_bucket",
+            field=models.IntegerField(blank=True, db_index=True, null=True),
+        ),
+        migrations.RunPython(set_location_buckets, migrations.RunPython.noop),
+    ]
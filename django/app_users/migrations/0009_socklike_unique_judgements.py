@@ -0,0 +1,50 @@
+# Generated by Django 4.2.1 on 2026-10-18 18:20
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+from app_users.migration_operations import AddUniqueConstraintConcurrently
+
+
+def remove_duplicate_judgements(apps, schema_editor):
+    """keep the first of several equal likes / dislikes of a sock"""
+    SockLike = apps.get_model("app_users", "SockLike")
+    for column in ("like", "dislike"):
+        duplicates = (
+            SockLike.objects.exclude(**{column: None})
+            .values("sock", column)
+            .annotate(first=Min("pk"), judgements=Count("pk"))
+            .filter(judgements__gt=1)
+        )
+        for duplicate in duplicates.iterator(chunk_size=2000):
+            SockLike.objects.filter(
+                sock=duplicate["sock"], **{column: duplicate[column]}
+            ).exclude(pk=duplicate["first"]).delete()
+
+
+class Migration(migrations.Migration):
+    """the unique indexes are built without blocking the swipes on postgres"""
+
+    atomic = False
+
+    dependencies = [
+        ("app_users", "0008_user_location_bucket"),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            remove_duplicate_judgements, migrations.RunPython.noop, atomic=True
+        ),
+        AddUniqueConstraintConcurrently(
+            model_name="socklike",
+            constraint=models.UniqueConstraint(
+                fields=("sock", "like"), name="unique_socklike_sock_like"
+            ),
+        ),
+        AddUniqueConstraintConcurrently(
+            model_name="socklike",
+            constraint=models.UniqueConstraint(
+                fields=("sock", "dislike"), name="unique_socklike_sock_dislike"
+            ),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 4.2.1 on 2026-10-18 19:05
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+    """step 1 of the switch to SockLike.target & decision: the nullable columns
+    are added without rewriting the table (0011 fills them, 0012 indexes them)
+    """
+
+    dependencies = [
+        ("app_users", "0009_socklike_unique_judgements"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="socklike",
+            name="decision",
+            field=models.SmallIntegerField(
+                blank=True, choices=[(0, "dislike"), (1, "like")], null=True
+            ),
+        ),
+        migrations.AddField(
+            model_name="socklike",
+            name="target",
+            field=models.ForeignKey(
+                blank=True,
+                db_index=False,
+                null=True,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="judged_by",
+                to="app_users.sock",
+            ),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 4.2.1 on 2026-10-18 19:05
+
+from django.db import migrations
+
+from app_users.backfills import backfill_socklike_decisions
+
+
+def fill_decisions(apps, schema_editor):
+    backfill_socklike_decisions(apps.get_model("app_users", "SockLike"))
+
+
+class Migration(migrations.Migration):
+    """step 2: fill target & decision of the stored judgements batch by batch
+    (large tables can be filled beforehand with manage.py
+    backfill_socklike_decisions, the migration then finds nothing left to do)
+    """
+
+    # one transaction per batch (see backfill_socklike_decisions)
+    atomic = False
+
+    dependencies = [
+        ("app_users", "0010_socklike_target_decision"),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_decisions, migrations.RunPython.noop),
+    ]
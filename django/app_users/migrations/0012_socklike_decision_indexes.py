@@ -0,0 +1,37 @@
+# Generated by Django 4.2.1 on 2026-10-18 19:05
+
+from django.db import migrations, models
+
+from app_users.migration_operations import (
+    AddIndexConcurrently,
+    AddUniqueConstraintConcurrently,
+)
+
+
+class Migration(migrations.Migration):
+    """step 3: the indexes of the seen checks (unique sock & target) and of the
+    reciprocal like checks (target, decision, sock), built without blocking the
+    swipes on postgres
+    """
+
+    atomic = False
+
+    dependencies = [
+        ("app_users", "0011_backfill_socklike_decisions"),
+    ]
+
+    operations = [
+        AddUniqueConstraintConcurrently(
+            model_name="socklike",
+            constraint=models.UniqueConstraint(
+                fields=("sock", "target"), name="unique_socklike_sock_target"
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="socklike",
+            index=models.Index(
+                fields=["target", "decision", "sock"],
+                name="socklike_target_decision",
+            ),
+        ),
+    ]
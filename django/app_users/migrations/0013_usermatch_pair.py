@@ -0,0 +1,26 @@
+# Generated by Django 4.2.1 on 2026-10-18 20:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    """step 1 of the canonical UserMatch pair: the nullable columns are added
+    without rewriting the table (0014 fills them, 0015 adds the unique index)
+    """
+
+    dependencies = [
+        ("app_users", "0012_socklike_decision_indexes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="usermatch",
+            name="high_id",
+            field=models.BigIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name="usermatch",
+            name="low_id",
+            field=models.BigIntegerField(blank=True, editable=False, null=True),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 4.2.1 on 2026-10-18 20:10
+
+from django.db import migrations
+
+from app_users.backfills import backfill_usermatch_pairs
+
+
+def fill_pairs(apps, schema_editor):
+    backfill_usermatch_pairs(apps.get_model("app_users", "UserMatch"))
+
+
+class Migration(migrations.Migration):
+    """step 2: fill the pairs of the stored matches batch by batch and remove
+    the duplicate matches (manage.py backfill_usermatch_pairs does the same)
+    """
+
+    # one transaction per batch (see backfill_usermatch_pairs)
+    atomic = False
+
+    dependencies = [
+        ("app_users", "0013_usermatch_pair"),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_pairs, migrations.RunPython.noop),
+    ]
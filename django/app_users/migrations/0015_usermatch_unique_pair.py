@@ -0,0 +1,26 @@
+# Generated by Django 4.2.1 on 2026-10-18 20:10
+
+from django.db import migrations, models
+
+from app_users.migration_operations import AddUniqueConstraintConcurrently
+
+
+class Migration(migrations.Migration):
+    """step 3: the unique index of the match lookups (low_id, high_id), built
+    without blocking the swipes on postgres
+    """
+
+    atomic = False
+
+    dependencies = [
+        ("app_users", "0014_backfill_usermatch_pairs"),
+    ]
+
+    operations = [
+        AddUniqueConstraintConcurrently(
+            model_name="usermatch",
+            constraint=models.UniqueConstraint(
+                fields=("low_id", "high_id"), name="unique_usermatch_pair"
+            ),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 4.2.1 on 2026-10-18 21:30
+
+from django.db import migrations, models
+
+from app_users.migration_operations import AddIndexConcurrently
+
+
+class Migration(migrations.Migration):
+    """the index of the chatroom lookups of the chat sockets, built without
+    blocking the matches on postgres
+    """
+
+    atomic = False
+
+    dependencies = [
+        ("app_users", "0015_usermatch_unique_pair"),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name="usermatch",
+            index=models.Index(
+                fields=["chatroom_uuid"], name="usermatch_chatroom_uuid"
+            ),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 4.2.1 on 2026-10-18 22:40
+
+from django.db import migrations, models
+
+from app_users.migration_operations import AddIndexConcurrently
+
+
+class Migration(migrations.Migration):
+    """the index of the chat history pages, built without blocking the chats
+    on postgres
+    """
+
+    atomic = False
+
+    dependencies = [
+        ("app_users", "0016_usermatch_chatroom_uuid_index"),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name="messagechat",
+            index=models.Index(
+                fields=["user", "other", "sent_date", "id"],
+                name="messagechat_history",
+            ),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 4.2.1 on 2026-10-18 23:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    """the read receipts (watermarks) of the users of a match, nullable
+    columns added without rewriting the table
+    """
+
+    dependencies = [
+        ("app_users", "0017_messagechat_history_index"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="usermatch",
+            name="other_read_id",
+            field=models.BigIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name="usermatch",
+            name="user_read_id",
+            field=models.BigIntegerField(blank=True, editable=False, null=True),
+        ),
+    ]
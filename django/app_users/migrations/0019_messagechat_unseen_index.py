@@ -0,0 +1,28 @@
+# Generated by Django 4.2.1 on 2026-10-18 23:20
+
+from django.db import migrations, models
+
+from app_users.migration_operations import AddIndexConcurrently
+
+
+class Migration(migrations.Migration):
+    """the partial index of the unseen chat messages (read receipts), built
+    without blocking the chats on postgres
+    """
+
+    atomic = False
+
+    dependencies = [
+        ("app_users", "0018_usermatch_read_receipts"),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name="messagechat",
+            index=models.Index(
+                condition=models.Q(("seen_date__isnull", True)),
+                fields=["other", "user", "id"],
+                name="messagechat_unseen",
+            ),
+        ),
+    ]
@@ -1,18 +1,22 @@
+import base64
 import os
 import sys
+import uuid
 from django.conf import settings
-from django.db import models
-from django.db.models import Q
+from django.db import models, transaction
+from django.db.models import F, Q, Subquery
+from django.db.models.functions import Coalesce, Greatest
 from django.db.models import signals
 from django.utils.translation import gettext_lazy as _
 from django.dispatch import receiver
 from django.contrib.auth.models import AbstractUser
 from django.utils import timezone
-from datetime import date, timedelta
+from datetime import date, datetime, timedelta
 from cloudinary import uploader
 from cloudinary.models import CloudinaryField
 
 from app_geo.utilities import GeoLocation
+from hotsox_prediction.geo_buckets import GeoBuckets
 
 from .tasks import destroy_profilepicture_on_cloud
 
@@ -42,6 +46,8 @@ class User(AbstractUser):
     location_city = models.CharField(max_length=255, blank=False)
     location_latitude = models.FloatField(blank=True, null=True)
     location_longitude = models.FloatField(blank=True, null=True)
+    # grid cell of the location for the max distance prefilter (see GeoBuckets)
+    location_bucket = models.IntegerField(blank=True, null=True, db_index=True)
     notification = models.BooleanField(default=True)
     social_instagram = models.URLField(
         max_length=255,
@@ -173,16 +179,19 @@ def create_user(sender, instance, **kwargs):
     if os.getenv("GITHUB_WORKFLOW") or "test" in sys.argv[0] or "test" in sys.argv[1]:
         instance.location_latitude = 0
         instance.location_longitude = 0
-        return
-
-    try:
-        (
-            instance.location_latitude,
-            instance.location_longitude,
-        ) = GeoLocation.get_geolocation_from_city(instance.location_city)
-    except:
-        instance.location_latitude = 0
-        instance.location_longitude = 0
+    else:
+        try:
+            (
+                instance.location_latitude,
+                instance.location_longitude,
+            ) = GeoLocation.get_geolocation_from_city(instance.location_city)
+        except:
+            instance.location_latitude = 0
+            instance.location_longitude = 0
+
+    instance.location_bucket = GeoBuckets.bucket(
+        instance.location_latitude, instance.location_longitude
+    )
 
 
 class UserProfilePicture(models.Model):
@@ -221,19 +230,90 @@ class UserMatch(models.Model):
     )
     unmatched = models.BooleanField(default=False)
     chatroom_uuid = models.UUIDField()
+    # the canonical pair of user & other (lower id, higher id), whoever liked
+    # first: a match is found with one probe of the unique index (see between)
+    low_id = models.BigIntegerField(blank=True, null=True, editable=False)
+    high_id = models.BigIntegerField(blank=True, null=True, editable=False)
+    # read receipts: the id of the newest message user & other have read of
+    # the chat (watermark, see read)
+    user_read_id = models.BigIntegerField(blank=True, null=True, editable=False)
+    other_read_id = models.BigIntegerField(blank=True, null=True, editable=False)
+
+    class Meta:
+        constraints = [
+            # two users match only once (INSERT ... ON CONFLICT, see judge_many)
+            models.UniqueConstraint(
+                fields=["low_id", "high_id"], name="unique_usermatch_pair"
+            ),
+        ]
+        indexes = [
+            # the chat sockets find their match by the chatroom of the session
+            models.Index(fields=["chatroom_uuid"], name="usermatch_chatroom_uuid"),
+        ]
 
     def __str__(self) -> str:
         return f"<Match between {self.user} and {self.other} status {self.unmatched} chatroom_uuid {self.chatroom_uuid} >"
 
+    def save(self, *args, **kwargs):
+        self.low_id, self.high_id = UserMatch.pair(self.user_id, self.other_id)
+        super().save(*args, **kwargs)
+
+    @staticmethod
+    def pair(user_id: int | None, other_id: int | None) -> tuple:
+        """return the canonical (low, high) pair of two user ids"""
+        if user_id is None or other_id is None:
+            return None, None
+        return min(user_id, other_id), max(user_id, other_id)
+
+    @staticmethod
+    def between(user: User | int, other: User | int) -> models.QuerySet:
+        """return the match (queryset) of two users (instances or ids), no
+        match if a user has no id (e.g. anonymous): a filter on None would
+        find the rows of unsaved pairs (IS NULL)
+        """
+        low_id, high_id = UserMatch.pair(
+            getattr(user, "pk", user), getattr(other, "pk", other)
+        )
+        if low_id is None:
+            return UserMatch.objects.none()
+        return UserMatch.objects.filter(low_id=low_id, high_id=high_id)
+
     def has_matches_between(self, user_instance: User, other_instance: User) -> bool:
         return (
-            UserMatch.objects.filter(
-                Q(user=user_instance, other=other_instance)
-                | Q(user=other_instance, other=user_instance)
-            ).exists()
+            UserMatch.between(user_instance, other_instance).exists()
             and not self.unmatched
         )
 
+    def read_id(self, user_id: int) -> int | None:
+        """return the read receipt (watermark) of a user of the match"""
+        return self.user_read_id if user_id == self.user_id else self.other_read_id
+
+    def read(self, user_id: int, message_id: int | None = None):
+        """record that a user of the match read the chat up to message_id
+        (default: every message received so far): one UPDATE moves the
+        watermark of the user forward (never back), the seen date of the
+        unseen messages up to it is set by one more (unseen messages index)
+        """
+        sender_id = self.other_id if user_id == self.user_id else self.user_id
+        field = "user_read_id" if user_id == self.user_id else "other_read_id"
+        received = MessageChat.objects.filter(user_id=sender_id, other_id=user_id)
+        unseen = received.filter(seen_date__isnull=True)
+        if message_id is None:
+            message_id = Subquery(
+                received.order_by("-sent_date", "-pk").values("pk")[:1]
+            )
+        else:
+            unseen = unseen.filter(pk__lte=message_id)
+        UserMatch.objects.filter(pk=self.pk).update(
+            **{
+                field: Greatest(
+                    Coalesce(F(field), 0),
+                    Coalesce(message_id, 0, output_field=models.BigIntegerField()),
+                )
+            }
+        )
+        unseen.update(seen_date=timezone.now())
+
 
 class Sock(models.Model):
     user = models.ForeignKey(User, related_name="sock", on_delete=models.CASCADE)
@@ -367,7 +447,9 @@ class Sock(models.Model):
             QuerySet: A queryset of Sock instances liked by the current Sock
             instance
         """
-        likes = Sock.objects.filter(like__sock=self)
+        likes = Sock.objects.filter(
+            judged_by__sock=self, judged_by__decision=SockLike.Decision.LIKE
+        )
         return likes
 
     def get_dislikes(self):
@@ -378,7 +460,9 @@ class Sock(models.Model):
         Returns:
             QuerySet: A queryset of Sock instances disliked by the current Sock instance
         """
-        dislikes = Sock.objects.filter(dislike__sock=self)
+        dislikes = Sock.objects.filter(
+            judged_by__sock=self, judged_by__decision=SockLike.Decision.DISLIKE
+        )
         return dislikes
 
     def __str__(self) -> str:
@@ -416,9 +500,27 @@ class SockProfilePicture(models.Model):
 
 
 class SockLike(models.Model):
+    """the judgement (like or dislike) of the sock target by sock"""
+
+    class Decision(models.IntegerChoices):
+        DISLIKE = 0, "dislike"
+        LIKE = 1, "like"
+
     sock = models.ForeignKey(
         Sock, related_name="sock_likes", on_delete=models.CASCADE, blank=False
     )
+    # the indexes of Meta cover the lookups of target
+    target = models.ForeignKey(
+        Sock,
+        related_name="judged_by",
+        on_delete=models.CASCADE,
+        blank=True,
+        null=True,
+        db_index=False,
+    )
+    decision = models.SmallIntegerField(choices=Decision.choices, blank=True, null=True)
+    # deprecated, target & decision replace them: they are still written for
+    # instances of the former version (rolling deploys) and dropped afterwards
     like = models.ForeignKey(
         Sock,
         related_name="like",
@@ -434,9 +536,150 @@ class SockLike(models.Model):
         null=True,
     )
 
+    class Meta:
+        constraints = [
+            # a sock judges another sock only once (INSERT ... ON CONFLICT, see
+            # judge), the index answers the seen checks (sock, target) index-only
+            models.UniqueConstraint(
+                fields=["sock", "target"], name="unique_socklike_sock_target"
+            ),
+            models.UniqueConstraint(
+                fields=["sock", "like"], name="unique_socklike_sock_like"
+            ),
+            models.UniqueConstraint(
+                fields=["sock", "dislike"], name="unique_socklike_sock_dislike"
+            ),
+        ]
+        indexes = [
+            # reciprocal like checks: the socks which liked a sock (index-only)
+            models.Index(
+                fields=["target", "decision", "sock"],
+                name="socklike_target_decision",
+            ),
+        ]
+
     def __str__(self) -> str:
         return f"<SockLike for {self.sock}>"
 
+    def save(self, *args, **kwargs):
+        self.fill_columns()
+        super().save(*args, **kwargs)
+
+    def fill_columns(self):
+        """fill target & decision of a judgement given by like / dislike and
+        the deprecated like / dislike of a judgement given by target & decision
+        """
+        if self.target_id is None:
+            self.target_id = (
+                self.like_id if self.like_id is not None else self.dislike_id
+            )
+            self.decision = (
+                SockLike.Decision.LIKE
+                if self.like_id is not None
+                else SockLike.Decision.DISLIKE
+            )
+        elif self.like_id is None and self.dislike_id is None:
+            if self.decision == SockLike.Decision.LIKE:
+                self.like_id = self.target_id
+            else:
+                self.dislike_id = self.target_id
+
+    @staticmethod
+    def new(sock_id: int, target_id: int, like: bool) -> "SockLike":
+        """return an unsaved judgement with all of its columns (bulk_create)"""
+        judgement = SockLike(
+            sock_id=sock_id,
+            target_id=target_id,
+            decision=SockLike.Decision.LIKE if like else SockLike.Decision.DISLIKE,
+        )
+        judgement.fill_columns()
+        return judgement
+
+    @staticmethod
+    def judge(
+        sock: Sock, other_sock: Sock, like: bool
+    ) -> tuple[bool, UserMatch | None]:
+        """store the like or dislike of other_sock by sock (see judge_many) and
+        return if it was new and the UserMatch if the like created a match
+        """
+        judged, matches = SockLike.judge_many(sock, [(other_sock, like)])
+        return bool(judged), matches[0] if matches else None
+
+    @staticmethod
+    def judge_many(sock: Sock, judgements: list) -> tuple[set, list]:
+        """store the likes and dislikes ((other sock, like) tuples, the last one
+        of a sock counts) of sock in one transaction and return the ids of the
+        newly judged socks and the UserMatches created by mutual likes.
+        For likes the rows of all involved users are locked first (in id order),
+        so simultaneous judgements between two users run one after another: a
+        mutual like always sees the other like and the users match only once.
+        The judgements and matches are inserted with ON CONFLICT DO NOTHING: a
+        sock judges another sock once, repeated (or changed) judgements change
+        nothing, two users match once.
+        """
+        decisions = {
+            other_sock.pk: (other_sock, like) for other_sock, like in judgements
+        }
+        likes = {sock_id for sock_id, (_, like) in decisions.items() if like}
+        with transaction.atomic():
+            if likes:
+                users = {sock.user_id} | {decisions[pk][0].user_id for pk in likes}
+                list(
+                    User.objects.select_for_update()
+                    .filter(pk__in=users)
+                    .order_by("pk")
+                    .values_list("pk", flat=True)
+                )
+            # the former judgements and the reciprocal likes in one query
+            # (both index-only, see Meta)
+            rows = SockLike.objects.filter(
+                Q(sock=sock, target__in=decisions)
+                | Q(target=sock, decision=SockLike.Decision.LIKE, sock__in=likes)
+            ).values_list("sock_id", "target_id")
+            judged, liked_back = set(), set()
+            for sock_id, target_id in rows:
+                if sock_id == sock.pk:
+                    judged.add(target_id)
+                else:
+                    liked_back.add(sock_id)
+
+            SockLike.objects.bulk_create(
+                [
+                    SockLike.new(sock.pk, sock_id, like)
+                    for sock_id, (_, like) in decisions.items()
+                    if sock_id not in judged
+                ],
+                ignore_conflicts=True,
+            )
+
+            # new mutual likes match the users once: a pair which matched
+            # already conflicts with the unique pair index and is skipped
+            matching_users = {
+                decisions[sock_id][0].user_id for sock_id in liked_back - judged
+            }
+            matches = [
+                UserMatch(
+                    user_id=sock.user_id,
+                    other_id=user_id,
+                    chatroom_uuid=uuid.uuid4(),
+                )
+                for user_id in sorted(matching_users)
+            ]
+            for match in matches:
+                match.low_id, match.high_id = UserMatch.pair(
+                    match.user_id, match.other_id
+                )
+            UserMatch.objects.bulk_create(matches, ignore_conflicts=True)
+            # the inserted matches (ON CONFLICT DO NOTHING returns no ids)
+            if matches:
+                matches = list(
+                    UserMatch.objects.filter(
+                        user_id=sock.user_id,
+                        chatroom_uuid__in=[match.chatroom_uuid for match in matches],
+                    ).order_by("other_id")
+                )
+        return decisions.keys() - judged, matches
+
 
 class MessageMail(models.Model):
     user = models.ForeignKey(User, related_name="mail", on_delete=models.CASCADE)
@@ -459,8 +702,81 @@ class MessageChat(models.Model):
     sent_date = models.DateTimeField(auto_now_add=True, blank=False)
     seen_date = models.DateTimeField(blank=True, null=True)
 
+    # messages per page of the chat history
+    HISTORY_PAGE_SIZE = 50
+
+    class Meta:
+        indexes = [
+            # the chat history of a direction, read backwards from a cursor
+            models.Index(
+                fields=["user", "other", "sent_date", "id"],
+                name="messagechat_history",
+            ),
+            # the (few) unseen messages of a chat, marked seen by the read
+            # receipts (see UserMatch.read)
+            models.Index(
+                fields=["other", "user", "id"],
+                condition=Q(seen_date__isnull=True),
+                name="messagechat_unseen",
+            ),
+        ]
+
     def __str__(self) -> str:
         if self.seen_date:
             return f"<Chat from {self.user} to {self.other} Subject: {self.message} sent@{self.sent_date.time()} / seen@{self.seen_date.time()}>"
         else:
             return f"<Chat from {self.user} to {self.other} Subject: {self.message} sent@{self.sent_date.time()} / UNSEEN YET!"
+
+    @property
+    def sent_time(self) -> str:
+        """the time the chat was sent as shown in the chat (e.g. 9:30 PM)"""
+        return self.sent_date.strftime("%I:%M %p").lstrip("0")
+
+    @classmethod
+    def history(
+        cls, user_id: int, other_id: int, before: tuple | None = None, limit=None
+    ) -> tuple:
+        """return a page of the chat between two users (newest first) and the
+        cursor of the next (older) page, None on the last page
+        keyset pagination over (sent_date, id): before is the cursor tuple of
+        the oldest message of the previous page; every direction is read
+        backwards from it on its own (history index) and both are merged, so
+        a page costs the same in a short and in a long chat
+        """
+        limit = limit or cls.HISTORY_PAGE_SIZE
+        page = []
+        for sender_id, receiver_id in ((user_id, other_id), (other_id, user_id)):
+            messages = cls.objects.filter(user_id=sender_id, other_id=receiver_id)
+            if before:
+                sent_date, pk = before
+                # the redundant sent_date bound keeps the index range scan
+                messages = messages.filter(
+                    Q(sent_date__lt=sent_date) | Q(sent_date=sent_date, pk__lt=pk),
+                    sent_date__lte=sent_date,
+                )
+            # one message more than the page tells if there is a next page
+            page += messages.select_related("user", "other").order_by(
+                "-sent_date", "-pk"
+            )[: limit + 1]
+        page.sort(key=lambda message: (message.sent_date, message.pk), reverse=True)
+        if len(page) > limit:
+            return page[:limit], cls.cursor(page[limit - 1])
+        return page, None
+
+    @staticmethod
+    def cursor(message) -> str:
+        """return the (opaque) cursor of the messages sent before message"""
+        return base64.urlsafe_b64encode(
+            f"{message.sent_date.isoformat()}|{message.pk}".encode()
+        ).decode()
+
+    @staticmethod
+    def parse_cursor(cursor: str) -> tuple | None:
+        """return the (sent_date, id) of a cursor, None if it is not valid"""
+        try:
+            sent_date, pk = (
+                base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+            )
+            return datetime.fromisoformat(sent_date), int(pk)
+        except (ValueError, UnicodeError):
+            return None
@@ -1,5 +1,17 @@
 from django.test import TestCase
-from ..models import User, UserProfilePicture, UserMatch, Sock, MessageMail, MessageChat
+from django.contrib.auth.models import AnonymousUser
+from django.db import IntegrityError
+from django.db.models import Q
+from ..models import (
+    User,
+    UserProfilePicture,
+    UserMatch,
+    Sock,
+    SockLike,
+    MessageMail,
+    MessageChat,
+)
+from ..backfills import backfill_socklike_decisions, backfill_usermatch_pairs
 from datetime import date
 from unittest import mock
 import uuid
@@ -206,3 +218,201 @@ class UserModelTestCase(TestCase):
         self.assertEqual(len(messages), 2)
         self.assertIn(self.chat1, messages)
         self.assertIn(self.chat2, messages)
+
+    def test_socklike_judge_like(self):
+        self.user_match2.delete()
+        sock3 = Sock.objects.create(
+            user=self.user3,
+            info_name="Test Sock3",
+            info_color="blue",
+            info_fabric="cotton",
+            info_fabric_thickness="1",
+            info_brand="aldi",
+            info_type="knee_high",
+            info_size="40-45",
+            info_age=11,
+            info_condition="11",
+            info_holes=3,
+            info_kilometers=100,
+            info_inoutdoor="2",
+            info_washed=15,
+            info_special="test special",
+        )
+
+        self.assertEqual((True, None), SockLike.judge(self.sock1, sock3, like=True))
+        # a repeated like is not stored again
+        self.assertEqual((False, None), SockLike.judge(self.sock1, sock3, like=True))
+        self.assertEqual(1, SockLike.objects.filter(sock=self.sock1).count())
+
+        # the reciprocal like creates the match of the users
+        created, user_match = SockLike.judge(sock3, self.sock1, like=True)
+        self.assertTrue(created)
+        self.assertEqual(
+            (self.user3, self.user1, False),
+            (user_match.user, user_match.other, user_match.unmatched),
+        )
+
+        # matching socks of already matched users do not create another match
+        SockLike.judge(self.sock2, sock3, like=True)
+        self.assertEqual((True, None), SockLike.judge(sock3, self.sock2, like=True))
+        self.assertEqual(
+            1,
+            UserMatch.objects.filter(
+                Q(user=self.user1, other=self.user3)
+                | Q(user=self.user3, other=self.user1)
+            ).count(),
+        )
+
+    def test_socklike_judge_dislike(self):
+        sock3 = Sock.objects.create(
+            user=self.user2,
+            info_name="Test Sock3",
+            info_color="blue",
+            info_fabric="cotton",
+            info_fabric_thickness="1",
+            info_brand="aldi",
+            info_type="knee_high",
+            info_size="40-45",
+            info_age=11,
+            info_condition="11",
+            info_holes=3,
+            info_kilometers=100,
+            info_inoutdoor="2",
+            info_washed=15,
+            info_special="test special",
+        )
+
+        self.assertEqual((True, None), SockLike.judge(self.sock1, sock3, like=False))
+        self.assertEqual((False, None), SockLike.judge(self.sock1, sock3, like=False))
+        self.assertEqual(
+            [sock3.pk],
+            list(
+                SockLike.objects.filter(sock=self.sock1).values_list(
+                    "dislike", flat=True
+                )
+            ),
+        )
+        # a disliked sock can not be liked afterwards
+        self.assertEqual((False, None), SockLike.judge(self.sock1, sock3, like=True))
+        self.assertEqual(
+            [(sock3.pk, SockLike.Decision.DISLIKE)],
+            list(
+                SockLike.objects.filter(sock=self.sock1).values_list(
+                    "target", "decision"
+                )
+            ),
+        )
+
+    def test_backfill_socklike_decisions(self):
+        SockLike.objects.all().delete()
+        rows = SockLike.objects.bulk_create(
+            [
+                SockLike(sock=self.sock1, like=self.sock2),
+                SockLike(sock=self.sock2, dislike=self.sock1),
+                # the first judgement of a pair counts
+                SockLike(sock=self.sock1, dislike=self.sock2),
+            ]
+        )
+        # rows of the former version: like / dislike only
+        self.assertFalse(SockLike.objects.exclude(target=None).exists())
+
+        result = backfill_socklike_decisions(SockLike, batch_size=2)
+        self.assertEqual({"filled": 2, "deleted": 1, "batches": 2}, result)
+        self.assertEqual(
+            [
+                (self.sock1.pk, self.sock2.pk, SockLike.Decision.LIKE),
+                (self.sock2.pk, self.sock1.pk, SockLike.Decision.DISLIKE),
+            ],
+            list(
+                SockLike.objects.order_by("pk").values_list(
+                    "sock", "target", "decision"
+                )
+            ),
+        )
+        self.assertEqual([self.sock2], list(self.sock1.get_likes()))
+        self.assertEqual([self.sock1], list(self.sock2.get_dislikes()))
+        # nothing left to do
+        self.assertEqual(0, backfill_socklike_decisions(SockLike)["filled"])
+
+    def test_usermatch_between(self):
+        match = self.user_match2
+        self.assertEqual((self.user1.pk, self.user3.pk), (match.low_id, match.high_id))
+        # the same match whoever is asked first
+        self.assertEqual([match], list(UserMatch.between(self.user1, self.user3)))
+        self.assertEqual([match], list(UserMatch.between(self.user3.pk, self.user1)))
+        self.assertFalse(UserMatch.between(self.user2, self.user3).exists())
+        # two users match only once
+        with self.assertRaises(IntegrityError):
+            UserMatch.objects.create(
+                user=self.user3, other=self.user1, chatroom_uuid=uuid.uuid4()
+            )
+
+    def test_usermatch_between_without_id(self):
+        # rows without a pair (not backfilled yet) are never found for a user
+        # without id
+        UserMatch.objects.bulk_create(
+            [UserMatch(user=self.user2, other=self.user3, chatroom_uuid=uuid.uuid4())]
+        )
+        self.assertTrue(UserMatch.objects.filter(low_id=None).exists())
+        self.assertFalse(UserMatch.between(AnonymousUser(), self.user2).exists())
+        self.assertFalse(UserMatch.between(None, None).exists())
+
+    def test_usermatch_read(self):
+        match = self.user_match1
+        # user2 read the first chat sent by user1
+        match.read(self.user2.pk, self.chat1.pk)
+        match.refresh_from_db()
+        self.assertEqual(self.chat1.pk, match.read_id(self.user2.pk))
+        self.assertIsNone(match.read_id(self.user1.pk))
+        self.assertEqual(
+            [True, False],
+            [chat.seen_date is not None for chat in MessageChat.objects.order_by("pk")],
+        )
+        # every chat received so far, a watermark never goes back
+        match.read(self.user2.pk)
+        match.read(self.user2.pk, self.chat1.pk)
+        match.refresh_from_db()
+        self.assertEqual(self.chat2.pk, match.other_read_id)
+        self.assertFalse(MessageChat.objects.filter(seen_date=None).exists())
+
+    def test_backfill_usermatch_pairs(self):
+        UserMatch.objects.all().delete()
+        # rows of the former version: user / other only
+        UserMatch.objects.bulk_create(
+            [
+                UserMatch(
+                    user=self.user1, other=self.user2, chatroom_uuid=uuid.uuid4()
+                ),
+                UserMatch(
+                    user=self.user1, other=self.user3, chatroom_uuid=uuid.uuid4()
+                ),
+                # duplicates of the first match, an unmatch is kept
+                UserMatch(
+                    user=self.user2, other=self.user1, chatroom_uuid=uuid.uuid4()
+                ),
+                UserMatch(
+                    user=self.user1,
+                    other=self.user2,
+                    unmatched=True,
+                    chatroom_uuid=uuid.uuid4(),
+                ),
+            ]
+        )
+        self.assertFalse(UserMatch.objects.exclude(low_id=None).exists())
+
+        result = backfill_usermatch_pairs(UserMatch, batch_size=3)
+        self.assertEqual({"filled": 2, "deleted": 2, "batches": 2}, result)
+        self.assertEqual(
+            [
+                (self.user1.pk, self.user2.pk, True),
+                (self.user1.pk, self.user3.pk, False),
+            ],
+            list(
+                UserMatch.objects.order_by("pk").values_list(
+                    "low_id", "high_id", "unmatched"
+                )
+            ),
+        )
+        self.assertTrue(UserMatch.between(self.user2, self.user1).exists())
+        # nothing left to do
+        self.assertEqual(0, backfill_usermatch_pairs(UserMatch)["filled"])
@@ -545,10 +545,7 @@ class UserMatchProfileDetails(HotSoxLogInAndValidationCheckMixin, TemplateView):
             return redirect(reverse("app_users:user-matches"))
 
         # validate is match exists
-        matches = UserMatch.objects.filter(
-            Q(user=current_user, other=match_user)
-            | Q(user=match_user, other=current_user)
-        )
+        matches = UserMatch.between(current_user, match_user)
         if not matches:
             return redirect(reverse("app_users:user-matches"))
 
@@ -600,10 +597,7 @@ class UserMatchDelete(HotSoxLogInAndValidationCheckMixin, TemplateView):
             return redirect(reverse("user-matches"))
 
         # validate is match exists
-        matches = UserMatch.objects.filter(
-            Q(user=current_user, other=match_user)
-            | Q(user=match_user, other=current_user)
-        )
+        matches = UserMatch.between(current_user, match_user)
         if not matches:
             return redirect(reverse("user-matches"))
 
@@ -11,7 +11,6 @@ https://docs.djangoproject.com/en/4.1/howto/deployment/asgi/
 import os
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "hotsox_project.settings")
-os.environ["DJANGO_ALLOW_ASYNC_UNSAFE"] = "true"
 
 # initialize main django setup
 from django import setup
@@ -36,7 +35,7 @@ application = ProtocolTypeRouter(
 
 # Hook in here to create defaults for AllAuth in the database
 # make sure google is stored in the socialaccount apps in the database
-from asgiref.sync import sync_to_async
+from concurrent.futures import ThreadPoolExecutor
 from django.conf import settings
 from .utilities import (
     create_db_entry_social_app,
@@ -44,21 +43,29 @@ from .utilities import (
     create_cookie_message,
 )
 
-created, settings.SITE_ID = create_db_entry_social_app(
-    site_name="127.0.0.1:8000",
-    site_domain="127.0.0.1:8000",
-    provider="google",
-    name="Google",
-    client_id=os.environ.get("GOOGLE_CLIENT_ID"),
-    secret=os.environ.get("GOOGLE_SECRET"),
-)
-if created:
-    print("included google to AllAuth, set SITE_ID to:", settings.SITE_ID)
 
-created = create_superuser()
-if created:
-    print("Administrate account user created")
+def create_defaults():
+    created, settings.SITE_ID = create_db_entry_social_app(
+        site_name="127.0.0.1:8000",
+        site_domain="127.0.0.1:8000",
+        provider="google",
+        name="Google",
+        client_id=os.environ.get("GOOGLE_CLIENT_ID"),
+        secret=os.environ.get("GOOGLE_SECRET"),
+    )
+    if created:
+        print("included google to AllAuth, set SITE_ID to:", settings.SITE_ID)
+
+    created = create_superuser()
+    if created:
+        print("Administrate account user created")
+
+    created = create_cookie_message()
+    if created:
+        print("Cookie message was created")
+
 
-created = create_cookie_message()
-if created:
-    print("Cookie message was created")
+# uvicorn imports this module inside its event loop, where django refuses
+# synchronous database access: the defaults are created in a thread of their own
+with ThreadPoolExecutor(max_workers=1) as executor:
+    executor.submit(create_defaults).result()
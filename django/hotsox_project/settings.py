@@ -13,7 +13,9 @@ https://docs.djangoproject.com/en/4.1/ref/settings/
 # imports for cloudinary linking and upload of images
 
 from pathlib import Path
+from django.core.exceptions import ImproperlyConfigured
 import os
+import sys
 from datetime import timedelta
 from dotenv import load_dotenv
 import cloudinary
@@ -34,6 +36,9 @@ cloudinary.config(
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
+# shared prediction package of django & fastapi (hotsox_prediction)
+sys.path.append(str(BASE_DIR.parent))
+
 
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/4.1/howto/deployment/checklist/
@@ -85,7 +90,24 @@ INSTALLED_APPS = [
 
 # WSGI_APPLICATION = "hotsox_project.wsgi.application"
 ASGI_APPLICATION = "hotsox_project.asgi.application"
-CHANNEL_LAYERS = {"default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}}
+# the chat groups are shared by all ASGI workers (and hosts) through redis at
+# CHANNEL_LAYER_URL (channels_redis), otherwise they live in the memory of the
+# process (a single worker only)
+if os.getenv("CHANNEL_LAYER_URL"):
+    CHANNEL_LAYERS = {
+        "default": {
+            "BACKEND": "channels_redis.core.RedisChannelLayer",
+            "CONFIG": {
+                "hosts": [os.getenv("CHANNEL_LAYER_URL")],
+                "prefix": "hotsox_chat",
+            },
+        }
+    }
+else:
+    CHANNEL_LAYERS = {"default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}}
+# a chat socket stores (and broadcasts) the read receipts of its user at most
+# once per CHAT_READ_RECEIPT_INTERVAL seconds (see app_chat/consumers.py)
+CHAT_READ_RECEIPT_INTERVAL = float(os.getenv("CHAT_READ_RECEIPT_INTERVAL", 1))
 
 AUTHENTICATION_BACKENDS = ["allauth.account.auth_backends.AuthenticationBackend"]
 
@@ -261,6 +283,75 @@ STATICFILES_DIRS = [os.path.join(BASE_DIR, "static")]
 
 GEOIP_PATH = os.path.join(BASE_DIR, "app_geo/geo_database")
 
+# directory of the saved sock feature store of the prediction algorithm
+# (manage.py build_sock_feature_store), it is memory-mapped at worker start
+SOCK_FEATURE_STORE_PATH = os.getenv("SOCK_FEATURE_STORE_PATH")
+# the socks changed by other processes are published to a feed in the redis at
+# SOCK_FEATURE_STORE_SYNC_URL (shared with the fastapi service, otherwise in the
+# django cache) and reloaded into the feature store at most every
+# SOCK_FEATURE_STORE_SYNC_INTERVAL seconds
+SOCK_FEATURE_STORE_SYNC_URL = os.getenv("SOCK_FEATURE_STORE_SYNC_URL")
+SOCK_FEATURE_STORE_SYNC_INTERVAL = float(
+    os.getenv("SOCK_FEATURE_STORE_SYNC_INTERVAL", 5)
+)
+# pools of at least SOCK_ANN_MIN_SOCKS socks are narrowed down to the
+# SOCK_ANN_CANDIDATES nearest socks (SockANNIndex) before they are scored
+SOCK_ANN_MIN_SOCKS = int(os.getenv("SOCK_ANN_MIN_SOCKS", 20000))
+SOCK_ANN_CANDIDATES = int(os.getenv("SOCK_ANN_CANDIDATES", 300))
+# the unseen pool is streamed from the database & scored in chunks of this size
+SOCK_RANKING_CHUNK_SIZE = int(os.getenv("SOCK_RANKING_CHUNK_SIZE", 2000))
+# only socks of users within SOCK_MAX_DISTANCE_KM of the swiping user are
+# candidates (0 = the whole world), see GeoBuckets
+SOCK_MAX_DISTANCE_KM = float(os.getenv("SOCK_MAX_DISTANCE_KM", 0))
+# every next sock request logs the timing spans of its pipeline stages as json
+# (logger hotsox_prediction, info), runs slower than PREDICTION_SLOW_MS as warning
+PREDICTION_SLOW_MS = float(os.getenv("PREDICTION_SLOW_MS", 500))
+# judgements per request of the bulk judgement endpoint (queued swipes)
+SWIPE_BULK_MAX_JUDGEMENTS = int(os.getenv("SWIPE_BULK_MAX_JUDGEMENTS", 500))
+# write-behind swipes: the judgements are buffered in the redis stream at
+# SWIPE_BUFFER_URL (shared with the celery worker) and stored by the celery
+# task flush_swipe_buffer (every SWIPE_BUFFER_FLUSH_INTERVAL seconds,
+# SWIPE_BUFFER_BATCH_SIZE judgements per transaction)
+SWIPE_WRITE_BEHIND = os.getenv("SWIPE_WRITE_BEHIND", "false").lower() == "true"
+SWIPE_BUFFER_URL = os.getenv("SWIPE_BUFFER_URL")
+if SWIPE_WRITE_BEHIND and not SWIPE_BUFFER_URL:
+    # a buffer in the memory of the web process is never flushed by the worker
+    raise ImproperlyConfigured("SWIPE_WRITE_BEHIND needs SWIPE_BUFFER_URL (redis)")
+SWIPE_BUFFER_BATCH_SIZE = int(os.getenv("SWIPE_BUFFER_BATCH_SIZE", 1000))
+SWIPE_BUFFER_FLUSH_INTERVAL = int(os.getenv("SWIPE_BUFFER_FLUSH_INTERVAL", 5))
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "handlers": {"console": {"class": "logging.StreamHandler"}},
+    "loggers": {
+        "hotsox_prediction": {
+            "handlers": ["console"],
+            "level": os.getenv("PREDICTION_LOG_LEVEL", "WARNING"),
+        },
+    },
+}
+
+# ranked candidate queues of the prediction algorithm (one per swiping sock),
+# they are kept in the cache - shared by all workers if redis is configured
+CANDIDATE_QUEUE_SIZE = int(os.getenv("CANDIDATE_QUEUE_SIZE", 50))
+CANDIDATE_QUEUE_TIMEOUT = int(os.getenv("CANDIDATE_QUEUE_TIMEOUT", 60 * 15))
+# the queues of socks of users active within CANDIDATE_PRECOMPUTE_ACTIVE_DAYS
+# are refreshed ahead of time by the celery task precompute_candidates
+# (every CANDIDATE_PRECOMPUTE_INTERVAL seconds, CANDIDATE_PRECOMPUTE_CHUNK_SIZE socks at once)
+CANDIDATE_PRECOMPUTE_ACTIVE_DAYS = int(os.getenv("CANDIDATE_PRECOMPUTE_ACTIVE_DAYS", 7))
+CANDIDATE_PRECOMPUTE_CHUNK_SIZE = int(os.getenv("CANDIDATE_PRECOMPUTE_CHUNK_SIZE", 200))
+CANDIDATE_PRECOMPUTE_INTERVAL = int(os.getenv("CANDIDATE_PRECOMPUTE_INTERVAL", 60 * 10))
+# processes scoring the pool of a rebuild (0 / 1 = in the calling process),
+# only used outside of daemonic celery prefork workers (see SockRanker.parallel)
+CANDIDATE_PRECOMPUTE_WORKERS = int(os.getenv("CANDIDATE_PRECOMPUTE_WORKERS", 0))
+if os.getenv("REDIS_DJANGO_CACHE_URL"):
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": os.getenv("REDIS_DJANGO_CACHE_URL"),
+        }
+    }
+
 # Main configuration for DRF
 REST_FRAMEWORK = {
     # swagger documentation
@@ -298,7 +389,7 @@ SIMPLE_JWT = {
     "REFRESH_TOKEN_LIFETIME": timedelta(days=1),
     "ROTATE_REFRESH_TOKENS": False,
     "BLACKLIST_AFTER_ROTATION": False,
-    "UPDATE_LAST_LOGIN": False,
+    "UPDATE_LAST_LOGIN": True,
     "ALGORITHM": "HS256",
     "SIGNING_KEY": SECRET_KEY,
     "VERIFYING_KEY": "",
@@ -346,3 +437,15 @@ CELERY_TASK_TRACK_STARTED = True
 CELERY_TASK_TIME_LIMIT = os.getenv("CELERY_TASK_TIME_LIMIT")
 CELERY_BROKER_URL = os.getenv("REDIS_DJANGO_URL")
 CELERY_RESULT_BACKEND = os.getenv("REDIS_DJANGO_URL")
+CELERY_BEAT_SCHEDULE = {}
+# the precomputed queues are only read by the web processes from a shared cache
+if os.getenv("REDIS_DJANGO_CACHE_URL"):
+    CELERY_BEAT_SCHEDULE["precompute_candidates"] = {
+        "task": "precompute_candidates",
+        "schedule": CANDIDATE_PRECOMPUTE_INTERVAL,
+    }
+if SWIPE_WRITE_BEHIND:
+    CELERY_BEAT_SCHEDULE["flush_swipe_buffer"] = {
+        "task": "flush_swipe_buffer",
+        "schedule": SWIPE_BUFFER_FLUSH_INTERVAL,
+    }
@@ -0,0 +1,7 @@
+import os
+import sys
+
+# shared prediction package of django & fastapi (hotsox_prediction)
+sys.path.append(
+    os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+)
@@ -1,5 +1,4 @@
 from sqlalchemy.orm import Session
-from sqlalchemy import or_, and_
 from ..database import models
 from fastapi import HTTPException, status
 
@@ -30,8 +29,12 @@ def show_all_chats(username: str, db: Session):
     return chats
 
 
-def show_specific_chat(username: str, receiver: str, db: Session):
-    """Business logic to show all chats between specific users"""
+def show_specific_chat(
+    username: str, receiver: str, db: Session, before: str | None = None
+):
+    """Business logic to show a page of the chats between specific users
+    (before: the "next" cursor of the previous page)
+    """
     user = db.query(models.User).filter(models.User.username == username).first()
     if not user:
         raise HTTPException(
@@ -49,26 +52,20 @@ def show_specific_chat(username: str, receiver: str, db: Session):
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"Receiver and sender are the same <{receiver}>, you can not chat with yourself!",
         )
-    chats = (
-        db.query(models.MessageChat)
-        .filter(
-            or_(
-                and_(
-                    models.MessageChat.user == user, models.MessageChat.other == other
-                ),
-                and_(
-                    models.MessageChat.user == other, models.MessageChat.other == user
-                ),
+    if before is not None:
+        before = models.MessageChat.parse_cursor(before)
+        if before is None:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Invalid cursor of the chats with <{receiver}>",
             )
-        )
-        .all()
-    )
-    if not chats:
+    chats, cursor = models.MessageChat.history(db, user.id, other.id, before=before)
+    if not chats and not before:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"No chats available between user <{username}> and <{receiver}>",
         )
-    return chats
+    return {"items": chats, "next": cursor}
 
 
 def send_specific_chat(username: str, receiver: str, chat_message: str, db: Session):
@@ -92,20 +89,7 @@ def send_specific_chat(username: str, receiver: str, chat_message: str, db: Sess
             detail=f"Receiver and sender are the same <{receiver}>, you can not chat with yourself!",
         )
 
-    match = (
-        db.query(models.UserMatch)
-        .filter(
-            (
-                (models.UserMatch.user_id == other.id)
-                & (models.UserMatch.other_id == user.id)
-            )
-            | (
-                (models.UserMatch.user_id == user.id)
-                & (models.UserMatch.other_id == other.id)
-            )
-        )
-        .first()
-    )
+    match = models.UserMatch.between(db, user.id, other.id).first()
     if not match:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -1,13 +1,33 @@
-import uuid
 from sqlalchemy.orm import Session
-from sqlalchemy import or_
-from ..database import models
+from ..database import models, schemas
 from fastapi import HTTPException, status
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
 
 from api.utilities.pre_prediction_algorithm import PrePredictionAlgorithm
 
 
-def get_next_sock(username: str, id: int, db: Session):
+def check_explain(user: models.User, explain: bool):
+    # the score breakdown of the socks (debug explain mode) is for superusers only
+    if explain and not user.is_superuser:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail=f"Explain is only available for superusers!",
+        )
+
+
+def explained_socks(socks: list, explanations: list) -> list:
+    """return the socks (ShowSock) with their score breakdown as json"""
+    return [
+        {
+            **schemas.ShowSock.from_orm(sock).dict(by_alias=True),
+            "explain": explanation,
+        }
+        for sock, explanation in zip(socks, explanations)
+    ]
+
+
+def get_next_sock(username: str, id: int, db: Session, explain: bool = False):
     user = db.query(models.User).filter(models.User.username == username).first()
     if not user:
         raise HTTPException(
@@ -21,13 +41,64 @@ def get_next_sock(username: str, id: int, db: Session):
             detail=f"Sock with the id <{id}> is not available!",
         )
 
-    sock = PrePredictionAlgorithm.get_next_sock(db, user, current_sock)
-    if not sock:
+    check_explain(user, explain)
+
+    if explain:
+        socks, explanations = PrePredictionAlgorithm.explain_next_socks(
+            db, user, current_sock, 1
+        )
+    else:
+        socks = PrePredictionAlgorithm.get_next_socks(db, user, current_sock, 1)
+    if not socks:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"No more socks to swipe",
         )
-    return sock
+    if explain:
+        return JSONResponse(jsonable_encoder(explained_socks(socks, explanations)[0]))
+    return socks[0]
+
+
+def get_next_socks(
+    username: str, id: int, count: int, db: Session, explain: bool = False
+):
+    user = db.query(models.User).filter(models.User.username == username).first()
+    if not user:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"User with the username <{username}> is not available!",
+        )
+    current_sock = db.query(models.Sock).filter(models.Sock.id == id).first()
+    if not current_sock in user.socks:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Sock with the id <{id}> is not available!",
+        )
+
+    max_count = PrePredictionAlgorithm.candidate_queue.size
+    if not 1 <= count <= max_count:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"The count has to be between 1 and {max_count}!",
+        )
+
+    check_explain(user, explain)
+
+    # one prefilter & scoring pass at most for the whole deck of socks
+    if explain:
+        socks, explanations = PrePredictionAlgorithm.explain_next_socks(
+            db, user, current_sock, count
+        )
+    else:
+        socks = PrePredictionAlgorithm.get_next_socks(db, user, current_sock, count)
+    if not socks:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"No more socks to swipe",
+        )
+    if explain:
+        return JSONResponse(jsonable_encoder(explained_socks(socks, explanations)))
+    return socks
 
 
 def judge_sock(
@@ -61,86 +132,112 @@ def judge_sock(
             detail=f"You can not judge your own sock!",
         )
 
-    already_liked = (
-        db.query(models.SockLike)
-        .filter(
-            models.SockLike.sock_id == user_sock_id,
-            or_(
-                models.SockLike.like_id == other_sock_id,
-                models.SockLike.dislike_id == other_sock_id,
-            ),
+    if PrePredictionAlgorithm.already_judged(
+        db, user, current_user_sock, other_sock_id
+    ):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Sock with the id <{other_sock_id}> was already judged!",
         )
-        .first()
+
+    # write-behind swipes: the judgement is buffered and stored by celery
+    if PrePredictionAlgorithm.swipe_buffer is not None:
+        PrePredictionAlgorithm.buffer_judgements(
+            current_user_sock, [(other_sock_id, judgement)]
+        )
+        return {"Message": "Judgement buffered, a new match is stored later"}
+
+    # the judged sock is removed from the candidate queue of the current sock
+    PrePredictionAlgorithm.sock_judged(current_user_sock, other_sock_id)
+
+    # the judgement, the check of the reciprocal like & the match in one transaction
+    created, user_match = models.SockLike.judge(
+        db, current_user_sock, other_sock, judgement
     )
-    if already_liked:
+    if not created:
+        db.rollback()
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"Sock with the id <{other_sock_id}> was already judged!",
         )
-
-    # setting the judgement to db
-    if not judgement:
-        judge = models.SockLike(dislike_id=other_sock_id, sock_id=user_sock_id)
-    else:
-        judge = models.SockLike(like_id=other_sock_id, sock_id=user_sock_id)
-    db.add(judge)
     db.commit()
-    db.refresh(judge)
-
-    # check if we have a match!
-    # check if like happens from boths ends!
-    successful_user_match1 = (
-        db.query(models.SockLike)
-        .filter(
-            (
-                (models.SockLike.sock_id == other_sock_id)
-                & (models.SockLike.like_id == user_sock_id)
-            )
+
+    # found a valid match!
+    if user_match:
+        db.refresh(user_match)
+        return {"Message": "New match found", "Match": user_match}
+
+    return {"Message": "No new match found"}
+
+
+def judge_socks(
+    username: str, user_sock_id: int, judgements: list, max_judgements: int, db: Session
+):
+    """store several likes/dislikes of a sock at once (see SockLike.judge_many)"""
+    if len(judgements) > max_judgements:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"At most {max_judgements} judgements per request!",
+        )
+    user = db.query(models.User).filter(models.User.username == username).first()
+    if not user:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"User with the username <{username}> is not available!",
         )
+
+    current_user_sock = (
+        db.query(models.Sock)
+        .filter(models.Sock.id == user_sock_id, models.Sock.user_id == user.id)
         .first()
     )
-    successful_user_match2 = (
-        db.query(models.SockLike)
-        .filter(
-            (
-                (models.SockLike.sock_id == user_sock_id)
-                & (models.SockLike.like_id == other_sock_id)
-            )
+    if not current_user_sock:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Sock with the id <{user_sock_id}> is not one of your socks!",
         )
-        .first()
+
+    decisions = {judgement.sock_id: judgement.like for judgement in judgements}
+    # the socks to judge in one query, own socks can not be judged
+    other_socks = {
+        sock.id: sock
+        for sock in db.query(models.Sock).filter(
+            models.Sock.id.in_(decisions), models.Sock.user_id != user.id
+        )
+    }
+    # write-behind swipes: the judgements are buffered (see judge_sock)
+    if PrePredictionAlgorithm.swipe_buffer is not None:
+        pending = PrePredictionAlgorithm.swipe_buffer.pending(current_user_sock.id)
+        buffered = sorted(other_socks.keys() - pending)
+        PrePredictionAlgorithm.buffer_judgements(
+            current_user_sock, [(sock_id, decisions[sock_id]) for sock_id in buffered]
+        )
+        return {
+            "judged": buffered,
+            "already_judged": sorted(other_socks.keys() & pending),
+            "not_found": sorted(decisions.keys() - other_socks.keys()),
+            "matches": [],
+        }
+
+    judged, user_matches = models.SockLike.judge_many(
+        db,
+        current_user_sock,
+        [(sock, decisions[sock_id]) for sock_id, sock in other_socks.items()],
     )
+    db.commit()
+    # the judged socks are removed from the candidate queue
+    PrePredictionAlgorithm.socks_judged(current_user_sock, judged)
 
-    # found a valid match!
-    set_valid_match = None
-    if successful_user_match1 and successful_user_match2:
-        # find already existing match
-        existing_match = (
-            db.query(models.UserMatch)
-            .filter(
-                (
-                    (models.UserMatch.user_id == user.id)
-                    & (models.UserMatch.other_id == other_sock.user.id)
-                )
-                | (
-                    (models.UserMatch.user_id == other_sock.user.id)
-                    & (models.UserMatch.other_id == user.id)
-                )
-            )
-            .first()
-        )
-
-        if not existing_match:
-            set_valid_match = models.UserMatch(
-                user_id=user.id,
-                other_id=other_sock.user.id,
-                chatroom_uuid=uuid.uuid4(),
-                unmatched=False,
-            )
-            db.add(set_valid_match)
-            db.commit()
-            db.refresh(set_valid_match)
-
-        if set_valid_match:
-            return {"Message": "New match found", "Match": set_valid_match}
+    for user_match in user_matches:
+        db.refresh(user_match)
+    return {
+        "judged": sorted(judged),
+        "already_judged": sorted(other_socks.keys() - judged),
+        "not_found": sorted(decisions.keys() - other_socks.keys()),
+        "matches": user_matches,
+    }
 
-    return {"Message": "No new match found"}
+
+def get_metrics():
+    """return the stage metrics of the prediction pipeline (of this process)"""
+    return PrePredictionAlgorithm.ranker.metrics.snapshot()
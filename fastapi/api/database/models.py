@@ -2,22 +2,32 @@ from sqlalchemy import (
     ForeignKey,
     Column,
     Integer,
+    BigInteger,
     Float,
     String,
     DateTime,
     Date,
     Boolean,
+    Index,
+    SmallInteger,
     UniqueConstraint,
 )
-from sqlalchemy import func, or_, and_, not_
+from sqlalchemy import func, or_, and_, not_, event, text
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.orm import relationship
 from sqlalchemy.dialects.postgresql import UUID
 from cloudinary import uploader
 from .setup import Base
 from datetime import datetime
+from hotsox_prediction import GeoBuckets
+import base64
+import uuid
 
 from celery_app import destroy_profilepicture_on_cloud
 
+# INSERT ... ON CONFLICT of the supported databases
+INSERTS = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}
+
 
 class User(Base):
     __tablename__ = "app_users_user"
@@ -38,6 +48,8 @@ class User(Base):
     location_city = Column(String)
     location_latitude = Column(Float)
     location_longitude = Column(Float)
+    # grid cell of the location for the max distance prefilter (see GeoBuckets)
+    location_bucket = Column(Integer, index=True)
     notification = Column(Boolean, default=True)
     social_instagram = Column(String)
     social_facebook = Column(String)
@@ -185,6 +197,10 @@ class UserProfilePicture(Base):
 
 class UserMatch(Base):
     __tablename__ = "app_users_usermatch"
+    __table_args__ = (
+        # two users match only once (INSERT ... ON CONFLICT, see judge_many)
+        UniqueConstraint("low_id", "high_id", name="unique_usermatch_pair"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(
@@ -199,6 +215,14 @@ class UserMatch(Base):
     )
     unmatched = Column(Boolean)
     chatroom_uuid = Column(UUID(as_uuid=True))
+    # the canonical pair of user & other (lower id, higher id), whoever liked
+    # first: a match is found with one probe of the unique index (see between)
+    low_id = Column(BigInteger, nullable=True)
+    high_id = Column(BigInteger, nullable=True)
+    # read receipts: the id of the newest message user & other have read of
+    # the chat (watermark, written by the django chat)
+    user_read_id = Column(BigInteger, nullable=True)
+    other_read_id = Column(BigInteger, nullable=True)
 
     user = relationship(
         "User",
@@ -211,6 +235,21 @@ class UserMatch(Base):
         foreign_keys=[other_id],
     )
 
+    @staticmethod
+    def pair(user_id: int | None, other_id: int | None) -> tuple:
+        """return the canonical (low, high) pair of two user ids"""
+        if user_id is None or other_id is None:
+            return None, None
+        return min(user_id, other_id), max(user_id, other_id)
+
+    @staticmethod
+    def between(db, user_id: int, other_id: int):
+        """return the match (query) of two users"""
+        low_id, high_id = UserMatch.pair(user_id, other_id)
+        return db.query(UserMatch).filter(
+            UserMatch.low_id == low_id, UserMatch.high_id == high_id
+        )
+
 
 class Sock(Base):
     __tablename__ = "app_users_sock"
@@ -261,11 +300,7 @@ class Sock(Base):
         # find all likes and delete them
         likes = (
             db.query(SockLike)
-            .filter(
-                (SockLike.sock_id == self.id)
-                | (SockLike.like_id == self.id)
-                | (SockLike.dislike_id == self.id)
-            )
+            .filter((SockLike.sock_id == self.id) | (SockLike.target_id == self.id))
             .all()
         )
         [db.delete(like) for like in likes]
@@ -311,13 +346,35 @@ class SockProfilePicture(Base):
 
 
 class SockLike(Base):
+    """the judgement (like or dislike) of the sock target by sock"""
+
     __tablename__ = "app_users_socklike"
+    __table_args__ = (
+        # a sock judges another sock only once (INSERT ... ON CONFLICT, see
+        # judge), the index answers the seen checks (sock, target) index-only
+        UniqueConstraint("sock_id", "target_id", name="unique_socklike_sock_target"),
+        UniqueConstraint("sock_id", "like_id", name="unique_socklike_sock_like"),
+        UniqueConstraint("sock_id", "dislike_id", name="unique_socklike_sock_dislike"),
+        # reciprocal like checks: the socks which liked a sock (index-only)
+        Index("socklike_target_decision", "target_id", "decision", "sock_id"),
+    )
+    # values of decision
+    DISLIKE, LIKE = 0, 1
 
     id = Column(Integer, primary_key=True, index=True)
     sock_id = Column(
         Integer,
         ForeignKey("app_users_sock.id", ondelete="CASCADE"),
     )
+    target_id = Column(
+        Integer,
+        ForeignKey("app_users_sock.id", ondelete="CASCADE"),
+        nullable=True,
+    )
+    decision = Column(SmallInteger, nullable=True)
+    # deprecated, target & decision replace them: they are still written for
+    # instances of the former version (rolling deploys) and dropped afterwards
+    # (the django migrations manage the table)
     like_id = Column(
         Integer,
         ForeignKey("app_users_sock.id", ondelete="CASCADE"),
@@ -345,6 +402,113 @@ class SockLike(Base):
         foreign_keys=[dislike_id],
     )
 
+    @staticmethod
+    def row(sock_id: int, target_id: int, like: bool) -> dict:
+        """return the columns of a judgement (for core inserts)"""
+        return {
+            "sock_id": sock_id,
+            "target_id": target_id,
+            "decision": SockLike.LIKE if like else SockLike.DISLIKE,
+            "like_id": target_id if like else None,
+            "dislike_id": None if like else target_id,
+        }
+
+    @staticmethod
+    def judge(db, sock: Sock, other_sock: Sock, like: bool) -> tuple:
+        """store the like or dislike of other_sock by sock (see judge_many) and
+        return if it was new and the UserMatch if the like created a match
+        """
+        judged, matches = SockLike.judge_many(db, sock, [(other_sock, like)])
+        return bool(judged), matches[0] if matches else None
+
+    @staticmethod
+    def judge_many(db, sock: Sock, judgements: list) -> tuple[set, list]:
+        """store the likes and dislikes ((other sock, like) tuples, the last one
+        of a sock counts) of sock (not committed) and return the ids of the
+        newly judged socks and the UserMatches created by mutual likes.
+        For likes the rows of all involved users are locked first (in id order),
+        so simultaneous judgements between two users run one after another: a
+        mutual like always sees the other like and the users match only once.
+        The judgements and matches are inserted with ON CONFLICT DO NOTHING
+        (one executemany each): a sock judges another sock once, repeated (or
+        changed) judgements change nothing, two users match once.
+        """
+        decisions = {
+            other_sock.id: (other_sock, like) for other_sock, like in judgements
+        }
+        likes = {sock_id for sock_id, (_, like) in decisions.items() if like}
+        if likes:
+            users = {sock.user_id} | {
+                decisions[sock_id][0].user_id for sock_id in likes
+            }
+            db.query(User.id).filter(User.id.in_(users)).order_by(
+                User.id
+            ).with_for_update().all()
+        # the former judgements and the reciprocal likes in one query
+        # (both index-only, see __table_args__)
+        rows = db.query(SockLike.sock_id, SockLike.target_id).filter(
+            or_(
+                and_(SockLike.sock_id == sock.id, SockLike.target_id.in_(decisions)),
+                and_(
+                    SockLike.target_id == sock.id,
+                    SockLike.decision == SockLike.LIKE,
+                    SockLike.sock_id.in_(likes),
+                ),
+            )
+        )
+        judged, liked_back = set(), set()
+        for sock_id, target_id in rows:
+            if sock_id == sock.id:
+                judged.add(target_id)
+            else:
+                liked_back.add(sock_id)
+
+        new_judgements = [
+            SockLike.row(sock.id, sock_id, like)
+            for sock_id, (_, like) in decisions.items()
+            if sock_id not in judged
+        ]
+        if new_judgements:
+            db.execute(
+                INSERTS[db.get_bind().dialect.name](SockLike).on_conflict_do_nothing(),
+                new_judgements,
+            )
+
+        # new mutual likes match the users once: a pair which matched already
+        # conflicts with the unique pair index and is skipped
+        matching_users = {
+            decisions[sock_id][0].user_id for sock_id in liked_back - judged
+        }
+        new_matches = [
+            dict(
+                zip(("low_id", "high_id"), UserMatch.pair(sock.user_id, user_id)),
+                user_id=sock.user_id,
+                other_id=user_id,
+                unmatched=False,
+                chatroom_uuid=uuid.uuid4(),
+            )
+            for user_id in sorted(matching_users)
+        ]
+        matches = []
+        if new_matches:
+            db.execute(
+                INSERTS[db.get_bind().dialect.name](UserMatch).on_conflict_do_nothing(),
+                new_matches,
+            )
+            # the inserted matches (no RETURNING of executemany)
+            matches = (
+                db.query(UserMatch)
+                .filter(
+                    UserMatch.user_id == sock.user_id,
+                    UserMatch.chatroom_uuid.in_(
+                        [match["chatroom_uuid"] for match in new_matches]
+                    ),
+                )
+                .order_by(UserMatch.other_id)
+                .all()
+            )
+        return decisions.keys() - judged, matches
+
 
 class MessageMail(Base):
     __tablename__ = "app_users_messagemail"
@@ -366,6 +530,21 @@ class MessageMail(Base):
 
 class MessageChat(Base):
     __tablename__ = "app_users_messagechat"
+    __table_args__ = (
+        # the chat history of a direction, read backwards from a cursor
+        Index("messagechat_history", "user_id", "other_id", "sent_date", "id"),
+        # the (few) unseen messages of a chat, marked seen by the read receipts
+        Index(
+            "messagechat_unseen",
+            "other_id",
+            "user_id",
+            "id",
+            postgresql_where=text("seen_date IS NULL"),
+            sqlite_where=text("seen_date IS NULL"),
+        ),
+    )
+    # messages per page of the chat history
+    HISTORY_PAGE_SIZE = 50
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(
@@ -394,6 +573,61 @@ class MessageChat(Base):
     def __str__(self):
         return f"<Chat {self.user_id}:{self.other_id} msg:{self.message} @{self.sent_date}/{self.seen_date}>"
 
+    @staticmethod
+    def history(
+        db, user_id: int, other_id: int, before: tuple | None = None, limit=None
+    ) -> tuple:
+        """return a page of the chat between two users (newest first) and the
+        cursor of the next (older) page, None on the last page
+        keyset pagination over (sent_date, id), every direction is read
+        backwards from the cursor on its own (history index) and both are
+        merged: a page costs the same in a short and in a long chat
+        """
+        limit = limit or MessageChat.HISTORY_PAGE_SIZE
+        page = []
+        for sender_id, receiver_id in ((user_id, other_id), (other_id, user_id)):
+            messages = db.query(MessageChat).filter(
+                MessageChat.user_id == sender_id, MessageChat.other_id == receiver_id
+            )
+            if before:
+                sent_date, id = before
+                # the redundant sent_date bound keeps the index range scan
+                messages = messages.filter(
+                    MessageChat.sent_date <= sent_date,
+                    or_(
+                        MessageChat.sent_date < sent_date,
+                        and_(MessageChat.sent_date == sent_date, MessageChat.id < id),
+                    ),
+                )
+            # one message more than the page tells if there is a next page
+            page += (
+                messages.order_by(MessageChat.sent_date.desc(), MessageChat.id.desc())
+                .limit(limit + 1)
+                .all()
+            )
+        page.sort(key=lambda message: (message.sent_date, message.id), reverse=True)
+        if len(page) > limit:
+            return page[:limit], MessageChat.cursor(page[limit - 1])
+        return page, None
+
+    @staticmethod
+    def cursor(message) -> str:
+        """return the (opaque) cursor of the messages sent before message"""
+        return base64.urlsafe_b64encode(
+            f"{message.sent_date.isoformat()}|{message.id}".encode()
+        ).decode()
+
+    @staticmethod
+    def parse_cursor(cursor: str) -> tuple | None:
+        """return the (sent_date, id) of a cursor, None if it is not valid"""
+        try:
+            sent_date, id = (
+                base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+            )
+            return datetime.fromisoformat(sent_date), int(id)
+        except (ValueError, UnicodeError):
+            return None
+
 
 # class AdminLog(Base):
 #     __tablename__ = "django_admin_log"
@@ -450,3 +684,19 @@ class MessageChat(Base):
 #         "User",
 #         back_populates="socialaccount_socialaccount",
 #     )
+
+
+# keep the grid cell of the user location up to date (see GeoBuckets)
+@event.listens_for(User, "before_insert")
+@event.listens_for(User, "before_update")
+def set_location_bucket(mapper, connection, target):
+    target.location_bucket = GeoBuckets.bucket(
+        target.location_latitude, target.location_longitude
+    )
+
+
+# keep the canonical pair of a match up to date (see UserMatch.between)
+@event.listens_for(UserMatch, "before_insert")
+@event.listens_for(UserMatch, "before_update")
+def set_match_pair(mapper, connection, target):
+    target.low_id, target.high_id = UserMatch.pair(target.user_id, target.other_id)
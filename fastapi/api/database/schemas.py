@@ -59,6 +59,12 @@ class MessageChatWithSender(MessageChat):
         allow_population_by_field_name = True
 
 
+# a page of the chat between two users (next: cursor of the older page)
+class MessageChatPage(BaseModel):
+    items: list[MessageChatWithSender]
+    next: str | None
+
+
 # basic schema for mails
 class MessageMail(BaseModel):
     id: int | None
@@ -98,6 +104,12 @@ class SockLikes(BaseModel):
         orm_mode = True
 
 
+# schema of a like (true) or dislike (false) of a sock (bulk judgement)
+class Judgement(BaseModel):
+    sock_id: int
+    like: bool
+
+
 # basic schema for sock profile pics
 class SockProfilePicture(BaseModel):
     id: int | None
@@ -40,6 +40,9 @@ async def token(
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail=f"Invalid Credentials"
         )
+    # active users get their candidate queues precomputed (celery_app.py)
+    user.last_login = datetime.utcnow()
+    db.commit()
 
     claims = {
         "sub": user.username,
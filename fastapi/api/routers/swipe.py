@@ -32,10 +32,40 @@ router = APIRouter(
 async def get_next_sock(
     request: Request,
     user_sock_id: int,
+    explain: bool = False,
     db: Session = Depends(get_db),
     current_user: schemas.ShowUser = Depends(oauth2.get_current_user),
 ):
-    return ctr_swipe.get_next_sock(current_user.username, user_sock_id, db)
+    return ctr_swipe.get_next_sock(current_user.username, user_sock_id, db, explain)
+
+
+@router.get(
+    "/{user_sock_id}/next/{count}",
+    response_model=list[schemas.ShowSock],
+    dependencies=[Depends(oauth2.check_active)],
+    status_code=200,
+)
+@limiter.limit("30/minute")
+async def get_next_socks(
+    request: Request,
+    user_sock_id: int,
+    count: int,
+    explain: bool = False,
+    db: Session = Depends(get_db),
+    current_user: schemas.ShowUser = Depends(oauth2.get_current_user),
+):
+    return ctr_swipe.get_next_socks(
+        current_user.username, user_sock_id, count, db, explain
+    )
+
+
+@router.get(
+    "/metrics",
+    dependencies=[Depends(oauth2.check_superuser)],
+    status_code=200,
+)
+async def get_metrics():
+    return ctr_swipe.get_metrics()
 
 
 @router.post(
@@ -56,3 +86,26 @@ async def judge_a_sock(
     return ctr_swipe.judge_sock(
         current_user.username, user_sock_id, other_sock_id, judgement, db
     )
+
+
+@router.post(
+    "/{user_sock_id}/judge",
+    dependencies=[Depends(oauth2.check_active)],
+    status_code=200,
+)
+@limiter.limit("20/minute")
+async def judge_socks(
+    request: Request,
+    user_sock_id: int,
+    judgements: list[schemas.Judgement],
+    db: Session = Depends(get_db),
+    current_user: schemas.ShowUser = Depends(oauth2.get_current_user),
+):
+    # swipes queued by the client (e.g. while offline) in one request
+    return ctr_swipe.judge_socks(
+        current_user.username,
+        user_sock_id,
+        judgements,
+        int(os.environ.get("SWIPE_BULK_MAX_JUDGEMENTS", 500)),
+        db,
+    )
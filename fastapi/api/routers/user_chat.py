@@ -54,7 +54,7 @@ async def get_all_chats(
 
 @router.get(
     "/chat/{receiver}",
-    response_model=list[schemas.MessageChatWithSender],
+    response_model=schemas.MessageChatPage,
     dependencies=[Depends(oauth2.check_active)],
     status_code=200,
 )
@@ -62,10 +62,11 @@ async def get_all_chats(
 async def get_chats(
     request: Request,
     receiver: str,
+    before: str | None = None,
     db: Session = Depends(get_db),
     current_user: schemas.ShowUser = Depends(oauth2.get_current_user),
 ):
-    return ctr_chat.show_specific_chat(current_user.username, receiver, db)
+    return ctr_chat.show_specific_chat(current_user.username, receiver, db, before)
 
 
 @router.post(
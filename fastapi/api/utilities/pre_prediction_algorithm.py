@@ -1,169 +1,557 @@
-import random
+import math
+import os
+from types import SimpleNamespace
+from itertools import islice
 from datetime import datetime, timedelta
-from difflib import SequenceMatcher
-from sqlalchemy import func, or_, and_, not_
-from sqlalchemy.orm import aliased
-from api.database.models import User, Sock, SockLike, UserMatch
+from sqlalchemy import case, func, or_, exists, event, inspect, select
+from sqlalchemy.orm import object_session, selectinload
+from api.database.models import User, Sock, SockLike, SockProfilePicture, UserMatch
 from api.database.setup import get_db_session
+from hotsox_prediction import (
+    CandidatePrecomputation,
+    CandidateQueue,
+    FeatureStoreSync,
+    GeoBuckets,
+    LocalCache,
+    RedisCache,
+    RedisSwipeStream,
+    SockFeatureStore,
+    SockRanker,
+    SockSource,
+    SwipeBuffer,
+)
 
 from sqlalchemy.orm import Session
 
 
+# a swipe buffer in the memory of the web process is never flushed by the
+# celery worker: write-behind swipes need the shared redis stream
+if os.environ.get("SWIPE_WRITE_BEHIND", "false").lower() == "true" and not (
+    os.environ.get("SWIPE_BUFFER_URL")
+):
+    raise RuntimeError("SWIPE_WRITE_BEHIND needs SWIPE_BUFFER_URL (redis)")
+
+
 class PrePredictionAlgorithm:
     """basic preprediction algorithm for hotsox
     a next sock should be predicted for the pool of given socks
     """
 
+    # process wide feature store, None until it is loaded (see get_feature_store)
+    feature_store = None
+    # ranked queues of the next socks per swiping sock, kept in redis if the env
+    # REDIS_FASTAPI_CACHE_URL is set (otherwise in the memory of this process)
+    candidate_queue = CandidateQueue(
+        RedisCache(os.environ["REDIS_FASTAPI_CACHE_URL"])
+        if os.environ.get("REDIS_FASTAPI_CACHE_URL")
+        else LocalCache(),
+        size=int(os.environ.get("CANDIDATE_QUEUE_SIZE", 50)),
+        timeout=int(os.environ.get("CANDIDATE_QUEUE_TIMEOUT", 60 * 15)),
+    )
+    # the socks changed by other processes (and the django service, through the
+    # redis at SOCK_FEATURE_STORE_SYNC_URL) are reloaded into the feature store
+    # (at most every SOCK_FEATURE_STORE_SYNC_INTERVAL seconds, see FeatureStoreSync)
+    feature_store_sync = FeatureStoreSync(
+        RedisCache(os.environ["SOCK_FEATURE_STORE_SYNC_URL"])
+        if os.environ.get("SOCK_FEATURE_STORE_SYNC_URL")
+        else candidate_queue.cache,
+        interval=float(os.environ.get("SOCK_FEATURE_STORE_SYNC_INTERVAL", 5)),
+    )
+    # shared ranking core (hotsox_prediction), fed by a SQLAlchemySockSource
+    ranker = SockRanker(
+        candidate_queue,
+        ann_min_socks=int(os.environ.get("SOCK_ANN_MIN_SOCKS", 20000)),
+        ann_candidates=int(os.environ.get("SOCK_ANN_CANDIDATES", 300)),
+        chunk_size=int(os.environ.get("SOCK_RANKING_CHUNK_SIZE", 2000)),
+        slow_ms=float(os.environ.get("PREDICTION_SLOW_MS", 500)),
+    )
+    # only socks of users within SOCK_MAX_DISTANCE_KM are candidates (0 = off)
+    max_distance_km = float(os.environ.get("SOCK_MAX_DISTANCE_KM", 0))
+    # queues of active socks are refreshed ahead of time (celery_app.py)
+    precomputation = CandidatePrecomputation(
+        ranker, chunk_size=int(os.environ.get("CANDIDATE_PRECOMPUTE_CHUNK_SIZE", 200))
+    )
+    # write-behind swipes (env SWIPE_WRITE_BEHIND=true): the judgements are
+    # buffered in a redis stream (SWIPE_BUFFER_URL, shared with the celery
+    # worker) and flushed to the database by celery (celery_app.py)
+    swipe_buffer = (
+        SwipeBuffer(
+            RedisSwipeStream(os.environ["SWIPE_BUFFER_URL"]),
+            batch_size=int(os.environ.get("SWIPE_BUFFER_BATCH_SIZE", 1000)),
+        )
+        if os.environ.get("SWIPE_WRITE_BEHIND", "false").lower() == "true"
+        else None
+    )
+
     @staticmethod
-    def _compare_socks(db: Session, current_sock, challenger_sock):
-        """function to calculate a similarity score between two socks"""
-        similarity_score = -1
-
-        # Weightage of each attribute
-        weights = {
-            "info_color": 10,
-            "info_size": 8,
-            "info_type": 7,
-            "info_fabric": 6,
-            "info_condition": 6,
-            "info_holes": 6,
-            "info_age": 5,
-            "info_fabric_thickness": 5,
-            "info_kilometers": 4,
-            "info_inoutdoor": 4,
-            "info_washed": 4,
-            "info_brand": 3,
-            "info_joining_date": 5,
-            "info_separation_date": 2,
-            "info_special": 2,
-            "info_about": 2,
-        }
-        # Maxima for percentage calculation
-        maxima = {
-            "info_color": 10,
-            "info_size": 7,
-            "info_type": 9,
-            "info_fabric": 7,
-            "info_condition": 12,
-            "info_holes": 10,
-            "info_age": 25,
-            "info_fabric_thickness": 7,
-            "info_kilometers": 1000,
-            "info_inoutdoor": 9,
-            "info_washed": 7,
-            "info_brand": 12,
-        }
+    def build_feature_store(db: Session) -> SockFeatureStore:
+        """build a new feature store of all socks from the database"""
+        return SockFeatureStore.build(
+            db.query(Sock).yield_per(2000),
+            [sock_id for (sock_id,) in db.query(SockProfilePicture.sock_id).distinct()],
+        )
 
-        # Calculate similarity score for each attribute
-        ratio = 1  # default ratio
-        for attribute, weight in weights.items():
-            # calculate for dates
-            if attribute in ["info_joining_date", "info_separation_date"]:
-                current_value = current_sock.__dict__.get(attribute)
-                challenger_value = challenger_sock.__dict__.get(attribute)
-                delta = abs((current_value - challenger_value).days)
-                if delta <= 60:
-                    ratio = (60 - delta) / 60
-                else:
-                    ratio = 0.1
-                similarity_score += weight * ratio
-
-            # calculate for text
-            elif attribute in ["info_special", "info_about"]:
-                current_value = current_sock.__dict__.get(attribute)
-                challenger_value = challenger_sock.__dict__.get(attribute)
-                ratio = SequenceMatcher(None, current_value, challenger_value).ratio()
-                similarity_score += weight * ratio
-
-            # calcualte for any other integer values
+    @staticmethod
+    def get_feature_store(db: Session) -> SockFeatureStore:
+        """return the process wide feature store of all socks
+        a saved store is memory-mapped from the env SOCK_FEATURE_STORE_PATH,
+        otherwise it is built from the database.
+        Afterwards it is kept up to date by the SQLAlchemy events below (the
+        commits of this process) and the feature_store_sync (the commits of
+        the other processes)
+        """
+        store = PrePredictionAlgorithm.feature_store
+        if store is None:
+            path = os.environ.get("SOCK_FEATURE_STORE_PATH")
+            if SockFeatureStore.exists(path):
+                store = SockFeatureStore.load(path)
             else:
-                ratio = (
-                    1
-                    - abs(
-                        int(current_sock.__dict__.get(attribute))
-                        - int(challenger_sock.__dict__.get(attribute))
-                    )
-                    / maxima[attribute]
-                )
-                similarity_score += weight * ratio
+                store = PrePredictionAlgorithm.build_feature_store(db)
+
+        def load(sock_ids):
+            socks = db.query(Sock).filter(Sock.id.in_(sock_ids)).all()
+            picture_sock_ids = [
+                sock_id
+                for (sock_id,) in db.query(SockProfilePicture.sock_id)
+                .filter(SockProfilePicture.sock_id.in_(sock_ids))
+                .distinct()
+            ]
+            return socks, picture_sock_ids
 
-        # return final score
-        return similarity_score
+        def build():
+            # in a background thread, with a session of its own
+            with get_db_session() as build_db:
+                return PrePredictionAlgorithm.build_feature_store(build_db)
+
+        PrePredictionAlgorithm.feature_store = (
+            PrePredictionAlgorithm.feature_store_sync.refresh(store, load, build)
+        )
+        return PrePredictionAlgorithm.feature_store
 
     @staticmethod
-    def _prefilter_list_of_all_socks(
-        db: Session, current_user: User, current_user_sock: Sock
-    ) -> list | None:
+    def _compare_socks(current_sock, challenger_sock):
+        """function to calculate a similarity score between two socks"""
+        return SockRanker.compare_socks(current_sock, challenger_sock)
+
+    @staticmethod
+    def _prefilter_query(db: Session, current_user: User, current_user_sock: Sock):
         """This method is used to pre filter the list of all socks to the currently
-        useen ones and return a list. All the liked and disliked socks as well as the
+        useen ones and return a query. All the liked and disliked socks as well as the
         socks of the user him/herself are excluded from the list.
+        The whole filter is done in one single database query (NOT EXISTS subqueries),
+        so the costs per swipe do not grow with the amount of SockLike rows.
         """
-        # open db session
-        # db = get_db_session()
+        # socks that have at least one picture
+        has_picture = exists().where(SockProfilePicture.sock_id == Sock.id)
 
-        all_none_user_socks = (
-            db.query(Sock).filter(Sock.user_id != current_user.id).all()
+        # socks that were already liked or disliked by the current sock
+        # (index-only on the unique sock & target index)
+        already_judged = exists().where(
+            SockLike.sock_id == current_user_sock.id, SockLike.target_id == Sock.id
         )
 
-        all_seen_socks = [
-            sock.dislike if sock.dislike is not None else sock.like
-            for sock in db.query(SockLike)
-            .filter(SockLike.sock_id == current_user_sock.id)
-            .all()
-        ]
+        # users that have been unmatched, so that we can exclude their socks!
+        # (one probe of the unique pair index, see UserMatch.between)
+        unwanted_user = exists().where(
+            UserMatch.unmatched == True,
+            UserMatch.low_id
+            == case(
+                (Sock.user_id < current_user.id, Sock.user_id), else_=current_user.id
+            ),
+            UserMatch.high_id
+            == case(
+                (Sock.user_id > current_user.id, Sock.user_id), else_=current_user.id
+            ),
+        )
 
-        unwanted_user_list = [
-            match.user if match.user != current_user else match.other
-            for match in current_user.get_unmatched(db, current_user)
-        ]
+        # exclude own socks & socks without any pictures & unwanted users & already seen socks
+        unseen_socks = (
+            db.query(Sock)
+            .filter(
+                Sock.user_id != current_user.id,
+                has_picture,
+                ~already_judged,
+                ~unwanted_user,
+            )
+            .order_by(Sock.id)
+        )
 
-        # exclude all the socks without any pictures & unwanted users & already seen socks
-        unseen_socks = [
-            sock
-            for sock in all_none_user_socks
-            if (sock not in all_seen_socks)
-            and (sock.user_id not in unwanted_user_list)
-            and sock.profile_pictures
-        ]
+        # socks judged by buffered swipes which are not stored yet
+        if PrePredictionAlgorithm.swipe_buffer is not None:
+            pending = PrePredictionAlgorithm.swipe_buffer.pending(current_user_sock.id)
+            if pending:
+                unseen_socks = unseen_socks.filter(Sock.id.not_in(pending))
+
+        if PrePredictionAlgorithm.max_distance_km:
+            unseen_socks = PrePredictionAlgorithm._near_socks(
+                unseen_socks, current_user, PrePredictionAlgorithm.max_distance_km
+            )
+        return unseen_socks
+
+    @staticmethod
+    def _near_socks(socks, current_user: User, max_distance: float):
+        """restrict a sock query to the socks of users within max_distance km
+        the grid cells around the user (indexed location_bucket ranges, see
+        GeoBuckets) narrow the users down, the exact distance is checked on them.
+        Users without a known location are not filtered and not found
+        """
+        latitude = current_user.location_latitude
+        longitude = current_user.location_longitude
+        ranges = GeoBuckets.ranges(latitude, longitude, max_distance)
+        if ranges is None:
+            return socks
 
-        # close db session
-        # db.close()
+        near_buckets = or_(
+            *(User.location_bucket.between(first, last) for first, last in ranges)
+        )
+        # haversine term of the distance (see GeoBuckets.haversine_limit)
+        other_latitude = func.radians(User.location_latitude)
+        other_longitude = func.radians(User.location_longitude)
+        haversine = func.power(
+            func.sin((other_latitude - math.radians(latitude)) / 2), 2
+        ) + math.cos(math.radians(latitude)) * func.cos(other_latitude) * func.power(
+            func.sin((other_longitude - math.radians(longitude)) / 2), 2
+        )
+        return socks.join(User, User.id == Sock.user_id).filter(
+            near_buckets, haversine <= GeoBuckets.haversine_limit(max_distance)
+        )
+
+    @staticmethod
+    def _prefilter_list_of_all_socks(
+        db: Session, current_user: User, current_user_sock: Sock
+    ) -> list | None:
+        """return the pre filtered socks (see _prefilter_query) as a list"""
+        unseen_socks = PrePredictionAlgorithm._prefilter_query(
+            db, current_user, current_user_sock
+        ).all()
         if unseen_socks:
             return unseen_socks
         return None
 
+    @staticmethod
+    def rank_candidates(
+        db: Session, current_user: User, current_user_sock: Sock, count: int
+    ) -> tuple[list, list]:
+        """rank the unseen socks and return the ids and scores of the best
+        count socks (best first), see SockRanker.rank_candidates
+        """
+        return PrePredictionAlgorithm.ranker.rank_candidates(
+            SQLAlchemySockSource(db, current_user, current_user_sock), count
+        )
+
+    @staticmethod
+    def get_next_socks(
+        db: Session, current_user: User, current_user_sock: Sock | None, count: int
+    ) -> list:
+        """return the next (up to count) best matching unseen socks for the current sock
+        the socks are served from a ranked candidate queue (see SockRanker.next_socks),
+        so the pool of unseen socks is only prefiltered and scored (once) if the
+        queue runs low. The pictures of the socks are loaded eagerly.
+        """
+        if current_user_sock is None:
+            return []
+        return PrePredictionAlgorithm.ranker.next_socks(
+            SQLAlchemySockSource(db, current_user, current_user_sock), count
+        )
+
+    @staticmethod
+    def explain_next_socks(
+        db: Session, current_user: User, current_user_sock: Sock, count: int
+    ) -> tuple[list, list]:
+        """return the next socks (see get_next_socks) and their score breakdown
+        with the timing spans of the pipeline (see SockRanker.explain)
+        """
+        source = SQLAlchemySockSource(db, current_user, current_user_sock)
+        next_socks = PrePredictionAlgorithm.ranker.next_socks(source, count)
+        return next_socks, PrePredictionAlgorithm.ranker.explain(source, next_socks)
+
     @staticmethod
     def get_next_sock(
         db: Session, current_user: User, current_user_sock: Sock | None
     ) -> Sock | None:
-        """currently this method is a simple mockup of the later version!
-        It is used to give a random record (sock) from the remaining pool of
-        unseen socks. We use basic randomization for that - nothing fancy!
+        """return the best matching unseen sock for the current sock (see get_next_socks)"""
+        next_socks = PrePredictionAlgorithm.get_next_socks(
+            db, current_user, current_user_sock, 1
+        )
+        if next_socks:
+            return next_socks[0]
+        # no reaming socks - return None!
+        return None
+
+    @staticmethod
+    def active_sock_sources(db: Session, after_id: int, limit: int) -> list:
+        """return the sources of the next (up to limit) socks with an id above
+        after_id whose users logged in within CANDIDATE_PRECOMPUTE_ACTIVE_DAYS
         """
-        if current_user_sock is None:
-            return None
+        since = datetime.utcnow() - timedelta(
+            days=int(os.environ.get("CANDIDATE_PRECOMPUTE_ACTIVE_DAYS", 7))
+        )
+        socks = (
+            db.query(Sock)
+            .join(User, Sock.user_id == User.id)
+            .filter(Sock.id > after_id, User.last_login >= since)
+            .options(selectinload(Sock.user))
+            .order_by(Sock.id)
+            .limit(limit)
+        )
+        return [SQLAlchemySockSource(db, sock.user, sock) for sock in socks]
 
-        # remaining unseen socks as list
-        unseen_socks = PrePredictionAlgorithm._prefilter_list_of_all_socks(
-            db, current_user, current_user_sock
+    @staticmethod
+    def candidate_queue_shared() -> bool:
+        """are the candidate queues shared by all processes (not in the memory
+        of this process, see REDIS_FASTAPI_CACHE_URL)
+        """
+        return not isinstance(PrePredictionAlgorithm.candidate_queue.cache, LocalCache)
+
+    @staticmethod
+    def precompute_candidates(
+        db: Session, restart: bool = False, workers: int | None = None
+    ) -> dict:
+        """refresh the candidate queues of all active socks ahead of time
+        (see CandidatePrecomputation) and return the metrics of the rebuild
+        the pools are scored on workers processes (CANDIDATE_PRECOMPUTE_WORKERS)
+        """
+        if workers is None:
+            workers = int(os.environ.get("CANDIDATE_PRECOMPUTE_WORKERS", 0))
+        with PrePredictionAlgorithm.ranker.parallel(
+            PrePredictionAlgorithm.get_feature_store(db), workers
+        ):
+            return PrePredictionAlgorithm.precomputation.run(
+                lambda after_id, limit: PrePredictionAlgorithm.active_sock_sources(
+                    db, after_id, limit
+                ),
+                restart,
+            )
+
+    @staticmethod
+    def already_judged(
+        db: Session, current_user: User, current_user_sock: Sock, other_sock_id: int
+    ) -> bool:
+        """return True if the current sock already liked or disliked the other sock
+        the judged filter answers most checks without a query, only socks which
+        were maybe judged are looked up in the database
+        """
+        if PrePredictionAlgorithm.swipe_buffer is not None:
+            pending = PrePredictionAlgorithm.swipe_buffer.pending(current_user_sock.id)
+            if other_sock_id in pending:
+                return True
+        source = SQLAlchemySockSource(db, current_user, current_user_sock)
+        if not PrePredictionAlgorithm.ranker.maybe_judged(source, [other_sock_id])[0]:
+            return False
+        return db.query(
+            exists().where(
+                SockLike.sock_id == current_user_sock.id,
+                SockLike.target_id == other_sock_id,
+            )
+        ).scalar()
+
+    @staticmethod
+    def sock_judged(current_user_sock: Sock, judged_sock_id):
+        """remove a liked or disliked sock from the candidate queue"""
+        PrePredictionAlgorithm.ranker.sock_judged(
+            current_user_sock.user_id, current_user_sock.id, judged_sock_id
         )
 
-        # check if there are remaining socks
-        if unseen_socks:
-            max_score = -1
-            chosen_one = unseen_socks[0]
-            # find best contender for match
-            for challenger_sock in unseen_socks:
-                score = PrePredictionAlgorithm._compare_socks(
-                    db, current_user_sock, challenger_sock
-                )
-                # detect if sock is better match then current best
-                if score > max_score:
-                    max_score = score
-                    chosen_one = challenger_sock
-
-            # this is the currently simplest version of a pre-prediction: randomizing
-            return chosen_one
+    @staticmethod
+    def socks_judged(current_user_sock: Sock, judged_sock_ids):
+        """remove several liked or disliked socks from the candidate queue"""
+        PrePredictionAlgorithm.ranker.socks_judged(
+            current_user_sock.user_id, current_user_sock.id, judged_sock_ids
+        )
 
-        # no reaming socks - return None!
-        return None
+    @staticmethod
+    def buffer_judgements(current_user_sock: Sock, judgements: list):
+        """buffer likes & dislikes [(sock id, like), ...] of the current sock
+        (write-behind swipes, see SwipeBuffer), the judged socks are removed
+        from the candidate queue at once
+        """
+        PrePredictionAlgorithm.swipe_buffer.add(current_user_sock.id, judgements)
+        PrePredictionAlgorithm.socks_judged(
+            current_user_sock, [sock_id for sock_id, _ in judgements]
+        )
+
+    @staticmethod
+    def flush_swipe_buffer(
+        db: Session, max_batches: int | None = None, on_match=None
+    ) -> dict:
+        """store the buffered swipes batch by batch (one transaction per batch,
+        see SockLike.judge_many) and return the metrics of the flush
+        on_match(sock, other_sock, user_match) is called for every new match
+        after its batch was committed
+        """
+
+        def store(judgements: dict) -> int:
+            sock_ids = set(judgements) | {
+                judged_id
+                for sock_judgements in judgements.values()
+                for judged_id, _ in sock_judgements
+            }
+            socks = {
+                sock.id: sock for sock in db.query(Sock).filter(Sock.id.in_(sock_ids))
+            }
+            matches = []
+            try:
+                for sock_id, sock_judgements in judgements.items():
+                    # deleted socks are skipped
+                    sock = socks.get(sock_id)
+                    if sock is None:
+                        continue
+                    other_socks = [
+                        (socks[judged_id], like)
+                        for judged_id, like in sock_judgements
+                        if judged_id in socks
+                        and socks[judged_id].user_id != sock.user_id
+                    ]
+                    _, user_matches = SockLike.judge_many(db, sock, other_socks)
+                    for user_match in user_matches:
+                        other_sock = next(
+                            other_sock
+                            for other_sock, like in other_socks
+                            if like and other_sock.user_id == user_match.other_id
+                        )
+                        matches.append((sock, other_sock, user_match))
+                db.commit()
+            except Exception:
+                db.rollback()
+                raise
+            if on_match is not None:
+                for match in matches:
+                    on_match(*match)
+            return len(matches)
+
+        return PrePredictionAlgorithm.swipe_buffer.flush(store, max_batches)
+
+
+class SQLAlchemySockSource(SockSource):
+    """SQLAlchemy adapter of the shared SockRanker (see hotsox_prediction)"""
+
+    def __init__(self, db: Session, current_user: User, current_user_sock: Sock):
+        super().__init__(current_user, current_user_sock)
+        self.db = db
+
+    def feature_store(self) -> SockFeatureStore:
+        return PrePredictionAlgorithm.get_feature_store(self.db)
+
+    def unseen_sock_ids(self, sock_ids) -> list:
+        query = PrePredictionAlgorithm._prefilter_query(self.db, self.user, self.sock)
+        return [
+            sock_id
+            for (sock_id,) in query.filter(Sock.id.in_(sock_ids)).with_entities(Sock.id)
+        ]
+
+    def unseen_sock_id_chunks(self, chunk_size: int, picture_after=None):
+        query = PrePredictionAlgorithm._prefilter_query(self.db, self.user, self.sock)
+        if picture_after is not None:
+            new_picture = exists().where(
+                SockProfilePicture.sock_id == Sock.id,
+                SockProfilePicture.id > picture_after,
+            )
+            query = query.filter(new_picture)
+        sock_ids = (
+            sock_id for (sock_id,) in query.with_entities(Sock.id).yield_per(chunk_size)
+        )
+        while chunk := list(islice(sock_ids, chunk_size)):
+            yield chunk
+
+    def judged_sock_ids(self) -> list:
+        judged_sock_ids = [
+            target_id
+            for (target_id,) in self.db.query(SockLike.target_id).filter(
+                SockLike.sock_id == self.sock.id
+            )
+        ]
+        if PrePredictionAlgorithm.swipe_buffer is not None:
+            judged_sock_ids += PrePredictionAlgorithm.swipe_buffer.pending(self.sock.id)
+        return judged_sock_ids
+
+    def load_socks(self, sock_ids):
+        return self.db.query(Sock).filter(Sock.id.in_(sock_ids))
+
+    def available_socks(self, sock_ids) -> dict:
+        return {
+            sock.id: sock
+            for sock in PrePredictionAlgorithm._prefilter_query(
+                self.db, self.user, self.sock
+            )
+            .filter(Sock.id.in_(sock_ids))
+            .options(selectinload(Sock.profile_pictures))
+        }
+
+
+# events to keep the sock feature store of the prediction up to date: the
+# changes of a flush are collected in the session and applied once it is
+# committed (to the store of this process if it was already loaded, the
+# changed socks are published to the other processes), a rollback discards them
+def feature_store_change(target, *change):
+    session = object_session(target)
+    if session is not None:
+        session.info.setdefault("feature_store_changes", []).append(change)
+
+
+@event.listens_for(Sock, "after_insert")
+@event.listens_for(Sock, "after_update")
+def feature_store_sock_saved(mapper, connection, target):
+    if PrePredictionAlgorithm.feature_store is not None:
+        # the attributes as flushed, they are expired after the commit
+        sock = SimpleNamespace(**inspect(target).dict)
+        feature_store_change(target, "upsert", sock)
+    feature_store_change(target, "publish", target.id)
+
+
+@event.listens_for(Sock, "after_delete")
+def feature_store_sock_deleted(mapper, connection, target):
+    feature_store_change(target, "remove", target.id)
+    feature_store_change(target, "publish", target.id)
+
+
+@event.listens_for(SockProfilePicture, "after_insert")
+def feature_store_picture_saved(mapper, connection, target):
+    feature_store_change(target, "has_picture", target.sock_id, True)
+    feature_store_change(target, "publish", target.sock_id)
+    # new pictures make socks available for swiping, the candidate queues merge them in
+    feature_store_change(target, "picture_added", target.id)
+
+
+@event.listens_for(SockProfilePicture, "after_delete")
+def feature_store_picture_deleted(mapper, connection, target):
+    feature_store_change(target, "publish", target.sock_id)
+    if PrePredictionAlgorithm.feature_store is None:
+        return
+    has_picture = connection.execute(
+        select(
+            exists().where(
+                SockProfilePicture.sock_id == target.sock_id,
+                SockProfilePicture.id != target.id,
+            )
+        )
+    ).scalar()
+    feature_store_change(target, "has_picture", target.sock_id, has_picture)
+
+
+@event.listens_for(Session, "after_commit")
+def feature_store_commit(session):
+    store = PrePredictionAlgorithm.feature_store
+    published = set()
+    for change, *args in session.info.pop("feature_store_changes", []):
+        if change == "publish":
+            published.update(args)
+        elif change == "picture_added":
+            PrePredictionAlgorithm.candidate_queue.picture_added(*args)
+        elif store is None:
+            continue
+        elif change == "upsert":
+            try:
+                store.upsert(*args)
+            except (AttributeError, TypeError, ValueError, OverflowError):
+                # attributes can not be encoded, the sock gets loaded on demand
+                store.remove(args[0].id)
+        elif change == "remove":
+            store.remove(*args)
+        else:
+            store.set_has_picture(*args)
+    PrePredictionAlgorithm.feature_store_sync.publish(published)
+
+
+@event.listens_for(Session, "after_rollback")
+def feature_store_rollback(session):
+    session.info.pop("feature_store_changes", None)
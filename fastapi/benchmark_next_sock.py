@@ -0,0 +1,227 @@
+"""measures the latency (p50/p99) and peak memory of
+PrePredictionAlgorithm.get_next_sock on growing synthetic databases (bulk inserted
+socks with like/dislike histories) and saves them as json
+
+    python benchmark_next_sock.py --socks 1000 10000 --output results.json
+
+everything runs in one transaction of the given (empty, local) postgres database
+which is rolled back in the end
+"""
+import argparse
+import json
+import time
+import numpy as np
+from sqlalchemy import create_engine, func, insert
+from sqlalchemy.orm import Session
+
+from api.database.models import Sock, SockLike, SockProfilePicture, User
+from api.database.setup import DATABASE_URL, Base
+from api.utilities.pre_prediction_algorithm import PrePredictionAlgorithm
+from hotsox_prediction import GeoBuckets, LocalCache
+from hotsox_prediction.benchmark import (
+    benchmark_metadata,
+    compare_results,
+    next_sock_phases,
+    synthetic_judgements,
+    synthetic_locations,
+    synthetic_sock_rows,
+    write_results,
+)
+
+# socks per synthetic user
+SOCKS_PER_USER = 2
+BATCH_SIZE = 5000
+
+
+def bulk_insert(db: Session, model, rows: list):
+    for start in range(0, len(rows), BATCH_SIZE):
+        db.execute(insert(model.__table__), rows[start : start + BATCH_SIZE])
+
+
+def insert_socks(db: Session, generator, amount: int) -> list:
+    """bulk insert amount socks (with a picture) of new users, return the ids
+    the ids are set here, the core inserts do not return them on every database
+    """
+    user_offset = db.query(func.coalesce(func.max(User.id), 0)).scalar()
+    sock_offset = db.query(func.coalesce(func.max(Sock.id), 0)).scalar()
+    picture_offset = db.query(
+        func.coalesce(func.max(SockProfilePicture.id), 0)
+    ).scalar()
+    locations = synthetic_locations(generator, amount // SOCKS_PER_USER + 1)
+    bulk_insert(
+        db,
+        User,
+        [
+            {
+                "id": user_offset + index,
+                "username": f"benchmark{user_offset + index}",
+                "email": f"benchmark{user_offset + index}@hotsox.test",
+                "info_gender": int(generator.integers(1, 6)),
+                "location_city": "benchmark",
+                "location_latitude": latitude,
+                "location_longitude": longitude,
+                "location_bucket": GeoBuckets.bucket(latitude, longitude),
+            }
+            for index, (latitude, longitude) in enumerate(locations, 1)
+        ],
+    )
+    sock_ids = list(range(sock_offset + 1, sock_offset + amount + 1))
+    bulk_insert(
+        db,
+        Sock,
+        [
+            {
+                **row,
+                "id": sock_id,
+                "user_id": user_offset + 1 + index // SOCKS_PER_USER,
+            }
+            for index, (sock_id, row) in enumerate(
+                zip(sock_ids, synthetic_sock_rows(generator, amount))
+            )
+        ],
+    )
+    bulk_insert(
+        db,
+        SockProfilePicture,
+        [
+            {
+                "id": picture_offset + index,
+                "sock_id": sock_id,
+                "profile_picture": "benchmark",
+            }
+            for index, sock_id in enumerate(sock_ids, 1)
+        ],
+    )
+    return sock_ids
+
+
+def insert_judgements(db: Session, judgements: list):
+    bulk_insert(
+        db,
+        SockLike,
+        [
+            SockLike.row(sock_id, judged_id, liked)
+            for sock_id, judged_id, liked in judgements
+        ],
+    )
+
+
+def benchmark(db: Session, generator, args) -> list:
+    def judge(next_sock, user, sock):
+        """dislike the next sock like the swipe route does"""
+        if next_sock is not None:
+            db.add(SockLike(**SockLike.row(sock.id, next_sock.id, False)))
+            db.flush()
+            PrePredictionAlgorithm.sock_judged(sock, next_sock.id)
+
+    scales, sock_ids = [], []
+    for amount in sorted(args.socks):
+        # the database grows from scale to scale
+        start = time.perf_counter()
+        new_ids = insert_socks(db, generator, amount - len(sock_ids))
+        sock_ids += new_ids
+        swiper_ids = generator.choice(
+            new_ids, min(args.swipers, len(new_ids)), replace=False
+        )
+        # realistic histories of the swipers and of a sample of all socks
+        history_ids = generator.choice(
+            new_ids, max(1, len(new_ids) // 100), replace=False
+        )
+        insert_judgements(
+            db,
+            synthetic_judgements(
+                generator,
+                sorted(set(swiper_ids.tolist()) | set(history_ids.tolist())),
+                sock_ids,
+                args.history,
+            ),
+        )
+        insert_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        PrePredictionAlgorithm.feature_store = (
+            PrePredictionAlgorithm.build_feature_store(db)
+        )
+        store_seconds = time.perf_counter() - start
+
+        swipers = [
+            (sock.user, sock)
+            for sock in db.query(Sock)
+            .filter(Sock.id.in_(swiper_ids.tolist()))
+            .order_by(Sock.id)
+        ]
+        phases = next_sock_phases(
+            lambda user, sock: PrePredictionAlgorithm.get_next_sock(db, user, sock),
+            judge,
+            lambda user, sock: PrePredictionAlgorithm.candidate_queue.invalidate(
+                user.id, sock.id
+            ),
+            swipers,
+            args.calls,
+        )
+        scales.append(
+            {
+                "socks": len(sock_ids),
+                "judgements": db.query(func.count(SockLike.id)).scalar(),
+                "insert_s": round(insert_seconds, 3),
+                "feature_store_s": round(store_seconds, 3),
+                "phases": phases,
+            }
+        )
+        print(
+            f"{len(sock_ids):>8} socks: "
+            + " | ".join(
+                f"{phase} p50 {metrics['ms_p50']:8.1f}ms "
+                f"p99 {metrics['ms_p99']:8.1f}ms {metrics['peak_mb']:6.1f}MB"
+                for phase, metrics in phases.items()
+            )
+        )
+    return scales
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--socks", type=int, nargs="+", default=[1000, 10000, 100000, 1000000]
+    )
+    parser.add_argument("--swipers", type=int, default=20)
+    parser.add_argument("--history", type=int, default=200)
+    parser.add_argument("--calls", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=1981)
+    parser.add_argument("--database-url", default=DATABASE_URL)
+    parser.add_argument("--output", default="benchmark_next_sock_fastapi.json")
+    parser.add_argument("--compare", help="json result of a former run")
+    args = parser.parse_args()
+
+    generator = np.random.default_rng(args.seed)
+    queue = PrePredictionAlgorithm.candidate_queue
+    judged_filter = PrePredictionAlgorithm.ranker.judged_filter
+    # the queues of the synthetic socks must not end up in the shared cache
+    queue.cache = judged_filter.cache = LocalCache()
+
+    engine = create_engine(args.database_url)
+    with engine.connect() as connection:
+        transaction = connection.begin()
+        try:
+            Base.metadata.create_all(bind=connection)
+            with Session(bind=connection, autoflush=False) as db:
+                scales = benchmark(db, generator, args)
+        finally:
+            transaction.rollback()
+
+    results = {
+        **benchmark_metadata("fastapi", engine.dialect.name),
+        "settings": {
+            key: getattr(args, key) for key in ("swipers", "history", "calls", "seed")
+        },
+        "scales": scales,
+    }
+    write_results(args.output, results)
+    print(f"results saved to {args.output}")
+    if args.compare:
+        with open(args.compare) as file:
+            print("\n".join(compare_results(json.load(file), results)))
+
+
+if __name__ == "__main__":
+    main()
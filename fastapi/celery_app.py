@@ -1,5 +1,6 @@
 from __future__ import absolute_import, unicode_literals
 import datetime
+import logging
 import os
 from dotenv import load_dotenv
 
@@ -26,6 +27,20 @@ celery_app.conf.task_reject_on_worker_lost = True
 celery_app.conf.worker_prefetch_multiplier = 1
 celery_app.conf.broker_url = os.environ.get("REDIS_FASTAPI_URL")
 celery_app.conf.result_backend = os.environ.get("REDIS_FASTAPI_URL")
+celery_app.conf.beat_schedule = {}
+# refresh the candidate queues of active socks ahead of time (only read by the
+# api processes from a shared cache)
+if os.environ.get("REDIS_FASTAPI_CACHE_URL"):
+    celery_app.conf.beat_schedule["precompute_candidates"] = {
+        "task": "precompute_candidates",
+        "schedule": int(os.environ.get("CANDIDATE_PRECOMPUTE_INTERVAL", 60 * 10)),
+    }
+# store the buffered swipes (write-behind mode, see PrePredictionAlgorithm)
+if os.environ.get("SWIPE_WRITE_BEHIND", "false").lower() == "true":
+    celery_app.conf.beat_schedule["flush_swipe_buffer"] = {
+        "task": "flush_swipe_buffer",
+        "schedule": int(os.environ.get("SWIPE_BUFFER_FLUSH_INTERVAL", 5)),
+    }
 
 # build eMail Config
 awesome_yag = yagmail.SMTP(os.getenv("MAIL_USERNAME"), os.getenv("MAIL_PASSWORD"))
@@ -55,3 +70,58 @@ def celery_send_mail_to_all_fanout(emails: list, subject: str, content: list):
 def destroy_profilepicture_on_cloud(public_id):
     uploader.destroy(public_id)
     return {"message": f"profile on cloud storage destroyed!"}
+
+
+@celery_app.task(name="precompute_candidates")
+def precompute_candidates(restart: bool = False, workers: int | None = None):
+    # imported here, the database models import this module
+    from api.database.setup import get_db_session
+    from api.utilities.pre_prediction_algorithm import PrePredictionAlgorithm
+
+    if not PrePredictionAlgorithm.candidate_queue_shared():
+        # the queues would only be stored in the memory of the celery worker
+        logging.getLogger("hotsox_prediction").warning(
+            "precompute_candidates needs a shared cache (redis)"
+        )
+        return {"message": "the candidate queues are not in a shared cache!"}
+    with get_db_session() as db:
+        metrics = PrePredictionAlgorithm.precompute_candidates(db, restart, workers)
+    return {
+        "message": f"candidate queues of {metrics['socks']} active socks precomputed!",
+        "metrics": metrics,
+    }
+
+
+def send_match_mails(user_sock, other_sock):
+    """notify both users of a new match (celery)"""
+    for user, other_user in (
+        (user_sock.user, other_sock.user),
+        (other_sock.user, user_sock.user),
+    ):
+        if user.notification:
+            celery_send_mail_to_user.delay(
+                user.email,
+                f"You have a match with {other_user.username}",
+                "Please visit HotSox to check your new match :)",
+            )
+
+
+@celery_app.task(name="flush_swipe_buffer")
+def flush_swipe_buffer():
+    # imported here, the database models import this module
+    from api.database.setup import get_db_session
+    from api.utilities.pre_prediction_algorithm import PrePredictionAlgorithm
+
+    if PrePredictionAlgorithm.swipe_buffer is None:
+        return {"message": "write-behind swipes are not enabled!"}
+    with get_db_session() as db:
+        metrics = PrePredictionAlgorithm.flush_swipe_buffer(
+            db,
+            on_match=lambda sock, other_sock, user_match: send_match_mails(
+                sock, other_sock
+            ),
+        )
+    return {
+        "message": f"{metrics['judgements']} buffered judgements stored!",
+        "metrics": metrics,
+    }
@@ -1,4 +1,5 @@
 import os
+import logging
 import warnings
 from fastapi_pagination.utils import FastAPIPaginationWarning
 from dotenv import load_dotenv
@@ -39,6 +40,11 @@ cloudinary.config(
 
 warnings.simplefilter("ignore", FastAPIPaginationWarning)
 
+# timing spans of the prediction pipeline (json lines, see SockRanker.next_socks)
+prediction_logger = logging.getLogger("hotsox_prediction")
+prediction_logger.addHandler(logging.StreamHandler())
+prediction_logger.setLevel(os.environ.get("PREDICTION_LOG_LEVEL", "WARNING"))
+
 # build FastAPI app / Hide schemas from docs
 app = FastAPI(
     title="HotSox FastAPI",
@@ -11,6 +11,18 @@ from sqlalchemy.dialects.postgresql.base import PGDDLCompiler
 from api.authentication.hashing import Hash
 from api.database.models import User
 from api.database.setup import Base, engine
+from api.routers import (
+    auth,
+    match,
+    sock,
+    sock_pic,
+    swipe,
+    user,
+    user_chat,
+    user_mail,
+    user_pic,
+)
+from api.utilities.pre_prediction_algorithm import PrePredictionAlgorithm
 
 # import main fast api app for testing
 from main import app
@@ -79,6 +91,21 @@ def test_db_setup():
     Base.metadata.drop_all(bind=engine)
     # create all tables
     Base.metadata.create_all(bind=engine)
+    # the ids start again, so the candidate queues of former tests are invalid
+    PrePredictionAlgorithm.candidate_queue.cache.clear()
+    # every test starts with fresh rate limits (the suite runs within a minute)
+    for router in (
+        auth,
+        match,
+        sock,
+        sock_pic,
+        swipe,
+        user,
+        user_chat,
+        user_mail,
+        user_pic,
+    ):
+        router.limiter.reset()
 
     # setup database for tests
     with Session(engine) as db:
@@ -1,5 +1,7 @@
 from unittest import mock
+import pytest
 from fastapi.testclient import TestClient
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 import warnings
 from fastapi_pagination.utils import FastAPIPaginationWarning
@@ -122,13 +124,15 @@ def test_specific_match(test_db_setup):
     assert response.json()["unmatched"] == True
     assert len(response.json()["chatroom_uuid"]) == 36
 
-    # setup database
-    setup_match_records()
+    # match again (two users match only once)
+    with Session(engine) as db:
+        db.query(UserMatch).update({"unmatched": False})
+        db.commit()
 
     # check from second user perspective
     response = client.request(
         "DELETE",
-        f"{PREFIX}/user/match/2",
+        f"{PREFIX}/user/match/1",
         headers=token("testuser2", "testuser2"),
     )
 
@@ -136,15 +140,41 @@ def test_specific_match(test_db_setup):
 
     # check if match was set to unmatched successfully
     response = client.get(
-        PREFIX + "/user/match/2",
+        PREFIX + "/user/match/1",
         headers=token(username="testuser2", password="testuser2"),
     )
     assert response.status_code == 200
     assert isinstance(response.json(), dict)
-    assert response.json()["id"] == 2
+    assert response.json()["id"] == 1
     assert response.json()["matched_with"] == {
         "email": "admin@admin.com",
         "username": "admin",
     }
     assert response.json()["unmatched"] == True
     assert len(response.json()["chatroom_uuid"]) == 36
+
+
+def test_match_between(test_db_setup):
+    # setup database
+    setup_match_records()
+
+    with Session(engine) as db:
+        user1 = db.query(User).filter(User.username == TEST_USER1["username"]).first()
+        user2 = db.query(User).filter(User.username == TEST_USER2["username"]).first()
+        match = db.query(UserMatch).one()
+        assert (match.low_id, match.high_id) == UserMatch.pair(user2.id, user1.id)
+        # the same match whoever is asked first
+        assert UserMatch.between(db, user1.id, user2.id).one().id == match.id
+        assert UserMatch.between(db, user2.id, user1.id).one().id == match.id
+
+        # two users match only once
+        db.add(
+            UserMatch(
+                user_id=user2.id,
+                other_id=user1.id,
+                unmatched=False,
+                chatroom_uuid=uuid.uuid4(),
+            )
+        )
+        with pytest.raises(IntegrityError):
+            db.commit()
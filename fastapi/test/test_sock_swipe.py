@@ -1,6 +1,7 @@
 from unittest import mock
 from fastapi.testclient import TestClient
 from datetime import datetime, date, timedelta
+from sqlalchemy import text
 from sqlalchemy.orm import Session
 
 import warnings
@@ -21,8 +22,12 @@ from .inital_test_setup import (
 
 # setup a test database for the test
 from api.authentication.hashing import Hash
-from api.database.models import User, Sock
+from api.database.models import User, Sock, SockLike, UserMatch
 from api.database.setup import engine
+from api.utilities.pre_prediction_algorithm import PrePredictionAlgorithm
+from hotsox_prediction import GeoBuckets
+from celery_app import flush_swipe_buffer, precompute_candidates
+from hotsox_prediction import LocalSwipeStream, SwipeBuffer
 
 
 def create_test_records():
@@ -153,6 +158,73 @@ def test_swipe_next_sock(mock_uploader_upload, test_db_setup):
     assert content["id_sock"] == 2
 
 
+@mock.patch("api.controller.ctr_sock_pic.uploader.upload")
+def test_swipe_next_socks(mock_uploader_upload, test_db_setup):
+    # set up the mock return value
+    mock_uploader_upload.return_value = {"url": "https://cloudinary.com/mock_image.jpg"}
+
+    create_test_records()
+
+    response = client.get(
+        PREFIX + f"/user/swipe/1/next/5",
+        headers=token("admin", "admin"),
+    )
+    content = response.json()
+
+    assert response.status_code == 200
+    assert [sock["id_sock"] for sock in content] == [2, 3]
+    assert all(len(sock["profile_pictures"]) == 1 for sock in content)
+
+    # the count is limited
+    response = client.get(
+        PREFIX + f"/user/swipe/1/next/0",
+        headers=token("admin", "admin"),
+    )
+    assert response.status_code == 400
+
+
+@mock.patch("api.controller.ctr_sock_pic.uploader.upload")
+def test_swipe_next_sock_after_judgement(mock_uploader_upload, test_db_setup):
+    # set up the mock return value
+    mock_uploader_upload.return_value = {"url": "https://cloudinary.com/mock_image.jpg"}
+
+    create_test_records()
+
+    # the next sock is served from the candidate queue until it is judged
+    for _ in range(2):
+        response = client.get(
+            PREFIX + f"/user/swipe/1/next",
+            headers=token("admin", "admin"),
+        )
+        assert response.status_code == 200
+        assert response.json()["id_sock"] == 2
+
+    response = client.post(
+        PREFIX + f"/user/swipe/1/judge/2?judgement=false",
+        headers=token("admin", "admin"),
+    )
+    assert response.status_code == 200
+
+    response = client.get(
+        PREFIX + f"/user/swipe/1/next",
+        headers=token("admin", "admin"),
+    )
+    assert response.status_code == 200
+    assert response.json()["id_sock"] == 3
+
+    response = client.post(
+        PREFIX + f"/user/swipe/1/judge/3?judgement=true",
+        headers=token("admin", "admin"),
+    )
+    assert response.status_code == 200
+
+    response = client.get(
+        PREFIX + f"/user/swipe/1/next",
+        headers=token("admin", "admin"),
+    )
+    assert response.status_code == 404
+
+
 @mock.patch("api.controller.ctr_sock_pic.uploader.upload")
 def test_swipe_judge_sock(mock_uploader_upload, test_db_setup):
     # set up the mock return value
@@ -201,3 +273,302 @@ def test_swipe_judge_sock(mock_uploader_upload, test_db_setup):
     assert content["Match"]["chatroom_uuid"] != ""
     assert len(content["Match"]["chatroom_uuid"]) == 36
     assert content["Match"]["unmatched"] == False
+
+    # the second matching pair of socks does not match the users again
+    response = client.post(
+        PREFIX + f"/user/swipe/3/judge/1?judgement=true",
+        headers=token("testuser2", "testuser2"),
+    )
+    assert response.status_code == 200
+    assert response.json() == {"Message": "No new match found"}
+    with Session(engine) as db:
+        assert db.query(UserMatch).count() == 1
+
+
+@mock.patch("api.controller.ctr_sock_pic.uploader.upload")
+def test_swipe_judge_socks(mock_uploader_upload, test_db_setup):
+    mock_uploader_upload.return_value = {"url": "https://cloudinary.com/mock_image.jpg"}
+    create_test_records()
+    client.post(
+        PREFIX + f"/user/swipe/2/judge/1?judgement=true",
+        headers=token("testuser2", "testuser2"),
+    )
+
+    judgements = [
+        {"sock_id": 2, "like": True},
+        {"sock_id": 3, "like": False},
+        {"sock_id": 1, "like": True},
+        {"sock_id": 99, "like": True},
+    ]
+    response = client.post(
+        PREFIX + f"/user/swipe/1/judge",
+        json=judgements,
+        headers=token("admin", "admin"),
+    )
+    content = response.json()
+    assert response.status_code == 200
+    assert content["judged"] == [2, 3]
+    assert content["already_judged"] == []
+    # own and unknown socks are not judged
+    assert content["not_found"] == [1, 99]
+    # the mutual like matches the users
+    assert len(content["matches"]) == 1
+    assert content["matches"][0]["user_id"] == 1
+    assert content["matches"][0]["other_id"] == 2
+
+    # repeated judgements change nothing
+    response = client.post(
+        PREFIX + f"/user/swipe/1/judge",
+        json=judgements[:2],
+        headers=token("admin", "admin"),
+    )
+    content = response.json()
+    assert content["judged"] == []
+    assert content["already_judged"] == [2, 3]
+    assert content["matches"] == []
+
+
+@mock.patch("api.controller.ctr_sock_pic.uploader.upload")
+def test_sock_like_judge(mock_uploader_upload, test_db_setup):
+    mock_uploader_upload.return_value = {"url": "https://cloudinary.com/mock_image.jpg"}
+    create_test_records()
+
+    with Session(engine) as db:
+        sock, other_sock = db.get(Sock, 1), db.get(Sock, 2)
+        # a repeated judgement is not inserted again (ON CONFLICT DO NOTHING)
+        assert SockLike.judge(db, sock, other_sock, False) == (True, None)
+        assert SockLike.judge(db, sock, other_sock, False) == (False, None)
+        # a disliked sock can not be liked afterwards
+        assert SockLike.judge(db, sock, other_sock, True) == (False, None)
+        created, user_match = SockLike.judge(db, other_sock, sock, True)
+        db.commit()
+        assert created
+        assert user_match is None
+        assert SockLike.judge(db, db.get(Sock, 3), sock, True) == (True, None)
+        # the reciprocal like of another sock of the user matches the users
+        created, user_match = SockLike.judge(db, sock, db.get(Sock, 3), True)
+        db.commit()
+        assert created
+        assert (user_match.user_id, user_match.other_id) == (1, 2)
+        assert sorted(
+            db.query(SockLike.sock_id, SockLike.target_id, SockLike.decision)
+        ) == [
+            (1, 2, SockLike.DISLIKE),
+            (1, 3, SockLike.LIKE),
+            (2, 1, SockLike.LIKE),
+            (3, 1, SockLike.LIKE),
+        ]
+
+
+@mock.patch("api.controller.ctr_sock_pic.uploader.upload")
+def test_precompute_candidates(mock_uploader_upload, test_db_setup):
+    # set up the mock return value
+    mock_uploader_upload.return_value = {"url": "https://cloudinary.com/mock_image.jpg"}
+
+    create_test_records()
+
+    # the queues in the memory of the worker would never be read by the api
+    assert "metrics" not in precompute_candidates()
+
+    # all socks of the (recently logged in) test users are precomputed
+    with mock.patch.object(
+        PrePredictionAlgorithm, "candidate_queue_shared", return_value=True
+    ):
+        result = precompute_candidates()
+    assert result["metrics"]["socks"] == 3
+    assert PrePredictionAlgorithm.precomputation.progress() is None
+
+    # the next swipe is served from the precomputed queue
+    with mock.patch.object(
+        PrePredictionAlgorithm.ranker, "rank_candidates"
+    ) as rank_candidates:
+        response = client.get(
+            PREFIX + f"/user/swipe/1/next",
+            headers=token("admin", "admin"),
+        )
+    assert response.status_code == 200
+    assert response.json()["id_sock"] == 2
+    rank_candidates.assert_not_called()
+
+
+@mock.patch("api.controller.ctr_sock_pic.uploader.upload")
+def test_swipe_next_sock_explain(mock_uploader_upload, test_db_setup):
+    # set up the mock return value
+    mock_uploader_upload.return_value = {"url": "https://cloudinary.com/mock_image.jpg"}
+
+    create_test_records()
+
+    response = client.get(
+        PREFIX + f"/user/swipe/1/next?explain=true",
+        headers=token("admin", "admin"),
+    )
+    content = response.json()
+
+    assert response.status_code == 200
+    assert content["id_sock"] == 2
+    explain = content["explain"]
+    assert explain["sock_id"] == 2
+    assert explain["attributes"]["info_color"]["points"] == 10.0
+    assert "score" in explain["pipeline"]["stages"]
+
+    # the score breakdown is for superusers only
+    response = client.get(
+        PREFIX + f"/user/swipe/2/next/2?explain=true",
+        headers=token("testuser2", "testuser2"),
+    )
+    assert response.status_code == 403
+
+
+@mock.patch("api.controller.ctr_sock_pic.uploader.upload")
+def test_swipe_metrics(mock_uploader_upload, test_db_setup):
+    # set up the mock return value
+    mock_uploader_upload.return_value = {"url": "https://cloudinary.com/mock_image.jpg"}
+
+    create_test_records()
+    PrePredictionAlgorithm.ranker.metrics.reset()
+
+    client.get(PREFIX + f"/user/swipe/1/next", headers=token("admin", "admin"))
+    response = client.get(
+        PREFIX + f"/user/swipe/metrics", headers=token("admin", "admin")
+    )
+    content = response.json()
+
+    assert response.status_code == 200
+    assert content["runs"] == 1
+    assert content["stages"]["available"]["candidates_out"] == 2
+
+    response = client.get(
+        PREFIX + f"/user/swipe/metrics", headers=token("testuser2", "testuser2")
+    )
+    assert response.status_code == 403
+
+
+@mock.patch("api.controller.ctr_sock_pic.uploader.upload")
+def test_swipe_max_distance(mock_uploader_upload, test_db_setup):
+    # set up the mock return value
+    mock_uploader_upload.return_value = {"url": "https://cloudinary.com/mock_image.jpg"}
+
+    create_test_records()
+
+    with Session(engine) as db:
+        # berlin & potsdam are ~27km apart
+        admin = db.query(User).filter(User.username == "admin").first()
+        other = db.query(User).filter(User.username == "testuser2").first()
+        admin.location_latitude, admin.location_longitude = 52.52, 13.40
+        other.location_latitude, other.location_longitude = 52.39, 13.06
+        db.commit()
+        assert other.location_bucket == GeoBuckets.bucket(52.39, 13.06)
+        sock = db.query(Sock).filter(Sock.user_id == admin.id).first()
+
+        def unseen_sock_ids():
+            query = PrePredictionAlgorithm._prefilter_query(db, admin, sock)
+            return [unseen.id for unseen in query]
+
+        with mock.patch.object(PrePredictionAlgorithm, "max_distance_km", 50):
+            assert unseen_sock_ids() == [2, 3]
+        with mock.patch.object(PrePredictionAlgorithm, "max_distance_km", 20):
+            assert unseen_sock_ids() == []
+            # users without a known location are not filtered
+            admin.location_latitude, admin.location_longitude = 0, 0
+            db.commit()
+            assert unseen_sock_ids() == [2, 3]
+
+
+@mock.patch("api.controller.ctr_sock_pic.uploader.upload")
+def test_swipe_judge_sock_write_behind(mock_uploader_upload, test_db_setup):
+    mock_uploader_upload.return_value = {"url": "https://cloudinary.com/mock_image.jpg"}
+    create_test_records()
+    client.post(
+        PREFIX + f"/user/swipe/2/judge/1?judgement=true",
+        headers=token("testuser2", "testuser2"),
+    )
+
+    with mock.patch.object(
+        PrePredictionAlgorithm, "swipe_buffer", SwipeBuffer(LocalSwipeStream())
+    ):
+        # the like is acknowledged at once, nothing is stored yet
+        response = client.post(
+            PREFIX + f"/user/swipe/1/judge/2?judgement=true",
+            headers=token("admin", "admin"),
+        )
+        assert response.status_code == 200
+        assert response.json() == {
+            "Message": "Judgement buffered, a new match is stored later"
+        }
+        response = client.post(
+            PREFIX + f"/user/swipe/1/judge/2?judgement=true",
+            headers=token("admin", "admin"),
+        )
+        assert response.status_code == 404
+
+        response = client.post(
+            PREFIX + f"/user/swipe/1/judge",
+            json=[{"sock_id": 2, "like": True}, {"sock_id": 3, "like": False}],
+            headers=token("admin", "admin"),
+        )
+        assert response.json()["judged"] == [3]
+        assert response.json()["already_judged"] == [2]
+
+        # the buffered socks are not shown again (even if the queue is rebuilt)
+        PrePredictionAlgorithm.candidate_queue.invalidate(1, 1)
+        response = client.get(
+            PREFIX + f"/user/swipe/1/next",
+            headers=token("admin", "admin"),
+        )
+        assert response.status_code == 404
+
+        with Session(engine) as db:
+            assert db.query(SockLike).filter(SockLike.sock_id == 1).count() == 0
+
+        # the celery task stores the judgements and finds the match (the
+        # users are notified by mail, testuser2 has turned notifications off)
+        with mock.patch("celery_app.celery_send_mail_to_user.delay") as mail_mock:
+            result = flush_swipe_buffer()
+        assert [call.args[0] for call in mail_mock.call_args_list] == [
+            "admin@admin.com"
+        ]
+        assert result["metrics"]["judgements"] == 2
+        assert result["metrics"]["matches"] == 1
+        assert PrePredictionAlgorithm.swipe_buffer.pending(1) == set()
+
+    with Session(engine) as db:
+        assert db.query(SockLike).filter(SockLike.sock_id == 1).count() == 2
+        user_match = db.query(UserMatch).one()
+        assert (user_match.user_id, user_match.other_id) == (1, 2)
+
+
+@mock.patch("api.controller.ctr_sock_pic.uploader.upload")
+def test_feature_store_updated_on_commit(mock_uploader_upload, test_db_setup):
+    # set up the mock return value
+    mock_uploader_upload.return_value = {"url": "https://cloudinary.com/mock_image.jpg"}
+
+    create_test_records()
+
+    sync = PrePredictionAlgorithm.feature_store_sync
+    with Session(engine) as db:
+        store = PrePredictionAlgorithm.build_feature_store(db)
+        store.sync_version = sync.version()
+        with mock.patch.object(
+            PrePredictionAlgorithm, "feature_store", store
+        ), mock.patch.multiple(sync, interval=0, pulled=None):
+            sock = db.get(Sock, 1)
+            # a change which is rolled back never reaches the store
+            sock.info_color = 3
+            db.flush()
+            assert store.codes[store.index[1]][0] == 1
+            db.rollback()
+            assert store.codes[store.index[1]][0] == 1
+
+            # a commit updates the store and is published to the other processes
+            sock.info_color = 3
+            db.commit()
+            assert store.codes[store.index[1]][0] == 3
+            assert sync.cache.get(sync.key(sync.version())) == [1]
+
+            # a sock changed by another process is reloaded from the database
+            db.execute(text("UPDATE app_users_sock SET info_color = 4 WHERE id = 2"))
+            db.commit()
+            sync.publish([2])
+            assert PrePredictionAlgorithm.get_feature_store(db) is store
+            assert store.codes[store.index[2]][0] == 4
+            assert store.sync_version == sync.version()
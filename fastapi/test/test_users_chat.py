@@ -83,7 +83,8 @@ def test_user_chats_with_chats_between_users(test_db_setup):
         headers=token("admin", "admin"),
     )
     assert response.status_code == 200
-    response_json = response.json()[0]
+    assert response.json()["next"] == None
+    response_json = response.json()["items"][0]
     assert response_json["receiver"] == {
         "username": "testuser2",
         "email": "testuser2@testuser2.com",
@@ -94,3 +95,39 @@ def test_user_chats_with_chats_between_users(test_db_setup):
         "username": "admin",
         "email": "admin@admin.com",
     }
+
+
+def test_user_chats_between_users_pages(test_db_setup):
+    with Session(engine) as db:
+        user1 = db.query(User).filter(User.username == TEST_USER1["username"]).first()
+        user2 = db.query(User).filter(User.username == TEST_USER2["username"]).first()
+        for i in range(30):
+            db.add(
+                MessageChat(user_id=user1.id, other_id=user2.id, message=f"test {i}")
+            )
+            db.add(
+                MessageChat(user_id=user2.id, other_id=user1.id, message=f"answer {i}")
+            )
+        db.commit()
+        ids = [
+            chat.id
+            for chat in db.query(MessageChat).order_by(
+                MessageChat.sent_date.desc(), MessageChat.id.desc()
+            )
+        ]
+
+    url = PREFIX + f"/user/chat/{TEST_USER2['username']}"
+    first = client.get(url, headers=token("admin", "admin")).json()
+    second = client.get(
+        url, params={"before": first["next"]}, headers=token("admin", "admin")
+    ).json()
+
+    # both directions, the newest first, every chat once
+    assert len(first["items"]) == MessageChat.HISTORY_PAGE_SIZE
+    assert second["next"] == None
+    assert [chat["id"] for chat in first["items"] + second["items"]] == ids
+
+    response = client.get(
+        url, params={"before": "invalid"}, headers=token("admin", "admin")
+    )
+    assert response.status_code == 400
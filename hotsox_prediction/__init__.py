@@ -0,0 +1,16 @@
+"""framework neutral prediction core shared by the django and the fastapi app
+the apps only implement a SockSource (database adapter) with their ORM
+"""
+
+from .candidate_queue import CandidateQueue, LocalCache, RedisCache
+from .feature_store_sync import FeatureStoreSync
+from .geo_buckets import GeoBuckets
+from .instrumentation import PipelineMetrics, PipelineTrace
+from .judged_filter import JudgedSockFilter
+from .precomputation import CandidatePrecomputation
+from .ranking import SockRanker, SockSource
+from .sock_ann_index import SockANNIndex
+from .sock_feature_store import SockFeatureStore
+from .sock_scoring import SockScoringEngine
+from .swipe_buffer import LocalSwipeStream, RedisSwipeStream, SwipeBuffer
+from .text_similarity import MinHashTextSimilarity
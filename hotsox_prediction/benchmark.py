@@ -0,0 +1,231 @@
+import json
+import os
+import platform
+import subprocess
+import time
+import tracemalloc
+import numpy as np
+from datetime import date, datetime, timedelta
+from types import SimpleNamespace
+
+from .ranking import SockSource
+from .sock_feature_store import SockFeatureStore
+from .sock_scoring import SockScoringEngine
+
+
+class SyntheticSockSource(SockSource):
+    """sock source of a synthetic feature store, the ids of the pool are
+    generated lazily chunk by chunk like the rows of a server-side cursor
+    """
+
+    def __init__(self, store: SockFeatureStore, sock):
+        super().__init__(SimpleNamespace(id=0), sock)
+        self.store = store
+
+    def feature_store(self) -> SockFeatureStore:
+        return self.store
+
+    def unseen_sock_ids(self, sock_ids) -> list:
+        return list(sock_ids)
+
+    def unseen_sock_id_chunks(self, chunk_size: int, picture_after=None):
+        for start in range(1, len(self.store) + 1, chunk_size):
+            yield list(range(start, min(start + chunk_size, len(self.store) + 1)))
+
+    def judged_sock_ids(self) -> list:
+        return []
+
+
+def synthetic_store(generator, amount: int) -> SockFeatureStore:
+    """feature store of random socks with the ids 1..amount
+    the arrays are filled directly, encoding real texts would take minutes
+    """
+    store = SockFeatureStore(capacity=amount)
+    store.size = amount
+    store.ids[:] = np.arange(1, amount + 1)
+    store.index = {sock_id: sock_id - 1 for sock_id in range(1, amount + 1)}
+    store.texts = [["", ""]] * amount
+    for column, attribute in enumerate(store.CODE_ATTRIBUTES):
+        maximum = SockScoringEngine.MAXIMA[attribute]
+        store.codes[:, column] = generator.integers(0, maximum + 1, amount)
+    for column, attribute in enumerate(store.COUNT_ATTRIBUTES):
+        maximum = SockScoringEngine.MAXIMA[attribute]
+        store.counts[:, column] = generator.integers(0, maximum + 1, amount)
+    store.days[:] = date.today().toordinal() - generator.integers(
+        0, 365, store.days.shape
+    )
+    store.signatures[:] = generator.integers(
+        0, 2**10, store.signatures.shape, dtype=np.uint32
+    )
+    store.has_picture[:] = True
+    return store
+
+
+def synthetic_sock(text: str = "hot sox"):
+    """sock (record) with average attributes to rank synthetic pools against"""
+    return SimpleNamespace(
+        **{
+            attribute: SockScoringEngine.MAXIMA[attribute] // 2
+            for attribute in SockScoringEngine.INTEGER_ATTRIBUTES
+        },
+        **dict.fromkeys(SockScoringEngine.DATE_ATTRIBUTES, date.today()),
+        **dict.fromkeys(SockScoringEngine.TEXT_ATTRIBUTES, text),
+    )
+
+
+# words of the synthetic sock texts (the MinHash costs depend on real texts)
+WORDS = (
+    "wool cotton stripes dots red blue green black grey warm soft fuzzy "
+    "holey lonely left right sporty cozy winter summer hiking dancing "
+    "washed twice never lost found dryer monster puppet grandma gift "
+    "lucky smelly fresh vintage brand new knitted silk bamboo toe heel"
+).split()
+
+
+def synthetic_text(generator, words: int) -> str:
+    return " ".join(generator.choice(WORDS, words))
+
+
+def synthetic_sock_rows(generator, amount: int) -> list:
+    """return the attributes of amount random socks as dicts (model fields)
+    the choice fields are codes 1..maximum, the counts 0..maximum
+    """
+    today = date.today()
+    columns = {}
+    for attribute in SockFeatureStore.CODE_ATTRIBUTES:
+        maximum = SockScoringEngine.MAXIMA[attribute]
+        columns[attribute] = generator.integers(1, maximum + 1, amount).tolist()
+    for attribute in SockFeatureStore.COUNT_ATTRIBUTES:
+        maximum = SockScoringEngine.MAXIMA[attribute]
+        columns[attribute] = generator.integers(0, maximum + 1, amount).tolist()
+    joined = generator.integers(0, 3 * 365, amount).tolist()
+    separated = generator.integers(0, 365, amount).tolist()
+    return [
+        {
+            **{attribute: values[index] for attribute, values in columns.items()},
+            "info_name": f"sock {index}",
+            "info_joining_date": today - timedelta(days=joined[index]),
+            "info_separation_date": today - timedelta(days=separated[index]),
+            "info_special": synthetic_text(generator, 4),
+            "info_about": synthetic_text(generator, 12),
+        }
+        for index in range(amount)
+    ]
+
+
+def synthetic_locations(generator, amount: int) -> list:
+    """return amount random (latitude, longitude) locations in europe"""
+    latitudes = generator.uniform(36, 60, amount).round(4).tolist()
+    longitudes = generator.uniform(-10, 30, amount).round(4).tolist()
+    return list(zip(latitudes, longitudes))
+
+
+def synthetic_judgements(generator, sock_ids, judged_ids, history: int) -> list:
+    """return a like/dislike history of history socks for every sock id as
+    (sock id, judged sock id, liked) tuples, about a third are likes
+    """
+    judged_ids = np.asarray(judged_ids)
+    judgements = []
+    for sock_id in sock_ids:
+        judged = generator.choice(
+            judged_ids, min(history, len(judged_ids)), replace=False
+        )
+        likes = generator.random(len(judged)) < 0.3
+        judgements.extend(
+            (sock_id, int(judged_id), bool(liked))
+            for judged_id, liked in zip(judged, likes)
+            if judged_id != sock_id
+        )
+    return judgements
+
+
+def measure_calls(function, arguments, after=None) -> dict:
+    """call function with every argument tuple and return the latencies
+    (p50/p99/mean/max ms) and the peak memory (tracemalloc) of the calls
+    after(result, *argument) is called untimed after every call (e.g. a swipe)
+    """
+    latencies = []
+    tracemalloc.start()
+    for argument in arguments:
+        start = time.perf_counter()
+        result = function(*argument)
+        latencies.append((time.perf_counter() - start) * 1000)
+        if after is not None:
+            after(result, *argument)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    p50, p99 = np.percentile(latencies, [50, 99]) if latencies else (0.0, 0.0)
+    return {
+        "calls": len(latencies),
+        "ms_p50": round(float(p50), 3),
+        "ms_p99": round(float(p99), 3),
+        "ms_mean": round(float(np.mean(latencies)), 3) if latencies else 0.0,
+        "ms_max": round(max(latencies, default=0.0), 3),
+        "peak_mb": round(peak / 2**20, 3),
+    }
+
+
+def next_sock_phases(get_next_sock, judge, invalidate, swipers, calls) -> dict:
+    """measure the next sock requests of the swipers ((user, sock) tuples)
+    cold: the first request after the candidate queue was invalidated (ranking)
+    warm: calls requests per swiper, every next sock is judged in between
+    judge(next sock, user, sock) and invalidate(user, sock) are not timed
+    """
+    for swiper in swipers:
+        invalidate(*swiper)
+    return {
+        "cold": measure_calls(get_next_sock, swipers),
+        "warm": measure_calls(get_next_sock, swipers * calls, after=judge),
+    }
+
+
+def benchmark_metadata(implementation: str, database: str) -> dict:
+    """return the context of a benchmark run (commit, machine, database)"""
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except OSError:
+        commit = ""
+    return {
+        "implementation": implementation,
+        "database": database,
+        "commit": commit or None,
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def write_results(path: str, results: dict):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, "w") as file:
+        json.dump(results, file, indent=2)
+
+
+def compare_results(previous: dict, current: dict) -> list:
+    """return a line per scale & phase with the p50/p99 change against a
+    former result file (e.g. of another commit)
+    """
+    former = {
+        (scale["socks"], phase): metrics
+        for scale in previous.get("scales", [])
+        for phase, metrics in scale["phases"].items()
+    }
+    lines = []
+    for scale in current["scales"]:
+        for phase, metrics in scale["phases"].items():
+            before = former.get((scale["socks"], phase))
+            if not before or not before["ms_p50"] or not before["ms_p99"]:
+                continue
+            lines.append(
+                f"{scale['socks']:>8} socks {phase:<6} "
+                f"p50 {metrics['ms_p50'] / before['ms_p50'] - 1:+7.1%} "
+                f"p99 {metrics['ms_p99'] / before['ms_p99'] - 1:+7.1%}"
+            )
+    return lines
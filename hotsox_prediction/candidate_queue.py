@@ -0,0 +1,175 @@
+import json
+import time
+
+
+class LocalCache:
+    """minimal in-process cache with a ttl (same interface as the django cache)"""
+
+    def __init__(self):
+        self._data = {}
+
+    def get(self, key, default=None):
+        value, expires = self._data.get(key, (default, None))
+        if expires is not None and expires < time.monotonic():
+            self._data.pop(key, None)
+            return default
+        return value
+
+    def set(self, key, value, timeout=None):
+        expires = None if timeout is None else time.monotonic() + timeout
+        self._data[key] = (value, expires)
+
+    def add(self, key, value, timeout=None) -> bool:
+        if self.get(key) is not None:
+            return False
+        self.set(key, value, timeout)
+        return True
+
+    def incr(self, key, delta=1) -> int:
+        value = self.get(key)
+        if value is None:
+            raise ValueError(f"key {key} not found")
+        value, expires = value + delta, self._data[key][1]
+        self._data[key] = (value, expires)
+        return value
+
+    def delete(self, key):
+        self._data.pop(key, None)
+
+    def clear(self):
+        self._data.clear()
+
+
+class RedisCache:
+    """json based redis cache (same interface as the django cache)"""
+
+    def __init__(self, url: str):
+        import redis
+
+        self._redis = redis.Redis.from_url(url)
+
+    def get(self, key, default=None):
+        value = self._redis.get(key)
+        return default if value is None else json.loads(value)
+
+    def set(self, key, value, timeout=None):
+        self._redis.set(
+            key, json.dumps(value), ex=None if timeout is None else int(timeout)
+        )
+
+    def add(self, key, value, timeout=None) -> bool:
+        return bool(
+            self._redis.set(
+                key,
+                json.dumps(value),
+                ex=None if timeout is None else int(timeout),
+                nx=True,
+            )
+        )
+
+    def incr(self, key, delta=1) -> int:
+        if not self._redis.exists(key):
+            raise ValueError(f"key {key} not found")
+        return self._redis.incrby(key, delta)
+
+    def delete(self, key):
+        self._redis.delete(key)
+
+
+class CandidateQueue:
+    """ranked queue of the next candidate sock ids per (user, sock) pair
+    the queues are stored in a cache with a ttl. An entry of a queue is a dict:
+    - ids/scores: the ranked candidates (best first)
+    - complete: True if the queue holds all remaining candidates
+    - last_picture_id: latest sock picture known when the queue was built,
+      socks with newer pictures are merged in as new arrivals
+    """
+
+    KEY_PREFIX = "candidate_queue"
+
+    def __init__(self, cache, size=50, low_watermark=5, timeout=60 * 15):
+        self.cache = cache
+        self.size = size
+        self.low_watermark = low_watermark
+        self.timeout = timeout
+
+    def key(self, user_id, sock_id) -> str:
+        return f"{self.KEY_PREFIX}:{user_id}:{sock_id}"
+
+    def latest_picture_id(self) -> int:
+        return self.cache.get(f"{self.KEY_PREFIX}:latest_picture", 0)
+
+    def picture_added(self, picture_id: int):
+        """remember the latest sock picture, so queues merge the new arrivals"""
+        if picture_id > self.latest_picture_id():
+            self.cache.set(f"{self.KEY_PREFIX}:latest_picture", picture_id, None)
+
+    def get(self, user_id, sock_id) -> dict | None:
+        return self.cache.get(self.key(user_id, sock_id))
+
+    def set(self, user_id, sock_id, ids, scores, complete, last_picture_id) -> dict:
+        """store a new ranked queue and return the entry"""
+        entry = {
+            "ids": list(ids)[: self.size],
+            "scores": list(scores)[: self.size],
+            "complete": complete and len(ids) <= self.size,
+            "last_picture_id": last_picture_id,
+        }
+        self.cache.set(self.key(user_id, sock_id), entry, self.timeout)
+        return entry
+
+    def merge(self, user_id, sock_id, entry, ids, scores, last_picture_id) -> dict:
+        """merge newly ranked candidates into an existing queue
+        on equal scores the candidates already in the queue come first
+        """
+        ranked = dict(zip(entry["ids"], entry["scores"]))
+        ranked.update(zip(ids, scores))
+        merged = sorted(ranked.items(), key=lambda item: -item[1])
+        return self.set(
+            user_id,
+            sock_id,
+            [sock_id for sock_id, _ in merged],
+            [score for _, score in merged],
+            entry["complete"],
+            last_picture_id,
+        )
+
+    def discard(self, user_id, sock_id, candidate_ids, entry=None) -> dict | None:
+        """remove candidates (e.g. judged or invalid socks) from a queue"""
+        if entry is None:
+            entry = self.get(user_id, sock_id)
+        if entry is None:
+            return None
+        candidate_ids = set(candidate_ids)
+        remaining = [
+            (candidate_id, score)
+            for candidate_id, score in zip(entry["ids"], entry["scores"])
+            if candidate_id not in candidate_ids
+        ]
+        if len(remaining) == len(entry["ids"]):
+            return entry
+        return self.set(
+            user_id,
+            sock_id,
+            [candidate_id for candidate_id, _ in remaining],
+            [score for _, score in remaining],
+            entry["complete"],
+            entry["last_picture_id"],
+        )
+
+    def touch(self, user_id, sock_id, entry: dict):
+        """store an unchanged queue again to restart its ttl"""
+        self.cache.set(self.key(user_id, sock_id), entry, self.timeout)
+
+    def invalidate(self, user_id, sock_id):
+        self.cache.delete(self.key(user_id, sock_id))
+
+    def needs_refill(self, entry: dict | None, count: int = 1) -> bool:
+        """a queue is refilled if it is missing or running low
+        (less than low_watermark or the requested count of candidates)
+        """
+        if entry is None:
+            return True
+        return not entry["complete"] and len(entry["ids"]) < max(
+            self.low_watermark, count
+        )
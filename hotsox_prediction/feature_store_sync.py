@@ -0,0 +1,126 @@
+import logging
+import threading
+import time
+
+logger = logging.getLogger("hotsox_prediction")
+
+
+class FeatureStoreSync:
+    """keep the sock feature stores of all processes up to date
+    every process publishes the ids of the socks it changed (after the commit)
+    to a feed in the shared cache: a version counter and one entry of sock ids
+    per version. The other processes pull the feed at most every interval
+    seconds and reload the changed socks into their store (upsert / remove),
+    so a sock edited by one web worker or the celery worker is scored with its
+    new attributes everywhere. A process which fell behind the feed (expired
+    entries) rebuilds its store in a background thread and keeps serving the
+    former store until the new one is ready.
+    """
+
+    KEY_PREFIX = "feature_store_changes"
+    # a process further behind rebuilds its store instead of reading the entries
+    MAX_ENTRIES = 1000
+
+    def __init__(self, cache, interval: float = 5, timeout: int = 60 * 60 * 24 * 7):
+        self.cache = cache
+        self.interval = interval
+        self.timeout = timeout
+        self.pulled = None
+        self.rebuilding = None
+        self.rebuilt = None
+
+    def key(self, name) -> str:
+        return f"{self.KEY_PREFIX}:{name}"
+
+    def version(self) -> int:
+        """return the version of the feed (number of published changes)"""
+        return self.cache.get(self.key("version"), 0)
+
+    def publish(self, sock_ids):
+        """add the ids of changed socks to the feed"""
+        sock_ids = sorted(set(sock_ids))
+        if not sock_ids:
+            return
+        self.cache.add(self.key("version"), 0, None)
+        version = self.cache.incr(self.key("version"))
+        self.cache.set(self.key(version), sock_ids, self.timeout)
+
+    def changes(self, since: int) -> tuple:
+        """return the version of the feed and the ids of the socks changed after
+        the version since, None instead of the ids if the entries are gone
+        """
+        version = self.version()
+        if version - since > self.MAX_ENTRIES:
+            return version, None
+        sock_ids = set()
+        for number in range(since + 1, version + 1):
+            entry = self.cache.get(self.key(number))
+            if entry is None:
+                if number == version:
+                    # still being published, it is read by the next pull
+                    return number - 1, sorted(sock_ids)
+                return version, None
+            sock_ids.update(entry)
+        return version, sorted(sock_ids)
+
+    @staticmethod
+    def apply(store, sock_ids, socks, picture_sock_ids):
+        """reload the changed socks into the store, deleted socks are removed"""
+        picture_sock_ids = set(picture_sock_ids)
+        missing = set(sock_ids)
+        for sock in socks:
+            missing.discard(sock.id)
+            try:
+                store.upsert(sock, has_picture=sock.id in picture_sock_ids)
+            except (TypeError, ValueError, OverflowError):
+                # attributes can not be encoded, the sock gets loaded on demand
+                store.remove(sock.id)
+        for sock_id in missing:
+            store.remove(sock_id)
+
+    def rebuild(self, build):
+        """build a new store in a background thread (picked up by refresh)"""
+        version = self.version()
+
+        def run():
+            try:
+                store = build()
+                store.sync_version = version
+                self.rebuilt = store
+            except Exception:
+                logger.exception("the sock feature store could not be rebuilt")
+
+        self.rebuilding = threading.Thread(target=run, daemon=True)
+        self.rebuilding.start()
+
+    def refresh(self, store, load, build):
+        """return the store with the changes of the other processes applied
+        load(sock_ids) returns the existing socks of the ids and the ids of the
+        socks with a picture, build() builds a new store from the database
+        """
+        if self.rebuilding is not None and not self.rebuilding.is_alive():
+            # the background rebuild is done (or failed and is started again)
+            self.rebuilding = None
+            if self.rebuilt is not None:
+                store, self.rebuilt = self.rebuilt, None
+        now = time.monotonic()
+        if self.pulled is not None and now - self.pulled < self.interval:
+            return store
+        self.pulled = now
+        if self.rebuilding is not None:
+            return store
+        if store.sync_version is None:
+            # built from the database right now
+            store.sync_version = self.version()
+            return store
+
+        version, sock_ids = self.changes(store.sync_version)
+        if sock_ids is None:
+            logger.warning("the sock feature store fell behind, it is rebuilt")
+            self.rebuild(build)
+            return store
+        if sock_ids:
+            socks, picture_sock_ids = load(sock_ids)
+            self.apply(store, sock_ids, socks, picture_sock_ids)
+        store.sync_version = version
+        return store
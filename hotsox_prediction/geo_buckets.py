@@ -0,0 +1,98 @@
+import math
+
+
+class GeoBuckets:
+    """lat/lon grid of CELL_DEGREES cells for the max distance prefilter
+    every user location is stored with the number of its cell (row major from
+    south west), a b-tree index on that column turns a radius search into a
+    few range scans (one per row of cells, see ranges). The ranges cover a
+    bounding box of the circle, the exact distance is checked afterwards
+    (see haversine_limit).
+    """
+
+    CELL_DEGREES = 0.5
+    ROWS = int(180 / CELL_DEGREES)
+    COLUMNS = int(360 / CELL_DEGREES)
+    EARTH_RADIUS_KM = 6371.0088
+
+    @staticmethod
+    def known(latitude, longitude) -> bool:
+        """(0, 0) is stored if the city of a user could not be geocoded"""
+        return (
+            latitude is not None
+            and longitude is not None
+            and (latitude, longitude) != (0, 0)
+        )
+
+    @classmethod
+    def row(cls, latitude: float) -> int:
+        return min(max(int((latitude + 90) // cls.CELL_DEGREES), 0), cls.ROWS - 1)
+
+    @classmethod
+    def column(cls, longitude: float) -> int:
+        return int(((longitude + 180) % 360) // cls.CELL_DEGREES) % cls.COLUMNS
+
+    @classmethod
+    def bucket(cls, latitude, longitude) -> int | None:
+        """return the cell of a location (None for unknown locations)"""
+        if not cls.known(latitude, longitude):
+            return None
+        return cls.row(latitude) * cls.COLUMNS + cls.column(longitude)
+
+    @classmethod
+    def ranges(cls, latitude, longitude, radius_km: float) -> list | None:
+        """return the (first, last) bucket ranges of all cells within radius_km
+        of a location (None for unknown locations), adjacent ranges are merged
+        """
+        if not cls.known(latitude, longitude):
+            return None
+        angle = radius_km / cls.EARTH_RADIUS_KM
+        south = math.degrees(math.radians(latitude) - angle)
+        north = math.degrees(math.radians(latitude) + angle)
+        # longitude span of the bounding box (whole rows around the poles)
+        spread = math.sin(angle) / math.cos(math.radians(latitude))
+        if south <= -90 or north >= 90 or angle >= math.pi / 2 or spread >= 1:
+            west, east = -180.0, 180.0 - cls.CELL_DEGREES / 2
+        else:
+            delta = math.degrees(math.asin(spread))
+            west, east = longitude - delta, longitude + delta
+
+        if east - west >= 360 - cls.CELL_DEGREES:
+            columns = [(0, cls.COLUMNS - 1)]
+        else:
+            first, last = cls.column(west), cls.column(east)
+            if first <= last:
+                columns = [(first, last)]
+            else:
+                # the box crosses the antimeridian
+                columns = [(0, last), (first, cls.COLUMNS - 1)]
+
+        ranges = []
+        for row in range(cls.row(max(south, -90)), cls.row(min(north, 90)) + 1):
+            for first, last in columns:
+                first, last = row * cls.COLUMNS + first, row * cls.COLUMNS + last
+                if ranges and ranges[-1][1] + 1 >= first:
+                    ranges[-1] = (ranges[-1][0], last)
+                else:
+                    ranges.append((first, last))
+        return ranges
+
+    @classmethod
+    def haversine_limit(cls, radius_km: float) -> float:
+        """return the limit of the haversine term
+        sin²(Δlat / 2) + cos(lat1) * cos(lat2) * sin²(Δlon / 2)
+        of two locations at most radius_km apart (no asin / sqrt in SQL)
+        """
+        angle = min(radius_km / cls.EARTH_RADIUS_KM, math.pi)
+        return math.sin(angle / 2) ** 2
+
+    @classmethod
+    def distance_km(cls, location_a: tuple, location_b: tuple) -> float:
+        """great circle distance of two (latitude, longitude) locations"""
+        lat_a, lon_a = map(math.radians, location_a)
+        lat_b, lon_b = map(math.radians, location_b)
+        term = (
+            math.sin((lat_b - lat_a) / 2) ** 2
+            + math.cos(lat_a) * math.cos(lat_b) * math.sin((lon_b - lon_a) / 2) ** 2
+        )
+        return 2 * cls.EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(term)))
@@ -0,0 +1,140 @@
+import json
+import logging
+import threading
+import time
+import numpy as np
+from collections import deque
+from contextlib import contextmanager
+
+logger = logging.getLogger("hotsox_prediction")
+
+
+class PipelineTrace:
+    """timing spans of one run of the prediction pipeline (one swipe)
+    spans of the same stage are summed up (e.g. the chunks of a streamed
+    pool), every stage keeps its time, its calls and the amount of
+    candidates going in and out
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages = {}
+
+    def add(
+        self,
+        stage: str,
+        seconds: float,
+        candidates_in=None,
+        candidates_out=None,
+        calls: int = 1,
+    ):
+        span = self.stages.setdefault(
+            stage, {"ms": 0.0, "calls": 0, "in": None, "out": None}
+        )
+        span["ms"] += seconds * 1000
+        span["calls"] += calls
+        for key, value in (("in", candidates_in), ("out", candidates_out)):
+            if value is not None:
+                span[key] = (span[key] or 0) + value
+
+    @contextmanager
+    def span(self, stage: str, candidates_in=None):
+        """time the block as stage, the yielded dict takes the amount of
+        candidates going out ({"out": ...}) and optionally going in
+        """
+        counts = {"in": candidates_in, "out": None}
+        start = time.perf_counter()
+        try:
+            yield counts
+        finally:
+            self.add(stage, time.perf_counter() - start, counts["in"], counts["out"])
+
+    def timed(self, stage: str, chunks):
+        """yield the chunks of an iterable (e.g. a streamed query), the time
+        spent producing them is added to stage (out = sum of the chunk sizes)
+        """
+        chunks = iter(chunks)
+        seconds, candidates = 0.0, 0
+        # the stage is listed where the stream starts
+        self.add(stage, 0, calls=0)
+        try:
+            while True:
+                start = time.perf_counter()
+                try:
+                    chunk = next(chunks)
+                except StopIteration:
+                    return
+                finally:
+                    seconds += time.perf_counter() - start
+                candidates += len(chunk)
+                yield chunk
+        finally:
+            self.add(stage, seconds, candidates_out=candidates)
+
+    def as_dict(self) -> dict:
+        return {
+            "ms": round((time.perf_counter() - self.started) * 1000, 3),
+            "stages": {
+                stage: {**span, "ms": round(span["ms"], 3)}
+                for stage, span in self.stages.items()
+            },
+        }
+
+
+class PipelineMetrics:
+    """process wide metrics of the prediction pipeline runs
+    per stage the runs, the total candidates in/out and the latency
+    percentiles of the last WINDOW runs are kept
+    """
+
+    WINDOW = 1000
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.runs = 0
+            self.stages = {}
+
+    def record(self, trace: dict):
+        """add a finished trace (PipelineTrace.as_dict)"""
+        with self.lock:
+            self.runs += 1
+            for stage, span in {"total": trace, **trace["stages"]}.items():
+                metrics = self.stages.setdefault(
+                    stage,
+                    {"runs": 0, "in": 0, "out": 0, "ms": deque(maxlen=self.WINDOW)},
+                )
+                metrics["runs"] += 1
+                metrics["in"] += span.get("in") or 0
+                metrics["out"] += span.get("out") or 0
+                metrics["ms"].append(span["ms"])
+
+    def snapshot(self) -> dict:
+        """return the metrics as json serializable dict"""
+        with self.lock:
+            stages = {}
+            for stage, metrics in self.stages.items():
+                p50, p95, p99 = np.percentile(list(metrics["ms"]), [50, 95, 99])
+                stages[stage] = {
+                    "runs": metrics["runs"],
+                    "candidates_in": metrics["in"],
+                    "candidates_out": metrics["out"],
+                    "ms_p50": round(float(p50), 3),
+                    "ms_p95": round(float(p95), 3),
+                    "ms_p99": round(float(p99), 3),
+                    "ms_max": round(max(metrics["ms"]), 3),
+                }
+            return {"runs": self.runs, "window": self.WINDOW, "stages": stages}
+
+
+def log_trace(event: str, trace: dict, slow_ms: float, **fields):
+    """log a finished trace as one json line on the logger hotsox_prediction
+    (info, warning if the run took longer than slow_ms)
+    """
+    level = logging.WARNING if trace["ms"] > slow_ms else logging.INFO
+    if logger.isEnabledFor(level):
+        record = {"event": event, **fields, **trace}
+        logger.log(level, json.dumps(record), extra={"pipeline": record})
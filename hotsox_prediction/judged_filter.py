@@ -0,0 +1,131 @@
+import base64
+import math
+import numpy as np
+
+
+class JudgedSockFilter:
+    """bloom filter of the socks a sock already liked or disliked (per sock)
+    the filter answers "maybe judged" or "definitely not judged" without a
+    database query: false positives are possible (ERROR_RATE), false
+    negatives are not. Every filter is stored in the cache as a compact bit
+    array (about 1.2 bytes per judged sock), updated on every judgement and
+    rebuilt from the SockLike rows when it is missing or full (with twice the
+    capacity of its judged socks, so it always stays at ERROR_RATE).
+    """
+
+    KEY_PREFIX = "judged_filter"
+    ERROR_RATE = 0.01
+    MIN_CAPACITY = 256
+
+    def __init__(self, cache, timeout=60 * 60 * 24):
+        self.cache = cache
+        self.timeout = timeout
+
+    def key(self, sock_id) -> str:
+        return f"{self.KEY_PREFIX}:{sock_id}"
+
+    @classmethod
+    def layout(cls, capacity: int) -> tuple[int, int]:
+        """return the amount of bits and of hash functions for a capacity"""
+        bits = math.ceil(-capacity * math.log(cls.ERROR_RATE) / math.log(2) ** 2)
+        hashes = max(1, round(bits / capacity * math.log(2)))
+        return bits, hashes
+
+    @staticmethod
+    def _mix(values: np.ndarray) -> np.ndarray:
+        """splitmix64 finalizer, spreads (sequential) ids over all 64 bits"""
+        values = values ^ (values >> np.uint64(30))
+        values = values * np.uint64(0xBF58476D1CE4E5B9)
+        values = values ^ (values >> np.uint64(27))
+        values = values * np.uint64(0x94D049BB133111EB)
+        return values ^ (values >> np.uint64(31))
+
+    @classmethod
+    def positions(cls, sock_ids, capacity: int) -> np.ndarray:
+        """return the bit positions of the sock ids as (ids, hashes) array
+        (double hashing: h1 + i * h2)
+        """
+        bits, hashes = cls.layout(capacity)
+        ids = np.asarray(sock_ids, dtype=np.int64).astype(np.uint64)
+        first = cls._mix(ids)
+        second = cls._mix(ids ^ np.uint64(0x9E3779B97F4A7C15)) | np.uint64(1)
+        steps = np.arange(hashes, dtype=np.uint64)
+        return (first[:, None] + steps[None, :] * second[:, None]) % np.uint64(bits)
+
+    @classmethod
+    def build(cls, judged_sock_ids) -> dict:
+        """build a new filter entry of the given judged sock ids"""
+        judged_sock_ids = list(judged_sock_ids)
+        capacity = max(cls.MIN_CAPACITY, 2 * len(judged_sock_ids))
+        bits = np.zeros(-(-cls.layout(capacity)[0] // 8), dtype=np.uint8)
+        cls._set_bits(bits, cls.positions(judged_sock_ids, capacity))
+        return cls._entry(bits, capacity, len(judged_sock_ids))
+
+    @staticmethod
+    def _entry(bits: np.ndarray, capacity: int, count: int) -> dict:
+        # base64 keeps the entry json serializable (see RedisCache)
+        return {
+            "capacity": capacity,
+            "count": count,
+            "bits": base64.b64encode(bits.tobytes()).decode("ascii"),
+        }
+
+    @staticmethod
+    def _bits(entry: dict) -> np.ndarray:
+        """return the bit array of an entry (8 bits per uint8, big endian)"""
+        return np.frombuffer(base64.b64decode(entry["bits"]), dtype=np.uint8)
+
+    @staticmethod
+    def _set_bits(bits: np.ndarray, positions: np.ndarray):
+        positions = positions.ravel()
+        np.bitwise_or.at(
+            bits,
+            (positions >> np.uint64(3)).astype(np.intp),
+            (np.uint8(128) >> (positions & np.uint64(7)).astype(np.uint8)),
+        )
+
+    def get(self, sock_id, judged_sock_ids) -> dict:
+        """return the filter of a sock, judged_sock_ids() returns all sock ids
+        the sock judged and is only called if the filter has to be rebuilt
+        """
+        entry = self.cache.get(self.key(sock_id))
+        if entry is None:
+            entry = self.build(judged_sock_ids())
+            self.cache.set(self.key(sock_id), entry, self.timeout)
+        return entry
+
+    def add(self, sock_id, judged_sock_id):
+        """add a judged sock to the filter of a sock (see add_many)"""
+        self.add_many(sock_id, [judged_sock_id])
+
+    def add_many(self, sock_id, judged_sock_ids):
+        """add judged socks to the filter of a sock (if the filter exists)
+        a full filter is dropped and rebuilt with a larger capacity on demand
+        """
+        judged_sock_ids = list(judged_sock_ids)
+        entry = self.cache.get(self.key(sock_id))
+        if entry is None or not judged_sock_ids:
+            return
+        if entry["count"] + len(judged_sock_ids) > entry["capacity"]:
+            self.cache.delete(self.key(sock_id))
+            return
+        bits = self._bits(entry).copy()
+        self._set_bits(bits, self.positions(judged_sock_ids, entry["capacity"]))
+        self.cache.set(
+            self.key(sock_id),
+            self._entry(bits, entry["capacity"], entry["count"] + len(judged_sock_ids)),
+            self.timeout,
+        )
+
+    def invalidate(self, sock_id):
+        self.cache.delete(self.key(sock_id))
+
+    @classmethod
+    def contains(cls, entry: dict, sock_ids) -> np.ndarray:
+        """return for every sock id if it maybe was judged (bool array)"""
+        if not len(sock_ids):
+            return np.zeros(0, dtype=bool)
+        positions = cls.positions(sock_ids, entry["capacity"])
+        bytes_ = cls._bits(entry)[(positions >> np.uint64(3)).astype(np.intp)]
+        masks = np.uint8(128) >> (positions & np.uint64(7)).astype(np.uint8)
+        return ((bytes_ & masks) != 0).all(axis=1)
@@ -0,0 +1,160 @@
+import multiprocessing
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from types import SimpleNamespace
+
+from .sock_feature_store import SockFeatureStore
+from .sock_scoring import SockScoringEngine
+
+# arrays of the feature store which are needed for scoring
+SHARED_COLUMNS = ("ids", "codes", "counts", "days", "signatures")
+
+
+def _attach(blocks: dict) -> tuple[dict, list]:
+    """attach to shared memory blocks {name: (block name, shape, dtype)}"""
+    arrays, handles = {}, []
+    for name, (block_name, shape, dtype) in blocks.items():
+        handle = shared_memory.SharedMemory(name=block_name)
+        handles.append(handle)
+        arrays[name] = np.ndarray(shape, dtype=dtype, buffer=handle.buf)
+    return arrays, handles
+
+
+def _score_rows(arrays: dict, start: int, stop: int, current_sock, count: int):
+    store = SockFeatureStore(capacity=0)
+    store.codes, store.counts = arrays["codes"], arrays["counts"]
+    rows = arrays["rows"][start:stop]
+    # the texts are compared by their MinHash signatures only
+    engine = SockScoringEngine.from_arrays(
+        keys=arrays["ids"][rows].tolist(),
+        integers=store.integers(rows),
+        days=arrays["days"][rows],
+        texts=None,
+        signatures=arrays["signatures"][rows],
+    )
+    return engine.top_k(current_sock, count)
+
+
+def score_shard(blocks: dict, start: int, stop: int, current_sock, count: int):
+    """score the rows[start:stop] of a shared feature store snapshot and return
+    the ids & scores of the best count socks (runs in a worker process)
+    """
+    arrays, handles = _attach(blocks)
+    try:
+        return _score_rows(arrays, start, stop, current_sock, count)
+    finally:
+        # the views have to be gone before the blocks can be closed
+        arrays.clear()
+        for handle in handles:
+            handle.close()
+
+
+class ParallelSockScorer:
+    """score very large pools on several cores (e.g. precompute_candidates)
+    a snapshot of the feature store arrays is copied once into shared memory
+    (share), the rows of a pool are sharded across a ProcessPoolExecutor and
+    the per-shard top k results are merged. The snapshot is not updated with
+    the store, socks saved later are scored in the calling process.
+    In daemonic processes (celery prefork workers can not have children) the
+    shards are scored one after another in the calling process.
+    """
+
+    def __init__(self, workers: int, min_shard_size: int = 20000):
+        self.workers = max(1, workers)
+        self.min_shard_size = min_shard_size
+        self.size = 0
+        self.blocks = {}
+        # view of the shared sock ids (snapshot_rows)
+        self.ids = None
+        self._memory = {}
+        self._executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @property
+    def parallel(self) -> bool:
+        return self.workers > 1 and not multiprocessing.current_process().daemon
+
+    def _share_array(self, name: str, array: np.ndarray):
+        memory = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+        shared = np.ndarray(array.shape, dtype=array.dtype, buffer=memory.buf)
+        shared[:] = array
+        self._memory[name] = memory
+        self.blocks[name] = (memory.name, array.shape, array.dtype.str)
+
+    def _release(self, names):
+        if "ids" in names:
+            self.ids = None
+        for name in names:
+            memory = self._memory.pop(name, None)
+            self.blocks.pop(name, None)
+            if memory is not None:
+                memory.close()
+                memory.unlink()
+
+    def share(self, store: SockFeatureStore):
+        """copy a snapshot of the scoring arrays of the store to shared memory"""
+        self._release(list(self._memory))
+        self.size = len(store)
+        for name in SHARED_COLUMNS:
+            self._share_array(
+                name, np.ascontiguousarray(getattr(store, name)[: self.size])
+            )
+        memory = self._memory["ids"]
+        self.ids = np.ndarray((self.size,), dtype=store.ids.dtype, buffer=memory.buf)
+
+    def snapshot_rows(self, store: SockFeatureStore, sock_ids) -> tuple:
+        """return the store rows of the sock ids and if the snapshot holds the
+        sock in the same row (bool array), removed socks move rows in the store
+        """
+        rows = store.rows(sock_ids)
+        shared = rows < self.size
+        shared[shared] = self.ids[rows[shared]] == np.asarray(sock_ids)[shared]
+        return rows, shared
+
+    def top_k(self, rows: np.ndarray, current_sock, count: int) -> list:
+        """score the given rows of the snapshot (all below size) and return the
+        per-shard results [(ids, scores), ...] in the order of the rows
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        if not len(rows) or count <= 0:
+            return []
+        # only the scoring attributes are sent to the workers (no ORM instance)
+        current_sock = SimpleNamespace(
+            **{
+                attribute: getattr(current_sock, attribute)
+                for attribute in SockScoringEngine.INTEGER_ATTRIBUTES
+                + SockScoringEngine.DATE_ATTRIBUTES
+                + SockScoringEngine.TEXT_ATTRIBUTES
+            }
+        )
+        self._release(["rows"])
+        self._share_array("rows", rows)
+
+        shards = min(self.workers, max(1, len(rows) // self.min_shard_size))
+        bounds = np.linspace(0, len(rows), shards + 1).astype(int)
+        arguments = [
+            (self.blocks, start, stop, current_sock, count)
+            for start, stop in zip(bounds[:-1], bounds[1:])
+        ]
+        try:
+            if shards == 1 or not self.parallel:
+                return [score_shard(*argument) for argument in arguments]
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            return list(self._executor.map(score_shard, *zip(*arguments)))
+        finally:
+            self._release(["rows"])
+
+    def close(self):
+        """stop the worker processes and free the shared memory"""
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+        self._release(list(self._memory))
+        self.size = 0
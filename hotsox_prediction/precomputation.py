@@ -0,0 +1,99 @@
+import time
+
+from .ranking import SockRanker
+
+
+class CandidatePrecomputation:
+    """precompute the candidate queues of recently active socks (celery job)
+    the active socks are walked in chunks of ascending sock ids, the queue of
+    every sock is refreshed (ranked again or merged with the new arrivals) so
+    the next swipe is served from the queue. The progress of a running rebuild
+    is kept in the cache after every chunk: an interrupted rebuild continues
+    after the last finished chunk. A finished rebuild stores its metrics
+    (see last_run).
+    """
+
+    KEY_PREFIX = "candidate_precomputation"
+
+    def __init__(self, ranker: SockRanker, chunk_size: int = 200):
+        self.ranker = ranker
+        self.cache = ranker.candidate_queue.cache
+        self.chunk_size = chunk_size
+
+    def key(self, name: str) -> str:
+        return f"{self.KEY_PREFIX}:{name}"
+
+    def progress(self) -> dict | None:
+        """return the progress of an unfinished rebuild"""
+        return self.cache.get(self.key("progress"))
+
+    def last_run(self) -> dict | None:
+        """return the metrics of the last finished rebuild"""
+        return self.cache.get(self.key("last_run"))
+
+    def run_chunk(self, active_sources, restart: bool = False) -> dict:
+        """refresh the queues of the next chunk of active socks
+        active_sources(after_id, limit) returns the SockSources of the next
+        (up to limit) active socks with an id above after_id in ascending order.
+        Returns the progress of the rebuild, its "done" flag is set on the
+        last chunk (the metrics are stored as last_run then)
+        """
+        progress = None if restart else self.progress()
+        if progress is None:
+            progress = {
+                "cursor": 0,
+                "socks": 0,
+                "chunks": 0,
+                "seconds": 0.0,
+                "pool": 0,
+                "started": time.time(),
+                "done": False,
+            }
+
+        start = time.perf_counter()
+        queue = self.ranker.candidate_queue
+        sources = list(active_sources(progress["cursor"], self.chunk_size))
+        for source in sources:
+            entry = queue.get(source.user.id, source.sock.id)
+            refreshed = self.ranker.refresh_candidate_queue(source, entry)
+            if refreshed is entry:
+                # nothing new, keep the queue until the next run
+                queue.touch(source.user.id, source.sock.id, entry)
+        if sources:
+            progress["cursor"] = sources[-1].sock.id
+            progress["pool"] = len(sources[-1].feature_store())
+        progress["socks"] += len(sources)
+        progress["chunks"] += 1
+        progress["seconds"] += time.perf_counter() - start
+        progress["done"] = len(sources) < self.chunk_size
+
+        if progress["done"]:
+            progress["finished"] = time.time()
+            self.cache.delete(self.key("progress"))
+            self.cache.set(self.key("last_run"), self.metrics(progress), None)
+        else:
+            self.cache.set(self.key("progress"), progress, None)
+        return progress
+
+    def run(self, active_sources, restart: bool = False) -> dict:
+        """refresh the queues of all active socks (chunk by chunk), continue an
+        unfinished rebuild unless restart is set and return the metrics
+        """
+        progress = self.run_chunk(active_sources, restart)
+        while not progress["done"]:
+            progress = self.run_chunk(active_sources)
+        return self.metrics(progress)
+
+    @staticmethod
+    def metrics(progress: dict) -> dict:
+        """return the metrics of a finished rebuild"""
+        return {
+            "socks": progress["socks"],
+            "chunks": progress["chunks"],
+            "pool": progress["pool"],
+            "seconds": round(progress["seconds"], 3),
+            "wall_seconds": round(progress["finished"] - progress["started"], 3),
+            "ms_per_sock": round(
+                progress["seconds"] * 1000 / max(progress["socks"], 1), 3
+            ),
+        }
@@ -0,0 +1,370 @@
+import heapq
+import multiprocessing
+import numpy as np
+from contextlib import contextmanager
+
+from .candidate_queue import CandidateQueue
+from .instrumentation import PipelineMetrics, PipelineTrace, log_trace
+from .judged_filter import JudgedSockFilter
+from .parallel_scoring import ParallelSockScorer
+from .sock_ann_index import SockANNIndex
+from .sock_feature_store import SockFeatureStore
+from .sock_scoring import SockScoringEngine
+
+
+class SockSource:
+    """database adapter of the SockRanker for one swiping user & sock
+    every app implements it with its own ORM, the ranker itself only works
+    with sock ids, the feature store and the candidate queue
+    """
+
+    def __init__(self, user, sock):
+        self.user = user
+        self.sock = sock
+        # timing spans of the pipeline stages run for this source
+        self.trace = PipelineTrace()
+
+    def feature_store(self) -> SockFeatureStore:
+        """return the process wide feature store of all socks"""
+        raise NotImplementedError
+
+    def unseen_sock_ids(self, sock_ids) -> list:
+        """return the prefiltered (unseen) socks among the given sock ids
+        (ids in ascending order)
+        """
+        raise NotImplementedError
+
+    def unseen_sock_id_chunks(self, chunk_size: int, picture_after=None):
+        """yield the ids of the prefiltered (unseen) socks in ascending order
+        as lists of up to chunk_size ids, streamed from a server-side cursor
+        optionally restricted to socks with a picture newer than the picture
+        id picture_after
+        """
+        raise NotImplementedError
+
+    def judged_sock_ids(self) -> list:
+        """return the ids of all socks the sock liked or disliked"""
+        raise NotImplementedError
+
+    def load_socks(self, sock_ids):
+        """return the socks (records) of the given ids"""
+        raise NotImplementedError
+
+    def available_socks(self, sock_ids) -> dict:
+        """return the unseen socks (with their pictures) among the ids by id"""
+        raise NotImplementedError
+
+
+class BoundedTopK:
+    """bounded min-heap of the best count (key, score) pairs of a stream
+    on equal scores the key pushed first wins (like SockScoringEngine.top_k)
+    """
+
+    def __init__(self, count: int):
+        self.count = count
+        self.heap = []
+        self.pushed = 0
+
+    def __len__(self) -> int:
+        return len(self.heap)
+
+    def push_many(self, keys, scores):
+        for key, score in zip(keys, scores):
+            item = (score, -self.pushed, key)
+            self.pushed += 1
+            if len(self.heap) < self.count:
+                heapq.heappush(self.heap, item)
+            elif self.count > 0 and item > self.heap[0]:
+                heapq.heapreplace(self.heap, item)
+
+    def result(self) -> tuple[list, list]:
+        """return the keys and scores (best first)"""
+        best = sorted(self.heap, reverse=True)
+        return [key for _, _, key in best], [score for score, _, _ in best]
+
+
+class SockRanker:
+    """framework neutral ranking core of the pre-prediction algorithm
+    the unseen socks of a SockSource are scored from the feature store, the
+    best ones are kept in a CandidateQueue and served from there. The judged
+    socks of every sock are tracked in a JudgedSockFilter (same cache).
+    """
+
+    def __init__(
+        self,
+        candidate_queue: CandidateQueue,
+        ann_min_socks: int = 20000,
+        ann_candidates: int = 300,
+        chunk_size: int = 2000,
+        slow_ms: float = 500,
+    ):
+        self.candidate_queue = candidate_queue
+        self.judged_filter = JudgedSockFilter(candidate_queue.cache)
+        # stores of at least ann_min_socks socks retrieve the candidates from
+        # a nearest neighbour index (see nearest_sock_ids)
+        self.ann_min_socks = ann_min_socks
+        self.ann_candidates = ann_candidates
+        # the unseen pool is streamed & scored in chunks of chunk_size socks
+        self.chunk_size = chunk_size
+        # scores the whole pool on several processes while set (see parallel)
+        self.parallel_scorer = None
+        # stage metrics of all next_socks runs, runs slower than slow_ms are
+        # logged as warning (see log_trace)
+        self.metrics = PipelineMetrics()
+        self.slow_ms = slow_ms
+
+    @staticmethod
+    def compare_socks(current_sock, challenger_sock) -> float:
+        """calculate a similarity score between two socks"""
+        return SockScoringEngine([challenger_sock]).score(current_sock)[0]
+
+    def nearest_sock_ids(self, store: SockFeatureStore, current_sock):
+        """return the ids of the ann_candidates nearest socks of the store
+        (by the integer attributes, see SockANNIndex) or None for small stores
+        the index is attached to the store once it holds ann_min_socks socks,
+        socks which are not part of the store yet are not found
+        """
+        if len(store) < self.ann_min_socks:
+            return None
+        if store.ann_index is None:
+            store.attach_ann_index(SockANNIndex())
+        return store.ann_index.query(
+            SockScoringEngine.encode_integers(current_sock), self.ann_candidates
+        )
+
+    @contextmanager
+    def parallel(self, store: SockFeatureStore, workers: int):
+        """score whole pools on workers processes within the block (offline
+        jobs, e.g. precompute_candidates) with a ParallelSockScorer on a
+        snapshot of the store. Without workers (or in a daemonic process like
+        a celery prefork worker, which can not start children) nothing changes
+        """
+        if workers <= 1 or multiprocessing.current_process().daemon:
+            yield None
+            return
+        with ParallelSockScorer(workers) as scorer:
+            scorer.share(store)
+            self.parallel_scorer = scorer
+            try:
+                yield scorer
+            finally:
+                self.parallel_scorer = None
+
+    def maybe_judged(self, source: SockSource, sock_ids):
+        """return for every sock id if the sock of the source maybe judged it
+        (bool array, see JudgedSockFilter), False is always correct
+        """
+        entry = self.judged_filter.get(source.sock.id, source.judged_sock_ids)
+        return self.judged_filter.contains(entry, sock_ids)
+
+    def rank_candidates(
+        self, source: SockSource, count: int, picture_after=None
+    ) -> tuple[list, list]:
+        """rank the unseen socks (or the ones with a picture newer than
+        picture_after) and return the ids and scores of the best count socks
+        large pools are narrowed down to the nearest neighbours of the current
+        sock first (see nearest_sock_ids), if enough of them are unseen. The
+        judged neighbours are dropped by the judged filter before the prefilter
+        query, a neighbour is only skipped by mistake at the error rate of the
+        filter (it is still part of the whole pool). The whole pool is streamed
+        in chunks, so the memory of a ranking does not depend on its size
+        """
+        trace = source.trace
+        store = source.feature_store()
+        unseen_sock_ids = nearest_sock_ids = None
+        if picture_after is None and len(store) >= self.ann_min_socks:
+            with trace.span("ann", len(store)) as span:
+                nearest_sock_ids = self.nearest_sock_ids(store, source.sock)
+                maybe_judged = self.maybe_judged(source, nearest_sock_ids)
+                nearest_sock_ids = [
+                    sock_id
+                    for sock_id, judged in zip(nearest_sock_ids, maybe_judged)
+                    if not judged
+                ]
+                span["out"] = len(nearest_sock_ids)
+            if nearest_sock_ids is not None and len(nearest_sock_ids) >= count:
+                with trace.span("prefilter", len(nearest_sock_ids)) as span:
+                    unseen_sock_ids = source.unseen_sock_ids(nearest_sock_ids)
+                    span["out"] = len(unseen_sock_ids)
+                if len(unseen_sock_ids) < count:
+                    # most neighbours were already seen, rank the whole pool
+                    unseen_sock_ids = None
+
+        if unseen_sock_ids is not None:
+            chunks = [unseen_sock_ids]
+        else:
+            # the time of the streamed prefilter query is spent between chunks
+            chunks = trace.timed(
+                "prefilter",
+                source.unseen_sock_id_chunks(
+                    self.chunk_size, picture_after=picture_after
+                ),
+            )
+
+        # score the pool chunk by chunk, only the best count socks are kept
+        # (memory does not grow with the size of the pool)
+        best = BoundedTopK(count)
+        scorer = self.parallel_scorer if unseen_sock_ids is None else None
+        shared_rows = []
+        for chunk in chunks:
+            # socks saved by another process are loaded into the store on demand
+            missing_sock_ids = store.missing(chunk)
+            if missing_sock_ids:
+                with trace.span("load", len(missing_sock_ids)) as span:
+                    socks = list(source.load_socks(missing_sock_ids))
+                    for sock in socks:
+                        store.upsert(sock, has_picture=True)
+                    span["out"] = len(socks)
+            with trace.span("score", len(chunk)):
+                if scorer is not None:
+                    # socks of the snapshot are scored by the workers (at the end)
+                    rows, shared = scorer.snapshot_rows(store, chunk)
+                    shared_rows.append(rows[shared])
+                    chunk = [sock_id for sock_id, row in zip(chunk, shared) if not row]
+                best.push_many(*store.engine(chunk).top_k(source.sock, count))
+        if shared_rows:
+            with trace.span("score"):
+                rows = np.concatenate(shared_rows)
+                for ids, scores in scorer.top_k(rows, source.sock, count):
+                    best.push_many(ids, scores)
+        trace.add("score", 0, candidates_out=len(best), calls=0)
+        return best.result()
+
+    def refresh_candidate_queue(
+        self, source: SockSource, entry: dict | None, count: int = 1
+    ) -> dict:
+        """return the up to date candidate queue of a swiping sock
+        socks which got a picture since the queue was built are merged in,
+        a missing (or expired) queue or one running low is ranked again
+        """
+        queue = self.candidate_queue
+        latest_picture_id = queue.latest_picture_id()
+
+        if queue.needs_refill(entry, count):
+            ids, scores = self.rank_candidates(source, queue.size + 1)
+            return queue.set(
+                source.user.id,
+                source.sock.id,
+                ids,
+                scores,
+                len(ids) <= queue.size,
+                latest_picture_id,
+            )
+
+        if latest_picture_id > entry["last_picture_id"]:
+            ids, scores = self.rank_candidates(
+                source, queue.size, picture_after=entry["last_picture_id"]
+            )
+            entry = queue.merge(
+                source.user.id,
+                source.sock.id,
+                entry,
+                ids,
+                scores,
+                latest_picture_id,
+            )
+        return entry
+
+    def next_socks(self, source: SockSource, count: int) -> list:
+        """return the next (up to count) best matching unseen socks of a source
+        the socks are served from the ranked candidate queue, so the pool of
+        unseen socks is only prefiltered and scored (once) if the queue runs low.
+        The head of the queue is checked against the prefilter again, socks
+        that were judged, deleted or became unavailable meanwhile are dropped.
+        The stages of the run are traced (source.trace), recorded in metrics
+        and logged (see log_trace)
+        """
+        socks = self._next_socks(source, count)
+        trace = source.trace.as_dict()
+        self.metrics.record(trace)
+        log_trace(
+            "next_socks",
+            trace,
+            self.slow_ms,
+            user=source.user.id,
+            sock=source.sock.id,
+            count=count,
+            socks=len(socks),
+        )
+        return socks
+
+    def _next_socks(self, source: SockSource, count: int) -> list:
+        queue = self.candidate_queue
+        count = min(count, queue.size)
+        with source.trace.span("queue") as span:
+            entry = queue.get(source.user.id, source.sock.id)
+            span["out"] = len(entry["ids"]) if entry else 0
+
+        while True:
+            refill = queue.needs_refill(entry, count)
+            entry = self.refresh_candidate_queue(source, entry, count)
+            window = entry["ids"][: max(count, queue.low_watermark)]
+            if not window:
+                # no reaming socks!
+                return []
+
+            with source.trace.span("available", len(window)) as span:
+                available = source.available_socks(window)
+                span["out"] = len(available)
+            unavailable = [sock_id for sock_id in window if sock_id not in available]
+            if unavailable:
+                entry = queue.discard(
+                    source.user.id, source.sock.id, unavailable, entry
+                )
+            socks = [available[sock_id] for sock_id in window if sock_id in available]
+
+            # go on with the rest of the queue if socks were unavailable
+            # (a freshly ranked queue is available, so it ends here)
+            if len(socks) >= count or not unavailable or refill:
+                return socks[:count]
+
+    def explain(self, source: SockSource, socks) -> list:
+        """return the score breakdown of the given socks against the sock of
+        the source (debug explain mode): the value of both socks, the ratio,
+        weight and points of every attribute and the pipeline trace
+        """
+        contributions = SockScoringEngine(socks).contributions(source.sock)
+        # summed up like SockScoringEngine.score
+        scores = np.full(len(socks), -1.0)
+        for points in contributions.values():
+            scores += points
+        trace = source.trace.as_dict()
+        explanations = []
+        for index, sock in enumerate(socks):
+            attributes = {}
+            for attribute, weight in SockScoringEngine.WEIGHTS.items():
+                points = float(contributions[attribute][index])
+                attributes[attribute] = {
+                    "current": self._explain_value(getattr(source.sock, attribute)),
+                    "candidate": self._explain_value(getattr(sock, attribute)),
+                    "ratio": round(points / weight, 4),
+                    "weight": weight,
+                    "points": round(points, 4),
+                }
+            explanations.append(
+                {
+                    "sock_id": sock.id,
+                    "score": round(float(scores[index]), 4),
+                    "attributes": attributes,
+                    "pipeline": trace,
+                }
+            )
+        return explanations
+
+    @staticmethod
+    def _explain_value(value):
+        if hasattr(value, "isoformat"):
+            return value.isoformat()
+        return value
+
+    def sock_judged(self, user_id, sock_id, judged_sock_id):
+        """remove a liked or disliked sock from the candidate queue of a sock
+        and add it to the judged filter of the sock
+        """
+        self.socks_judged(user_id, sock_id, [judged_sock_id])
+
+    def socks_judged(self, user_id, sock_id, judged_sock_ids):
+        """sock_judged for several socks (one update of the queue & filter)"""
+        judged_sock_ids = list(judged_sock_ids)
+        self.candidate_queue.discard(user_id, sock_id, judged_sock_ids)
+        self.judged_filter.add_many(sock_id, judged_sock_ids)
@@ -0,0 +1,203 @@
+import heapq
+import itertools
+import numpy as np
+
+from .sock_scoring import SockScoringEngine
+
+
+class _Node:
+    """node of the SockANNIndex tree (a leaf if split_dimension is None)"""
+
+    __slots__ = (
+        "lower",
+        "upper",
+        "split_dimension",
+        "split_value",
+        "left",
+        "right",
+        "ids",
+        "vectors",
+        "_matrix",
+    )
+
+    def __init__(self, lower, upper):
+        self.lower = lower
+        self.upper = upper
+        self.split_dimension = None
+        self.split_value = None
+        self.left = None
+        self.right = None
+        self.ids = []
+        self.vectors = []
+        self._matrix = None
+
+    def matrix(self) -> np.ndarray:
+        """the vectors of a leaf as one array (cached until the leaf changes)"""
+        if self._matrix is None:
+            self._matrix = np.array(self.vectors).reshape(
+                len(self.vectors), len(self.lower)
+            )
+        return self._matrix
+
+
+class SockANNIndex:
+    """nearest neighbour index of socks for the candidate retrieval of the swiping
+    the integer attributes dominate the score and their part of the score is
+    sum(weights) - a weighted L1 distance, so socks are stored as weighted
+    attribute vectors in a kd-tree with bounding boxes. A query searches the
+    tree best first and returns the `count` closest socks, which are re-ranked
+    exactly (dates & texts included) by the scoring engine.
+    Socks are inserted/removed incrementally, leaves are split when they grow
+    and bounding boxes only grow, so they stay valid bounds after removals.
+    With approximation > 0 nodes are pruned earlier (distance / (1 + approximation)).
+    """
+
+    # score points per unit of every integer attribute (scoring order)
+    SCALE = np.array(
+        [
+            SockScoringEngine.WEIGHTS[attribute] / SockScoringEngine.MAXIMA[attribute]
+            for attribute in SockScoringEngine.INTEGER_ATTRIBUTES
+        ]
+    )
+
+    def __init__(self, leaf_size: int = 512, approximation: float = 1.0):
+        self.leaf_size = leaf_size
+        self.approximation = approximation
+        self.root = None
+        self.leaf_of = {}
+
+    def __len__(self) -> int:
+        return len(self.leaf_of)
+
+    def __contains__(self, sock_id) -> bool:
+        return sock_id in self.leaf_of
+
+    @classmethod
+    def vectors(cls, integers) -> np.ndarray:
+        """return the weighted vectors of integer attributes in scoring order"""
+        return np.asarray(integers, dtype=float).reshape(-1, len(cls.SCALE)) * cls.SCALE
+
+    def _build(self, ids: list, vectors: np.ndarray) -> _Node:
+        """build a (sub)tree by splitting at the median of the widest dimension"""
+        node = _Node(vectors.min(axis=0), vectors.max(axis=0))
+        spread = node.upper - node.lower
+        if len(ids) <= self.leaf_size or not spread.any():
+            node.ids = list(ids)
+            node.vectors = list(vectors)
+            for sock_id in ids:
+                self.leaf_of[sock_id] = node
+            return node
+
+        dimension = int(np.argmax(spread))
+        order = np.argsort(vectors[:, dimension], kind="stable")
+        middle = len(order) // 2
+        node.split_dimension = dimension
+        node.split_value = vectors[order[middle - 1], dimension]
+        left = vectors[:, dimension] <= node.split_value
+        if left.all():
+            # many equal values, split below them
+            left = vectors[:, dimension] < node.split_value
+            node.split_value = vectors[left, dimension].max()
+        ids = np.asarray(ids, dtype=object)
+        node.left = self._build(list(ids[left]), vectors[left])
+        node.right = self._build(list(ids[~left]), vectors[~left])
+        return node
+
+    def insert_many(self, sock_ids, integers):
+        """insert (or move) socks with their integer attributes in scoring order"""
+        sock_ids = list(sock_ids)
+        vectors = self.vectors(integers)
+        if self.root is None and len(set(sock_ids)) == len(sock_ids) and sock_ids:
+            self.root = self._build(sock_ids, vectors)
+            return
+        for sock_id, vector in zip(sock_ids, vectors):
+            self._insert(sock_id, vector)
+
+    def insert(self, sock_id, integers):
+        self.insert_many([sock_id], integers)
+
+    def _insert(self, sock_id, vector: np.ndarray):
+        self.remove(sock_id)
+        if self.root is None:
+            self.root = self._build([sock_id], vector[None])
+            return
+
+        node = self.root
+        while True:
+            np.minimum(node.lower, vector, out=node.lower)
+            np.maximum(node.upper, vector, out=node.upper)
+            if node.split_dimension is None:
+                break
+            if vector[node.split_dimension] <= node.split_value:
+                node = node.left
+            else:
+                node = node.right
+
+        node.ids.append(sock_id)
+        node.vectors.append(vector)
+        node._matrix = None
+        self.leaf_of[sock_id] = node
+        if len(node.ids) > 2 * self.leaf_size:
+            # turn the grown leaf into a subtree
+            subtree = self._build(node.ids, node.matrix())
+            for slot in _Node.__slots__:
+                setattr(node, slot, getattr(subtree, slot))
+            self._relink(node)
+
+    def _relink(self, node: _Node):
+        """point the ids of all leaves below a node to their leaf"""
+        if node.split_dimension is None:
+            for sock_id in node.ids:
+                self.leaf_of[sock_id] = node
+        else:
+            self._relink(node.left)
+            self._relink(node.right)
+
+    def remove(self, sock_id):
+        leaf = self.leaf_of.pop(sock_id, None)
+        if leaf is None:
+            return
+        position = leaf.ids.index(sock_id)
+        del leaf.ids[position]
+        del leaf.vectors[position]
+        leaf._matrix = None
+
+    def _lower_bound(self, node: _Node, vector: np.ndarray) -> float:
+        """minimal distance of a vector to the bounding box of a node"""
+        return float(
+            np.maximum(np.maximum(node.lower - vector, vector - node.upper), 0).sum()
+        )
+
+    def query(self, integers, count: int) -> list:
+        """return the ids of the (up to) count socks closest to the integer attributes"""
+        if self.root is None or count <= 0:
+            return []
+        vector = self.vectors(integers)[0]
+        shrink = 1 + self.approximation
+        distances = np.empty(0)
+        ids = np.empty(0, dtype=object)
+        tie = itertools.count()
+        nodes = [(self._lower_bound(self.root, vector), next(tie), self.root)]
+        while nodes:
+            bound, _, node = heapq.heappop(nodes)
+            if len(ids) == count and bound * shrink >= distances.max():
+                break
+            if node.split_dimension is None:
+                if not node.ids:
+                    continue
+                # merge the leaf into the best count results so far
+                distances = np.concatenate(
+                    [distances, np.abs(node.matrix() - vector).sum(axis=1)]
+                )
+                leaf_ids = np.empty(len(node.ids), dtype=object)
+                leaf_ids[:] = node.ids
+                ids = np.concatenate([ids, leaf_ids])
+                if len(ids) > count:
+                    best = np.argpartition(distances, count - 1)[:count]
+                    distances, ids = distances[best], ids[best]
+            else:
+                for child in (node.left, node.right):
+                    heapq.heappush(
+                        nodes, (self._lower_bound(child, vector), next(tie), child)
+                    )
+        return ids[np.argsort(distances, kind="stable")].tolist()
@@ -0,0 +1,243 @@
+import json
+import os
+import numpy as np
+
+from .sock_scoring import SockScoringEngine
+from .text_similarity import MinHashTextSimilarity
+
+
+class SockFeatureStore:
+    """compact, array-backed feature table of socks keyed by the sock id
+    every row holds the encoded attributes of one sock:
+    - codes: choice attributes as int8
+    - counts: small integer attributes as int16
+    - days: joining & separation date as day offsets (int32)
+    - fingerprints: 64bit fingerprints of the text attributes
+    - signatures: MinHash signatures of the text attributes (uint32)
+    The table is built once, updated incrementally (upsert/remove) and can be
+    saved to a directory of .npy files which are memory-mapped when loaded.
+    An attached nearest neighbour index (see attach_ann_index) is kept up to date.
+    """
+
+    CODE_ATTRIBUTES = (
+        "info_color",
+        "info_size",
+        "info_type",
+        "info_fabric",
+        "info_condition",
+        "info_fabric_thickness",
+        "info_inoutdoor",
+        "info_brand",
+    )
+    COUNT_ATTRIBUTES = (
+        "info_holes",
+        "info_age",
+        "info_kilometers",
+        "info_washed",
+    )
+    # name, dtype and amount of columns of each array of the table
+    COLUMNS = {
+        "ids": (np.int64, None),
+        "user_ids": (np.int64, None),
+        "codes": (np.int8, len(CODE_ATTRIBUTES)),
+        "counts": (np.int16, len(COUNT_ATTRIBUTES)),
+        "days": (np.int32, len(SockScoringEngine.DATE_ATTRIBUTES)),
+        "fingerprints": (np.uint64, len(SockScoringEngine.TEXT_ATTRIBUTES)),
+        "signatures": (
+            np.uint32,
+            (
+                len(SockScoringEngine.TEXT_ATTRIBUTES),
+                MinHashTextSimilarity.NUM_PERMUTATIONS,
+            ),
+        ),
+        "has_picture": (np.bool_, None),
+    }
+    TEXTS_FILE = "texts.json"
+    META_FILE = "meta.json"
+
+    def __init__(self, capacity: int = 1024):
+        self.size = 0
+        self.index = {}
+        self.ann_index = None
+        self.texts = []
+        # version of the change feed the store is up to date with (FeatureStoreSync)
+        self.sync_version = None
+        for name, (dtype, width) in self.COLUMNS.items():
+            if width is None:
+                shape = (capacity,)
+            elif isinstance(width, tuple):
+                shape = (capacity,) + width
+            else:
+                shape = (capacity, width)
+            setattr(self, name, np.zeros(shape, dtype=dtype))
+
+    def __len__(self) -> int:
+        return self.size
+
+    def __contains__(self, sock_id) -> bool:
+        return sock_id in self.index
+
+    @classmethod
+    def build(cls, socks, picture_sock_ids=()) -> "SockFeatureStore":
+        """build a new store from an iterable of socks
+        socks with attributes that can not be encoded are skipped
+        """
+        store = cls()
+        picture_sock_ids = set(picture_sock_ids)
+        for sock in socks:
+            try:
+                store.upsert(sock, has_picture=sock.id in picture_sock_ids)
+            except (TypeError, ValueError, OverflowError):
+                store.remove(sock.id)
+        return store
+
+    def _grow(self, capacity: int):
+        """resize all arrays (this also detaches them from a memory-mapped file)"""
+        for name in self.COLUMNS:
+            old = getattr(self, name)
+            new = np.zeros((capacity,) + old.shape[1:], dtype=old.dtype)
+            new[: self.size] = old[: self.size]
+            setattr(self, name, new)
+
+    def upsert(self, sock, has_picture: bool | None = None) -> int:
+        """insert or update the row of a sock and return the row number
+        has_picture is only changed if it is explicitly given
+        """
+        row = self.index.get(sock.id)
+        if row is None:
+            if self.size == len(self.ids):
+                self._grow(max(2 * len(self.ids), 1024))
+            row = self.size
+            self.size += 1
+            self.index[sock.id] = row
+            self.texts.append(None)
+            self.has_picture[row] = False
+
+        self.ids[row] = sock.id
+        self.user_ids[row] = sock.user_id
+        self.codes[row] = [int(getattr(sock, name)) for name in self.CODE_ATTRIBUTES]
+        self.counts[row] = [int(getattr(sock, name)) for name in self.COUNT_ATTRIBUTES]
+        self.days[row] = SockScoringEngine.encode_days(sock)
+        texts = [getattr(sock, name) for name in SockScoringEngine.TEXT_ATTRIBUTES]
+        self.fingerprints[row] = [SockScoringEngine.fingerprint(text) for text in texts]
+        self.signatures[row] = MinHashTextSimilarity.signatures(texts)
+        self.texts[row] = texts
+        if has_picture is not None:
+            self.has_picture[row] = has_picture
+        if self.ann_index is not None:
+            self.ann_index.insert(sock.id, self.integers(np.array([row])))
+        return row
+
+    def attach_ann_index(self, ann_index):
+        """fill a nearest neighbour index (SockANNIndex) with all socks of the store
+        and keep it up to date with every upsert/remove
+        """
+        ann_index.insert_many(
+            self.ids[: self.size].tolist(), self.integers(np.arange(self.size))
+        )
+        self.ann_index = ann_index
+
+    def set_has_picture(self, sock_id, has_picture: bool):
+        """update the picture flag of a sock (if it is part of the store)"""
+        row = self.index.get(sock_id)
+        if row is not None:
+            self.has_picture[row] = has_picture
+
+    def remove(self, sock_id):
+        """remove a sock by moving the last row into its place"""
+        row = self.index.pop(sock_id, None)
+        if row is None:
+            return
+        if self.ann_index is not None:
+            self.ann_index.remove(sock_id)
+        last = self.size - 1
+        if row != last:
+            for name in self.COLUMNS:
+                array = getattr(self, name)
+                array[row] = array[last]
+            self.texts[row] = self.texts[last]
+            self.index[int(self.ids[row])] = row
+        self.texts.pop()
+        self.size = last
+
+    def missing(self, sock_ids) -> list:
+        """return all sock ids which are not part of the store"""
+        return [sock_id for sock_id in sock_ids if sock_id not in self.index]
+
+    def rows(self, sock_ids) -> np.ndarray:
+        """return the row numbers of the given sock ids"""
+        return np.fromiter(
+            (self.index[sock_id] for sock_id in sock_ids), dtype=np.int64
+        )
+
+    def integers(self, rows: np.ndarray) -> np.ndarray:
+        """return the integer attributes of the given rows in scoring order"""
+        integers = np.empty(
+            (len(rows), len(SockScoringEngine.INTEGER_ATTRIBUTES)), dtype=np.int64
+        )
+        for column, attribute in enumerate(SockScoringEngine.INTEGER_ATTRIBUTES):
+            if attribute in self.CODE_ATTRIBUTES:
+                source = self.codes[rows, self.CODE_ATTRIBUTES.index(attribute)]
+            else:
+                source = self.counts[rows, self.COUNT_ATTRIBUTES.index(attribute)]
+            integers[:, column] = source
+        return integers
+
+    def engine(self, sock_ids, exact_texts: bool = False) -> SockScoringEngine:
+        """return a scoring engine for the given sock ids (keys are the sock ids)"""
+        sock_ids = list(sock_ids)
+        rows = self.rows(sock_ids)
+        texts = {
+            attribute: [self.texts[row][column] for row in rows]
+            for column, attribute in enumerate(SockScoringEngine.TEXT_ATTRIBUTES)
+        }
+        return SockScoringEngine.from_arrays(
+            keys=sock_ids,
+            integers=self.integers(rows),
+            days=self.days[rows],
+            texts=texts,
+            fingerprints=self.fingerprints[rows],
+            signatures=self.signatures[rows],
+            exact_texts=exact_texts,
+        )
+
+    def save(self, directory: str):
+        """save the store as .npy files (one per array) and a json file for texts"""
+        os.makedirs(directory, exist_ok=True)
+        for name in self.COLUMNS:
+            np.save(
+                os.path.join(directory, f"{name}.npy"), getattr(self, name)[: self.size]
+            )
+        with open(os.path.join(directory, self.TEXTS_FILE), "w") as texts_file:
+            json.dump(self.texts, texts_file)
+        with open(os.path.join(directory, self.META_FILE), "w") as meta_file:
+            json.dump({"sync_version": self.sync_version}, meta_file)
+
+    @classmethod
+    def load(cls, directory: str, mmap_mode: str | None = "c") -> "SockFeatureStore":
+        """load a saved store, by default the arrays are memory-mapped copy-on-write,
+        so workers share the pages of the file until they update a row
+        """
+        store = cls(capacity=0)
+        for name in cls.COLUMNS:
+            setattr(
+                store,
+                name,
+                np.load(os.path.join(directory, f"{name}.npy"), mmap_mode=mmap_mode),
+            )
+        with open(os.path.join(directory, cls.TEXTS_FILE)) as texts_file:
+            store.texts = json.load(texts_file)
+        meta_path = os.path.join(directory, cls.META_FILE)
+        if os.path.exists(meta_path):
+            with open(meta_path) as meta_file:
+                store.sync_version = json.load(meta_file)["sync_version"]
+        store.size = len(store.ids)
+        store.index = {int(sock_id): row for row, sock_id in enumerate(store.ids)}
+        return store
+
+    @staticmethod
+    def exists(directory: str | None) -> bool:
+        """check if a saved store is available in the directory"""
+        return bool(directory) and os.path.exists(
+            os.path.join(directory, SockFeatureStore.TEXTS_FILE)
+        )
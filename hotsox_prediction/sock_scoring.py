@@ -0,0 +1,278 @@
+import numpy as np
+from datetime import date, datetime
+from difflib import SequenceMatcher
+from hashlib import blake2b
+from .text_similarity import MinHashTextSimilarity
+
+
+class SockScoringEngine:
+    """vectorized scoring engine for the pre-prediction algorithm
+    all candidate socks are loaded once into a numpy feature matrix (or taken
+    from a SockFeatureStore) and scored against the current sock in one
+    batched operation.
+    The text attributes are compared with MinHash signatures (see
+    MinHashTextSimilarity), with exact_texts=True the SequenceMatcher ratio of
+    the former formula is calculated instead.
+    """
+
+    # Weightage of each attribute (order matters: scores are summed in this order)
+    WEIGHTS = {
+        "info_color": 10,
+        "info_size": 8,
+        "info_type": 7,
+        "info_fabric": 6,
+        "info_condition": 6,
+        "info_holes": 6,
+        "info_age": 5,
+        "info_fabric_thickness": 5,
+        "info_kilometers": 4,
+        "info_inoutdoor": 4,
+        "info_washed": 4,
+        "info_brand": 3,
+        "info_joining_date": 5,
+        "info_separation_date": 2,
+        "info_special": 2,
+        "info_about": 2,
+    }
+    # Maxima for percentage calculation
+    MAXIMA = {
+        "info_color": 10,
+        "info_size": 7,
+        "info_type": 9,
+        "info_fabric": 7,
+        "info_condition": 12,
+        "info_holes": 10,
+        "info_age": 25,
+        "info_fabric_thickness": 7,
+        "info_kilometers": 1000,
+        "info_inoutdoor": 9,
+        "info_washed": 7,
+        "info_brand": 12,
+    }
+    INTEGER_ATTRIBUTES = tuple(MAXIMA)
+    DATE_ATTRIBUTES = ("info_joining_date", "info_separation_date")
+    TEXT_ATTRIBUTES = ("info_special", "info_about")
+
+    # dates closer than this amount of days get a linear ratio, all others 0.1
+    DATE_WINDOW = 60
+    DATE_FALLBACK_RATIO = 0.1
+
+    def __init__(self, socks, exact_texts: bool = False):
+        """build the feature matrix for the given candidate socks"""
+        socks = list(socks)
+        self._setup(
+            keys=socks,
+            integers=[self.encode_integers(sock) for sock in socks],
+            days=[self.encode_days(sock) for sock in socks],
+            texts={
+                attribute: [getattr(sock, attribute) for sock in socks]
+                for attribute in self.TEXT_ATTRIBUTES
+            },
+            exact_texts=exact_texts,
+        )
+
+    @classmethod
+    def from_arrays(
+        cls,
+        keys,
+        integers,
+        days,
+        texts,
+        fingerprints=None,
+        signatures=None,
+        exact_texts: bool = False,
+    ):
+        """build the engine from precomputed feature arrays (e.g. SockFeatureStore)
+        keys can be anything (e.g. sock ids) and is returned by best_match
+        """
+        engine = cls.__new__(cls)
+        engine._setup(
+            keys, integers, days, texts, fingerprints, signatures, exact_texts
+        )
+        return engine
+
+    def _setup(
+        self,
+        keys,
+        integers,
+        days,
+        texts,
+        fingerprints=None,
+        signatures=None,
+        exact_texts=False,
+    ):
+        self.keys = list(keys)
+        self.integers = np.asarray(integers, dtype=np.int64).reshape(
+            len(self.keys), len(self.INTEGER_ATTRIBUTES)
+        )
+        self.days = np.asarray(days, dtype=np.int64).reshape(
+            len(self.keys), len(self.DATE_ATTRIBUTES)
+        )
+        self.texts = texts
+        # optional 64bit fingerprints of the texts to skip identical texts
+        self.fingerprints = fingerprints
+        self.exact_texts = exact_texts
+        if signatures is None and not exact_texts:
+            signatures = self.encode_signatures(texts)
+        # MinHash signatures of the texts as (candidates, texts, permutations)
+        self.signatures = signatures
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    @staticmethod
+    def day_number(value: date | datetime | str) -> int:
+        """convert a date (or datetime) into a day offset usable for subtraction
+        iso strings are accepted too (e.g. unsaved form/serializer values)
+        """
+        if isinstance(value, str):
+            value = date.fromisoformat(value[:10])
+        if isinstance(value, datetime):
+            value = value.date()
+        return value.toordinal()
+
+    @staticmethod
+    def fingerprint(text: str) -> int:
+        """return a stable 64bit fingerprint of a text"""
+        return int.from_bytes(
+            blake2b(text.encode("utf-8"), digest_size=8).digest(), "little"
+        )
+
+    @classmethod
+    def encode_integers(cls, sock) -> list:
+        """return the integer (and choice) attributes of a sock as a list"""
+        return [int(getattr(sock, attribute)) for attribute in cls.INTEGER_ATTRIBUTES]
+
+    @classmethod
+    def encode_signatures(cls, texts: dict) -> np.ndarray:
+        """return the MinHash signatures of the text attributes of all candidates"""
+        return np.stack(
+            [
+                MinHashTextSimilarity.signatures(texts[attribute])
+                for attribute in cls.TEXT_ATTRIBUTES
+            ],
+            axis=1,
+        ).reshape(-1, len(cls.TEXT_ATTRIBUTES), MinHashTextSimilarity.NUM_PERMUTATIONS)
+
+    @classmethod
+    def encode_days(cls, sock) -> list:
+        """return the date attributes of a sock as day offsets"""
+        return [
+            cls.day_number(getattr(sock, attribute))
+            for attribute in cls.DATE_ATTRIBUTES
+        ]
+
+    @staticmethod
+    def text_ratios(
+        current_value: str,
+        challenger_values: list,
+        current_fingerprint=None,
+        challenger_fingerprints=None,
+    ) -> np.ndarray:
+        """calculate the SequenceMatcher ratio of one text against a list of texts
+        the ratio of each distinct challenger text is only calculated once,
+        identical texts (same fingerprint) always have a ratio of 1.0
+        """
+        if challenger_fingerprints is None:
+            keys = challenger_values
+        else:
+            keys = challenger_fingerprints.tolist()
+
+        matcher = SequenceMatcher(None, current_value)
+        ratios = {}
+        if current_fingerprint is not None:
+            ratios[int(current_fingerprint)] = 1.0
+        for key, value in zip(keys, challenger_values):
+            if key not in ratios:
+                matcher.set_seq2(value)
+                ratios[key] = matcher.ratio()
+        return np.array([ratios[key] for key in keys], dtype=float)
+
+    @classmethod
+    def date_ratios(cls, current_day: int, challenger_days: np.ndarray) -> np.ndarray:
+        """calculate the date ratio of one day offset against an array of offsets"""
+        delta = np.abs(current_day - challenger_days)
+        return np.where(
+            delta <= cls.DATE_WINDOW,
+            (cls.DATE_WINDOW - delta) / cls.DATE_WINDOW,
+            cls.DATE_FALLBACK_RATIO,
+        )
+
+    def contributions(self, current_sock) -> dict:
+        """calculate the weighted ratio (points) of every attribute for all
+        candidates against the current sock ({attribute: array}, WEIGHTS order)
+        """
+        contributions = {}
+        if not self.keys:
+            return contributions
+
+        # calcualte for integer values
+        current_integers = self.encode_integers(current_sock)
+        for column, attribute in enumerate(self.INTEGER_ATTRIBUTES):
+            ratio = (
+                1
+                - np.abs(current_integers[column] - self.integers[:, column])
+                / self.MAXIMA[attribute]
+            )
+            contributions[attribute] = self.WEIGHTS[attribute] * ratio
+
+        # calculate for dates
+        current_days = self.encode_days(current_sock)
+        for column, attribute in enumerate(self.DATE_ATTRIBUTES):
+            ratio = self.date_ratios(current_days[column], self.days[:, column])
+            contributions[attribute] = self.WEIGHTS[attribute] * ratio
+
+        # calculate for text
+        for column, attribute in enumerate(self.TEXT_ATTRIBUTES):
+            current_value = getattr(current_sock, attribute)
+            if not self.exact_texts:
+                ratio = MinHashTextSimilarity.similarities(
+                    MinHashTextSimilarity.signature(current_value),
+                    self.signatures[:, column],
+                )
+            elif self.fingerprints is None:
+                ratio = self.text_ratios(current_value, self.texts[attribute])
+            else:
+                ratio = self.text_ratios(
+                    current_value,
+                    self.texts[attribute],
+                    self.fingerprint(current_value),
+                    self.fingerprints[:, column],
+                )
+            contributions[attribute] = self.WEIGHTS[attribute] * ratio
+
+        return contributions
+
+    def score(self, current_sock) -> np.ndarray:
+        """calculate the similarity score of all candidates against the current sock"""
+        scores = np.full(len(self.keys), -1.0)
+        for points in self.contributions(current_sock).values():
+            scores += points
+        return scores
+
+    def best_match(self, current_sock):
+        """return the candidate with the highest score (first one on ties)
+        like the previous loop, the first candidate is returned if no score beats -1
+        """
+        if not self.keys:
+            return None
+        scores = self.score(current_sock)
+        index = int(np.argmax(scores))
+        if scores[index] > -1:
+            return self.keys[index]
+        return self.keys[0]
+
+    def top_k(self, current_sock, count: int) -> tuple[list, list]:
+        """return the keys and scores of the best count candidates
+        best first, on ties the earlier candidate comes first
+        """
+        if count <= 0 or not self.keys:
+            return [], []
+        scores = self.score(current_sock)
+        if count < len(scores) // 4:
+            # only sort the best candidates of large pools
+            candidates = np.argpartition(-scores, count - 1)[:count]
+        else:
+            candidates = np.arange(len(scores))
+        order = candidates[np.lexsort((candidates, -scores[candidates]))][:count]
+        return [self.keys[index] for index in order], scores[order].tolist()
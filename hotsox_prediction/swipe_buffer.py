@@ -0,0 +1,156 @@
+import itertools
+import json
+import time
+
+
+class LocalSwipeStream:
+    """in-process stream of buffered judgements (tests & single process setups)
+    same interface as the RedisSwipeStream
+    """
+
+    def __init__(self):
+        self._entries = {}
+        self._ids = itertools.count(1)
+        self._pending = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def append(self, records: list):
+        for record in records:
+            self._entries[next(self._ids)] = record
+
+    def read(self, count: int) -> list:
+        """return the oldest (up to count) entries as (entry id, record) pairs"""
+        return list(itertools.islice(self._entries.items(), count))
+
+    def delete(self, entry_ids):
+        for entry_id in entry_ids:
+            self._entries.pop(entry_id, None)
+
+    def add_pending(self, sock_id, judged_sock_ids):
+        self._pending.setdefault(sock_id, set()).update(judged_sock_ids)
+
+    def pending(self, sock_id) -> set:
+        return set(self._pending.get(sock_id, ()))
+
+    def remove_pending(self, sock_id, judged_sock_ids):
+        pending = self._pending.get(sock_id, set())
+        pending.difference_update(judged_sock_ids)
+        if not pending:
+            self._pending.pop(sock_id, None)
+
+
+class RedisSwipeStream:
+    """redis stream of buffered judgements (shared by all web & celery workers)
+    the judgements are XADDed to one stream, the pending judged socks of every
+    sock are kept in a redis set
+    """
+
+    KEY_PREFIX = "swipe_buffer"
+
+    def __init__(self, url: str):
+        import redis
+
+        self._redis = redis.Redis.from_url(url)
+        self.stream = f"{self.KEY_PREFIX}:stream"
+
+    def pending_key(self, sock_id) -> str:
+        return f"{self.KEY_PREFIX}:pending:{sock_id}"
+
+    def __len__(self) -> int:
+        return self._redis.xlen(self.stream)
+
+    def append(self, records: list):
+        pipeline = self._redis.pipeline()
+        for record in records:
+            pipeline.xadd(self.stream, {"judgement": json.dumps(record)})
+        pipeline.execute()
+
+    def read(self, count: int) -> list:
+        """return the oldest (up to count) entries as (entry id, record) pairs"""
+        return [
+            (entry_id, json.loads(fields[b"judgement"]))
+            for entry_id, fields in self._redis.xrange(self.stream, count=count)
+        ]
+
+    def delete(self, entry_ids):
+        if entry_ids:
+            self._redis.xdel(self.stream, *entry_ids)
+
+    def add_pending(self, sock_id, judged_sock_ids):
+        if judged_sock_ids:
+            self._redis.sadd(self.pending_key(sock_id), *judged_sock_ids)
+
+    def pending(self, sock_id) -> set:
+        return {
+            int(member) for member in self._redis.smembers(self.pending_key(sock_id))
+        }
+
+    def remove_pending(self, sock_id, judged_sock_ids):
+        if judged_sock_ids:
+            self._redis.srem(self.pending_key(sock_id), *judged_sock_ids)
+
+
+class SwipeBuffer:
+    """write-behind buffer of likes & dislikes (optional swipe mode)
+    a judgement is appended to the stream and acknowledged at once, a celery
+    job flushes the stream to the SockLike table in large batches (and finds
+    the matches there). Until a judgement is flushed the judged sock stays
+    pending: the apps exclude the pending socks of a sock from its candidates,
+    so a buffered sock is never shown twice.
+    Flushing is idempotent (the judgements are inserted with ON CONFLICT DO
+    NOTHING), an entry is only deleted from the stream after it was stored.
+    """
+
+    def __init__(self, stream, batch_size: int = 1000):
+        self.stream = stream
+        self.batch_size = batch_size
+
+    def __len__(self) -> int:
+        return len(self.stream)
+
+    def add(self, sock_id, judgements: list):
+        """buffer judgements [(judged sock id, like), ...] of a sock"""
+        judgements = list(judgements)
+        if not judgements:
+            return
+        # pending first, the stream entries can be flushed right away
+        self.stream.add_pending(sock_id, [judged_id for judged_id, _ in judgements])
+        self.stream.append(
+            [
+                {"sock_id": sock_id, "judged_id": judged_id, "like": like}
+                for judged_id, like in judgements
+            ]
+        )
+
+    def pending(self, sock_id) -> set:
+        """return the ids of the buffered (not yet stored) socks a sock judged"""
+        return self.stream.pending(sock_id)
+
+    def flush(self, store, max_batches: int | None = None) -> dict:
+        """store the buffered judgements batch by batch and return the metrics
+        store(judgements) persists one batch {sock id: [(judged sock id, like)]}
+        in one transaction and returns the amount of new matches
+        """
+        metrics = {"judgements": 0, "batches": 0, "matches": 0, "seconds": 0.0}
+        start = time.perf_counter()
+        while max_batches is None or metrics["batches"] < max_batches:
+            entries = self.stream.read(self.batch_size)
+            if not entries:
+                break
+            judgements = {}
+            for _, record in entries:
+                judgements.setdefault(record["sock_id"], []).append(
+                    (record["judged_id"], record["like"])
+                )
+            metrics["matches"] += store(judgements) or 0
+            self.stream.delete([entry_id for entry_id, _ in entries])
+            for sock_id, sock_judgements in judgements.items():
+                self.stream.remove_pending(
+                    sock_id, [judged_id for judged_id, _ in sock_judgements]
+                )
+            metrics["judgements"] += len(entries)
+            metrics["batches"] += 1
+        metrics["seconds"] = round(time.perf_counter() - start, 3)
+        return metrics
@@ -0,0 +1,69 @@
+import numpy as np
+
+
+class MinHashTextSimilarity:
+    """estimate the similarity of texts from MinHash signatures
+    a text is split into overlapping character shingles, the signature holds the
+    minimum hash of all shingles under NUM_PERMUTATIONS random hash functions.
+    The share of equal signature values estimates the Jaccard similarity J of
+    the shingle sets, which is turned into the Dice coefficient 2J / (1 + J) to
+    come close to the SequenceMatcher ratio (2 * matches / total length).
+    Signatures are computed once per sock and compared in vectorized form.
+    """
+
+    NUM_PERMUTATIONS = 64
+    SHINGLE_SIZE = 4
+    SEED = 1981
+    # prime above 2**32 for the hash functions (a * x + b) % PRIME
+    PRIME = 4294967311
+    # signature of an empty text (no shingles)
+    EMPTY = np.iinfo(np.uint32).max
+
+    _random = np.random.default_rng(SEED)
+    _a = _random.integers(1, 2**32, NUM_PERMUTATIONS, dtype=np.uint64)
+    _b = _random.integers(0, 2**32, NUM_PERMUTATIONS, dtype=np.uint64)
+
+    @classmethod
+    def shingle_hashes(cls, text: str) -> np.ndarray:
+        """return the distinct 32bit hashes of all character shingles of a text
+        texts shorter than SHINGLE_SIZE are a single shingle
+        """
+        codes = np.frombuffer(text.encode("utf-32-le"), dtype=np.uint32)
+        codes = codes.astype(np.uint64)
+        width = min(cls.SHINGLE_SIZE, len(codes))
+        if width == 0:
+            return np.empty(0, dtype=np.uint64)
+
+        # polynomial rolling hash over all windows of the text at once
+        hashes = np.zeros(len(codes) - width + 1, dtype=np.uint64)
+        for offset in range(width):
+            window = codes[offset : len(codes) - width + 1 + offset]
+            hashes = (hashes * np.uint64(1000003) + window) & np.uint64(0xFFFFFFFF)
+        return np.unique(hashes)
+
+    @classmethod
+    def signature(cls, text: str | None) -> np.ndarray:
+        """return the MinHash signature of a text (uint32 array)"""
+        hashes = cls.shingle_hashes(text or "")
+        if not len(hashes):
+            return np.full(cls.NUM_PERMUTATIONS, cls.EMPTY, dtype=np.uint32)
+        permuted = (cls._a[:, None] * hashes[None, :] + cls._b[:, None]) % np.uint64(
+            cls.PRIME
+        )
+        return (permuted.min(axis=1) & np.uint64(0xFFFFFFFF)).astype(np.uint32)
+
+    @classmethod
+    def signatures(cls, texts) -> np.ndarray:
+        """return the signatures of a list of texts as (texts, permutations) array"""
+        signatures = np.empty((len(texts), cls.NUM_PERMUTATIONS), dtype=np.uint32)
+        for row, text in enumerate(texts):
+            signatures[row] = cls.signature(text)
+        return signatures
+
+    @staticmethod
+    def similarities(
+        current_signature: np.ndarray, challenger_signatures: np.ndarray
+    ) -> np.ndarray:
+        """estimate the similarity of one signature against an array of signatures"""
+        jaccard = np.mean(challenger_signatures == current_signature, axis=-1)
+        return 2 * jaccard / (1 + jaccard)